@@ -0,0 +1,179 @@
+# Resumen del carrito calculado desde sus items
+"""
+Totales del carrito derivados de `cart_items JOIN products`
+
+carts.total_amount se mantiene sumando y restando `precio * cantidad` en cada escritura y se
+desvía cuando cambia el precio de un producto o se elimina. El resumen (total, items
+distintos y unidades) se calcula siempre con una sola consulta de agregación sobre los
+precios actuales; la búsqueda usa el índice único de carts.user_id (o de carts.session_id
+para carritos de invitado) y la clave primaria (cart_id, product_id) de cart_items.
+
+Caché opcional por carrito (CART_SUMMARY_CACHE_ENABLED=true), en memoria del proceso:
+- crud la invalida tras confirmar cada escritura del carrito
+- cambios de precio o eliminación de productos (ORM o UPDATE/DELETE masivos) la vacían
+  completa al confirmar, porque no se sabe qué carritos contienen el producto
+Cada invalidación incrementa una generación; un resultado calculado antes de una
+invalidación no se guarda. Con varios workers la caché de cada proceso solo ve sus propias
+escrituras: conviene un TTL corto o dejarla desactivada.
+"""
+import os
+import time
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+from sqlalchemy import event, inspect, text
+from sqlalchemy.orm import Session
+
+from app.database import Product
+
+CART_SUMMARY_CACHE_ENABLED = os.getenv("CART_SUMMARY_CACHE_ENABLED", "false").lower() == "true"
+CART_SUMMARY_CACHE_TTL_SECONDS = float(os.getenv("CART_SUMMARY_CACHE_TTL_SECONDS", "30"))
+CART_SUMMARY_CACHE_MAX_ENTRIES = int(os.getenv("CART_SUMMARY_CACHE_MAX_ENTRIES", "10000"))
+
+# Items cuyo producto ya no existe quedan fuera del total y del conteo (JOIN interno)
+_SUMMARY_SQL = """
+SELECT c.id AS cart_id,
+       COUNT(ci.product_id) AS item_count,
+       COALESCE(SUM(ci.quantity), 0) AS unit_count,
+       COALESCE(SUM(ci.quantity * p.price), 0) AS total
+FROM carts c
+LEFT JOIN (cart_items ci JOIN products p ON p.id = ci.product_id) ON ci.cart_id = c.id
+WHERE {condition}
+GROUP BY c.id
+"""
+_SUMMARY_BY_USER = text(_SUMMARY_SQL.format(condition="c.user_id = :user_id"))
+_SUMMARY_BY_SESSION = text(_SUMMARY_SQL.format(condition="c.session_id = :session_id"))
+_SUMMARY_BY_CART = text(_SUMMARY_SQL.format(condition="c.id = :cart_id"))
+
+class CartSummary:
+    """Total e items de un carrito; cart_id es None si el usuario o la sesión aún no tiene carrito"""
+
+    __slots__ = ("cart_id", "total", "item_count", "unit_count")
+
+    def __init__(self, cart_id: Optional[int], total: float = 0.0, item_count: int = 0, unit_count: int = 0):
+        self.cart_id = cart_id
+        self.total = total
+        self.item_count = item_count
+        self.unit_count = unit_count
+
+class CartSummaryCache:
+    """LRU de resúmenes por carrito con TTL y generación para descartar resultados viejos"""
+
+    def __init__(self, max_entries: int, ttl_seconds: float):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[int, Tuple[CartSummary, float]]" = OrderedDict()
+        # ("user", user_id) o ("session", session_id) -> cart_id
+        self._owner_carts: Dict[Tuple[str, Any], int] = {}
+        self._generation = 0
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "invalidations": 0, "full_invalidations": 0}
+
+    @property
+    def generation(self) -> int:
+        return self._generation
+
+    def get(self, owner: Optional[Tuple[str, Any]] = None, cart_id: Optional[int] = None) -> Optional[CartSummary]:
+        with self._lock:
+            if cart_id is None:
+                cart_id = self._owner_carts.get(owner)
+            entry = self._entries.get(cart_id) if cart_id is not None else None
+            if entry is None or time.monotonic() - entry[1] > self.ttl_seconds:
+                self.stats["misses"] += 1
+                return None
+            self._entries.move_to_end(cart_id)
+            self.stats["hits"] += 1
+            return entry[0]
+
+    def store(self, summary: CartSummary, generation: int, owner: Optional[Tuple[str, Any]] = None) -> None:
+        """Guardar solo si no hubo invalidaciones desde que empezó la consulta"""
+        if summary.cart_id is None:
+            return
+        with self._lock:
+            if generation != self._generation:
+                return
+            if owner is not None:
+                self._owner_carts[owner] = summary.cart_id
+            self._entries[summary.cart_id] = (summary, time.monotonic())
+            self._entries.move_to_end(summary.cart_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            if len(self._owner_carts) > self.max_entries:
+                self._owner_carts.clear()
+
+    def invalidate(self, cart_ids: Optional[Iterable[int]] = None) -> None:
+        """Descartar los carritos indicados (o todos)"""
+        with self._lock:
+            self._generation += 1
+            if cart_ids is None:
+                self._entries.clear()
+                self.stats["full_invalidations"] += 1
+                return
+            for cart_id in cart_ids:
+                self._entries.pop(cart_id, None)
+            self.stats["invalidations"] += 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {**self.stats, "enabled": CART_SUMMARY_CACHE_ENABLED, "entries": len(self._entries)}
+
+_cart_summary_cache = CartSummaryCache(CART_SUMMARY_CACHE_MAX_ENTRIES, CART_SUMMARY_CACHE_TTL_SECONDS)
+
+def get_cart_summary_cache() -> CartSummaryCache:
+    """Caché compartida por todo el proceso"""
+    return _cart_summary_cache
+
+def get_cart_summary(db: Session, user_id: Optional[int] = None, cart_id: Optional[int] = None,
+                     session_id: Optional[str] = None) -> CartSummary:
+    """
+    Resumen del carrito del usuario, del carrito de invitado de la sesión o del carrito
+    indicado, con una consulta de agregación
+    """
+    if cart_id is not None:
+        owner, statement, params = None, _SUMMARY_BY_CART, {"cart_id": cart_id}
+    elif user_id is not None:
+        owner, statement, params = ("user", user_id), _SUMMARY_BY_USER, {"user_id": user_id}
+    else:
+        owner, statement, params = ("session", session_id), _SUMMARY_BY_SESSION, {"session_id": session_id}
+    if CART_SUMMARY_CACHE_ENABLED:
+        cached = _cart_summary_cache.get(owner=owner, cart_id=cart_id)
+        if cached is not None:
+            return cached
+    generation = _cart_summary_cache.generation
+    row = db.execute(statement, params).first()
+    if row is None:
+        return CartSummary(None)
+    summary = CartSummary(row.cart_id, float(row.total), int(row.item_count), int(row.unit_count))
+    if CART_SUMMARY_CACHE_ENABLED:
+        _cart_summary_cache.store(summary, generation, owner=owner)
+    return summary
+
+def invalidate_cart_summaries(cart_ids: Optional[Iterable[int]] = None) -> None:
+    """Llamar después de confirmar una escritura en cart_items (None = todos los carritos)"""
+    _cart_summary_cache.invalidate(cart_ids)
+
+# ------------------------------------------------------ invalidación por eventos
+
+@event.listens_for(Session, "after_flush")
+def _collect_price_changes(session: Session, flush_context) -> None:
+    """Productos eliminados o con precio modificado en este flush"""
+    for instance in list(session.dirty) + list(session.deleted):
+        if isinstance(instance, Product) and (
+                instance in session.deleted or inspect(instance).attrs.price.history.has_changes()):
+            session.info["cart_summaries_stale"] = True
+            return
+
+@event.listens_for(Session, "do_orm_execute")
+def _collect_bulk_price_changes(orm_execute_state) -> None:
+    if (orm_execute_state.is_update or orm_execute_state.is_delete) and any(
+            mapper.class_ is Product for mapper in orm_execute_state.all_mappers):
+        orm_execute_state.session.info["cart_summaries_stale"] = True
+
+@event.listens_for(Session, "after_commit")
+def _apply_price_changes(session: Session) -> None:
+    if session.info.pop("cart_summaries_stale", False):
+        _cart_summary_cache.invalidate()
+
+@event.listens_for(Session, "after_rollback")
+def _discard_price_changes(session: Session) -> None:
+    session.info.pop("cart_summaries_stale", None)
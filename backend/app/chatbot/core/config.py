@@ -3,6 +3,7 @@
 Configuración y datos básicos del chatbot
 Contiene información de la empresa y respuestas preparadas
 """
+import os
 from typing import Dict, List, Any
 
 class ChatbotConfig:
@@ -168,35 +169,6 @@ class ChatbotConfig:
         "basico": ["básico", "simple", "internet", "word", "excel", "navegación"]
     }
     
-    # Patrones de productos específicos
-    SPECIFIC_PRODUCT_PATTERNS = [
-        # ASUS patterns
-        r"asus\s+vivobook\s+go\s+15\s+e1504fa[\s\w]*",
-        r"asus\s+vivobook\s+go\s+15[\s\w]*",
-        r"asus\s+rog\s+strix\s+g15[\s\w]*",
-        r"asus\s+vivobook\s+16x[\s\w]*",
-        r"asus\s+vivobook[\s\w]*",
-        
-        # HP patterns
-        r"hp\s+pavilion\s+gaming[\s\w]*",
-        r"hp\s+pavilion[\s\w]*",
-        r"hp\s+15-fc0048la[\s\w]*",
-        r"hp\s+14-ep0011la[\s\w]*",
-        r"hp\s+envy\s+x360[\s\w]*",
-        r"hp\s+omen[\s\w]*",
-        
-        # Lenovo patterns
-        r"lenovo\s+legion\s+5[\s\w]*",
-        r"lenovo\s+v15\s+g4\s+amn[\s\w]*",
-        r"lenovo\s+v15\s+g4\s+i3[\s\w]*",
-        r"lenovo\s+ideapad\s+flex\s+5[\s\w]*",
-        r"lenovo\s+yoga\s+7[\s\w]*",
-        r"lenovo\s+v15[\s\w]*",
-        
-        # Dell patterns
-        r"dell\s+inspiron\s+3520[\s\w]*",
-        r"dell\s+inspiron[\s\w]*"
-    ]
       # Patrones de acciones
     CART_PATTERNS = [
         r"agrega(?:r)? al carrito", r"a[ñn]ade(?:r)? al carrito", r"quiero comprar",
@@ -205,6 +177,78 @@ class ChatbotConfig:
         r"agrega", r"puedes agregar", r"agregarlo", r"añadirlo", r"comprarlo", r"lo quiero",        r"lo agrego", r"puedes agregarlo", r"me lo das", r"lo llevo"
     ]
     
+    # Verbos de CART_PATTERNS demasiado genéricos para decidir solos ("quiero una laptop" es una búsqueda)
+    CART_GENERIC_VERBS = [
+        "agregar", "añadir", "comprar", "llevar", "quiero", "necesito", "agrega"
+    ]
+    
+    # Clasificación rápida por reglas: confianza mínima para no consultar a Gemini
+    INTENT_FAST_PATH_THRESHOLD = float(os.getenv("INTENT_FAST_PATH_THRESHOLD", "0.85"))
+    # Llamada única a Gemini (intención + entidades + respuesta); "false" vuelve al flujo en dos pasos
+    INTENT_SINGLE_CALL = os.getenv("INTENT_SINGLE_CALL", "true").lower() == "true"
+
+    # Caché de respuestas de la IA (backend: "memory" o "sqlite" para compartir entre workers)
+    RESPONSE_CACHE_ENABLED = os.getenv("RESPONSE_CACHE_ENABLED", "true").lower() == "true"
+    RESPONSE_CACHE_BACKEND = os.getenv("RESPONSE_CACHE_BACKEND", "memory")
+    RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "1000"))
+    RESPONSE_CACHE_TTL_SECONDS = float(os.getenv("RESPONSE_CACHE_TTL_SECONDS", "21600"))
+    RESPONSE_CACHE_SQLITE_PATH = os.getenv("RESPONSE_CACHE_SQLITE_PATH", "response_cache.db")
+
+    # Índice en memoria del catálogo: recarga completa periódica (cambios hechos por otros procesos)
+    CATALOG_INDEX_TTL_SECONDS = float(os.getenv("CATALOG_INDEX_TTL_SECONDS", "300"))
+
+    # Historial de conversaciones en memoria: turnos por sesión, expiración por inactividad,
+    # máximo de sesiones (LRU) y presupuesto opcional de bytes (0 = sin límite)
+    CONVERSATION_MAX_TURNS = int(os.getenv("CONVERSATION_MAX_TURNS", "10"))
+    CONVERSATION_IDLE_TTL_SECONDS = float(os.getenv("CONVERSATION_IDLE_TTL_SECONDS", "1800"))
+    CONVERSATION_MAX_SESSIONS = int(os.getenv("CONVERSATION_MAX_SESSIONS", "5000"))
+    CONVERSATION_MAX_BYTES = int(os.getenv("CONVERSATION_MAX_BYTES", "0"))
+    CONVERSATION_MAX_RESPONSE_CHARS = int(os.getenv("CONVERSATION_MAX_RESPONSE_CHARS", "4000"))
+    CONVERSATION_SWEEP_INTERVAL_SECONDS = float(os.getenv("CONVERSATION_SWEEP_INTERVAL_SECONDS", "60"))
+    # Almacenamiento del historial: "memory" (un solo proceso) o "database" (chat_sessions/chat_messages,
+    # compartido entre workers) con escritura diferida por lotes
+    CONVERSATION_STORE = os.getenv("CONVERSATION_STORE", "memory")
+    CONVERSATION_WRITE_BATCH_SIZE = int(os.getenv("CONVERSATION_WRITE_BATCH_SIZE", "50"))
+    CONVERSATION_WRITE_INTERVAL_SECONDS = float(os.getenv("CONVERSATION_WRITE_INTERVAL_SECONDS", "0.2"))
+    # Segundos que una sesión en caché se sirve sin consultar chat_sessions.last_activity (0 = validar siempre)
+    CONVERSATION_CACHE_VALIDATE_SECONDS = float(os.getenv("CONVERSATION_CACHE_VALIDATE_SECONDS", "30"))
+
+    # Ranking local de recomendaciones: productos elegidos y candidatos que se puntúan
+    RECOMMENDATION_TOP_K = int(os.getenv("RECOMMENDATION_TOP_K", "3"))
+    RECOMMENDATION_CANDIDATE_LIMIT = int(os.getenv("RECOMMENDATION_CANDIDATE_LIMIT", "500"))
+
+    # Presupuesto de tokens (estimados) por prompt y tope para el contexto conversacional
+    PROMPT_TOKEN_BUDGET = int(os.getenv("PROMPT_TOKEN_BUDGET", "1500"))
+    PROMPT_CONTEXT_MAX_TOKENS = int(os.getenv("PROMPT_CONTEXT_MAX_TOKENS", "300"))
+
+    # Métricas en /metrics (tramos por mensaje, consultas SQL, llamadas a la IA); "false" las desactiva
+    METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() == "true"
+
+    # Logging: nivel global, formato ("text" o "json"), niveles por módulo ("app.search=DEBUG,...")
+    # y un registro por mensaje con sus tiempos, muestreado (los lentos y los errores siempre)
+    LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+    LOG_FORMAT = os.getenv("LOG_FORMAT", "text")
+    LOG_LEVELS = os.getenv("LOG_LEVELS", "")
+    LOG_REQUEST_SAMPLE_RATE = float(os.getenv("LOG_REQUEST_SAMPLE_RATE", "0.1"))
+    LOG_SLOW_REQUEST_MS = float(os.getenv("LOG_SLOW_REQUEST_MS", "2000"))
+
+    # Cliente compartido de IA: llamadas simultáneas, timeout, reintentos ante 429/5xx
+    # (backoff exponencial con jitter) y circuit breaker (fallos seguidos / segundos abierto)
+    LLM_PROVIDER = os.getenv("LLM_PROVIDER", "gemini")
+    LLM_MODEL = os.getenv("LLM_MODEL", "gemini-1.5-flash")
+    LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "16"))
+    LLM_TIMEOUT_SECONDS = float(os.getenv("LLM_TIMEOUT_SECONDS", "20"))
+    LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))
+    LLM_BACKOFF_BASE_SECONDS = float(os.getenv("LLM_BACKOFF_BASE_SECONDS", "0.5"))
+    LLM_BACKOFF_MAX_SECONDS = float(os.getenv("LLM_BACKOFF_MAX_SECONDS", "4"))
+    LLM_CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("LLM_CIRCUIT_FAILURE_THRESHOLD", "5"))
+    LLM_CIRCUIT_RESET_SECONDS = float(os.getenv("LLM_CIRCUIT_RESET_SECONDS", "30"))
+    # Proveedor local (LLM_PROVIDER=local): latencia simulada, variación, tasa de errores y semilla
+    LOCAL_LLM_LATENCY_MS = float(os.getenv("LOCAL_LLM_LATENCY_MS", "0"))
+    LOCAL_LLM_JITTER_MS = float(os.getenv("LOCAL_LLM_JITTER_MS", "0"))
+    LOCAL_LLM_ERROR_RATE = float(os.getenv("LOCAL_LLM_ERROR_RATE", "0"))
+    LOCAL_LLM_SEED = int(os.getenv("LOCAL_LLM_SEED", "42"))
+    
     SPEC_PATTERNS = [
         "especificaciones", "specs", "características", "detalles", 
         "información detallada", "especificacion", "que especificacion",
@@ -256,11 +300,6 @@ class ChatbotConfig:
         r"especificaciones? de la tercera?", r"especificaciones? del tercero"
     ]
     
-    SPECIFIC_PRODUCT_PATTERNS = [
-        r"(?:laptop|pc|monitor|tablet)\s+(?:[a-zA-Z0-9]+\s*){1,5}", 
-        r"(?:[a-zA-Z]+\s+){0,2}(?:xps|macbook|thinkpad|rog|omen|spectre|zenbook|ideapad|legion|alienware|envy|pavilion|aspire|predator|surface)\s*\d*\s*[a-zA-Z0-9]*" # Ej: Dell XPS 13, ROG Strix G15
-    ]
-    
     # Patrones para comparación de productos ESPECÍFICOS (marcas/modelos concretos)
     COMPARISON_PATTERNS = [
         r"compara(?:r)?\s+(.+)\s+(?:con|vs|versus)\s+(.+)",     # "compara lenovo thinkpad con hp pavilion"
@@ -2,17 +2,25 @@
 Chatbot principal modularizado - Versión 4
 Orquesta todos los componentes del chatbot de manera organizada
 """
+import asyncio
 import logging
-from typing import Dict, Any, Optional, List
+from typing import Dict, Any, Optional, List, AsyncIterator, Tuple
 from sqlalchemy.orm import Session
 
+from app.database import engine, run_db
+from app.models import Product as ProductModel
+
+from .config import ChatbotConfig
 from ..services.product_service import ProductService
 from ..services.ai_response_generator import AIResponseGenerator
 from ..services.enhanced_llm_service import EnhancedLLMService
 from ..services.intent_classifier import IntentClassifier
+from ..services.llm_client import get_llm_client
 from ..utils.entity_extractor import EntityExtractor
 from ..utils.response_formatter import ResponseFormatter
 from ..utils.conversation_manager import ConversationManager
+from ..utils.streaming import set_event_sink, reset_event_sink, is_streaming, emit_event
+from ..utils.metrics import get_metrics, instrument_engine, span, traced
 
 logger = logging.getLogger(__name__)
 
@@ -21,21 +29,84 @@ class EnhancedInfotecChatbotV4:
     
     def __init__(self, api_key: str):
         """Inicializar el chatbot con todos sus componentes"""
-        # Inicializar servicios
+        # Inicializar servicios (un solo cliente de Gemini compartido por todos)
+        self.llm_client = get_llm_client(api_key)
         self.product_service = ProductService()
-        self.ai_generator = AIResponseGenerator(api_key)
-        self.llm_service = EnhancedLLMService(api_key)
-        self.intent_classifier = IntentClassifier(api_key)
+        self.ai_generator = AIResponseGenerator(api_key, llm_client=self.llm_client)
+        self.llm_service = EnhancedLLMService(api_key, llm_client=self.llm_client)
+        self.intent_classifier = IntentClassifier(api_key, llm_client=self.llm_client)
         # Inicializar utilidades
-        self.entity_extractor = EntityExtractor()
+        self.entity_extractor = EntityExtractor(catalog_index=self.product_service.catalog_index)
         self.response_formatter = ResponseFormatter()
         self.conversation_manager = ConversationManager()
+        # Métricas: consultas SQL por petición y estado de las cachés en /metrics
+        self.metrics = get_metrics()
+        instrument_engine(engine)
+        self.metrics.add_collector("chatbot", self._collect_metrics)
         
         logger.info("ChatbotV4 inicializado correctamente con LLM mejorado y clasificador de intenciones")
     
     def process_message(self, message: str, db: Session, user_id: Optional[int] = None, 
                        session_id: str = "default") -> Dict[str, Any]:
-        """Procesar mensaje del usuario - Método principal"""
+        """Procesar mensaje del usuario de forma síncrona (scripts y pruebas manuales)"""
+        return asyncio.run(self.process_message_async(message, db, user_id, session_id))
+    
+    async def process_message_stream(self, message: str, db: Session, user_id: Optional[int] = None,
+                                     session_id: str = "default") -> AsyncIterator[Tuple[str, Dict[str, Any]]]:
+        """
+        Procesar mensaje emitiendo eventos a medida que se generan:
+        "intent", "token" (fragmentos de texto), "products", "cart_action" y "done" con el resultado final
+        """
+        queue: asyncio.Queue = asyncio.Queue()
+        end_of_stream = object()
+        
+        async def run_pipeline() -> Dict[str, Any]:
+            token = set_event_sink(queue)
+            try:
+                return await self.process_message_async(message, db, user_id, session_id)
+            finally:
+                reset_event_sink(token)
+                queue.put_nowait((end_of_stream, None))
+        
+        task = asyncio.create_task(run_pipeline())
+        try:
+            streamed_text = False
+            while True:
+                event, data = await queue.get()
+                if event is end_of_stream:
+                    break
+                streamed_text = streamed_text or event == "token"
+                yield event, data
+            
+            result = await task
+            if not streamed_text:
+                # Respuestas sin LLM (formateadores, respuestas preparadas, caché): un único fragmento
+                yield "token", {"text": result["response"]}
+            if result.get("products"):
+                yield "products", {"products": result["products"]}
+            if result.get("cart_action"):
+                yield "cart_action", {"cart_action": result["cart_action"]}
+            yield "done", result
+        finally:
+            if not task.done():
+                # El cliente cerró la conexión antes de terminar
+                task.cancel()
+    
+    async def process_message_async(self, message: str, db: Session, user_id: Optional[int] = None, 
+                                    session_id: str = "default") -> Dict[str, Any]:
+        """Procesar mensaje del usuario - Método principal (no bloquea el event loop)"""
+        # Traza de la petición: tramos, consultas SQL y llamadas a la IA por intención
+        trace_token = self.metrics.start_request()
+        intent = "error"
+        try:
+            result = await self._process_message(message, db, user_id, session_id)
+            intent = result["intent"]
+            return result
+        finally:
+            self.metrics.finish_request(trace_token, intent)
+    
+    async def _process_message(self, message: str, db: Session, user_id: Optional[int],
+                               session_id: str) -> Dict[str, Any]:
         try:
             # Validar entrada
             if not message or not message.strip():
@@ -49,15 +120,36 @@ class EnhancedInfotecChatbotV4:
                 }
             
             # Obtener historial de conversación
-            conversation_history = self.conversation_manager.get_conversation_history(session_id)
+            with span("history"):
+                conversation_history = await self.conversation_manager.get_conversation_history_async(session_id)
             
-            # Usar IA para clasificar la intención del mensaje
-            intent_result = self.intent_classifier.classify_intent(message, conversation_history)
+            # Usar IA para clasificar la intención del mensaje. En modo de llamada única Gemini
+            # devuelve también entidades y, para intenciones simples, la respuesta final
+            context_str = self.conversation_manager.get_context_string(conversation_history)
+            # En streaming se usa el flujo en dos pasos: la respuesta JSON de la llamada única no se puede transmitir
+            with span("classify"):
+                if ChatbotConfig.INTENT_SINGLE_CALL and not is_streaming():
+                    intent_result = await self.intent_classifier.classify_and_answer_async(
+                        message, conversation_history, context_str
+                    )
+                else:
+                    intent_result = await self.intent_classifier.classify_intent_async(message, conversation_history)
             intent = intent_result["intent"]
             should_search = intent_result["should_show_products"]
+            direct_answer = intent_result.pop("answer", None)
+            emit_event("intent", {"intent": intent, "should_show_products": should_search})
             
-            # Extraer entidades adicionales si es necesario (mantenemos para compatibilidad)
-            entities = self.entity_extractor.extract_entities(message, conversation_history)
+            if direct_answer:
+                # La respuesta ya viene resuelta: no hacen falta los regex del extractor
+                entities = {"_original_message": message}
+            else:
+                # Extraer entidades adicionales si es necesario (mantenemos para compatibilidad)
+                with span("entities"):
+                    # El trie de productos se lee sin consultas; solo se recarga si el catálogo cambió
+                    if self.product_service.catalog_index.is_stale():
+                        await run_db(self.product_service.refresh_catalog, db)
+                    entities = self.entity_extractor.extract_entities(message, conversation_history)
+                    self._merge_ai_entities(entities, intent_result["entities"])
             
             # Agregar información del clasificador de intenciones
             entities["_intent_confidence"] = intent_result["confidence"]
@@ -82,76 +174,29 @@ class EnhancedInfotecChatbotV4:
             bot_response = ""
             cart_action = None
             
-            if should_search or entities.get("accion") == "pregunta_tecnologica":
+            if direct_answer:
+                bot_response = self._handle_direct_answer(message, intent, direct_answer, context_str)
+            elif should_search or entities.get("accion") == "pregunta_tecnologica":
                 # Procesar solicitudes relacionadas con productos o preguntas tecnológicas
-                bot_response, products, cart_action = self._handle_product_request(
+                bot_response, products, cart_action = await self._handle_product_request(
                     entities, conversation_history, db, user_id, session_id
                 )
             else:
                 # Generar respuesta general
-                bot_response = self._handle_general_conversation(message, conversation_history)
+                bot_response = await self._handle_general_conversation(message, conversation_history)
             
-            # MEJORA: Mejorar la serialización de productos para guardar en conversación
-            products_list = []
-            if products:
-                # Convertir los productos a un formato serializable optimizado
-                for p in products:
-                    if hasattr(p, 'dict'):
-                        # Si tiene método dict, usarlo directamente
-                        product_dict = p.dict()
-                        # Guardar solo campos esenciales para optimizar
-                        products_list.append({
-                            "name": product_dict.get("name", ""),
-                            "id": product_dict.get("id", None),
-                            "price": product_dict.get("price", 0),
-                            "brand": product_dict.get("brand", ""),
-                            "type": product_dict.get("type", ""),
-                        })
-                    elif isinstance(p, dict):
-                        # Si ya es un diccionario, guardar campos esenciales
-                        products_list.append({
-                            "name": p.get("name", ""),
-                            "id": p.get("id", None),
-                            "price": p.get("price", 0),
-                            "brand": p.get("brand", ""),
-                            "type": p.get("type", ""),
-                        })
-                    else:
-                        # Si no podemos convertirlo, al menos guardar el nombre como string
-                        try:
-                            products_list.append({"name": str(p)})
-                        except Exception as e:
-                            logger.warning(f"No se pudo convertir producto para guardar: {e}")
-            
-            # MEJORA: Mejor manejo de productos mostrados
+            # Productos mostrados en este turno, en orden y con su ID: "la segunda" se resuelve
+            # después directamente por ID (ver _handle_contextual_spec_request)
+            products_list = [self._history_product(p) for p in products]
             showed_products = len(products) > 0
             
-            # Agregar contexto de la respuesta para hacer tracking de productos
-            if showed_products and not products_list:
-                # Si la respuesta indica productos pero no tenemos lista, extraer nombres
-                import re
-                product_patterns = [
-                    r'\*\*\d+\.\s+([^*\(]+?)(?:\*\*|\()',   # **1. Nombre del producto** o **1. Nombre del producto(
-                    r'\d+\.\s+\*\*([^*\(]+?)(?:\*\*|\()',   # 1. **Nombre del producto** o 1. **Nombre del producto(
-                ]
-                
-                all_matches = []
-                for pattern in product_patterns:
-                    matches = re.findall(pattern, bot_response)
-                    if matches:
-                        all_matches.extend(matches)
-                
-                for name in all_matches:
-                    products_list.append({"name": name.strip()})
-            
-            # Registrar para depuración
-            logger.info(f"Guardando conversación con {len(products_list)} productos")
               # Guardar conversación con toda la información relevante
-            self.conversation_manager.save_conversation(
-                session_id, message, bot_response, intent, entities, 
-                products_shown=showed_products,
-                products_list=products_list
-            )
+            with span("save"):
+                self.conversation_manager.save_conversation(
+                    session_id, message, bot_response, intent, entities, 
+                    products_shown=showed_products,
+                    products_list=products_list
+                )
             
             return {
                 "response": bot_response,
@@ -163,7 +208,7 @@ class EnhancedInfotecChatbotV4:
             }
             
         except Exception as e:
-            logger.error(f"Error procesando mensaje: {e}")
+            logger.error("Error procesando mensaje: %s", e)
             return {
                 "response": "Disculpa, tuve un problema técnico. ¿Podrías repetir tu mensaje? Estoy aquí para ayudarte 🤖",
                 "intent": "error",
@@ -173,7 +218,8 @@ class EnhancedInfotecChatbotV4:
                 "cart_action": None
             }
         
-    def _handle_comparison_request(self, entities: Dict[str, Any], db: Session) -> tuple:
+    @traced("comparison")
+    async def _handle_comparison_request(self, entities: Dict[str, Any], db: Session) -> tuple:
         """Manejar solicitud de comparación de productos usando LLM mejorado."""
         product_names = entities.get("productos_a_comparar", [])
         brand_names = entities.get("marcas_a_comparar", [])
@@ -182,7 +228,7 @@ class EnhancedInfotecChatbotV4:
         
         if not product_names and not brand_names:
             # Usar LLM para responder si no se especifican productos
-            bot_response = self.llm_service.answer_tech_question(
+            bot_response = await self.llm_service.answer_tech_question_async(
                 f"El usuario quiere comparar productos pero no especificó cuáles. Mensaje: '{original_query}'",
                 "Necesito nombres específicos de productos o marcas para hacer una comparación"
             )
@@ -190,8 +236,8 @@ class EnhancedInfotecChatbotV4:
 
         # MEJORA: Si solo hay marcas, ir directamente al LLM sin buscar productos
         if brand_names and len(brand_names) >= 2 and not product_names:
-            logger.info(f"Comparación directa de marcas detectada: {brand_names}")
-            bot_response = self.llm_service.generate_comparison_response(
+            logger.debug("Comparación directa de marcas detectada: %s", brand_names)
+            bot_response = await self.llm_service.generate_comparison_response_async(
                 brand_names[0], 
                 brand_names[1], 
                 attributes,
@@ -203,15 +249,15 @@ class EnhancedInfotecChatbotV4:
         # Buscar los productos en la base de datos
         products = []
         for name in product_names:
-            product = self.product_service.find_product_by_name(db, name)
+            product = await run_db(self.product_service.find_product_by_name, db, name)
             if product:
                 products.append(product)
           # Si se encuentra al menos un producto, seguir con el proceso
         if len(products) >= 2:
             # Obtener datos de comparación usando el servicio de productos
             product_names_for_comparison = [products[0].name, products[1].name]
-            comparison_data = self.product_service.get_comparison_data(
-                db, product_names_for_comparison, [], attributes
+            comparison_data = await run_db(
+                self.product_service.get_comparison_data, db, product_names_for_comparison, [], attributes
             )
             
             if comparison_data:
@@ -225,7 +271,7 @@ class EnhancedInfotecChatbotV4:
                 return bot_response, products, None
         elif len(products) == 1 and brand_names and len(brand_names) >= 1:
             # Si tenemos un producto y una marca, usar LLM para comparación
-            bot_response = self.llm_service.generate_comparison_response(
+            bot_response = await self.llm_service.generate_comparison_response_async(
                 products[0].brand, 
                 brand_names[0], 
                 attributes,
@@ -236,7 +282,7 @@ class EnhancedInfotecChatbotV4:
         else:
             # No se encontraron suficientes productos, buscar productos recomendados
             search_query = " ".join(product_names + brand_names)
-            recommended_products = self.product_service.search_products(db, search_query)
+            recommended_products = await run_db(self.product_service.search_products, db, search_query)
             
             if recommended_products and len(recommended_products) >= 2:
                 # Mostrar productos encontrados para que el usuario elija
@@ -247,7 +293,7 @@ class EnhancedInfotecChatbotV4:
             else:
                 # No se encontraron productos, usar LLM para generar respuesta
                 if product_names and len(product_names) >= 2:
-                    bot_response = self.llm_service.generate_comparison_response(
+                    bot_response = await self.llm_service.generate_comparison_response_async(
                         product_names[0], 
                         product_names[1], 
                         attributes,
@@ -259,15 +305,17 @@ class EnhancedInfotecChatbotV4:
                     
                 return bot_response, [], None
     
-    def _handle_tech_question(self, message: str, conversation_history: List[Dict[str, Any]]) -> str:
+    @traced("tech_question")
+    async def _handle_tech_question(self, message: str, conversation_history: List[Dict[str, Any]]) -> str:
         """Manejar preguntas técnicas usando LLM especializado"""
         # Generar contexto para la IA
         context_str = self.conversation_manager.get_context_string(conversation_history)
         
         # Usar servicio LLM para responder preguntas tecnológicas
-        return self.llm_service.answer_tech_question(message, context_str)
+        return await self.llm_service.answer_tech_question_async(message, context_str)
     
-    def _handle_product_request(self, entities: Dict[str, Any], 
+    @traced("product_request")
+    async def _handle_product_request(self, entities: Dict[str, Any], 
                                conversation_history: List[Dict[str, Any]],
                                db: Session, user_id: Optional[int], 
                                session_id: str) -> tuple:
@@ -278,18 +326,18 @@ class EnhancedInfotecChatbotV4:
         # Si es una pregunta tecnológica, manejarla con el servicio LLM
         if action == "pregunta_tecnologica":
             original_message = entities.get("_original_message", "")
-            bot_response = self._handle_tech_question(original_message, conversation_history)
+            bot_response = await self._handle_tech_question(original_message, conversation_history)
             return bot_response, [], None
         
         # Solicitud de ver especificaciones de un producto
         if action == "ver_especificaciones":
             # Si hay un producto específico mencionado, mostrar sus especificaciones
             if entities.get("producto_especifico"):
-                return self._handle_specific_product_request(entities, db)
+                return await self._handle_specific_product_request(entities, db)
             else:
                 # Si hay una referencia contextual (la segunda, el primero, etc.)
                 if entities.get("numero_producto"):
-                    return self._handle_contextual_spec_request(entities, conversation_history, db)
+                    return await self._handle_contextual_spec_request(entities, conversation_history, db)
                 else:
                     # Si no hay un producto específico ni referencia contextual, mostrar ayuda
                     bot_response = """Parece que quieres ver especificaciones de un producto, pero no sé cuál.
@@ -304,23 +352,24 @@ class EnhancedInfotecChatbotV4:
         
         # Solicitud de comparación de productos
         elif action == "comparar_productos":
-            return self._handle_comparison_request(entities, db)
+            return await self._handle_comparison_request(entities, db)
           # Solicitud de agregar al carrito
         elif action == "agregar_carrito":
-            return self._handle_add_to_cart_request(entities, conversation_history, db, user_id, session_id)
+            return await self._handle_add_to_cart_request(entities, conversation_history, db, user_id, session_id)
         
         # Solicitud de recomendación de categoría
         elif action == "recomendar_categoria":
-            return self._handle_recommendation_request(entities, conversation_history, db)
+            return await self._handle_recommendation_request(entities, conversation_history, db)
             
         # Por defecto, búsqueda de productos
         else:
-            bot_response, products = self._handle_product_search(entities, conversation_history, db)
+            bot_response, products = await self._handle_product_search(entities, conversation_history, db)
             return bot_response, products, None
     
-    def _handle_specific_product_request(self, entities: Dict[str, Any], db: Session) -> tuple:
+    @traced("specific_product")
+    async def _handle_specific_product_request(self, entities: Dict[str, Any], db: Session) -> tuple:
         """Manejar solicitud de ver detalles de un producto específico"""
-        product = self.product_service.find_product_by_name(db, entities["producto_especifico"])
+        product = await self._resolve_specific_product(entities, db)
         
         if product:
             # Generar respuesta con todos los detalles del producto
@@ -338,58 +387,61 @@ class EnhancedInfotecChatbotV4:
 ¿Te gustaría que busque alternativas similares? 😊"""
             return bot_response, [], None
     
-    def _handle_contextual_spec_request(self, entities: Dict[str, Any], 
+    async def _resolve_specific_product(self, entities: Dict[str, Any], db: Session) -> Optional[ProductModel]:
+        """Producto ya identificado por el extractor (por ID) o, si no, buscado por nombre"""
+        if entities.get("producto_id") is not None:
+            product = await run_db(self.product_service.get_product_by_id, db, entities["producto_id"])
+            if product:
+                return product
+        return await run_db(self.product_service.find_product_by_name, db, entities["producto_especifico"])
+    
+    @traced("contextual_specs")
+    async def _handle_contextual_spec_request(self, entities: Dict[str, Any], 
                                       conversation_history: Optional[List[Dict[str, Any]]], 
                                       db: Session) -> tuple:
         """Manejar solicitudes de especificaciones con referencias contextuales (la segunda, el primero, etc.)"""
         numero_producto = entities.get("numero_producto", 1)
-        logger.info(f"Solicitud de especificaciones para producto #{numero_producto}")
+        logger.debug("Solicitud de especificaciones para producto #%s", numero_producto)
         
         # Verificar si hay conversación previa
         if not conversation_history:
             bot_response = f"""Lo siento, no puedo identificar cuál es "{'la ' + ['primera', 'segunda', 'tercera'][numero_producto-1] if numero_producto <= 3 else 'el producto'}" porque no hay conversación previa.
 
 ¿Podrías mencionar el nombre específico del producto del que quieres ver las especificaciones? 😊"""
-            return bot_response, []
-        
-        # MEJORA: Buscar en el historial la última vez que se mostraron productos
-        # Extraer los nombres de productos desde el historial de conversación
-        recommended_products = self._extract_last_recommended_products(conversation_history)
+            return bot_response, [], None
         
-        # Registrar información detallada para depuración
-        logger.info(f"Productos encontrados en conversación (total: {len(recommended_products)}): {recommended_products}")
+        # Productos mostrados en el último turno que los tuvo, en el orden en que se listaron
+        shown_products = self._last_shown_products(conversation_history)
+        logger.debug("Productos del último turno con productos: %s", [item.get("id") for item in shown_products])
         
         # Verificar si se encontraron suficientes productos
-        if not recommended_products or len(recommended_products) < numero_producto:
+        if not shown_products or len(shown_products) < numero_producto:
             # Preparar un mensaje más informativo
-            if not recommended_products:
+            if not shown_products:
                 message = "No encontré productos mencionados en nuestra conversación reciente."
             else:
-                message = f"Solo encontré {len(recommended_products)} productos en nuestra conversación, pero estás preguntando por el #{numero_producto}."
+                message = f"Solo encontré {len(shown_products)} productos en nuestra conversación, pero estás preguntando por el #{numero_producto}."
                 
             ordinal = ['primera', 'segunda', 'tercera'][numero_producto-1] if numero_producto <= 3 else f'producto #{numero_producto}'
             bot_response = f"""Lo siento, no puedo mostrar información sobre la {ordinal} opción. {message}
 
 ¿Podrías decirme el nombre específico del producto que te interesa? También puedo mostrarte nuestras mejores recomendaciones nuevamente. 😊"""
-            return bot_response, []
-        
-        # Obtener el producto específico por su índice
-        target_product_name = recommended_products[numero_producto - 1]
-        logger.info(f"Buscando especificaciones para: '{target_product_name}'")
+            return bot_response, [], None
         
-        # MEJORA: Buscar el producto en la base de datos de forma más flexible
-        product = self.product_service.find_product_by_name(db, target_product_name)
+        # Producto por su ID (índice del catálogo en memoria, sin búsquedas por nombre)
+        target = shown_products[numero_producto - 1]
+        target_product_name = target.get("name", "")
+        product = await run_db(self.product_service.get_product_by_id, db, target["id"])
         
         if product:
             # Generar respuesta con los detalles del producto
             bot_response = self.response_formatter.format_product_details(product)
             return bot_response, [product], None
         else:
-            # Si no se encuentra el producto exacto, intentar buscar alternativas
-            logger.warning(f"No se encontró el producto '{target_product_name}' en la base de datos")
-              # Intento de búsqueda más flexible con términos clave del nombre
+            # El producto ya no está activo: buscar alternativas con los términos clave del nombre
+            logger.warning("El producto %s ('%s') ya no está en el catálogo", target["id"], target_product_name)
             search_terms = ' '.join([term for term in target_product_name.split() if len(term) > 3])
-            alternative_products = self.product_service.search_products(db, search_terms)
+            alternative_products = await run_db(self.product_service.search_products, db, search_terms)
             
             if alternative_products:
                 bot_response = f"""No encontré exactamente el producto "**{target_product_name}**" en nuestro inventario, pero te muestro algunas alternativas similares:
@@ -407,126 +459,41 @@ class EnhancedInfotecChatbotV4:
 • Contactes directamente con nuestros especialistas
 
 ¿Cómo prefieres continuar? 😊"""
-                return bot_response, []
+                return bot_response, [], None
     
-    def _extract_last_recommended_products(self, conversation_history: List[Dict[str, Any]]) -> List[str]:
-        """Extraer la lista de productos recomendados de la conversación más reciente"""
-        product_names = []
-        
-        # Buscar hacia atrás en el historial la última respuesta que contenga productos
-        for entry in reversed(conversation_history):            # Registrar entrada para depuración
-            logger.info(f"Analizando entrada de conversación: products_shown={entry.get('products_shown')}, intent={entry.get('intent')}")
-            
-            # MEJORA: Verificar primero si el mensaje es una respuesta a una búsqueda de productos
-            intent = entry.get("intent", "")
-            is_product_related = intent in ["buscar_producto", "comparar_productos", "ver_especificaciones"]
-            showed_products = entry.get("products_shown", False)
-            
-            # Intentar obtener productos de la nueva estructura optimizada
-            products_list = entry.get("products_list", [])
-            
-            if products_list:
-                logger.info(f"Encontrada lista de productos con {len(products_list)} elementos")
-                for product in products_list:
-                    if isinstance(product, dict):
-                        if 'name' in product:
-                            name = product.get("name", "").strip()
-                            if name:  # Verificar que no sea vacío
-                                product_names.append(name)
-                                logger.info(f"Producto extraído de products_list: {name}")
-                    else:
-                        # Si es un objeto product, intentar extraer el nombre
-                        try:
-                            name = product.name if hasattr(product, 'name') else str(product)
-                            if name.strip():  # Verificar que no sea vacío
-                                product_names.append(name)
-                                logger.info(f"Producto extraído de products_list (objeto): {name}")
-                        except Exception as e:
-                            logger.warning(f"No se pudo extraer nombre de producto: {e}")
-                
-                if product_names:
-                    logger.info(f"Se extrajeron {len(product_names)} productos de products_list")
-                    break
-            
-            # MEJORA: Extraer productos directamente del texto de la respuesta
-            bot_response = entry.get("bot_response", "")
-            
-            # MEJORA: Comprobar si la respuesta contiene listado de productos numerados
-            # Patrones más comunes en las respuestas del chatbot
-            if (showed_products or is_product_related) and bot_response:
-                import re
-                
-                # MEJORA: Usar patrones específicos para detectar productos en respuestas formateadas
-                patterns = [
-                    # Patrones específicos del formato de respuesta
-                    r'\*\*\d+\.\s+([^*\(]+?)(?:\*\*|\()',   # **1. Nombre del producto** o **1. Nombre del producto(
-                    r'\d+\.\s+\*\*([^*\(]+?)(?:\*\*|\()',   # 1. **Nombre del producto** o 1. **Nombre del producto(
-                    r'\*\*([^*\n\(]+?)\*\*\s+\(S/\s+\d+',   # **Nombre del producto** (S/ precio)
-                    
-                    # Patrones generales para capturar productos en diferentes formatos
-                    r'\*\*\d+\.\s+([^*]+?)\*\*',            # **1. Nombre de producto**
-                    r'\d+\.\s+([^(]+?)\(',                  # 1. Nombre de producto (
-                    r'\d+\.\s+([^:]+?):\s',                 # 1. Nombre de producto: 
-                    r'\d+\.\s+([^\n]+?)(?=\n|$)',           # 1. Nombre de producto (final de línea)
-                    
-                    # Patrones de marca y modelo específicos
-                    r'laptop ([A-Za-z0-9]+\s+[A-Za-z0-9]+)',  # laptop + marca modelo
-                    r'([A-Za-z0-9]+\s+[A-Za-z0-9]+\s+[A-Za-z0-9]+)(?:\s+\d+GB|\s+\d+TB|\s+i\d)', # Patrones de marca, modelo y especificación
-                ]
-                
-                all_matches = []
-                for pattern in patterns:
-                    matches = re.findall(pattern, bot_response)
-                    if matches:
-                        all_matches.extend(matches)
-                        logger.info(f"Patrón '{pattern}' encontró {len(matches)} coincidencias")
-                
-                if all_matches:
-                    # Limpiar los nombres de productos
-                    for match in all_matches:
-                        # MEJORA: Mejor limpieza de nombres
-                        clean_name = match.strip()
-                        # Eliminar separadores comunes
-                        for sep in ['💰', '🏷️', '(', ')', ':', '*', '  ']:
-                            if sep in clean_name:
-                                clean_name = clean_name.split(sep)[0].strip()
-                        
-                        # Eliminar emojis y caracteres especiales comunes
-                        clean_name = re.sub(r'[💻🎮⭐✨🔥💡📱🖥️💾🧠⚡]', '', clean_name).strip()
-                        
-                        # Validación más estricta para nombres de productos
-                        if (clean_name and len(clean_name) > 3 and 
-                            not clean_name.isdigit() and 
-                            not clean_name.lower().startswith(('precio', 'total', 'subtotal', 'cantidad'))):
-                            product_names.append(clean_name)
-                            logger.info(f"Producto extraído del texto: '{clean_name}'")
-                    
-                    if product_names:
-                        logger.info(f"Se extrajeron {len(product_names)} productos del texto de la respuesta")
-                        break
-        
-        # Eliminar duplicados manteniendo el orden
-        unique_products = []
-        seen = set()
-        for name in product_names:
-            # Normalizar para comparación (minúsculas, sin espacios extras)
-            norm_name = ' '.join(name.lower().split())
-            if norm_name not in seen and len(norm_name) > 3:  # Filtro adicional por longitud
-                seen.add(norm_name)
-                unique_products.append(name)
-        
-        logger.info(f"Total de productos extraídos (únicos): {len(unique_products)}")
-        logger.info(f"Productos encontrados: {unique_products}")
-        return unique_products
+    @staticmethod
+    def _history_product(product: Any) -> Dict[str, Any]:
+        """Campos esenciales de un producto mostrado para guardar en el historial"""
+        if isinstance(product, dict):
+            get = product.get
+        else:
+            get = lambda key, default=None: getattr(product, key, default)
+        return {
+            "name": get("name", ""),
+            "id": get("id", None),
+            "price": get("price", 0),
+            "brand": get("brand", ""),
+            "type": get("type", ""),
+        }
+    
+    @staticmethod
+    def _last_shown_products(conversation_history: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Productos (con ID) del turno más reciente que mostró productos, en el orden mostrado"""
+        for entry in reversed(conversation_history):
+            shown = [product for product in entry.get("products_list") or () if product.get("id") is not None]
+            if shown:
+                return shown
+        return []
 
-    def _handle_add_to_cart_request(self, entities: Dict[str, Any], conversation_history: List[Dict[str, Any]], 
+    @traced("add_to_cart")
+    async def _handle_add_to_cart_request(self, entities: Dict[str, Any], conversation_history: List[Dict[str, Any]], 
                                    db: Session, user_id: Optional[int], session_id: str) -> tuple:
         """Manejar solicitud de agregar al carrito - MEJORADO"""
         if entities.get("producto_especifico"):
-            product = self.product_service.find_product_by_name(db, entities["producto_especifico"])
+            product = await self._resolve_specific_product(entities, db)
             if product:
                 quantity = entities.get("cantidad", 1)
-                result = self.product_service.add_to_cart(db, product.id, quantity, user_id, session_id)
+                result = await run_db(self.product_service.add_to_cart, db, product.id, quantity, user_id, session_id)
                 # Usar el response formatter para generar respuesta consistente
                 bot_response = self.response_formatter.format_cart_response(result)
                 
@@ -552,7 +519,7 @@ class EnhancedInfotecChatbotV4:
         else:
             # Buscar productos para que elija cuál agregar
             search_query = self.entity_extractor.get_search_query_from_context(entities, conversation_history)
-            products = self.product_service.search_products(db, search_query, max_price=entities.get("presupuesto"))
+            products = await run_db(self.product_service.search_products, db, search_query, max_price=entities.get("presupuesto"))
             
             if products:
                 bot_response = "🛒 **¡Perfecto! Aquí tienes las opciones disponibles:**\n\n"
@@ -569,78 +536,48 @@ class EnhancedInfotecChatbotV4:
                 bot_response += "¡Estoy aquí para encontrar la mejor opción para ti! 😊"
                 return bot_response, [], None
 
-    def _handle_recommendation_request(self, entities: Dict[str, Any], conversation_history: List[Dict[str, Any]],
+    @traced("recommendation")
+    async def _handle_recommendation_request(self, entities: Dict[str, Any], conversation_history: List[Dict[str, Any]],
                                      db: Session) -> tuple:
         """Manejar solicitudes de recomendación inteligente"""
-        logger.info("Procesando solicitud de recomendación inteligente")
-        
         # Extraer información relevante
         categoria = entities.get("categoria")
         uso = entities.get("uso")
         presupuesto = entities.get("presupuesto")
         user_query = entities.get("_original_message", "")
         
-        logger.info(f"Recomendación - Categoría: {categoria}, Uso: {uso}, Presupuesto: {presupuesto}")
+        logger.debug("Recomendación - Categoría: %s, Uso: %s, Presupuesto: %s", categoria, uso, presupuesto)
         
-        # Obtener productos para análisis (más productos para mejor recomendación)
-        all_products = self.product_service.get_best_products_for_recommendation(
-            db, category=categoria, use_case=uso, max_price=presupuesto, limit=50
+        # El ranking local elige los productos; la IA solo redacta la explicación
+        ranked = await run_db(
+            self.product_service.get_ranked_recommendations,
+            db, category=categoria, use_case=uso, max_price=presupuesto
         )
         
-        if not all_products:
+        if not ranked:
             return self._handle_no_products_for_recommendation(categoria, uso, presupuesto)
         
-        # Convertir productos a formato dict para el LLM
-        products_dict = []
-        for product in all_products:
-            product_dict = product.dict() if hasattr(product, 'dict') else {
-                "id": getattr(product, 'id', None),
-                "name": getattr(product, 'name', 'Producto'),
-                "price": getattr(product, 'price', 0),
-                "brand": getattr(product, 'brand', ''),
-                "rating": getattr(product, 'rating', 0),
-                "stock_quantity": getattr(product, 'stock_quantity', 0),
-                "description": getattr(product, 'description', ''),
-                "specifications": getattr(product, 'specifications', {})
-            }
-            products_dict.append(product_dict)
+        recommended_products = [item.product for item in ranked]
         
         # Generar contexto conversacional
         context_str = self.conversation_manager.get_context_string(conversation_history)
         
-        # Usar IA para generar recomendaciones inteligentes (TOP 3)
         try:
-            bot_response, recommended_product_names = self.llm_service.recommend_top_products_with_context(
-                products_dict,
+            bot_response = await self.llm_service.explain_recommendations_async(
+                ranked,
                 user_query,
                 context_str,
                 category=categoria,
-                use_case=uso,
-                count=3
+                use_case=uso
             )
             
-            # Filtrar productos recomendados de la lista original
-            recommended_products = []
-            for product in all_products[:10]:  # Limitar a los primeros 10 para mostrar
-                product_name = getattr(product, 'name', '')
-                # Verificar si el producto está en las recomendaciones del LLM
-                if any(rec_name.lower() in product_name.lower() or product_name.lower() in rec_name.lower() 
-                       for rec_name in recommended_product_names):
-                    recommended_products.append(product)
-                    if len(recommended_products) >= 3:
-                        break
-            
-            # Si no se encontraron productos específicos recomendados, usar los mejores disponibles
-            if not recommended_products:
-                recommended_products = all_products[:3]
-            
-            logger.info(f"Recomendaciones generadas: {len(recommended_products)} productos")
+            logger.debug("Recomendaciones generadas: %s", [product.id for product in recommended_products])
             return bot_response, recommended_products, None
             
         except Exception as e:
-            logger.error(f"Error generando recomendaciones con IA: {e}")
-            # Fallback: usar los mejores productos ordenados por rating/precio
-            return self._handle_fallback_recommendation(all_products[:3], user_query, categoria, uso)
+            logger.error("Error generando recomendaciones con IA: %s", e)
+            # Fallback: mismos productos del ranking con una explicación simple
+            return self._handle_fallback_recommendation(recommended_products, user_query, categoria, uso)
 
     def _handle_no_products_for_recommendation(self, categoria: Optional[str], uso: Optional[str], 
                                              presupuesto: Optional[int]) -> tuple:
@@ -699,13 +636,14 @@ class EnhancedInfotecChatbotV4:
         
         return bot_response, products, None
 
-    def _handle_product_search(self, entities: Dict[str, Any], conversation_history: List[Dict[str, Any]],
+    @traced("product_search")
+    async def _handle_product_search(self, entities: Dict[str, Any], conversation_history: List[Dict[str, Any]],
                               db: Session) -> tuple:
         """Manejar búsqueda normal de productos"""
         search_query = self.entity_extractor.get_search_query_from_context(entities, conversation_history)
         
         if search_query:
-            products = self.product_service.search_products(db, search_query, max_price=entities.get("presupuesto"))
+            products = await run_db(self.product_service.search_products, db, search_query, max_price=entities.get("presupuesto"))
             
             if products:
                 use_case = entities.get("uso")
@@ -725,7 +663,44 @@ class EnhancedInfotecChatbotV4:
             bot_response += "¿Qué tipo de producto estás buscando? 😊"
             return bot_response, []
 
-    def _handle_general_conversation(self, message: str, conversation_history: List[Dict[str, Any]]) -> str:
+    @traced("direct_answer")
+    def _handle_direct_answer(self, message: str, intent: str, answer: str, context_str: str) -> str:
+        """Usar la respuesta de la llamada única y guardarla en la caché de respuestas"""
+        if intent == "conversacion_general":
+            # Las respuestas preparadas (envíos, garantía...) tienen prioridad sobre la IA
+            prepared_response = self.response_formatter.check_prepared_response(message)
+            if prepared_response:
+                return prepared_response
+            cache_namespace = "general"
+        else:
+            cache_namespace = "tech"
+        
+        # Así el flujo en dos pasos (p. ej. tras el atajo por reglas) reutiliza esta respuesta
+        cache = self.llm_service.response_cache
+        cache.set(cache.make_key(cache_namespace, message, context_str), answer)
+        return answer
+    
+    def _merge_ai_entities(self, entities: Dict[str, Any], ai_entities: Dict[str, Any]) -> None:
+        """Completar las entidades del extractor con las que devolvió Gemini (solo valores válidos)"""
+        if not ai_entities:
+            return
+        config = self.entity_extractor.config
+        validators = {
+            "producto": lambda v: v in config.PRODUCT_PATTERNS,
+            "marca": lambda v: v in config.BRANDS,
+            "uso": lambda v: v in config.USE_CASES,
+            "presupuesto": lambda v: isinstance(v, (int, float)) and v > 0,
+            "numero_producto": lambda v: isinstance(v, int) and 1 <= v <= 10,
+        }
+        for key, is_valid in validators.items():
+            value = ai_entities.get(key)
+            if isinstance(value, str):
+                value = value.strip().lower()
+            if key not in entities and value is not None and is_valid(value):
+                entities[key] = int(value) if key == "presupuesto" else value
+    
+    @traced("general_conversation")
+    async def _handle_general_conversation(self, message: str, conversation_history: List[Dict[str, Any]]) -> str:
         """Manejar conversación general con capacidades tecnológicas mejoradas"""
         # Verificar respuestas preparadas primero
         prepared_response = self.response_formatter.check_prepared_response(message)
@@ -749,10 +724,34 @@ class EnhancedInfotecChatbotV4:
         
         if is_tech_question:
             # Usar LLM especializado para consultas tecnológicas
-            return self.llm_service.answer_tech_question(message, context_str)
+            return await self.llm_service.answer_tech_question_async(message, context_str)
         else:
             # Usar IA general para respuesta conversacional
-            return self.ai_generator.generate_general_response(message, context_str)
+            return await self.ai_generator.generate_general_response_async(message, context_str)
+
+    def _collect_metrics(self) -> List[tuple]:
+        """Aciertos de cachés y rutas del clasificador para /metrics (se leen al momento del scrape)"""
+        cache = self.llm_service.response_cache.get_stats()
+        memory = self.conversation_manager.get_stats()
+        classifier = self.intent_classifier.get_stats()
+        llm = self.llm_client.get_stats()
+        collected = [
+            ("response_cache_requests_total", "counter", "Consultas a la caché de respuestas de la IA",
+             [({"result": "hit"}, cache["hits"]), ({"result": "miss"}, cache["misses"])]),
+            ("response_cache_entries", "gauge", "Respuestas guardadas en la caché", [({}, cache["size"])]),
+            ("intent_classifications_total", "counter", "Mensajes por ruta de clasificación",
+             [({"path": path}, classifier[path]) for path in ("fast_path", "llm", "fallback") if path in classifier]),
+            ("llm_in_flight", "gauge", "Llamadas a la IA en curso", [({}, llm["in_flight"])]),
+            ("llm_retries_total", "counter", "Reintentos de llamadas a la IA", [({}, llm["retries"])]),
+            ("llm_circuit_open", "gauge", "1 si el circuito de la IA está abierto",
+             [({}, int(llm["circuit_state"] != "closed"))]),
+            ("conversation_sessions", "gauge", "Sesiones de conversación en memoria", [({}, memory["live_sessions"])]),
+        ]
+        if "cache_hits" in memory:
+            collected.append(("conversation_cache_requests_total", "counter",
+                              "Consultas al historial en memoria (almacenamiento en base de datos)",
+                              [({"result": "hit"}, memory["cache_hits"]), ({"result": "miss"}, memory["cache_misses"])]))
+        return collected
 
     # Métodos de utilidad para compatibilidad
     def get_conversation_history(self, session_id: str) -> List[Dict[str, Any]]:
@@ -4,82 +4,104 @@ Generador de respuestas usando inteligencia artificial
 Maneja las respuestas generales del chatbot usando Gemini AI
 """
 import logging
-import google.generativeai as genai
+from typing import Optional
 from ..core.config import ChatbotConfig
+from ..utils.response_cache import ResponseCache, get_response_cache
+from ..utils.streaming import generate_text_async
+from .llm_client import LLMClient, get_llm_client
+from ..utils.prompt_budget import PromptBuilder
 
 logger = logging.getLogger(__name__)
 
 class AIResponseGenerator:
     """Genera respuestas usando IA para conversaciones generales"""
     
-    def __init__(self, api_key: str):
+    def __init__(self, api_key: str, response_cache: Optional[ResponseCache] = None,
+                 llm_client: Optional[LLMClient] = None):
         """Inicializar el generador de respuestas con IA"""
-        genai.configure(api_key=api_key)
-        self.model = genai.GenerativeModel('gemini-1.5-flash')
+        self.llm = llm_client or get_llm_client(api_key)
         self.config = ChatbotConfig()
+        self.response_cache = response_cache or get_response_cache()
     
-    def generate_general_response(self, message: str, context_str: str = "") -> str:
+    async def generate_general_response_async(self, message: str, context_str: str = "") -> str:
         """Generar respuesta general usando IA"""
         try:
-            # Detectar tipo de mensaje para respuesta personalizada
-            message_lower = message.lower()
+            canned_response = self._get_canned_response(message)
+            if canned_response:
+                return canned_response
             
-            # Respuestas específicas para saludos
-            if any(greeting in message_lower for greeting in ["hola", "buenas", "buenos dias", "buenas tardes", "buenas noches", "hey", "hi"]):
-                return "¡Hola! 👋 Soy InfoBot de GRUPO INFOTEC. Me da mucho gusto saludarte. 😊 Estamos aquí para ayudarte con laptops, PCs y todo lo que necesites en tecnología. ¿En qué puedo asistirte hoy? ✨"
+            cache_key = self.response_cache.make_key("general", message, context_str)
+            cached = await self.response_cache.get_async(cache_key)
+            if cached:
+                return cached
             
-            # Respuestas para preguntas casuales
-            if any(casual in message_lower for casual in ["que tal", "como estas", "como va", "que hay", "que tal el dia"]):
-                return "¡Todo excelente por aquí! 😄 Gracias por preguntar. Estoy listo para ayudarte con cualquier consulta sobre nuestros productos. En GRUPO INFOTEC tenemos las mejores ofertas en laptops y PCs. ¿Hay algo específico que te interese? 💻"
-            
-            # Respuestas para agradecimientos
-            if any(thanks in message_lower for thanks in ["gracias", "muchas gracias", "te agradezco"]):
-                return "¡De nada! 😊 Ha sido un placer ayudarte. Recuerda que en GRUPO INFOTEC estamos disponibles 24/7 para cualquier consulta. ¡Que tengas un excelente día! ✨"
-            
-            # Usar IA para respuestas más complejas
             prompt = self._build_ai_prompt(message, context_str)
-            response = self.model.generate_content(prompt)
-            return response.text.strip()
+            answer = (await generate_text_async(self.llm, prompt)).strip()
+            await self.response_cache.set_async(cache_key, answer)
+            return answer
             
         except Exception as e:
-            logger.error(f"Error generando respuesta general: {e}")
-            return "¡Hola! 👋 Soy InfoBot de GRUPO INFOTEC. Estoy aquí para ayudarte con información sobre nuestros productos y servicios. ¿En qué puedo asistirte hoy? 😊"
+            logger.error("Error generando respuesta general: %s", e)
+            return self._fallback_general_response()
     
-    def _build_ai_prompt(self, message: str, context_str: str) -> str:
-        """Construir prompt para la IA"""
-        company_info = self.config.COMPANY_INFO
+    def _get_canned_response(self, message: str) -> Optional[str]:
+        """Respuestas fijas para saludos, preguntas casuales y agradecimientos (sin llamar a la IA)"""
+        # Detectar tipo de mensaje para respuesta personalizada
+        message_lower = message.lower()
         
-        prompt = f"""
-        Eres InfoBot, el asistente virtual amigable de GRUPO INFOTEC, empresa peruana líder en tecnología.
+        # Respuestas específicas para saludos
+        if any(greeting in message_lower for greeting in ["hola", "buenas", "buenos dias", "buenas tardes", "buenas noches", "hey", "hi"]):
+            return "¡Hola! 👋 Soy InfoBot de GRUPO INFOTEC. Me da mucho gusto saludarte. 😊 Estamos aquí para ayudarte con laptops, PCs y todo lo que necesites en tecnología. ¿En qué puedo asistirte hoy? ✨"
         
-        INFORMACIÓN DE LA EMPRESA:
-        - Nombre: {company_info['nombre']}
-        - Especialidad: Laptops, PCs gaming, componentes, soporte técnico especializado
-        - Ubicación: Lima, Perú (con envíos a todo el país)
-        - Experiencia: +15 años en el mercado peruano
-        - Servicios: Venta de equipos, soporte 24/7, garantías extendidas, financiamiento
+        # Respuestas para preguntas casuales
+        if any(casual in message_lower for casual in ["que tal", "como estas", "como va", "que hay", "que tal el dia"]):
+            return "¡Todo excelente por aquí! 😄 Gracias por preguntar. Estoy listo para ayudarte con cualquier consulta sobre nuestros productos. En GRUPO INFOTEC tenemos las mejores ofertas en laptops y PCs. ¿Hay algo específico que te interese? 💻"
         
-        ESPECIALIDADES:
-        {', '.join(company_info['especialidades'])}
+        # Respuestas para agradecimientos
+        if any(thanks in message_lower for thanks in ["gracias", "muchas gracias", "te agradezco"]):
+            return "¡De nada! 😊 Ha sido un placer ayudarte. Recuerda que en GRUPO INFOTEC estamos disponibles 24/7 para cualquier consulta. ¡Que tengas un excelente día! ✨"
         
-        SERVICIOS:
-        {', '.join(company_info['servicios'])}
-        
-        INSTRUCCIONES IMPORTANTES:
-        1. Responde de manera amigable y conversacional (100-150 palabras máximo)
-        2. Usa emojis moderadamente para hacer las respuestas más expresivas
-        3. Mantén un tono entusiasta pero profesional
-        4. Si preguntan sobre productos, ofrece ayuda específica
-        5. Menciona beneficios de GRUPO INFOTEC cuando sea relevante
-        6. Haz preguntas de seguimiento para mantener la conversación
-        7. NUNCA inventes especificaciones técnicas
-        8. Termina siempre invitando a continuar la conversación
-        
-        CONTEXTO DE CONVERSACIÓN: {context_str}
-        
-        MENSAJE DEL USUARIO: {message}
-        
-        Responde como InfoBot de GRUPO INFOTEC de manera conversacional:
-        """
+        return None
+    
+    def _fallback_general_response(self) -> str:
+        """Respuesta de respaldo cuando la IA no está disponible"""
+        return "¡Hola! 👋 Soy InfoBot de GRUPO INFOTEC. Estoy aquí para ayudarte con información sobre nuestros productos y servicios. ¿En qué puedo asistirte hoy? 😊"
+    
+    def _build_ai_prompt(self, message: str, context_str: str) -> str:
+        """Construir prompt para la IA"""
+        company_info = self.config.COMPANY_INFO
         
-        return prompt
+        builder = PromptBuilder("general")
+        builder.add(f"""Eres InfoBot, el asistente virtual amigable de GRUPO INFOTEC, empresa peruana líder en tecnología.
+
+INFORMACIÓN DE LA EMPRESA:
+- Nombre: {company_info['nombre']}
+- Especialidad: Laptops, PCs gaming, componentes, soporte técnico especializado
+- Ubicación: Lima, Perú (con envíos a todo el país)
+- Experiencia: +15 años en el mercado peruano
+- Servicios: Venta de equipos, soporte 24/7, garantías extendidas, financiamiento
+
+ESPECIALIDADES:
+{', '.join(company_info['especialidades'])}
+
+SERVICIOS:
+{', '.join(company_info['servicios'])}
+
+INSTRUCCIONES IMPORTANTES:
+1. Responde de manera amigable y conversacional (100-150 palabras máximo)
+2. Usa emojis moderadamente para hacer las respuestas más expresivas
+3. Mantén un tono entusiasta pero profesional
+4. Si preguntan sobre productos, ofrece ayuda específica
+5. Menciona beneficios de GRUPO INFOTEC cuando sea relevante
+6. Haz preguntas de seguimiento para mantener la conversación
+7. NUNCA inventes especificaciones técnicas
+8. Termina siempre invitando a continuar la conversación
+
+CONTEXTO DE CONVERSACIÓN:""")
+        builder.add_context(context_str)
+        builder.add(f"""
+MENSAJE DEL USUARIO: {message}
+
+Responde como InfoBot de GRUPO INFOTEC de manera conversacional:
+""")
+        return builder.build()
@@ -0,0 +1,508 @@
+# filepath: backend/app/chatbot/services/catalog_index.py
+"""
+Índice en memoria del catálogo de productos
+Carga una sola vez los productos activos y mantiene un índice invertido de tokens
+(sin tildes, en minúsculas) sobre nombre, marca, modelo, especificaciones y descripción.
+Responde búsquedas, búsquedas por nombre y productos similares sin consultas ILIKE,
+y se actualiza de forma incremental cuando la sesión de SQLAlchemy confirma cambios.
+Además arma un trie de tokens sobre nombres, modelos y SKU para reconocer en el mensaje
+del usuario el producto concreto que menciona (ProductNameTrie)
+"""
+import re
+import json
+import math
+import time
+import bisect
+import logging
+import threading
+import unicodedata
+from typing import Dict, List, Optional, Set, Any, Iterable, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from app.database import Product
+from app.models import Product as ProductModel
+from ..core.config import ChatbotConfig
+from ..utils.product_specs import get_product_specs
+
+logger = logging.getLogger(__name__)
+
+_TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+
+def fold_text(text: Optional[str]) -> str:
+    """Minúsculas y sin tildes ("Portátil" -> "portatil")"""
+    if not text:
+        return ""
+    text = unicodedata.normalize("NFKD", str(text).lower())
+    return "".join(char for char in text if not unicodedata.combining(char))
+
+def tokenize(text: Optional[str]) -> List[str]:
+    """Separar en tokens alfanuméricos normalizados"""
+    return _TOKEN_PATTERN.findall(fold_text(text))
+
+class _TrieNode:
+    __slots__ = ("children", "product_ids")
+
+    def __init__(self):
+        self.children: Dict[str, "_TrieNode"] = {}
+        self.product_ids: Set[int] = set()
+
+class ProductNameTrie:
+    """
+    Trie de tokens sobre las frases que nombran a cada producto (nombre, marca + modelo, SKU)
+    Se insertan todos los sufijos de cada frase, así cualquier secuencia contigua de tokens
+    de un nombre es un camino desde la raíz y cada nodo guarda los productos que la contienen.
+    Una mención vale si identifica a un solo producto e incluye algún token de su modelo o
+    SKU: "la lenovo legion 5" resuelve, "una laptop hp" o "rtx 4060" no
+    """
+
+    __slots__ = ("_root", "_products", "_model_tokens", "nodes")
+
+    def __init__(self):
+        self._root = _TrieNode()
+        self._products: Dict[int, ProductModel] = {}
+        self._model_tokens: Dict[int, Set[str]] = {}
+        self.nodes = 0
+
+    def add(self, product: ProductModel, phrases: Iterable[List[str]], model_tokens: Set[str]) -> None:
+        self._products[product.id] = product
+        self._model_tokens[product.id] = model_tokens
+        for tokens in phrases:
+            for start in range(len(tokens)):
+                node = self._root
+                for token in tokens[start:]:
+                    child = node.children.get(token)
+                    if child is None:
+                        child = node.children[token] = _TrieNode()
+                        self.nodes += 1
+                    child.product_ids.add(product.id)
+                    node = child
+
+    def match(self, tokens: List[str]) -> Optional[Tuple[ProductModel, int, int]]:
+        """Producto de la mención más larga del texto y su tramo [inicio, fin) en tokens"""
+        best: Optional[Tuple[ProductModel, int, int]] = None
+        for start in range(len(tokens)):
+            node = self._root
+            end = start
+            while end < len(tokens) and tokens[end] in node.children:
+                node = node.children[tokens[end]]
+                end += 1
+            # El nodo más profundo es el más específico: menos productos y más tokens del mensaje
+            if end == start or len(node.product_ids) != 1:
+                continue
+            product_id = next(iter(node.product_ids))
+            if not self._model_tokens[product_id].intersection(tokens[start:end]):
+                continue
+            if best is None or end - start > best[2] - best[1]:
+                best = (self._products[product_id], start, end)
+        return best
+
+class CatalogIndex:
+    """Índice invertido del catálogo con actualización incremental"""
+
+    # Peso de cada campo en la puntuación de relevancia
+    FIELD_WEIGHTS = {"name": 3.0, "brand": 3.0, "model": 2.0, "specifications": 1.5, "description": 0.5}
+
+    # Palabras que no aportan a la búsqueda
+    STOP_WORDS = {
+        "de", "del", "la", "el", "los", "las", "un", "una", "unos", "unas", "y", "o", "con", "para",
+        "por", "en", "que", "mi", "me", "su", "al", "lo"
+    }
+
+    # Palabras de modelo o SKU que no identifican un producto ("pc gamer", "gaming pro")
+    GENERIC_MODEL_TOKENS = {
+        "pc", "laptop", "notebook", "portatil", "computadora", "desktop", "monitor", "teclado", "mouse",
+        "gamer", "gaming", "pro", "oficina", "office"
+    }
+
+    # Longitud mínima para buscar un token por prefijo ("gam" -> "gaming", "gamer")
+    MIN_PREFIX_LENGTH = 3
+
+    def __init__(self, ttl_seconds: float = 300.0):
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.RLock()
+        self._products: Dict[int, ProductModel] = {}
+        self._folded_names: Dict[int, str] = {}
+        self._postings: Dict[str, Dict[int, float]] = {}
+        self._product_tokens: Dict[int, Dict[str, float]] = {}
+        self._name_tokens: Dict[int, Set[str]] = {}
+        self._sorted_tokens: List[str] = []
+        self._tokens_dirty = False
+        # Se reemplaza completo tras cada carga o actualización; las lecturas no toman el lock
+        self._name_trie = ProductNameTrie()
+        self._name_trie_dirty = False
+        self._loaded_at: Optional[float] = None
+        self._pending_ids: Set[int] = set()
+        self._needs_full_reload = True
+        self.stats = {"full_loads": 0, "incremental_refreshes": 0, "queries": 0, "name_trie_builds": 0}
+
+    # ------------------------------------------------------------------ carga
+
+    def ensure_fresh(self, db: Session) -> None:
+        """Cargar el catálogo la primera vez, aplicar cambios pendientes o recargar si venció el TTL"""
+        with self._lock:
+            expired = self._loaded_at is None or time.time() - self._loaded_at > self.ttl_seconds
+            if self._needs_full_reload or expired:
+                self._full_load(db)
+            elif self._pending_ids:
+                self._refresh_products(db, self._pending_ids)
+            if self._name_trie_dirty:
+                self._rebuild_name_trie()
+
+    def is_stale(self) -> bool:
+        """Hay cambios pendientes o venció el TTL: la próxima consulta irá a la base de datos"""
+        return (self._needs_full_reload or bool(self._pending_ids) or self._loaded_at is None
+                or time.time() - self._loaded_at > self.ttl_seconds)
+
+    def invalidate(self, product_ids: Optional[Iterable[int]] = None) -> None:
+        """Marcar productos como modificados (o todo el catálogo si no se indican IDs)"""
+        with self._lock:
+            if product_ids is None:
+                self._needs_full_reload = True
+            else:
+                self._pending_ids.update(product_ids)
+
+    def _full_load(self, db: Session) -> None:
+        started = time.perf_counter()
+        db_products = db.query(Product).filter(Product.is_active == True).all()
+        self._products.clear()
+        self._folded_names.clear()
+        self._postings.clear()
+        self._product_tokens.clear()
+        self._name_tokens.clear()
+        self._name_trie_dirty = True
+        for db_product in db_products:
+            self._index_product(db_product)
+        self._sorted_tokens = sorted(self._postings)
+        self._tokens_dirty = False
+        self._pending_ids.clear()
+        self._needs_full_reload = False
+        self._loaded_at = time.time()
+        self.stats["full_loads"] += 1
+        logger.info("Índice de catálogo cargado: %s productos, %s tokens en %.1f ms",
+                    len(self._products), len(self._postings), (time.perf_counter() - started) * 1000)
+
+    def _refresh_products(self, db: Session, product_ids: Set[int]) -> None:
+        ids = list(product_ids)
+        self._pending_ids.clear()
+        for product_id in ids:
+            self._unindex_product(product_id)
+        for db_product in db.query(Product).filter(Product.id.in_(ids), Product.is_active == True).all():
+            self._index_product(db_product)
+        self.stats["incremental_refreshes"] += 1
+        logger.debug("Índice de catálogo actualizado para %d productos", len(ids))
+
+    def _rebuild_name_trie(self) -> None:
+        """Trie de menciones desde los productos indexados (nombre, marca + modelo y SKU)"""
+        started = time.perf_counter()
+        trie = ProductNameTrie()
+        for product_id in sorted(self._products):
+            product = self._products[product_id]
+            brand_tokens = set(tokenize(product.brand))
+            sku_tokens = tokenize(product.sku)
+            model_tokens = ((set(tokenize(product.model)) | set(sku_tokens))
+                            - brand_tokens - self.STOP_WORDS - self.GENERIC_MODEL_TOKENS)
+            phrases = [tokenize(product.name), tokenize(f"{product.brand} {product.model}"), sku_tokens]
+            trie.add(product, phrases, model_tokens)
+        self._name_trie = trie
+        self._name_trie_dirty = False
+        self.stats["name_trie_builds"] += 1
+        logger.debug("Trie de nombres reconstruido: %d productos, %d nodos en %.1f ms",
+                     len(self._products), trie.nodes, (time.perf_counter() - started) * 1000)
+
+    def _index_product(self, db_product: Product) -> None:
+        try:
+            product = ProductModel.from_orm(db_product)
+        except Exception as e:
+            logger.warning("Producto %s no indexado: %s", db_product.id, e)
+            return
+
+        weights: Dict[str, float] = {}
+        fields = {
+            "name": product.name,
+            "brand": product.brand,
+            "model": product.model,
+            "specifications": self._specifications_text(product.specifications),
+            "description": product.description,
+        }
+        for field, text in fields.items():
+            for token in tokenize(text):
+                weights[token] = max(weights.get(token, 0.0), self.FIELD_WEIGHTS[field])
+
+        # Normalizar especificaciones al indexar: formateadores y recomendaciones las leen de la caché
+        get_product_specs(product)
+        self._products[product.id] = product
+        self._folded_names[product.id] = fold_text(product.name)
+        self._name_tokens[product.id] = set(tokenize(product.name))
+        self._product_tokens[product.id] = weights
+        self._name_trie_dirty = True
+        for token, weight in weights.items():
+            if token not in self._postings:
+                self._tokens_dirty = True
+            self._postings.setdefault(token, {})[product.id] = weight
+
+    def _unindex_product(self, product_id: int) -> None:
+        for token in self._product_tokens.pop(product_id, {}):
+            posting = self._postings.get(token)
+            if posting is not None:
+                posting.pop(product_id, None)
+                if not posting:
+                    del self._postings[token]
+                    self._tokens_dirty = True
+        if self._products.pop(product_id, None) is not None:
+            self._name_trie_dirty = True
+        self._folded_names.pop(product_id, None)
+        self._name_tokens.pop(product_id, None)
+
+    @staticmethod
+    def _specifications_text(specifications: Optional[str]) -> str:
+        """Las especificaciones se guardan como JSON; se indexan solo sus valores"""
+        if not specifications:
+            return ""
+        try:
+            specs = json.loads(specifications)
+        except (TypeError, ValueError):
+            return str(specifications)
+        if isinstance(specs, dict):
+            return " ".join(str(value) for value in specs.values())
+        return str(specs)
+
+    # -------------------------------------------------------------- consultas
+
+    def _expand(self, token: str) -> Dict[int, float]:
+        """Productos que contienen el token (exacto o, si es largo, como prefijo) con su peso"""
+        if self._tokens_dirty:
+            self._sorted_tokens = sorted(self._postings)
+            self._tokens_dirty = False
+        if len(token) < self.MIN_PREFIX_LENGTH:
+            return dict(self._postings.get(token, {}))
+
+        matches: Dict[int, float] = {}
+        position = bisect.bisect_left(self._sorted_tokens, token)
+        while position < len(self._sorted_tokens) and self._sorted_tokens[position].startswith(token):
+            exact = self._sorted_tokens[position] == token
+            for product_id, weight in self._postings[self._sorted_tokens[position]].items():
+                # Las coincidencias por prefijo valen un poco menos que las exactas
+                score = weight if exact else weight * 0.8
+                if score > matches.get(product_id, 0.0):
+                    matches[product_id] = score
+            position += 1
+        return matches
+
+    def _query_tokens(self, text: str) -> List[str]:
+        return [token for token in dict.fromkeys(tokenize(text)) if token not in self.STOP_WORDS]
+
+    def search(self, db: Session, query: str, limit: int = 20, max_price: Optional[float] = None,
+               in_stock_only: bool = False) -> List[ProductModel]:
+        """
+        Buscar productos: primero los que contienen todos los términos; si no hay, los que
+        contienen al menos la mitad. Ordenados por relevancia y luego por rating
+        """
+        self.ensure_fresh(db)
+        with self._lock:
+            self.stats["queries"] += 1
+            tokens = self._query_tokens(query)
+            if not tokens:
+                return []
+
+            scores: Dict[int, float] = {}
+            hits: Dict[int, int] = {}
+            for token in tokens:
+                for product_id, weight in self._expand(token).items():
+                    scores[product_id] = scores.get(product_id, 0.0) + weight
+                    hits[product_id] = hits.get(product_id, 0) + 1
+
+            required = len(tokens)
+            if not any(count == required for count in hits.values()):
+                required = max(1, math.ceil(len(tokens) / 2))
+
+            candidates = []
+            for product_id, count in hits.items():
+                product = self._products[product_id]
+                if count < required:
+                    continue
+                if in_stock_only and product.stock_quantity <= 0:
+                    continue
+                if max_price and product.price > max_price:
+                    continue
+                candidates.append(product)
+
+            candidates.sort(key=lambda p: (-hits[p.id], -scores[p.id], -(p.rating or 0), p.id))
+            return candidates[:limit]
+
+    def list_products(self, db: Session, limit: Optional[int] = None) -> List[ProductModel]:
+        """Productos activos en orden de ID (equivalente a crud.get_products sin filtros)"""
+        self.ensure_fresh(db)
+        with self._lock:
+            products = [self._products[product_id] for product_id in sorted(self._products)]
+        return products[:limit] if limit else products
+
+    def match_product(self, text: str) -> Optional[ProductModel]:
+        """
+        Producto concreto mencionado en un texto libre, en una pasada por el trie y sin
+        consultar la base de datos (usa el catálogo cargado por la última ensure_fresh)
+        """
+        found = self._name_trie.match(tokenize(text))
+        return found[0] if found else None
+
+    def resolve_product(self, db: Session, text: str) -> Optional[ProductModel]:
+        """match_product con el índice actualizado"""
+        self.ensure_fresh(db)
+        return self.match_product(text)
+
+    def get_product(self, db: Session, product_id: int) -> Optional[ProductModel]:
+        """Producto activo por ID desde el índice"""
+        self.ensure_fresh(db)
+        return self._products.get(product_id)
+
+    def find_by_name(self, db: Session, product_name: str) -> Optional[ProductModel]:
+        """Producto cuyo nombre contiene el texto buscado o, si no, todas sus palabras clave"""
+        self.ensure_fresh(db)
+        with self._lock:
+            self.stats["queries"] += 1
+            folded = " ".join(fold_text(product_name).split())
+            if not folded:
+                return None
+
+            # Estrategia 1: el nombre contiene el texto completo
+            for product_id in sorted(self._folded_names):
+                if folded in self._folded_names[product_id]:
+                    return self._products[product_id]
+
+            # Estrategia 2: el nombre contiene todas las palabras clave (más de 2 letras)
+            keywords = [token for token in self._query_tokens(product_name) if len(token) > 2]
+            if not keywords:
+                return None
+            candidates: Optional[Set[int]] = None
+            for keyword in keywords:
+                matching = {product_id for product_id in self._expand(keyword)
+                            if self._matches_name(product_id, keyword)}
+                candidates = matching if candidates is None else candidates & matching
+                if not candidates:
+                    return None
+            best_id = min(candidates, key=lambda product_id: (-(self._products[product_id].rating or 0), product_id))
+            return self._products[best_id]
+
+    def find_similar(self, db: Session, product_name: str, limit: int = 3,
+                     brand: Optional[str] = None, product_type_keywords: Optional[List[str]] = None) -> List[ProductModel]:
+        """
+        Productos parecidos a un nombre: puntúa las palabras clave del nombre y la marca;
+        si nada coincide, devuelve los mejor valorados del tipo de producto
+        """
+        self.ensure_fresh(db)
+        with self._lock:
+            self.stats["queries"] += 1
+            common_words = {"para", "como", "mejor", "buena", "esta", "este", "cual", "tiene", "tienes"}
+            keywords = [token for token in self._query_tokens(product_name)
+                        if (len(token) >= 4 or any(char.isdigit() for char in token)) and token not in common_words]
+
+            scores: Dict[int, float] = {}
+            for keyword in keywords:
+                for product_id in self._expand(keyword):
+                    if self._matches_name(product_id, keyword):
+                        scores[product_id] = scores.get(product_id, 0.0) + 1.0
+            if brand:
+                brand_token = fold_text(brand)
+                for product_id in list(scores):
+                    if brand_token in self._name_tokens[product_id] or \
+                            fold_text(self._products[product_id].brand) == brand_token:
+                        scores[product_id] += 0.5
+
+            if not scores and product_type_keywords:
+                for keyword in product_type_keywords:
+                    for product_id in self._expand(fold_text(keyword)):
+                        if self._matches_name(product_id, fold_text(keyword)):
+                            scores[product_id] = 1.0
+
+            ranked = sorted(scores, key=lambda product_id: (-scores[product_id],
+                                                             -(self._products[product_id].rating or 0), product_id))
+            return [self._products[product_id] for product_id in ranked[:limit]]
+
+    def find_for_comparison(self, db: Session, product_names: Optional[List[str]] = None,
+                            brand_names: Optional[List[str]] = None, limit_per_item: int = 2) -> List[ProductModel]:
+        """Hasta limit_per_item productos por cada nombre o marca, sin duplicados"""
+        self.ensure_fresh(db)
+        with self._lock:
+            self.stats["queries"] += 1
+            found: Dict[int, ProductModel] = {}
+
+            def best_first(product_ids: Iterable[int], matches: Dict[int, int]) -> List[int]:
+                return sorted(
+                    (product_id for product_id in product_ids if product_id not in found),
+                    key=lambda product_id: (-matches.get(product_id, 0), -(self._products[product_id].rating or 0),
+                                            self._products[product_id].price or 0)
+                )[:limit_per_item]
+
+            for name_query in product_names or []:
+                matches: Dict[int, int] = {}
+                for keyword in self._query_tokens(name_query):
+                    for product_id in self._expand(keyword):
+                        if self._matches_name(product_id, keyword):
+                            matches[product_id] = matches.get(product_id, 0) + 1
+                for product_id in best_first(matches, matches):
+                    found[product_id] = self._products[product_id]
+
+            for brand_name in brand_names or []:
+                brand_folded = fold_text(brand_name.strip())
+                if not brand_folded:
+                    continue
+                brand_ids = [product_id for product_id, name in self._folded_names.items() if brand_folded in name]
+                for product_id in best_first(brand_ids, {}):
+                    found[product_id] = self._products[product_id]
+
+            return list(found.values())
+
+    def _matches_name(self, product_id: int, token: str) -> bool:
+        """El token aparece en el nombre del producto (exacto o como prefijo)"""
+        name_tokens = self._name_tokens.get(product_id, set())
+        if token in name_tokens:
+            return True
+        return len(token) >= self.MIN_PREFIX_LENGTH and any(name_token.startswith(token) for name_token in name_tokens)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Métricas del índice para monitoreo"""
+        return {
+            **self.stats,
+            "products": len(self._products),
+            "tokens": len(self._postings),
+            "name_trie_nodes": self._name_trie.nodes,
+            "pending_updates": len(self._pending_ids),
+            "loaded_at": self._loaded_at
+        }
+
+_catalog_index = CatalogIndex(ChatbotConfig.CATALOG_INDEX_TTL_SECONDS)
+
+def get_catalog_index() -> CatalogIndex:
+    """Índice compartido por todo el proceso"""
+    return _catalog_index
+
+# ------------------------------------------------------ invalidación por eventos
+
+@event.listens_for(Session, "after_flush")
+def _collect_changed_products(session: Session, flush_context) -> None:
+    """Anotar en la sesión los productos insertados, modificados o eliminados en este flush"""
+    changed = session.info.setdefault("catalog_changed_ids", set())
+    for instance in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(instance, Product) and instance.id is not None:
+            changed.add(instance.id)
+
+@event.listens_for(Session, "do_orm_execute")
+def _collect_bulk_changes(orm_execute_state) -> None:
+    """UPDATE/DELETE masivos sobre productos: no se conocen los IDs, recargar todo al confirmar"""
+    if (orm_execute_state.is_update or orm_execute_state.is_delete) and any(
+            mapper.class_ is Product for mapper in orm_execute_state.all_mappers):
+        orm_execute_state.session.info["catalog_full_reload"] = True
+
+@event.listens_for(Session, "after_commit")
+def _apply_product_changes(session: Session) -> None:
+    changed = session.info.pop("catalog_changed_ids", None)
+    if session.info.pop("catalog_full_reload", False):
+        _catalog_index.invalidate()
+    elif changed:
+        _catalog_index.invalidate(changed)
+
+@event.listens_for(Session, "after_rollback")
+def _discard_product_changes(session: Session) -> None:
+    session.info.pop("catalog_changed_ids", None)
+    session.info.pop("catalog_full_reload", None)
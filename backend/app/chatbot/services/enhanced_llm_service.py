@@ -4,7 +4,11 @@ Maneja comparaciones de productos, consultas tecnológicas y recomendaciones ava
 '''
 import logging
 from typing import List, Dict, Any, Optional
-import google.generativeai as genai
+from ..utils.response_cache import ResponseCache, get_response_cache
+from ..utils.streaming import generate_text_async
+from .llm_client import LLMClient, get_llm_client
+from ..utils.prompt_budget import PromptBuilder, data_row
+from .recommendation_ranker import RankedProduct
 
 logger = logging.getLogger(__name__)
 
@@ -13,21 +17,15 @@ class EnhancedLLMService:
     Servicio mejorado para interactuar con Gemini AI.
     Maneja comparaciones de productos y consultas tecnológicas avanzadas.
     """
-    def __init__(self, api_key: Optional[str] = None):
+    def __init__(self, api_key: Optional[str] = None, response_cache: Optional[ResponseCache] = None,
+                 llm_client: Optional[LLMClient] = None):
         self.api_key = api_key
-        if not api_key:
-            logger.warning("EnhancedLLMService inicializado sin API key. Funcionalidad limitada.")
-            self.model = None
-        else:
-            try:
-                genai.configure(api_key=api_key)
-                self.model = genai.GenerativeModel('gemini-1.5-flash')
-                logger.info("EnhancedLLMService inicializado correctamente con Gemini AI")
-            except Exception as e:
-                logger.error(f"Error inicializando Gemini AI: {e}")
-                self.model = None
-
-    def generate_comparison_response(
+        self.response_cache = response_cache or get_response_cache()
+        self.llm = llm_client or get_llm_client(api_key)
+        if not self.llm.available:
+            logger.warning("EnhancedLLMService sin Gemini disponible. Funcionalidad limitada.")
+
+    async def generate_comparison_response_async(
         self,
         item1_name: str,
         item2_name: str,
@@ -38,49 +36,46 @@ class EnhancedLLMService:
         """
         Genera una comparación detallada usando Gemini AI.
         """
-        logger.info(f"LLM Comparación: '{item1_name}' vs '{item2_name}' en atributos: {attributes}")
+        logger.debug("LLM Comparación: '%s' vs '%s' en atributos: %s", item1_name, item2_name, attributes)
+        
+        cache_key = self.response_cache.make_key(
+            "comparison", f"{item1_name} vs {item2_name}", sorted(attributes), item1_data, item2_data
+        )
+        cached = await self.response_cache.get_async(cache_key)
+        if cached:
+            return cached
         
-        if not self.model:
+        if not self.llm.available:
             return self._fallback_comparison_response(item1_name, item2_name, attributes)
         
         try:
             prompt = self._build_comparison_prompt(item1_name, item2_name, attributes, item1_data, item2_data)
-            response = self.model.generate_content(prompt)
-            return response.text.strip()
+            answer = (await generate_text_async(self.llm, prompt)).strip()
+            await self.response_cache.set_async(cache_key, answer)
+            return answer
             
         except Exception as e:
-            logger.error(f"Error en comparación LLM: {e}")
+            logger.error("Error en comparación LLM: %s", e)
             return self._fallback_comparison_response(item1_name, item2_name, attributes)
     
     def _build_comparison_prompt(self, item1_name: str, item2_name: str, attributes: List[str], 
                                 item1_data: Optional[Dict[str, Any]], item2_data: Optional[Dict[str, Any]]) -> str:
         """Construir prompt especializado para comparación de productos tecnológicos"""
+        aspects = ', '.join(attributes) if attributes and 'caracteristicas' not in attributes else 'Todas las características relevantes'
         
-        prompt = f"""
-Eres un experto consultor en tecnología de GRUPO INFOTEC, empresa líder en equipos tecnológicos en Perú.
+        # Una fila compacta por producto (clave: valor | ...) en vez de viñetas por atributo
+        rows = [f"{name.upper()}: {data_row(data)}" for name, data in ((item1_name, item1_data), (item2_name, item2_data)) if data]
+        
+        builder = PromptBuilder("comparison")
+        builder.add(f"""Eres un experto consultor en tecnología de GRUPO INFOTEC, empresa líder en equipos tecnológicos en Perú.
 
 TAREA: Compara detalladamente '{item1_name}' con '{item2_name}' para ayudar a un cliente a tomar la mejor decisión.
 
 ASPECTOS A COMPARAR:
-{', '.join(attributes) if attributes and 'caracteristicas' not in attributes else 'Todas las características relevantes'}
-
-INFORMACIÓN DISPONIBLE:
-"""
-        
-        if item1_data:
-            prompt += f"\n📊 DATOS DE {item1_name.upper()}:\n"
-            for key, value in item1_data.items():
-                if value and value != "N/A":
-                    prompt += f"• {key.replace('_', ' ').title()}: {value}\n"
-        
-        if item2_data:
-            prompt += f"\n📊 DATOS DE {item2_name.upper()}:\n"
-            for key, value in item2_data.items():
-                if value and value != "N/A":
-                    prompt += f"• {key.replace('_', ' ').title()}: {value}\n"
-        
-        prompt += f"""
-
+{aspects}
+""")
+        builder.add_rows("INFORMACIÓN DISPONIBLE:", rows, min_rows=len(rows))
+        builder.add(f"""
 INSTRUCCIONES:
 1. Proporciona una comparación clara y estructurada
 2. Destaca las ventajas y desventajas de cada producto
@@ -98,9 +93,8 @@ Formato de respuesta:
 
 💡 **Recomendación:**
 [Sugerencia según tipo de usuario]
-"""
-        
-        return prompt
+""")
+        return builder.build()
     
     def _fallback_comparison_response(self, item1_name: str, item2_name: str, attributes: List[str]) -> str:
         """Respuesta de respaldo cuando no está disponible el LLM"""
@@ -120,325 +114,124 @@ Lo siento, en este momento tengo limitaciones para realizar una comparación det
 
 ¿Te gustaría que busque información específica de alguno de estos productos?"""
 
-    def recommend_top_products(
+    async def explain_recommendations_async(
         self,
-        candidate_products: List[Dict[str, Any]],
-        user_query: str,
-        category: Optional[str] = None,
-        use_case: Optional[str] = None,
-        count: int = 3
-    ) -> str:
-        """
-        Genera recomendaciones inteligentes de productos usando IA
-        """
-        logger.info(f"Generando recomendaciones IA para {len(candidate_products)} productos")
-        
-        if not self.model:
-            return self._fallback_recommendation_response(candidate_products, user_query, count)
-        
-        try:
-            prompt = self._build_recommendation_prompt(
-                candidate_products, user_query, category, use_case, count
-            )
-            response = self.model.generate_content(prompt)
-            return response.text.strip()
-            
-        except Exception as e:
-            logger.error(f"Error generando recomendaciones con IA: {e}")
-            return self._fallback_recommendation_response(candidate_products, user_query, count)
-
-    def _build_recommendation_prompt(
-        self,
-        products: List[Dict[str, Any]],
-        user_query: str,
-        category: Optional[str],
-        use_case: Optional[str],
-        count: int
-    ) -> str:
-        """Construir prompt para recomendaciones"""
-        
-        # Formatear productos para el prompt
-        products_text = ""
-        for i, product in enumerate(products[:50], 1):  # Máximo 50 productos para análisis
-            specs_text = ""
-            if product.get("specifications"):
-                specs = product["specifications"]
-                if isinstance(specs, dict):
-                    specs_text = ", ".join([f"{k}: {v}" for k, v in specs.items() if v])
-                else:
-                    specs_text = str(specs)
-            
-            products_text += f"""
-{i}. {product.get('name', 'N/A')}
-   - Precio: S/ {product.get('price', 0)}
-   - Marca: {product.get('brand', 'N/A')}
-   - Rating: {product.get('rating', 'N/A')}/5
-   - Stock: {product.get('stock_quantity', 0)}
-   - Descripción: {product.get('description', 'N/A')}
-   - Especificaciones: {specs_text or 'N/A'}
-"""
-
-        context_info = ""
-        if category:
-            context_info += f"Categoría solicitada: {category}\n"
-        if use_case:
-            context_info += f"Caso de uso: {use_case}\n"
-
-        return f"""Eres InfoBot de GRUPO INFOTEC, especialista en tecnología. Analiza estos {len(products)} productos y recomienda los {count} mejores para la consulta del usuario.
-
-CONSULTA DEL USUARIO: "{user_query}"
-{context_info}
-
-PRODUCTOS DISPONIBLES:
-{products_text}
-
-INSTRUCCIONES:
-1. Analiza TODOS los productos considerando: precio, especificaciones, rating, stock, relación calidad-precio
-2. Selecciona los {count} mejores productos que respondan mejor a la consulta
-3. Ordénalos del mejor al menos recomendado
-4. Para cada recomendación incluye:
-   - Nombre del producto exacto
-   - Precio
-   - 2-3 razones principales por las que lo recomiendas
-   - Un beneficio clave específico
-
-FORMATO DE RESPUESTA (máximo 150 palabras):
-🎯 **Mis {count} mejores recomendaciones:**
-
-**1. [Nombre exacto]** (S/ [precio])
-✨ [Razón principal] - [Beneficio específico]
-
-**2. [Nombre exacto]** (S/ [precio])  
-✨ [Razón principal] - [Beneficio específico]
-
-**3. [Nombre exacto]** (S/ [precio])
-✨ [Razón principal] - [Beneficio específico]
-
-💡 ¿Te interesa alguna? ¡Puedo darte más detalles! 😊
-
-IMPORTANTE: 
-- Solo recomienda productos de la lista proporcionada
-- Usa los nombres exactos de los productos
-- Sé conciso pero informativo
-- Responde como InfoBot de GRUPO INFOTEC
-"""
-
-    def _fallback_recommendation_response(
-        self,
-        products: List[Dict[str, Any]],
-        user_query: str,
-        count: int
-    ) -> str:
-        """Respuesta de respaldo para recomendaciones"""
-        # Ordenar productos por rating y precio para dar mejores primero
-        sorted_products = sorted(
-            products, 
-            key=lambda x: (x.get('rating', 0) or 0, -(x.get('price', 0) or 0)), 
-            reverse=True
-        )
-        
-        response = f"🎯 **Mis {count} mejores recomendaciones:**\n\n"
-        
-        for i, product in enumerate(sorted_products[:count], 1):
-            name = product.get('name', 'Producto')
-            price = product.get('price', 0)
-            brand = product.get('brand', '')
-            rating = product.get('rating', 0)
-            
-            brand_text = f" de {brand}" if brand else ""
-            rating_text = f" - Rating {rating}/5" if rating else ""
-            
-            response += f"**{i}. {name}** (S/ {price})\n"
-            response += f"✨ Excelente opción{brand_text}{rating_text}\n\n"
-        
-        response += "💡 ¿Te interesa alguna? ¡Puedo darte más detalles! 😊"
-        return response
-
-    def recommend_top_products_with_context(
-        self,
-        candidate_products: List[Dict[str, Any]],
+        ranked_products: List[RankedProduct],
         user_query: str,
         conversation_context: str,
         category: Optional[str] = None,
-        use_case: Optional[str] = None,
-        count: int = 3
-    ) -> tuple[str, List[str]]:
+        use_case: Optional[str] = None
+    ) -> str:
         """
-        Genera recomendaciones inteligentes con contexto conversacional y devuelve nombres de productos
+        Redacta la explicación de los productos ya elegidos por el ranking local.
+        La IA no selecciona: solo recibe los IDs y datos compactos del top-k.
         """
-        logger.info(f"Generando recomendaciones IA con contexto para {len(candidate_products)} productos")
+        logger.debug("Explicando %s recomendaciones con IA", len(ranked_products))
         
-        if not self.model:
-            return self._fallback_recommendation_with_context(candidate_products, user_query, count)
+        if not self.llm.available:
+            return self._fallback_explanation(ranked_products, use_case)
         
         try:
-            prompt = self._build_context_recommendation_prompt(
-                candidate_products, user_query, conversation_context, category, use_case, count
-            )
-            response = self.model.generate_content(prompt)
-            
-            # Extraer nombres de productos de la respuesta
-            product_names = self._extract_product_names_from_response(response.text, candidate_products)
-            
-            return response.text.strip(), product_names
-            
+            prompt = self._build_explanation_prompt(ranked_products, user_query, conversation_context, category, use_case)
+            response_text = await generate_text_async(self.llm, prompt)
+            return response_text.strip()
         except Exception as e:
-            logger.error(f"Error generando recomendaciones con contexto: {e}")
-            return self._fallback_recommendation_with_context(candidate_products, user_query, count)
+            logger.error("Error explicando recomendaciones: %s", e)
+            return self._fallback_explanation(ranked_products, use_case)
 
-    def _build_context_recommendation_prompt(
+    def _build_explanation_prompt(
         self,
-        products: List[Dict[str, Any]],
+        ranked_products: List[RankedProduct],
         user_query: str,
         conversation_context: str,
         category: Optional[str],
-        use_case: Optional[str],
-        count: int
+        use_case: Optional[str]
     ) -> str:
-        """Construir prompt para recomendaciones con contexto conversacional"""
-        
-        # Formatear productos para el prompt
-        products_text = ""
-        for i, product in enumerate(products[:50], 1):  # Máximo 50 productos para análisis
-            specs_text = ""
-            if product.get("specifications"):
-                specs = product["specifications"]
-                if isinstance(specs, dict):
-                    specs_text = ", ".join([f"{k}: {v}" for k, v in specs.items() if v])
-                else:
-                    specs_text = str(specs)
-            
-            products_text += f"""
-{i}. {product.get('name', 'N/A')}
-   - Precio: S/ {product.get('price', 0)}
-   - Marca: {product.get('brand', 'N/A')}
-   - Rating: {product.get('rating', 'N/A')}/5
-   - Stock: {product.get('stock_quantity', 0)}
-   - Descripción: {product.get('description', 'N/A')}
-   - Especificaciones: {specs_text or 'N/A'}
-"""
-
+        """Prompt con solo los productos elegidos (una línea de datos por producto, en orden)"""
+        count = len(ranked_products)
         context_info = ""
         if category:
             context_info += f"Categoría solicitada: {category}\n"
         if use_case:
             context_info += f"Caso de uso: {use_case}\n"
 
-        return f"""Eres InfoBot de GRUPO INFOTEC, especialista en tecnología. Analiza estos {len(products)} productos y recomienda los {count} mejores considerando el CONTEXTO COMPLETO de la conversación.
-
-CONTEXTO DE LA CONVERSACIÓN:
-{conversation_context}
-
+        builder = PromptBuilder("recommendation_explanation")
+        builder.add(f"Eres InfoBot de GRUPO INFOTEC, especialista en tecnología. Ya seleccionamos los {count} mejores productos para el usuario; explica por qué cada uno le conviene.\n\nCONTEXTO DE LA CONVERSACIÓN:")
+        builder.add_context(conversation_context)
+        builder.add(f"""
 CONSULTA ACTUAL: "{user_query}"
-{context_info}
-
-PRODUCTOS DISPONIBLES:
-{products_text}
-
-INSTRUCCIONES CRÍTICAS:
-1. LEE TODO EL CONTEXTO conversacional para entender las necesidades específicas del usuario
-2. Si mencionó un uso específico (diseño, gaming, trabajo, etc.), PRIORIZA productos adecuados para esa tarea
-3. Analiza TODOS los productos considerando: especificaciones técnicas, precio, rating, stock
-4. Selecciona los {count} mejores productos que respondan al contexto completo
-5. Ordénalos del mejor al menos recomendado
-
+{context_info}""")
+        # Todos los elegidos son obligatorios: la respuesta debe mencionarlos en orden
+        builder.add_rows("PRODUCTOS SELECCIONADOS (en orden de recomendación):",
+                         (f"{i}. {item.compact_facts()}" for i, item in enumerate(ranked_products, 1)),
+                         min_rows=count)
+        builder.add(f"""
 FORMATO DE RESPUESTA (máximo 150 palabras):
 🎯 **Mis {count} mejores recomendaciones para [mencionar uso específico si aplica]:**
 
 **1. [Nombre EXACTO del producto]** (S/ [precio])
 ✨ [Razón específica para el uso mencionado] - [Beneficio técnico específico]
 
-**2. [Nombre EXACTO del producto]** (S/ [precio])  
-✨ [Razón específica para el uso mencionado] - [Beneficio técnico específico]
-
-**3. [Nombre EXACTO del producto]** (S/ [precio])
-✨ [Razón específica para el uso mencionado] - [Beneficio técnico específico]
+(repite el formato para cada producto)
 
 💡 ¿Te interesa alguna? ¡Puedo darte más detalles! 😊
 
-IMPORTANTE: 
-- Solo recomienda productos de la lista proporcionada
-- Usa los nombres EXACTOS de los productos
-- Considera el contexto conversacional completo
-- Sé específico sobre por qué cada producto es adecuado para el uso mencionado
-"""
-
-    def _extract_product_names_from_response(self, response_text: str, candidate_products: List[Dict[str, Any]]) -> List[str]:
-        """Extraer nombres de productos específicos de la respuesta de la IA"""
-        product_names = []
-        
-        # Buscar nombres de productos en la respuesta
-        for product in candidate_products:
-            product_name = product.get('name', '')
-            if product_name and product_name.lower() in response_text.lower():
-                product_names.append(product_name)
-                if len(product_names) >= 5:  # Máximo 5 productos
-                    break
-        
-        return product_names
+IMPORTANTE:
+- Mantén el orden y los nombres EXACTOS de la lista; no agregues otros productos
+- Usa solo los datos proporcionados
+""")
+        return builder.build()
 
-    def _fallback_recommendation_with_context(
-        self,
-        products: List[Dict[str, Any]],
-        user_query: str,
-        count: int
-    ) -> tuple[str, List[str]]:
-        """Respuesta de respaldo para recomendaciones con contexto"""
-        # Ordenar productos por rating y precio para dar mejores primero
-        sorted_products = sorted(
-            products, 
-            key=lambda x: (x.get('rating', 0) or 0, -(x.get('price', 0) or 0)), 
-            reverse=True
-        )
+    def _fallback_explanation(self, ranked_products: List[RankedProduct], use_case: Optional[str]) -> str:
+        """Explicación de respaldo que respeta el orden del ranking"""
+        use_case_text = f" para {use_case}" if use_case else ""
+        response = f"🎯 **Mis {len(ranked_products)} mejores recomendaciones{use_case_text}:**\n\n"
         
-        response = f"🎯 **Mis {count} mejores recomendaciones:**\n\n"
-        product_names = []
-        
-        for i, product in enumerate(sorted_products[:count], 1):
-            name = product.get('name', 'Producto')
-            price = product.get('price', 0)
-            brand = product.get('brand', '')
-            rating = product.get('rating', 0)
-            
-            brand_text = f" de {brand}" if brand else ""
-            rating_text = f" - Rating {rating}/5" if rating else ""
-            
-            response += f"**{i}. {name}** (S/ {price})\n"
-            response += f"✨ Excelente opción{brand_text}{rating_text}\n\n"
+        for i, item in enumerate(ranked_products, 1):
+            product = item.product
+            summary = item.specs.summary()
+            rating_text = f" - Rating {product.rating}/5" if product.rating else ""
             
-            product_names.append(name)
+            response += f"**{i}. {product.name}** (S/ {product.price})\n"
+            response += f"✨ {summary or 'Excelente relación calidad-precio'}{rating_text}\n\n"
         
         response += "💡 ¿Te interesa alguna? ¡Puedo darte más detalles! 😊"
-        return response, product_names
+        return response
 
-    def answer_tech_question(self, question: str, context: str = "") -> str:
+    async def answer_tech_question_async(self, question: str, context: str = "") -> str:
         """
         Responde preguntas generales sobre tecnología usando IA.
         """
-        logger.info(f"Consulta tecnológica: {question[:50]}...")
+        logger.debug("Consulta tecnológica: %s...", question[:50])
+        
+        cache_key = self.response_cache.make_key("tech", question, context)
+        cached = await self.response_cache.get_async(cache_key)
+        if cached:
+            return cached
         
-        if not self.model:
+        if not self.llm.available:
             return self._fallback_tech_response(question)
         
         try:
             prompt = self._build_tech_question_prompt(question, context)
-            response = self.model.generate_content(prompt)
-            return response.text.strip()
+            answer = (await generate_text_async(self.llm, prompt)).strip()
+            await self.response_cache.set_async(cache_key, answer)
+            return answer
             
         except Exception as e:
-            logger.error(f"Error en consulta tecnológica: {e}")
+            logger.error("Error en consulta tecnológica: %s", e)
             return self._fallback_tech_response(question)
 
     def _build_tech_question_prompt(self, question: str, context: str) -> str:
         """Construir prompt para consultas tecnológicas"""
-        
-        prompt = f"""
-Eres InfoBot, el asistente especializado en tecnología de GRUPO INFOTEC, empresa líder en Perú.
+        builder = PromptBuilder("tech_question")
+        builder.add(f"""Eres InfoBot, el asistente especializado en tecnología de GRUPO INFOTEC, empresa líder en Perú.
 
 CONSULTA DEL CLIENTE: "{question}"
 
-CONTEXTO ADICIONAL: {context if context else "Ninguno"}
-
+CONTEXTO ADICIONAL:""")
+        builder.add_context(context, empty="Ninguno")
+        builder.add("""
 CONOCIMIENTO BASE:
 - Eres experto en laptops, PCs, componentes, hardware y software
 - Tienes conocimiento actualizado sobre marcas como HP, Dell, Asus, Lenovo, Acer, MSI
@@ -457,9 +250,8 @@ INSTRUCCIONES:
 IMPORTANTE: No inventes especificaciones exactas de productos. Si necesitas datos específicos, sugiere buscar productos en nuestra tienda.
 
 Responde como InfoBot de GRUPO INFOTEC:
-"""
-        
-        return prompt
+""")
+        return builder.build()
 
     def _fallback_tech_response(self, question: str) -> str:
         """Respuesta de respaldo para consultas tecnológicas"""
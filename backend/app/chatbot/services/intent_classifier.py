@@ -3,37 +3,75 @@
 Clasificador de intenciones usando IA para determinar el tipo de consulta del usuario
 """
 import logging
-import google.generativeai as genai
 from typing import Dict, Any, Optional
+from ..core.config import ChatbotConfig
+from .rule_based_classifier import RuleBasedIntentClassifier
+from ..utils.prompt_budget import PromptBuilder
+from .llm_client import LLMClient, get_llm_client
 
 logger = logging.getLogger(__name__)
 
 class IntentClassifier:
     """Clasificador de intenciones usando Gemini AI"""
     
-    def __init__(self, api_key: str):
-        """Inicializar el clasificador con la API key"""
+    # Categorías de intención compartidas por el prompt de clasificación y el de llamada única
+    INTENT_CATEGORIES = """
+1. **pregunta_tecnologica**: Preguntas generales sobre tecnología, comparaciones teóricas entre marcas/componentes, diferencias técnicas SIN mencionar productos específicos del catálogo
+   - Ejemplos: "qué es mejor AMD o Intel", "diferencia entre SSD y HDD", "cuál procesador es mejor"
+   - NO incluye: preguntas sobre productos específicos de la tienda
+
+2. **buscar_producto**: Búsqueda de productos del catálogo, preguntas sobre categorías específicas
+   - Ejemplos: "busco una laptop", "qué laptops HP tienen", "necesito una computadora"
+   - Incluye: búsquedas directas de productos por categoría o marca
+
+3. **recomendar_producto**: Solicitudes de recomendaciones inteligentes de productos, especialmente después de ver opciones
+   - Ejemplos: "¿Cuál recomiendas?", "que me recomiendas", "cuál es la mejor laptop que tienes", "cuál me conviene más"
+   - Incluye: cualquier pregunta pidiendo recomendaciones específicas
+
+4. **comparar_productos**: Comparación entre productos específicos del catálogo mencionados por nombre
+   - Ejemplos: "compara laptop Dell XPS vs HP Spectre", "diferencias entre estas dos PCs específicas"
+
+5. **ver_especificaciones**: Solicitud de especificaciones técnicas de un producto específico mencionado
+   - Ejemplos: "especificaciones del modelo Lenovo V15", "detalles técnicos de esta laptop"
+   - Incluye: cualquier solicitud para ver especificaciones de un producto previamente listado como "la segunda" o "el número 2"
+
+6. **agregar_carrito**: Intención explícita de comprar o agregar productos al carrito
+   - Ejemplos: "quiero comprar este", "agrega al carrito", "lo llevo"
+
+7. **conversacion_general**: Saludos, despedidas, agradecimientos, consultas generales no técnicas
+   - Ejemplos: "hola", "gracias", "cómo estás", "información de la empresa"
+"""
+
+    CLASSIFICATION_RULES = """
+IMPORTANTE:
+- Para preguntas como "qué es mejor X o Y" donde X,Y son marcas/componentes → "pregunta_tecnologica"
+- Para "busco/quiero/necesito + producto" → "buscar_producto"  
+- Para "cuál es la mejor laptop que tienes" → "recomendar_producto"
+- Para "¿Cuál recomiendas?" → "recomendar_producto"
+- Para "que me recomiendas" → "recomendar_producto"
+- Para "cuáles son las especificaciones de la segunda" → "ver_especificaciones"
+- Para referencias como "la segunda", "el número 2", etc. → "ver_especificaciones"
+- Confidence: 0.9+ para casos claros, 0.7-0.9 para casos moderados, <0.7 para casos ambiguos
+- should_show_products: false para pregunta_tecnologica y conversacion_general, true para el resto
+"""
+    
+    # Intenciones que se pueden responder directamente en la llamada única (no requieren catálogo)
+    DIRECT_ANSWER_INTENTS = ("pregunta_tecnologica", "conversacion_general")
+    VALID_INTENTS = (
+        "pregunta_tecnologica", "buscar_producto", "recomendar_producto", "comparar_productos",
+        "ver_especificaciones", "agregar_carrito", "conversacion_general"
+    )
+    SINGLE_CALL_GENERATION_CONFIG = {"response_mime_type": "application/json"}
+    
+    def __init__(self, api_key: str, llm_client: Optional[LLMClient] = None):
+        """Inicializar el clasificador con la API key (o el cliente compartido de Gemini)"""
         self.api_key = api_key
-        self.model = None
-        self._initialize_model()
-        
-    def _initialize_model(self):
-        """Inicializar el modelo de Gemini"""
-        try:
-            genai.configure(api_key=self.api_key)
-            # Intentar primero con 'gemini-1.5-flash', y si falla, usar 'gemini-pro'
-            try:
-                self.model = genai.GenerativeModel('gemini-1.5-flash')
-                logger.info("Clasificador de intenciones inicializado con gemini-1.5-flash")
-            except Exception as model_error:
-                logger.warning(f"Error al inicializar gemini-1.5-flash: {model_error}. Intentando con gemini-pro...")
-                self.model = genai.GenerativeModel('gemini-pro')
-                logger.info("Clasificador de intenciones inicializado con gemini-pro como fallback")
-            
-            logger.info("Clasificador de intenciones inicializado correctamente")
-        except Exception as e:
-            logger.error(f"Error inicializando clasificador: {e}")
-            self.model = None
+        self.llm = llm_client or get_llm_client(api_key)
+        # Pre-clasificador por reglas: evita la llamada a Gemini en mensajes obvios
+        self.rule_classifier = RuleBasedIntentClassifier(self._fallback_classification)
+        self.fast_path_threshold = ChatbotConfig.INTENT_FAST_PATH_THRESHOLD
+        self.stats = {"fast_path": 0, "llm": 0, "fallback": 0}
+        self.direct_answers = 0
     
     def classify_intent(self, message: str, conversation_history: Optional[list] = None) -> Dict[str, Any]:
         """
@@ -47,23 +85,110 @@ class IntentClassifier:
             "should_show_products": bool  # Si debe mostrar productos
         }
         """
-        if not self.model:
+        fast_result = self._try_fast_path(message, conversation_history)
+        if fast_result:
+            return fast_result
+        
+        if not self.llm.available:
+            self.stats["fallback"] += 1
             return self._fallback_classification(message, conversation_history)
         
         try:
             prompt = self._build_classification_prompt(message, conversation_history)
-            response = self.model.generate_content(prompt)
+            response_text = self.llm.generate(prompt)
+            self.stats["llm"] += 1
             
             # Parsear la respuesta de Gemini
-            return self._parse_classification_response(response.text, message, conversation_history)
+            return self._parse_classification_response(response_text, message, conversation_history)
             
         except Exception as e:
-            logger.error(f"Error en clasificación de intención: {e}")
+            logger.error("Error en clasificación de intención: %s", e)
+            self.stats["fallback"] += 1
+            return self._fallback_classification(message, conversation_history)
+
+    async def classify_intent_async(self, message: str, conversation_history: Optional[list] = None) -> Dict[str, Any]:
+        """Versión asíncrona de classify_intent: no bloquea el event loop mientras Gemini responde"""
+        fast_result = self._try_fast_path(message, conversation_history)
+        if fast_result:
+            return fast_result
+
+        if not self.llm.available:
+            self.stats["fallback"] += 1
             return self._fallback_classification(message, conversation_history)
+
+        try:
+            prompt = self._build_classification_prompt(message, conversation_history)
+            response_text = await self.llm.generate_async(prompt)
+            self.stats["llm"] += 1
+
+            return self._parse_classification_response(response_text, message, conversation_history)
+
+        except Exception as e:
+            logger.error("Error en clasificación de intención: %s", e)
+            self.stats["fallback"] += 1
+            return self._fallback_classification(message, conversation_history)
+
+    async def classify_and_answer_async(self, message: str, conversation_history: Optional[list] = None,
+                                        context_str: str = "") -> Dict[str, Any]:
+        """
+        Modo de llamada única: intención, entidades y, para intenciones simples
+        (DIRECT_ANSWER_INTENTS), la respuesta final en un solo viaje a Gemini.
+        Devuelve el mismo formato que classify_intent más la clave "answer" (o None).
+        Si la respuesta no se puede parsear se usa el flujo en dos pasos (classify_intent_async).
+        """
+        fast_result = self._try_fast_path(message, conversation_history)
+        if fast_result:
+            return fast_result
+        
+        if not self.llm.available:
+            self.stats["fallback"] += 1
+            return self._fallback_classification(message, conversation_history)
+        
+        try:
+            prompt = self._build_single_call_prompt(message, conversation_history, context_str)
+            response_text = await self.llm.generate_async(
+                prompt, generation_config=self.SINGLE_CALL_GENERATION_CONFIG
+            )
+        except Exception as e:
+            logger.error("Error en clasificación de llamada única: %s", e)
+            self.stats["fallback"] += 1
+            return self._fallback_classification(message, conversation_history)
+        
+        result = self._parse_single_call_response(response_text)
+        if result is None:
+            # El flujo en dos pasos cuenta el mensaje (llm o fallback): aquí no se suma
+            logger.warning("Respuesta de llamada única inválida, usando flujo en dos pasos")
+            return await self.classify_intent_async(message, conversation_history)
+        self.stats["llm"] += 1
+        return result
     
-    def _build_classification_prompt(self, message: str, conversation_history: Optional[list] = None) -> str:
-        """Construir prompt para clasificación de intenciones"""
+    def _try_fast_path(self, message: str, conversation_history: Optional[list] = None) -> Optional[Dict[str, Any]]:
+        """Devolver la clasificación por reglas si supera el umbral de confianza"""
+        try:
+            result = self.rule_classifier.classify(message, conversation_history)
+        except Exception as e:
+            logger.error("Error en clasificación por reglas: %s", e)
+            return None
         
+        if result and result["confidence"] >= self.fast_path_threshold:
+            self.stats["fast_path"] += 1
+            logger.debug("Intención resuelta por reglas: %s", result["intent"])
+            return result
+        return None
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Contadores de mensajes por ruta de clasificación (reglas, Gemini, respaldo)"""
+        total = sum(self.stats.values())
+        return {
+            **self.stats,
+            "total": total,
+            "fast_path_ratio": round(self.stats["fast_path"] / total, 3) if total else 0.0,
+            "direct_answers": self.direct_answers,
+            "threshold": self.fast_path_threshold
+        }
+    
+    def _build_history_context(self, conversation_history: Optional[list] = None) -> str:
+        """Resumir los últimos mensajes para dar contexto al clasificador"""
         context = ""
         if conversation_history:
             # Tomar últimos 3 mensajes para contexto
@@ -77,42 +202,22 @@ class IntentClassifier:
                     bot_msg = msg["bot_response"][:100] + "..." if len(msg["bot_response"]) > 100 else msg["bot_response"]
                     context_parts.append(f"Bot: {bot_msg}")
             context = "\n".join(context_parts)
-        prompt = f"""
-Eres un clasificador de intenciones para un chatbot de venta de productos tecnológicos (GRUPO INFOTEC).
+        return context
+    
+    def _build_classification_prompt(self, message: str, conversation_history: Optional[list] = None) -> str:
+        """Construir prompt para clasificación de intenciones"""
+        context = self._build_history_context(conversation_history)
+        builder = PromptBuilder("intent_classification")
+        builder.add(f"""Eres un clasificador de intenciones para un chatbot de venta de productos tecnológicos (GRUPO INFOTEC).
 
 MENSAJE DEL USUARIO: "{message}"
 
-CONTEXTO PREVIO:
-{context if context else "Sin contexto previo"}
-
+CONTEXTO PREVIO:""")
+        builder.add_context(context)
+        builder.add(f"""
 INSTRUCCIONES:
 Analiza el mensaje y clasifícalo en UNA de estas categorías:
-
-1. **pregunta_tecnologica**: Preguntas generales sobre tecnología, comparaciones teóricas entre marcas/componentes, diferencias técnicas SIN mencionar productos específicos del catálogo
-   - Ejemplos: "qué es mejor AMD o Intel", "diferencia entre SSD y HDD", "cuál procesador es mejor"
-   - NO incluye: preguntas sobre productos específicos de la tienda
-
-2. **buscar_producto**: Búsqueda de productos del catálogo, preguntas sobre categorías específicas
-   - Ejemplos: "busco una laptop", "qué laptops HP tienen", "necesito una computadora"
-   - Incluye: búsquedas directas de productos por categoría o marca
-
-3. **recomendar_producto**: Solicitudes de recomendaciones inteligentes de productos, especialmente después de ver opciones
-   - Ejemplos: "¿Cuál recomiendas?", "que me recomiendas", "cuál es la mejor laptop que tienes", "cuál me conviene más"
-   - Incluye: cualquier pregunta pidiendo recomendaciones específicas
-
-4. **comparar_productos**: Comparación entre productos específicos del catálogo mencionados por nombre
-   - Ejemplos: "compara laptop Dell XPS vs HP Spectre", "diferencias entre estas dos PCs específicas"
-
-5. **ver_especificaciones**: Solicitud de especificaciones técnicas de un producto específico mencionado
-   - Ejemplos: "especificaciones del modelo Lenovo V15", "detalles técnicos de esta laptop"
-   - Incluye: cualquier solicitud para ver especificaciones de un producto previamente listado como "la segunda" o "el número 2"
-
-6. **agregar_carrito**: Intención explícita de comprar o agregar productos al carrito
-   - Ejemplos: "quiero comprar este", "agrega al carrito", "lo llevo"
-
-7. **conversacion_general**: Saludos, despedidas, agradecimientos, consultas generales no técnicas
-   - Ejemplos: "hola", "gracias", "cómo estás", "información de la empresa"
-
+{self.INTENT_CATEGORIES}
 RESPONDE EXACTAMENTE en este formato JSON:
 {{
   "intent": "categoria_detectada",
@@ -125,20 +230,85 @@ RESPONDE EXACTAMENTE en este formato JSON:
     "components": ["componente1"]
   }}
 }}
+{self.CLASSIFICATION_RULES}""")
+        return builder.build()
+    
+    def _build_single_call_prompt(self, message: str, conversation_history: Optional[list] = None,
+                                  context_str: str = "") -> str:
+        """Construir prompt de llamada única (clasificación + entidades + respuesta)"""
+        context = context_str or self._build_history_context(conversation_history)
+        company_info = ChatbotConfig.COMPANY_INFO
+        builder = PromptBuilder("single_call")
+        builder.add(f"""Eres InfoBot, el asistente virtual de {company_info['nombre']} (tienda peruana de tecnología).
+En UNA sola respuesta debes clasificar el mensaje, extraer sus entidades y, solo para
+intenciones simples, redactar la respuesta final al cliente.
 
-IMPORTANTE:
-- Para preguntas como "qué es mejor X o Y" donde X,Y son marcas/componentes → "pregunta_tecnologica"
-- Para "busco/quiero/necesito + producto" → "buscar_producto"  
-- Para "cuál es la mejor laptop que tienes" → "recomendar_producto"
-- Para "¿Cuál recomiendas?" → "recomendar_producto"
-- Para "que me recomiendas" → "recomendar_producto"
-- Para "cuáles son las especificaciones de la segunda" → "ver_especificaciones"
-- Para referencias como "la segunda", "el número 2", etc. → "ver_especificaciones"
-- Confidence: 0.9+ para casos claros, 0.7-0.9 para casos moderados, <0.7 para casos ambiguos
-- should_show_products: false para pregunta_tecnologica y conversacion_general, true para el resto
-"""
-        
-        return prompt
+MENSAJE DEL USUARIO: "{message}"
+
+CONTEXTO PREVIO:""")
+        builder.add_context(context)
+        builder.add(f"""
+PASO 1 - Clasifica el mensaje en UNA de estas categorías:
+{self.INTENT_CATEGORIES}{self.CLASSIFICATION_RULES}
+PASO 2 - Extrae entidades (null si no aparecen):
+- producto: uno de {list(ChatbotConfig.PRODUCT_PATTERNS.keys())}
+- marca: una de {ChatbotConfig.BRANDS}
+- uso: uno de {list(ChatbotConfig.USE_CASES.keys())}
+- presupuesto: monto máximo en soles (número entero)
+- numero_producto: posición del producto mencionado en la lista anterior ("la segunda" → 2)
+
+PASO 3 - Solo si la intención es pregunta_tecnologica o conversacion_general, escribe en "answer"
+la respuesta final: amigable y profesional, máximo 150 palabras, emojis moderados, sin inventar
+especificaciones de productos, terminando con una invitación a seguir conversando.
+Especialidades: {', '.join(company_info['especialidades'])}
+Servicios: {', '.join(company_info['servicios'])}
+Para cualquier otra intención "answer" debe ser null.
+
+RESPONDE SOLO con este JSON:
+{{
+  "intent": "categoria_detectada",
+  "confidence": 0.95,
+  "reasoning": "breve explicación",
+  "should_show_products": false,
+  "extracted_entities": {{"producto": null, "marca": null, "uso": null, "presupuesto": null, "numero_producto": null}},
+  "answer": null
+}}
+""")
+        return builder.build()
+    
+    def _parse_single_call_response(self, response_text: str) -> Optional[Dict[str, Any]]:
+        """Parsear la respuesta de llamada única; None si no es válida"""
+        try:
+            import json
+            import re
+            
+            json_match = re.search(r'\{.*\}', response_text, re.DOTALL)
+            if not json_match:
+                return None
+            result = json.loads(json_match.group())
+            if result.get("intent") not in self.VALID_INTENTS:
+                return None
+            
+            intent = result["intent"]
+            answer = result.get("answer")
+            if intent not in self.DIRECT_ANSWER_INTENTS or not isinstance(answer, str) or not answer.strip():
+                answer = None
+            else:
+                answer = answer.strip()
+                self.direct_answers += 1
+            
+            entities = result.get("extracted_entities") or {}
+            return {
+                "intent": intent,
+                "confidence": float(result.get("confidence", 0.8)),
+                "entities": {key: value for key, value in entities.items() if value not in (None, "", [])},
+                "should_show_products": bool(result.get("should_show_products", intent not in self.DIRECT_ANSWER_INTENTS)),
+                "reasoning": result.get("reasoning", ""),
+                "answer": answer
+            }
+        except Exception as e:
+            logger.error("Error parseando respuesta de llamada única: %s", e)
+            return None
     
     def _parse_classification_response(self, response_text: str, original_message: str, conversation_history: Optional[list] = None) -> Dict[str, Any]:
         """Parsear la respuesta de clasificación de Gemini"""
@@ -163,7 +333,7 @@ IMPORTANTE:
                         "reasoning": result.get("reasoning", "")
                     }
         except Exception as e:
-            logger.error(f"Error parseando respuesta de clasificación: {e}")
+            logger.error("Error parseando respuesta de clasificación: %s", e)
         
         # Fallback si no se puede parsear
         return self._fallback_classification(original_message, conversation_history)
@@ -219,13 +389,13 @@ IMPORTANTE:
         for pattern in recommendation_patterns:
             if pattern in message_lower:
                 is_recommendation_request = True
-                logger.info(f"Detectada solicitud de recomendación con patrón: '{pattern}'")
+                logger.debug("Detectada solicitud de recomendación con patrón: '%s'", pattern)
                 break
         
         # También detectar recomendaciones con palabras clave
         if any(keyword in message_lower for keyword in recommendation_keywords):
             is_recommendation_request = True
-            logger.info("Detectada solicitud de recomendación por palabra clave")
+            logger.debug("Detectada solicitud de recomendación por palabra clave")
             
         # Para "cual es la mejor"
         if "cual es la mejor" in message_lower and len(message_lower.split()) <= 6:
@@ -267,17 +437,17 @@ IMPORTANTE:
         if ("cual" in message_lower or "que" in message_lower or "cuál" in message_lower or "qué" in message_lower) and "mejor" in message_lower:
             if any(prod in message_lower for prod in product_types) and ("tienes" in message_lower or "tienen" in message_lower):
                 is_product_request = True
-                logger.info("Detectada solicitud específica de 'mejor laptop que tienes'")
+                logger.debug("Detectada solicitud específica de 'mejor laptop que tienes'")
             # Capturar frases como "cual es la mejor" sin mencionar el producto específico
             elif "mejor" in message_lower and len(message_lower.split()) <= 6:
                 is_product_request = True
-                logger.info("Detectada solicitud genérica de 'mejor producto'")
+                logger.debug("Detectada solicitud genérica de 'mejor producto'")
         
         # Detectar patrones como "dame/muestra/necesito la mejor laptop"
         if any(verb in message_lower for verb in ["dame", "muestra", "necesito", "quiero", "busco"]) and "mejor" in message_lower:
             if any(prod in message_lower for prod in product_types):
                 is_product_request = True
-                logger.info("Detectada solicitud de 'mejor producto' con verbo de acción")
+                logger.debug("Detectada solicitud de 'mejor producto' con verbo de acción")
         
         # Detectar patrón de pregunta tecnológica "qué es mejor X o Y"
         is_tech_comparison = False
@@ -0,0 +1,343 @@
+# filepath: backend/app/chatbot/services/llm_client.py
+"""
+Cliente compartido de IA
+Un solo proveedor (Gemini o el local de pruebas, ver llm_providers) por proceso para todos
+los servicios, con límite de llamadas simultáneas, timeout por llamada, reintentos con
+backoff aleatorio ante 429/5xx y un circuit breaker: si el proveedor está degradado las
+llamadas fallan al instante y cada servicio responde con su _fallback_* en lugar de
+bloquear workers
+"""
+import time
+import random
+import asyncio
+import logging
+import threading
+from collections import deque
+from typing import Any, Callable, Deque, Dict, Optional
+
+from google.api_core import exceptions as google_exceptions
+
+from ..core.config import ChatbotConfig
+from ..utils.metrics import get_metrics
+from ..utils.prompt_budget import estimate_tokens
+from .llm_providers import LLMError, LLMProvider, LLMTransientError, LLMUnavailableError, create_llm_provider
+
+logger = logging.getLogger(__name__)
+
+# 429 (cuota), 5xx y timeouts del lado de Gemini: vale la pena reintentar
+RETRYABLE_ERRORS = (
+    google_exceptions.TooManyRequests,
+    google_exceptions.ResourceExhausted,
+    google_exceptions.ServerError,
+    google_exceptions.DeadlineExceeded,
+    LLMTransientError,
+    asyncio.TimeoutError,
+    TimeoutError,
+)
+
+class CircuitBreaker:
+    """
+    Circuito de tres estados: cerrado (normal), abierto (rechaza llamadas durante
+    reset_timeout tras failure_threshold fallos seguidos) y semiabierto (deja pasar
+    una llamada de prueba; si funciona se cierra, si falla se vuelve a abrir)
+    """
+
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, failure_threshold: int, reset_timeout: float):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.times_opened = 0
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    def is_open(self) -> bool:
+        """Consulta sin efectos: True si las llamadas se rechazarían ahora"""
+        with self._lock:
+            if self.state == self.OPEN:
+                return time.monotonic() - self.opened_at < self.reset_timeout
+            return self.state == self.HALF_OPEN and self._probe_in_flight
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN:
+                if time.monotonic() - self.opened_at < self.reset_timeout:
+                    return False
+                self.state = self.HALF_OPEN
+                self._probe_in_flight = False
+            if self._probe_in_flight:
+                return False
+            self._probe_in_flight = True
+            return True
+
+    def record_success(self) -> None:
+        with self._lock:
+            if self.state != self.CLOSED:
+                logger.info("Circuito de la IA cerrado: el proveedor respondió correctamente")
+            self.state = self.CLOSED
+            self.failures = 0
+            self._probe_in_flight = False
+
+    def release_probe(self) -> None:
+        """La llamada de prueba terminó sin resultado (p. ej. cancelada): dejar pasar otra"""
+        with self._lock:
+            self._probe_in_flight = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            self._probe_in_flight = False
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    self.times_opened += 1
+                    logger.warning("Circuito de la IA abierto tras %s fallos; respuestas de respaldo durante %.0fs",
+                                   self.failures, self.reset_timeout)
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+
+class ConcurrencyLimit:
+    """
+    Tope de llamadas en curso compartido por los hilos (generate) y por todos los event
+    loops (generate_async; process_message usa asyncio.run). Un solo contador protegido
+    por lock: al liberar, el cupo pasa directamente al primero en la cola de espera
+    """
+
+    __slots__ = ("max_in_flight", "in_flight", "_waiters", "_lock")
+
+    def __init__(self, max_in_flight: int):
+        self.max_in_flight = max_in_flight
+        self.in_flight = 0
+        self._waiters: Deque[Callable[[], None]] = deque()
+        self._lock = threading.Lock()
+
+    def _try_acquire(self, wake: Callable[[], None]) -> bool:
+        """Tomar un cupo libre o, si no hay, encolar wake (se llama al recibir el cupo)"""
+        with self._lock:
+            if self.in_flight < self.max_in_flight and not self._waiters:
+                self.in_flight += 1
+                return True
+            self._waiters.append(wake)
+            return False
+
+    def acquire(self) -> None:
+        """Esperar un cupo bloqueando el hilo"""
+        ready = threading.Event()
+        if not self._try_acquire(ready.set):
+            ready.wait()
+
+    async def acquire_async(self) -> None:
+        """Esperar un cupo sin bloquear el event loop"""
+        loop = asyncio.get_running_loop()
+        granted = loop.create_future()
+
+        def wake() -> None:
+            loop.call_soon_threadsafe(lambda: granted.done() or granted.set_result(None))
+
+        if self._try_acquire(wake):
+            return
+        try:
+            await granted
+        except asyncio.CancelledError:
+            with self._lock:
+                waiting = wake in self._waiters
+                if waiting:
+                    self._waiters.remove(wake)
+            if not waiting:
+                # El cupo ya se había cedido a esta tarea: pasarlo al siguiente
+                self.release()
+            raise
+
+    def release(self) -> None:
+        with self._lock:
+            wake = self._waiters.popleft() if self._waiters else None
+            if wake is None:
+                self.in_flight -= 1
+        if wake is not None:
+            wake()
+
+class LLMClient:
+    """Acceso compartido y protegido a la IA para todos los servicios del chatbot"""
+
+    def __init__(self, api_key: Optional[str], config: Optional[ChatbotConfig] = None,
+                 provider: Optional[LLMProvider] = None):
+        self.config = config or ChatbotConfig()
+        self.timeout = self.config.LLM_TIMEOUT_SECONDS
+        self.max_retries = self.config.LLM_MAX_RETRIES
+        self.backoff_base = self.config.LLM_BACKOFF_BASE_SECONDS
+        self.backoff_max = self.config.LLM_BACKOFF_MAX_SECONDS
+        self.max_in_flight = self.config.LLM_MAX_CONCURRENCY
+        self.breaker = CircuitBreaker(self.config.LLM_CIRCUIT_FAILURE_THRESHOLD,
+                                      self.config.LLM_CIRCUIT_RESET_SECONDS)
+        # Límite de llamadas en curso del proceso, común a las síncronas y a las async
+        self.slots = ConcurrencyLimit(self.max_in_flight)
+        self._lock = threading.Lock()
+        self.metrics = get_metrics()
+        self.stats = {"calls": 0, "successes": 0, "failures": 0, "retries": 0,
+                      "timeouts": 0, "rejected": 0}
+        self.provider = provider or create_llm_provider(api_key, self.config)
+        if self.provider is None:
+            logger.warning("LLMClient sin proveedor de IA (falta API key): se usarán respuestas de respaldo")
+        else:
+            logger.info("LLMClient inicializado con '%s' (máx. %s llamadas simultáneas)",
+                        self.provider.name, self.max_in_flight)
+
+    @property
+    def available(self) -> bool:
+        """False si no hay proveedor o el circuito está abierto (usar la respuesta de respaldo)"""
+        return self.provider is not None and not self.breaker.is_open()
+
+    def _count(self, key: str) -> None:
+        with self._lock:
+            self.stats[key] += 1
+
+    def _acquire_breaker(self) -> None:
+        if self.provider is None:
+            raise LLMUnavailableError("Proveedor de IA no configurado")
+        if not self.breaker.allow():
+            self._count("rejected")
+            self.metrics.record_llm_call(self.provider.name, "rejected", 0.0)
+            raise LLMUnavailableError("Circuito de la IA abierto")
+        self._count("calls")
+
+    def _backoff(self, attempt: int) -> float:
+        # Backoff exponencial con jitter completo para no sincronizar reintentos entre workers
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    def _on_error(self, error: Exception, attempt: int) -> bool:
+        """Registrar el error; True si se debe reintentar"""
+        if isinstance(error, (asyncio.TimeoutError, TimeoutError, google_exceptions.DeadlineExceeded)):
+            self._count("timeouts")
+        retryable = isinstance(error, RETRYABLE_ERRORS)
+        if retryable and attempt < self.max_retries:
+            self._count("retries")
+            logger.warning("La IA falló (%s), reintento %s/%s", type(error).__name__, attempt + 1, self.max_retries)
+            return True
+        self._count("failures")
+        # Solo la degradación del servicio abre el circuito; un prompt inválido no dice nada
+        # de la salud del proveedor: el estado no cambia, solo se libera la llamada de prueba
+        if retryable:
+            self.breaker.record_failure()
+        else:
+            self.breaker.release_probe()
+        return False
+
+    def _on_success(self) -> None:
+        self._count("successes")
+        self.breaker.record_success()
+
+    def _record_call(self, outcome: str, started: float, prompt: str, text: Optional[str] = None) -> None:
+        # Tokens estimados (el proveedor solo devuelve texto); la duración incluye reintentos y backoff
+        self.metrics.record_llm_call(self.provider.name, outcome, time.perf_counter() - started,
+                                     estimate_tokens(prompt), estimate_tokens(text))
+
+    def generate(self, prompt: str, **kwargs) -> str:
+        """Generar texto (llamada síncrona, para código que corre fuera del event loop)"""
+        self._acquire_breaker()
+        try:
+            return self._generate(prompt, **kwargs)
+        except BaseException:
+            # Sin esto una prueba interrumpida dejaría el circuito semiabierto rechazando todo
+            self.breaker.release_probe()
+            raise
+
+    def _generate(self, prompt: str, **kwargs) -> str:
+        started = time.perf_counter()
+        attempt = 0
+        while True:
+            try:
+                self.slots.acquire()
+                try:
+                    text = self.provider.generate(prompt, timeout=self.timeout, **kwargs)
+                finally:
+                    self.slots.release()
+                self._on_success()
+                self._record_call("success", started, prompt, text)
+                return text
+            except Exception as e:
+                if not self._on_error(e, attempt):
+                    self._record_call("error", started, prompt)
+                    raise
+            time.sleep(self._backoff(attempt))
+            attempt += 1
+
+    async def generate_async(self, prompt: str, on_chunk: Optional[Callable[[str], None]] = None,
+                             **kwargs) -> str:
+        """
+        Generar texto sin bloquear el event loop. Con on_chunk se pide la respuesta por
+        fragmentos y se entrega cada uno a medida que llega; solo se reintenta si todavía
+        no se emitió ningún fragmento
+        """
+        self._acquire_breaker()
+        try:
+            return await self._generate_async(prompt, on_chunk, **kwargs)
+        except BaseException:
+            # asyncio.CancelledError (cliente del streaming desconectado) no es Exception:
+            # liberar la llamada de prueba para que el circuito no quede rechazando todo
+            self.breaker.release_probe()
+            raise
+
+    async def _generate_async(self, prompt: str, on_chunk: Optional[Callable[[str], None]],
+                              **kwargs) -> str:
+        started = time.perf_counter()
+        attempt = 0
+        emitted = [False]
+        while True:
+            try:
+                await self.slots.acquire_async()
+                try:
+                    text = await asyncio.wait_for(
+                        self._request_async(prompt, on_chunk, emitted, kwargs), self.timeout
+                    )
+                finally:
+                    self.slots.release()
+                self._on_success()
+                self._record_call("success", started, prompt, text)
+                return text
+            except Exception as e:
+                # Con fragmentos ya emitidos no se reintenta (el cliente vería texto duplicado)
+                if not self._on_error(e, self.max_retries if emitted[0] else attempt):
+                    self._record_call("error", started, prompt)
+                    raise
+            await asyncio.sleep(self._backoff(attempt))
+            attempt += 1
+
+    async def _request_async(self, prompt: str, on_chunk: Optional[Callable[[str], None]],
+                             emitted: list, kwargs: Dict[str, Any]) -> str:
+        if on_chunk is None:
+            return await self.provider.generate_async(prompt, **kwargs)
+
+        parts = []
+        async for text in self.provider.stream_async(prompt, **kwargs):
+            parts.append(text)
+            emitted[0] = True
+            on_chunk(text)
+        return "".join(parts)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Métricas del cliente para monitoreo"""
+        with self._lock:
+            stats = {**self.stats, "in_flight": self.slots.in_flight}
+        return {
+            **stats,
+            "max_in_flight": self.max_in_flight,
+            "provider": self.provider.name if self.provider is not None else None,
+            "circuit_state": self.breaker.state,
+            "circuit_opened": self.breaker.times_opened,
+        }
+
+_shared_client: Optional[LLMClient] = None
+_shared_client_lock = threading.Lock()
+
+def get_llm_client(api_key: Optional[str] = None) -> LLMClient:
+    """Cliente compartido por todos los servicios de IA del proceso"""
+    global _shared_client
+    if _shared_client is None:
+        with _shared_client_lock:
+            if _shared_client is None:
+                _shared_client = LLMClient(api_key)
+    return _shared_client
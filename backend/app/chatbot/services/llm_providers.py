@@ -0,0 +1,208 @@
+# filepath: backend/app/chatbot/services/llm_providers.py
+"""
+Proveedores de texto para el cliente compartido de IA (LLM_PROVIDER)
+- gemini: Google Gemini (producción)
+- local: respuestas deterministas sin red, con latencia y tasa de errores simuladas,
+  para pruebas de carga y CI sin gastar cuota de Gemini
+"""
+import re
+import json
+import time
+import random
+import asyncio
+import logging
+import threading
+from abc import ABC, abstractmethod
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from ..core.config import ChatbotConfig
+from ..utils.entity_extractor import EntityExtractor
+from .rule_based_classifier import RuleBasedIntentClassifier
+
+logger = logging.getLogger(__name__)
+
+class LLMError(Exception):
+    """Error de una llamada a la IA"""
+
+class LLMUnavailableError(LLMError):
+    """IA no configurada o circuito abierto: usar la respuesta de respaldo"""
+
+class LLMTransientError(LLMError):
+    """Falla temporal del proveedor (equivalente a un 429/503): se puede reintentar"""
+
+class LLMProvider(ABC):
+    """Interfaz de un proveedor de texto (un proveedor incompleto falla al instanciarse)"""
+
+    name = "base"
+
+    @abstractmethod
+    def generate(self, prompt: str, timeout: Optional[float] = None, **kwargs) -> str:
+        """Respuesta completa (llamada síncrona)"""
+
+    @abstractmethod
+    async def generate_async(self, prompt: str, **kwargs) -> str:
+        """Respuesta completa sin bloquear el event loop"""
+
+    @abstractmethod
+    def stream_async(self, prompt: str, **kwargs) -> AsyncIterator[str]:
+        """Fragmentos de texto a medida que se generan"""
+
+class GeminiProvider(LLMProvider):
+    """Google Gemini: un solo genai.configure y un modelo por proceso"""
+
+    name = "gemini"
+
+    def __init__(self, api_key: str, model_name: str):
+        import google.generativeai as genai
+
+        genai.configure(api_key=api_key)
+        self.model_name = model_name
+        self.model = genai.GenerativeModel(model_name)
+
+    def generate(self, prompt: str, timeout: Optional[float] = None, **kwargs) -> str:
+        request_options = {"timeout": timeout} if timeout else None
+        return self.model.generate_content(prompt, request_options=request_options, **kwargs).text
+
+    async def generate_async(self, prompt: str, **kwargs) -> str:
+        response = await self.model.generate_content_async(prompt, **kwargs)
+        return response.text
+
+    async def stream_async(self, prompt: str, **kwargs) -> AsyncIterator[str]:
+        response = await self.model.generate_content_async(prompt, stream=True, **kwargs)
+        async for chunk in response:
+            try:
+                text = chunk.text
+            except ValueError:
+                # Fragmentos sin texto (p. ej. solo metadatos de seguridad)
+                continue
+            if text:
+                yield text
+
+class LocalProvider(LLMProvider):
+    """
+    Proveedor determinista sin red. Reconoce el tipo de prompt por su contenido y devuelve
+    JSON de intención (con entidades y respuesta directa) o texto con plantilla; la latencia
+    y los errores simulados salen de un generador con semilla fija
+    """
+
+    name = "local"
+
+    _MESSAGE = re.compile(r'MENSAJE DEL USUARIO: "?(.*?)"?\n')
+    _QUERY = re.compile(r'CONSULTA (?:DEL CLIENTE|ACTUAL|DEL USUARIO): "(.*?)"')
+    _COMPARISON = re.compile(r"Compara detalladamente '(.*?)' con '(.*?)'")
+    _PRODUCT_ROW = re.compile(r"^(?:\d+\. )?ID \d+ \| ([^|]+) \| S/ ([\d.]+)", re.MULTILINE)
+
+    def __init__(self, latency_ms: float = 0.0, jitter_ms: float = 0.0,
+                 error_rate: float = 0.0, seed: int = 0):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._rules = RuleBasedIntentClassifier()
+        self._entities = EntityExtractor()
+
+    @classmethod
+    def from_config(cls, config: ChatbotConfig) -> "LocalProvider":
+        return cls(config.LOCAL_LLM_LATENCY_MS, config.LOCAL_LLM_JITTER_MS,
+                   config.LOCAL_LLM_ERROR_RATE, config.LOCAL_LLM_SEED)
+
+    def _draw(self) -> float:
+        """Latencia de esta llamada en segundos; lanza el error simulado si toca"""
+        with self._lock:
+            fails = self._random.random() < self.error_rate
+            jitter = self._random.uniform(-self.jitter_ms, self.jitter_ms) if self.jitter_ms else 0.0
+        if fails:
+            raise LLMTransientError("Error simulado del proveedor local")
+        return max(0.0, self.latency_ms + jitter) / 1000
+
+    def generate(self, prompt: str, timeout: Optional[float] = None, **kwargs) -> str:
+        delay = self._draw()
+        if timeout is not None and delay > timeout:
+            time.sleep(timeout)
+            raise TimeoutError("Timeout simulado del proveedor local")
+        time.sleep(delay)
+        return self.respond(prompt)
+
+    async def generate_async(self, prompt: str, **kwargs) -> str:
+        await asyncio.sleep(self._draw())
+        return self.respond(prompt)
+
+    async def stream_async(self, prompt: str, **kwargs) -> AsyncIterator[str]:
+        await asyncio.sleep(self._draw())
+        words = self.respond(prompt).split(" ")
+        for index, word in enumerate(words):
+            yield word if index == 0 else " " + word
+
+    def respond(self, prompt: str) -> str:
+        """Respuesta determinista según el tipo de prompt"""
+        if '"intent"' in prompt:
+            message_match = self._MESSAGE.search(prompt)
+            return json.dumps(self._classify(message_match.group(1) if message_match else ""), ensure_ascii=False)
+        comparison = self._COMPARISON.search(prompt)
+        if comparison:
+            return (f"🔍 **Comparación: {comparison.group(1)} vs {comparison.group(2)}**\n\n"
+                    "Ambos son buenas opciones; el primero destaca en rendimiento y el segundo en precio.\n\n"
+                    "💡 **Recomendación:** elige según tu presupuesto y uso principal.")
+        products = self._PRODUCT_ROW.findall(prompt)
+        if products:
+            lines = ["🎯 **Mis mejores recomendaciones:**", ""]
+            for index, (name, price) in enumerate(products[:3], 1):
+                lines.append(f"**{index}. {name.strip()}** (S/ {price})")
+                lines.append("✨ Gran equilibrio entre rendimiento y precio para lo que buscas")
+                lines.append("")
+            lines.append("💡 ¿Te interesa alguna? ¡Puedo darte más detalles! 😊")
+            return "\n".join(lines)
+        query = self._QUERY.search(prompt) or self._MESSAGE.search(prompt)
+        topic = query.group(1) if query else "tu consulta"
+        return (f"💡 Sobre \"{topic}\": depende sobre todo del uso que le darás y de tu presupuesto. "
+                "Puedo mostrarte opciones de nuestro catálogo que encajen. ¿Qué necesitas? 😊")
+
+    def _classify(self, message: str) -> Dict[str, Any]:
+        message_lower = message.lower()
+        result = self._rules.classify(message) or {}
+        intent = result.get("intent") or self._keyword_intent(message_lower)
+        entities = self._entities.extract_entities(message)
+        extracted = {key: entities.get(key) for key in ("producto", "marca", "uso", "presupuesto")}
+        extracted["numero_producto"] = result.get("entities", {}).get("numero_producto")
+        direct = intent in ("pregunta_tecnologica", "conversacion_general")
+        return {
+            "intent": intent,
+            "confidence": 0.9,
+            "reasoning": "proveedor local",
+            "should_show_products": not direct,
+            "extracted_entities": extracted,
+            "answer": (f"💡 Sobre \"{message}\": con gusto te ayudo. ¿Te muestro opciones de nuestro catálogo? 😊"
+                       if direct else None),
+        }
+
+    @staticmethod
+    def _keyword_intent(message_lower: str) -> str:
+        keyword_intents: List[tuple] = [
+            (("recomi", "conviene", "sugier"), "recomendar_producto"),
+            (("compar", " vs ", "versus"), "comparar_productos"),
+            (("especificacion", "caracteristicas", "características", "detalles"), "ver_especificaciones"),
+            (("carrito", "comprar", "lo llevo"), "agregar_carrito"),
+            (tuple(ChatbotConfig.PRODUCT_PATTERNS.keys()) + ("busco", "necesito"), "buscar_producto"),
+            (("qué es", "que es", "diferencia", "?"), "pregunta_tecnologica"),
+        ]
+        for keywords, intent in keyword_intents:
+            if any(keyword in message_lower for keyword in keywords):
+                return intent
+        return "conversacion_general"
+
+def create_llm_provider(api_key: Optional[str], config: ChatbotConfig) -> Optional[LLMProvider]:
+    """Proveedor según LLM_PROVIDER; None si Gemini no tiene API key o no se pudo inicializar"""
+    provider = config.LLM_PROVIDER.lower()
+    if provider == "local":
+        logger.info("Usando proveedor de IA local (respuestas deterministas, sin red)")
+        return LocalProvider.from_config(config)
+    if provider != "gemini":
+        logger.warning("LLM_PROVIDER desconocido '%s', usando gemini", provider)
+    if not api_key:
+        return None
+    try:
+        return GeminiProvider(api_key, config.LLM_MODEL)
+    except Exception as e:
+        logger.error("Error inicializando Gemini AI: %s", e)
+        return None
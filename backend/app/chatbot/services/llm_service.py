@@ -4,7 +4,7 @@ Utiliza Gemini AI para comparaciones de productos y consultas tecnológicas avan
 '''
 import logging
 from typing import List, Dict, Any, Optional
-import google.generativeai as genai
+from .llm_client import LLMClient, get_llm_client
 
 logger = logging.getLogger(__name__)
 
@@ -13,19 +13,11 @@ class LLMService:
     Servicio mejorado para interactuar con Gemini AI.
     Maneja comparaciones de productos y consultas tecnológicas avanzadas.
     """
-    def __init__(self, api_key: Optional[str] = None):
+    def __init__(self, api_key: Optional[str] = None, llm_client: Optional[LLMClient] = None):
         self.api_key = api_key
-        if not api_key:
-            logger.warning("LLMService inicializado sin API key. Funcionalidad limitada.")
-            self.model = None
-        else:
-            try:
-                genai.configure(api_key=api_key)
-                self.model = genai.GenerativeModel('gemini-1.5-flash')
-                logger.info("LLMService inicializado correctamente con Gemini AI")
-            except Exception as e:
-                logger.error(f"Error inicializando Gemini AI: {e}")
-                self.model = None
+        self.llm = llm_client or get_llm_client(api_key)
+        if not self.llm.available:
+            logger.warning("LLMService sin Gemini disponible. Funcionalidad limitada.")
 
     def generate_comparison_fallback(
         self,
@@ -38,18 +30,17 @@ class LLMService:
         """
         Genera una comparación detallada usando Gemini AI cuando la búsqueda estructurada falla o es insuficiente.
         """
-        logger.info(f"LLM Comparación: '{item1_name}' vs '{item2_name}' en atributos: {attributes}")
+        logger.info("LLM Comparación: '%s' vs '%s' en atributos: %s", item1_name, item2_name, attributes)
         
-        if not self.model:
+        if not self.llm.available:
             return self._fallback_comparison_response(item1_name, item2_name, attributes)
         
         try:
             prompt = self._build_comparison_prompt(item1_name, item2_name, attributes, item1_data, item2_data)
-            response = self.model.generate_content(prompt)
-            return response.text.strip()
+            return self.llm.generate(prompt).strip()
             
         except Exception as e:
-            logger.error(f"Error en comparación LLM: {e}")
+            logger.error("Error en comparación LLM: %s", e)
             return self._fallback_comparison_response(item1_name, item2_name, attributes)
     
     def _build_comparison_prompt(self, item1_name: str, item2_name: str, attributes: List[str], 
@@ -131,7 +122,7 @@ Lo siento, en este momento tengo limitaciones para realizar una comparación det
         """
         Recomienda los 'count' mejores productos de una lista de candidatos usando LLM.
         """
-        logger.info(f"LLM Recomendación: Top {count} productos para query: '{user_query}', categoría: {category}, uso: {use_case}")
+        logger.info("LLM Recomendación: Top %s productos para query: '%s', categoría: %s, uso: %s", count, user_query, category, use_case)
 
         if not candidate_products:
             return "Lo siento, no tengo suficientes datos en este momento para hacer una recomendación precisa con IA sobre eso."
@@ -173,6 +164,6 @@ Lo siento, en este momento tengo limitaciones para realizar una comparación det
         response_text += "\nEspero que esto te ayude a decidir. ¡Avísame si tienes más preguntas!"
         # ----- FIN SIMULACIÓN -----
 
-        logger.debug(f"LLM Prompt para recomendación: {prompt}")
-        logger.debug(f"LLM Respuesta simulada: {response_text}")
+        logger.debug("LLM Prompt para recomendación: %s", prompt)
+        logger.debug("LLM Respuesta simulada: %s", response_text)
         return response_text
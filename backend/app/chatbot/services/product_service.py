@@ -6,95 +6,99 @@ Maneja las operaciones relacionadas con búsqueda, especificaciones y carrito
 import logging
 from typing import List, Optional, Dict, Any
 from sqlalchemy.orm import Session
-from app.database import Product
+from app.database import Product as DBProduct
 from app.models import Product as ProductModel
 from ..core.config import ChatbotConfig
+from app.search import fulltext_enabled, fulltext_search, fulltext_find_by_name
+from .catalog_index import get_catalog_index
+from .recommendation_ranker import RankedProduct, RecommendationRanker
+from ..utils.product_specs import get_product_specs
 
 logger = logging.getLogger(__name__)
 
 class ProductService:
     """Servicio para operaciones con productos"""
     
+    # Palabras con las que se reconoce cada tipo de producto en el nombre
+    PRODUCT_TYPE_KEYWORDS = {
+        'laptop': ['laptop', 'notebook', 'portátil'],
+        'pc': ['pc', 'computadora', 'desktop', 'escritorio'],
+        'monitor': ['monitor', 'pantalla'],
+        'teclado': ['teclado', 'keyboard'],
+        'mouse': ['mouse', 'ratón'],
+        'audifonos': ['audífonos', 'auriculares', 'headset'],
+        'componente_pc': ['tarjeta', 'procesador', 'memoria', 'disco']
+    }
+    
     def __init__(self):
         self.config = ChatbotConfig()
+        self.catalog_index = get_catalog_index()
+        self.ranker = RecommendationRanker(self.config)
     
     def search_products(self, db: Session, search_query: str, max_price: Optional[int] = None) -> List[ProductModel]:
         """Buscar productos en la base de datos"""
         try:
-            # Import CRUD function
-            from app.crud import search_products as crud_search_products
-            
-            # Buscar productos usando CRUD
-            db_products = crud_search_products(db, search_query, limit=20)
-            
-            # Convertir a modelos Pydantic con validaciones manuales
-            products = []
-            count = 0
-            
-            for db_product in db_products:
-                try:
-                    # Crear el modelo primero
-                    product_model = ProductModel.from_orm(db_product)
-                    
-                    # Filtrar por stock
-                    if product_model.stock_quantity <= 0:
-                        continue
-                    
-                    # Filtrar por precio si se especifica
-                    if max_price and product_model.price > max_price:
-                        continue
-                    
-                    products.append(product_model)
-                    count += 1
-                    
-                    if count >= 10:  # Máximo 10 productos
-                        break
-                        
-                except Exception as e:
-                    logger.warning(f"Error convirtiendo producto: {e}")
-                    continue
+            if fulltext_enabled():
+                # Índices de texto completo de la base de datos (tsvector / FTS5)
+                products = fulltext_search(db, search_query, limit=10, in_stock_only=True, max_price=max_price)
+                return [ProductModel.from_orm(product) for product in products]
             
-            return products
+            # Índice en memoria: sin ILIKE ni escaneo de la tabla (máximo 10 productos con stock)
+            return self.catalog_index.search(db, search_query, limit=10, max_price=max_price, in_stock_only=True)
             
         except Exception as e:
-            logger.error(f"Error buscando productos: {e}")
+            logger.error("Error buscando productos: %s", e)
             return []
     
     def find_product_by_name(self, db: Session, product_name: str) -> Optional[ProductModel]:
         """Buscar producto específico por nombre"""
         try:
-            logger.info(f"Buscando producto por nombre: '{product_name}'")
+            logger.debug("Buscando producto por nombre: '%s'", product_name)
             
-            # Limpiar y normalizar el nombre del producto
-            clean_name = product_name.strip().lower()
-            
-            # Estrategia 1: Buscar por coincidencia exacta en el nombre
-            exact_match = db.query(Product).filter(Product.name.ilike(f"%{clean_name}%")).first()
-            if exact_match:
-                logger.info(f"Encontrado por coincidencia exacta: {exact_match.name}")
-                return ProductModel.from_orm(exact_match)
-            
-            # Estrategia 2: Buscar por palabras clave individuales
-            keywords = [word for word in clean_name.split() if len(word) > 2]
-            logger.info(f"Buscando por palabras clave: {keywords}")
-            
-            if keywords:
-                db_query = db.query(Product)
-                for keyword in keywords:
-                    db_query = db_query.filter(Product.name.ilike(f"%{keyword}%"))
-                
-                product = db_query.first()
-                if product:
-                    logger.info(f"Encontrado por palabras clave: {product.name}")
-                    return ProductModel.from_orm(product)
-            
-            logger.warning(f"No se encontró producto para: '{product_name}'")
+            if fulltext_enabled():
+                # Índices de texto completo: sin cargar el catálogo en memoria
+                db_product = fulltext_find_by_name(db, product_name.strip())
+                product = ProductModel.from_orm(db_product) if db_product else None
+            else:
+                # Nombre, modelo o SKU reconocido por el trie del catálogo: sin consultas
+                product = (self.catalog_index.resolve_product(db, product_name)
+                           or self.catalog_index.find_by_name(db, product_name.strip()))
+            if product:
+                logger.debug("Producto encontrado por nombre: %s", product.name)
+                return product
+            
+            logger.warning("No se encontró producto para: '%s'", product_name)
             return None
             
         except Exception as e:
-            logger.error(f"Error buscando producto por nombre '{product_name}': {e}")
+            logger.error("Error buscando producto por nombre '%s': %s", product_name, e)
+            return None
+    
+    def get_product_by_id(self, db: Session, product_id: int) -> Optional[ProductModel]:
+        """Producto ya resuelto por el extractor (entities["producto_id"]), desde el índice"""
+        try:
+            if fulltext_enabled():
+                # Sin índice en memoria: lectura por clave primaria
+                db_product = self._get_active_product(db, product_id)
+                return ProductModel.from_orm(db_product) if db_product else None
+            return self.catalog_index.get_product(db, product_id)
+        except Exception as e:
+            logger.error("Error obteniendo producto %s: %s", product_id, e)
             return None
     
+    @staticmethod
+    def _get_active_product(db: Session, product_id: int) -> Optional[DBProduct]:
+        """Producto activo por clave primaria (usa el identity map de la sesión si ya está cargado)"""
+        product = db.get(DBProduct, product_id)
+        return product if product and product.is_active else None
+    
+    def refresh_catalog(self, db: Session) -> None:
+        """Aplicar cambios pendientes del catálogo antes de extraer entidades del mensaje"""
+        try:
+            self.catalog_index.ensure_fresh(db)
+        except Exception as e:
+            logger.warning("No se pudo actualizar el índice del catálogo: %s", e)
+    
     def get_comparison_data(
         self, 
         db: Session, 
@@ -109,27 +113,18 @@ class ProductService:
         attributes: Lista de atributos a extraer (ej: ["precio", "bateria"]).
                     Si "caracteristicas" está en attributes, se devuelven todos los datos relevantes.        """
         
-        # Import the missing function
-        from app.crud import get_products_by_names_or_brands_for_comparison
-        
-        db_products = get_products_by_names_or_brands_for_comparison(
+        product_models = self.catalog_index.find_for_comparison(
             db, 
             product_names=product_names, 
             brand_names=brand_names, 
             limit_per_item=2 # Obtener hasta 2 productos por nombre/marca para dar opciones
         )
 
-        if not db_products:
+        if not product_models:
             return []
 
         comparison_results = []
-        for product_db in db_products:
-            try:
-                product_model = ProductModel.from_orm(product_db)
-            except Exception as e:
-                logger.warning(f"Error convirtiendo producto DB a Pydantic model: {product_db.name}, error: {e}")
-                continue
-
+        for product_model in product_models:
             product_data = {}
             
             # Siempre incluir nombre, id y precio base para identificación
@@ -137,21 +132,9 @@ class ProductService:
             product_data["name"] = product_model.name
             product_data["price"] = product_model.price # Precio base siempre
 
-            # Mapeo de atributos solicitados a campos del modelo o lógica especial
-            attribute_map = {
-                "precio": "price",
-                "bateria": "battery_life", # Asumiendo que existe un campo battery_life
-                "pantalla": "screen_specifications", # Asumiendo campo
-                "rendimiento": "performance_score", # Asumiendo campo
-                "camara": "camera_specifications", # Asumiendo campo
-                "almacenamiento": "storage_capacity", # Asumiendo campo
-                "ram": "ram_amount", # Asumiendo campo
-                "procesador": "processor_model", # Asumiendo campo
-                "tarjeta grafica": "graphics_card_model", # Asumiendo campo                "peso": "weight_kg", # Asumiendo campo
-                "dimensiones": "dimensions_cm", # Asumiendo campo
-                "marca": "brand_name", # Asumiendo que se puede extraer o ya existe
-                # "caracteristicas" se maneja especialmente
-            }
+            # Especificaciones normalizadas: "procesador", "ram", "almacenamiento", "pantalla", ...
+            specs = get_product_specs(product_model)
+            spec_values = specs.as_comparison_dict()
             
             if "caracteristicas" in attributes or not attributes:
                 # Devolver un conjunto razonable de datos.
@@ -159,33 +142,21 @@ class ProductService:
                 product_data["description"] = product_model.description if hasattr(product_model, 'description') else "N/A"
                 product_data["category_id"] = getattr(product_model, 'category_id', "N/A")
                 product_data["rating"] = getattr(product_model, 'rating', "N/A")
-                # Añadir más campos relevantes si existen en ProductModel
-                if hasattr(product_model, 'specifications') and product_model.specifications:
-                     if isinstance(product_model.specifications, dict):
-                        product_data.update(product_model.specifications)
-                     else:
-                        product_data['other_specifications'] = str(product_model.specifications)
-
-                # Incluir atributos mapeados si no están ya
-                for req_attr, model_attr_name in attribute_map.items():
-                    if req_attr not in product_data and hasattr(product_model, model_attr_name):
-                        product_data[req_attr] = getattr(product_model, model_attr_name, "N/A")
+                product_data.update(spec_values)
+                product_data["caracteristicas"] = specs.summary() or "N/A"
             else:
                 for req_attr in attributes:
                     if req_attr == "precio": # Ya incluido
                         continue
-                    model_attr_key = attribute_map.get(req_attr)
-                    if model_attr_key and hasattr(product_model, model_attr_key):
-                        product_data[req_attr] = getattr(product_model, model_attr_key, "N/A")
+                    if req_attr in spec_values:
+                        product_data[req_attr] = spec_values[req_attr]
                     elif hasattr(product_model, req_attr): # Intento directo
                          product_data[req_attr] = getattr(product_model, req_attr, "N/A")
                     else:
-                        # Si el atributo no se encuentra directamente o mapeado,
-                        # podríamos intentar buscarlo en un campo genérico de especificaciones si existe
-                        if hasattr(product_model, 'specifications') and isinstance(product_model.specifications, dict):
-                            product_data[req_attr] = product_model.specifications.get(req_attr, "N/A")
-                        else:
-                            product_data[req_attr] = "N/A (no especificado)"
+                        product_data[req_attr] = "N/A (no especificado)"
+            
+            if product_model.brand:
+                product_data["marca"] = product_model.brand
             
             # Intentar obtener la marca si no está ya
             if "marca" not in product_data or product_data["marca"] == "N/A":
@@ -204,62 +175,57 @@ class ProductService:
                     user_id: Optional[int] = None, session_id: Optional[str] = None) -> Dict[str, Any]:
         """Agregar producto al carrito - Versión mejorada con mejor respuesta"""
         
+        if user_id is None and (not session_id or session_id == "default"):
+            # Sin usuario ni sesión propia no hay carrito de invitado seguro: "default" es
+            # compartido por todos los clientes sin sesión
+            logger.warning("Carrito sin user_id ni session_id propio; producto %s no agregado", product_id)
+            return {
+                "success": False,
+                "message": "❌ No pudimos identificar tu sesión. Recarga la página o inicia sesión para usar el carrito.",
+                "product": None
+            }
+        
         try:
-            # Verificar que el producto existe y tiene stock
-            product = db.query(Product).filter(Product.id == product_id).first()
-            if not product:
-                logger.warning(f"Producto {product_id} no encontrado")
+            # Producto y stock por clave primaria (vigentes aunque el índice esté por recargarse);
+            # la sentencia del carrito vuelve a verificar el stock de forma atómica
+            db_product = self._get_active_product(db, product_id)
+            if not db_product:
+                logger.warning("Producto %s no encontrado", product_id)
                 return {
                     "success": False,
                     "message": "❌ Producto no encontrado en nuestro inventario",
                     "product": None
                 }
-            
-            # Convertir a modelo Pydantic para evitar errores de tipado
-            try:
-                product_model = ProductModel.from_orm(product)
-                # Verificar stock disponible
-                if product_model.stock_quantity < quantity:
-                    logger.warning(f"Stock insuficiente. Disponible: {product_model.stock_quantity}, Solicitado: {quantity}")
-                    return {
-                        "success": False,
-                        "message": f"⚠️ Stock insuficiente. Solo quedan **{product_model.stock_quantity}** unidades disponibles",
-                        "product": product_model,
-                        "available_stock": product_model.stock_quantity
-                    }
-            except Exception as model_error:
-                logger.error(f"Error convirtiendo producto a modelo: {model_error}")
+            product_model = ProductModel.from_orm(db_product)
+            if product_model.stock_quantity < quantity:
+                logger.warning("Stock insuficiente. Disponible: %s, Solicitado: %s", product_model.stock_quantity, quantity)
                 return {
                     "success": False,
-                    "message": "❌ Error procesando el producto. Inténtalo nuevamente.",
-                    "product": None
+                    "message": f"⚠️ Stock insuficiente. Solo quedan **{product_model.stock_quantity}** unidades disponibles",
+                    "product": product_model,
+                    "available_stock": product_model.stock_quantity
                 }
             
-            logger.info(f"Agregando producto {product_id} al carrito (cantidad: {quantity})")
+            logger.debug("Agregando producto %s al carrito (cantidad: %s)", product_id, quantity)
             
             # Usar CRUD para agregar al carrito
-            from app.crud import add_to_cart as crud_add_to_cart
-            
-            # Si no hay user_id, usar un user_id temporal (1) para pruebas
-            effective_user_id = user_id if user_id else 1
+            from app.crud import add_to_cart as crud_add_to_cart, get_cart_summary
             
             try:
+                # Upsert del item en una sola transacción (ya confirmada); sin user_id va al
+                # carrito de invitado de la sesión del chat
                 cart_item = crud_add_to_cart(
                     db=db,
-                    user_id=effective_user_id,
+                    user_id=user_id,
                     product_id=product_id,
-                    quantity=quantity
+                    quantity=quantity,
+                    session_id=session_id
                 )
                 
-                # Hacer commit explícito para asegurar que se guarde
-                db.commit()
-                
                 if cart_item:
-                    logger.info(f"Producto {product_id} agregado exitosamente al carrito")
-                    
-                    # Calcular total del carrito actualizado
-                    from app.crud import get_cart_total
-                    cart_total = get_cart_total(db, effective_user_id)
+                    logger.debug("Producto %s agregado exitosamente al carrito", product_id)
+                    # Total derivado de los items con los precios actuales
+                    cart_total = get_cart_summary(db, cart_id=cart_item.cart_id).total
                     
                     return {
                         "success": True,
@@ -268,11 +234,12 @@ class ProductService:
                         "quantity": quantity,
                         "cart_item_id": cart_item.id,
                         "cart_total": cart_total,
-                        "user_id": effective_user_id,
+                        "user_id": user_id,
+                        "session_id": None if user_id else session_id,
                         "item_subtotal": product_model.price * quantity
                     }
                 else:
-                    logger.warning(f"No se pudo agregar producto {product_id} al carrito")
+                    logger.warning("No se pudo agregar producto %s al carrito", product_id)
                     return {
                         "success": False,
                         "message": "❌ No se pudo agregar el producto al carrito. Inténtalo nuevamente.",
@@ -280,7 +247,7 @@ class ProductService:
                     }
                     
             except Exception as db_error:
-                logger.error(f"Error de base de datos al agregar al carrito: {db_error}")
+                logger.error("Error de base de datos al agregar al carrito: %s", db_error)
                 db.rollback()
                 return {
                     "success": False,
@@ -289,52 +256,17 @@ class ProductService:
                 }
                 
         except Exception as e:
-            logger.error(f"Error general agregando al carrito: {e}")
+            logger.error("Error general agregando al carrito: %s", e)
             return {
                 "success": False,
                 "message": "❌ Error interno del sistema. Contacta al soporte técnico de GRUPO INFOTEC.",
                 "product": None
             }
     
-    def get_all_products_for_recommendation(self, db: Session, category: Optional[str] = None, 
-                                          use_case: Optional[str] = None, limit: int = 50) -> List[ProductModel]:
-        """Obtener todos los productos disponibles para análisis y recomendación por IA"""
-        try:
-            from app.crud import get_products, search_products as crud_search_products
-            
-            logger.info(f"Obteniendo productos para recomendación - categoría: {category}, uso: {use_case}")
-            
-            # Si hay una categoría específica, buscar por ella
-            if category:
-                db_products = crud_search_products(db, category, limit=limit)
-            else:
-                # Obtener todos los productos activos
-                db_products = get_products(db, skip=0, limit=limit)
-              # Convertir a modelos Pydantic y filtrar por stock
-            products = []
-            for db_product in db_products:
-                try:
-                    product_model = ProductModel.from_orm(db_product)
-                    
-                    # Solo incluir productos con stock
-                    if product_model.stock_quantity > 0:
-                        products.append(product_model)
-                        
-                except Exception as e:
-                    logger.warning(f"Error convirtiendo producto: {e}")
-                    continue
-            
-            logger.info(f"Encontrados {len(products)} productos para recomendación")
-            return products
-            
-        except Exception as e:
-            logger.error(f"Error obteniendo productos para recomendación: {e}")
-            return []
-            
     def find_similar_products(self, db: Session, product_name: str, limit: int = 3) -> List[ProductModel]:
         """Buscar productos similares a un nombre de producto dado"""
         try:
-            logger.info(f"Buscando productos similares a: '{product_name}'")
+            logger.debug("Buscando productos similares a: '%s'", product_name)
             
             # Extraer marca del nombre del producto
             brand = None
@@ -364,180 +296,59 @@ class ProductService:
                 elif any(keyword in product_name.lower() for keyword in monitor_keywords):
                     product_type = 'monitor'
             
-            # Extraer palabras clave importantes (números de modelo, etc.)
-            keywords = []
-            words = product_name.lower().split()
-            for word in words:
-                # Mantener palabras que parecen importantes (números de modelo, etc.)
-                if any(c.isdigit() for c in word) or len(word) >= 4:
-                    # Filtrar palabras comunes no específicas
-                    common_words = ['para', 'como', 'mejor', 'buena', 'esta', 'este', 'cuál', 'cual', 'tiene', 'tienes']
-                    if word not in common_words:
-                        keywords.append(word)
-            
-            # Extraer especificaciones técnicas mencionadas
-            specs = []
-            spec_patterns = {
-                'ram': [r'(\d+)\s*(?:gb|ram)', r'ram\s*(?:de)?\s*(\d+)'],
-                'procesador': [r'(i\d)', r'(ryzen\s*\d)', r'(core\s*i\d)'],
-                'almacenamiento': [r'(\d+)\s*(?:gb|tb)\s*(?:ssd|hdd)', r'ssd\s*(?:de)?\s*(\d+)']
-            }
-            
-            for spec_type, patterns in spec_patterns.items():
-                for pattern in patterns:
-                    matches = re.findall(pattern, product_name.lower())
-                    if matches:
-                        specs.append(f"{spec_type}_{matches[0]}")
-            
-            logger.info(f"Análisis - Marca: {brand}, Tipo: {product_type}, Keywords: {keywords}, Specs: {specs}")
+            logger.debug("Análisis - Marca: %s, Tipo: %s", brand, product_type)
             
-            # Construir la consulta
-            query = db.query(Product)
-            
-            # Primera estrategia: coincidencia exacta por palabras clave importantes
-            if keywords:
-                exact_query = db.query(Product)
-                # Usar la primera palabra clave importante como filtro principal
-                keyword_filters = []
-                for keyword in keywords:
-                    keyword_filters.append(Product.name.ilike(f"%{keyword}%"))
-                
-                from sqlalchemy import and_, or_
-                if len(keyword_filters) > 1:
-                    # Intentar encontrar productos que coincidan con al menos 2 palabras clave
-                    for i in range(len(keyword_filters) - 1):
-                        for j in range(i + 1, len(keyword_filters)):
-                            exact_query = exact_query.filter(and_(keyword_filters[i], keyword_filters[j]))
-                            exact_matches = exact_query.all()
-                            if exact_matches:
-                                logger.info(f"Encontrados {len(exact_matches)} productos con coincidencia exacta")
-                                result = []
-                                for product in exact_matches[:limit]:
-                                    try:
-                                        result.append(ProductModel.from_orm(product))
-                                    except Exception as e:
-                                        logger.warning(f"Error convirtiendo producto similar: {e}")
-                                return result
+            # El índice puntúa las palabras clave del nombre (modelo, números) y la marca;
+            # si nada coincide, devuelve los mejor valorados del mismo tipo de producto
+            type_keywords = self.PRODUCT_TYPE_KEYWORDS.get(product_type, [product_type]) if product_type else None
+            result = self.catalog_index.find_similar(
+                db, product_name, limit=limit, brand=brand, product_type_keywords=type_keywords
+            )
             
-            # Si llegamos aquí, no hubo coincidencias exactas, usar estrategia más flexible
-            # Filtrar por marca si se detectó
-            if brand:
-                query = query.filter(Product.name.ilike(f"%{brand}%"))
-            
-            # Filtrar por palabras clave si se detectaron
-            if keywords:
-                # Usar al menos 2 keywords si hay disponibles, si no, usar solo 1
-                from sqlalchemy import or_
-                keyword_conditions = [Product.name.ilike(f"%{keyword}%") for keyword in keywords]
-                query = query.filter(or_(*keyword_conditions))
-            
-            # Filtrar por especificaciones técnicas
-            if specs and not keywords:
-                from sqlalchemy import or_
-                spec_conditions = [Product.name.ilike(f"%{spec.split('_')[1]}%") for spec in specs]
-                query = query.filter(or_(*spec_conditions))
-            
-            # Si no hay suficientes filtros, agregar filtro por tipo de producto
-            if not brand and not keywords and not specs and product_type:
-                # Convertir tipo de producto a palabras clave para búsqueda
-                type_keywords = {
-                    'laptop': ['laptop', 'notebook', 'portátil'],
-                    'pc': ['pc', 'computadora', 'desktop', 'escritorio'],
-                    'monitor': ['monitor', 'pantalla'],
-                    'teclado': ['teclado', 'keyboard'],
-                    'mouse': ['mouse', 'ratón'],
-                    'audifonos': ['audífonos', 'auriculares', 'headset'],
-                    'componente_pc': ['tarjeta', 'procesador', 'memoria', 'disco']
-                }.get(product_type, [product_type])
-                
-                from sqlalchemy import or_
-                conditions = [Product.name.ilike(f"%{kw}%") for kw in type_keywords]
-                query = query.filter(or_(*conditions))
-            
-            # Ejecutar la consulta
-            similar_products = query.limit(limit).all()
-            
-            # Si no hay resultados y tenemos un tipo de producto, intentar buscar solo por tipo
-            if not similar_products and product_type:
-                from sqlalchemy import or_
-                type_keywords = {
-                    'laptop': ['laptop', 'notebook', 'portátil'],
-                    'pc': ['pc', 'computadora', 'desktop', 'escritorio'],
-                    'monitor': ['monitor', 'pantalla'],
-                    'teclado': ['teclado', 'keyboard'],
-                    'mouse': ['mouse', 'ratón'],
-                    'audifonos': ['audífonos', 'auriculares', 'headset'],
-                    'componente_pc': ['tarjeta', 'procesador', 'memoria', 'disco']
-                }.get(product_type, [product_type])
-                
-                fallback_query = db.query(Product)
-                conditions = [Product.name.ilike(f"%{kw}%") for kw in type_keywords]
-                fallback_query = fallback_query.filter(or_(*conditions))
-                
-                # Ordenar por rating para mostrar los mejores primero
-                fallback_query = fallback_query.order_by(Product.rating.desc())
-                
-                similar_products = fallback_query.limit(limit).all()
-            
-            result = []
-            for product in similar_products:
-                try:
-                    result.append(ProductModel.from_orm(product))
-                except Exception as e:
-                    logger.warning(f"Error convirtiendo producto similar: {e}")
-            
-            logger.info(f"Encontrados {len(result)} productos similares")
+            logger.debug("Encontrados %s productos similares", len(result))
             return result
             
         except Exception as e:
-            logger.error(f"Error buscando productos similares a '{product_name}': {e}")
+            logger.error("Error buscando productos similares a '%s': %s", product_name, e)
             return []
 
-    def get_best_products_for_recommendation(self, db: Session, category: Optional[str] = None, 
-                                           use_case: Optional[str] = None, max_price: Optional[int] = None,
-                                           limit: int = 50) -> List[ProductModel]:
-        """Obtener los mejores productos para recomendación basados en rating, precio y disponibilidad"""
+    def get_ranked_recommendations(self, db: Session, category: Optional[str] = None,
+                                   use_case: Optional[str] = None, max_price: Optional[int] = None,
+                                   top_k: Optional[int] = None) -> List[RankedProduct]:
+        """Elegir los mejores productos con el ranking local (uso, presupuesto, specs, rating, stock y descuento)"""
         try:
-            from app.crud import get_products, search_products as crud_search_products
-            
-            logger.info(f"Obteniendo mejores productos - categoría: {category}, uso: {use_case}, precio_max: {max_price}")
-            
-            # Si hay una categoría específica, buscar por ella
-            if category:
-                db_products = crud_search_products(db, category, limit=limit * 2)  # Obtener más para filtrar mejor
+            logger.debug("Ranking de recomendaciones - categoría: %s, uso: %s, precio_max: %s", category, use_case, max_price)
+            candidate_limit = self.config.RECOMMENDATION_CANDIDATE_LIMIT
+            
+            if fulltext_enabled():
+                products = self._ranking_candidates_from_db(db, category, max_price, candidate_limit)
+            # Si hay una categoría específica, buscar por ella (con stock y dentro del presupuesto)
+            elif category:
+                products = self.catalog_index.search(db, category, limit=candidate_limit, max_price=max_price,
+                                                     in_stock_only=True)
             else:
-                # Obtener todos los productos activos
-                db_products = get_products(db, skip=0, limit=limit * 2)
-            
-            # Convertir a modelos Pydantic, filtrar y ordenar
-            products = []
-            for db_product in db_products:
-                try:
-                    product_model = ProductModel.from_orm(db_product)
-                    
-                    # Filtrar por stock
-                    if product_model.stock_quantity <= 0:
-                        continue
-                        
-                    # Filtrar por precio máximo si se especifica
-                    if max_price and product_model.price > max_price:
-                        continue
-                    
-                    products.append(product_model)
-                        
-                except Exception as e:
-                    logger.warning(f"Error convirtiendo producto: {e}")
-                    continue
+                # Todos los productos activos; el ranking descarta los que no califican
+                products = self.catalog_index.list_products(db)[:candidate_limit]
             
-            # Ordenar por rating (descendente) y luego por precio (ascendente) para mejores primero
-            products.sort(key=lambda x: (-(x.rating or 0), x.price or 0))
+            ranked = self.ranker.rank(products, use_case=use_case, max_price=max_price,
+                                      top_k=top_k or self.config.RECOMMENDATION_TOP_K)
             
-            # Limitar al número solicitado
-            products = products[:limit]
-            
-            logger.info(f"Encontrados {len(products)} mejores productos para recomendación")
-            return products
+            logger.debug("Ranking: %s productos elegidos de %s candidatos", len(ranked), len(products))
+            return ranked
             
         except Exception as e:
-            logger.error(f"Error obteniendo mejores productos para recomendación: {e}")
+            logger.error("Error obteniendo ranking de recomendaciones: %s", e)
             return []
+
+    @staticmethod
+    def _ranking_candidates_from_db(db: Session, category: Optional[str], max_price: Optional[int],
+                                    limit: int) -> List[ProductModel]:
+        """Candidatos del ranking sin el índice en memoria: texto completo o consulta acotada por rating"""
+        if category:
+            db_products = fulltext_search(db, category, limit=limit, in_stock_only=True, max_price=max_price)
+        else:
+            query = db.query(DBProduct).filter(DBProduct.is_active == True, DBProduct.stock_quantity > 0)
+            if max_price:
+                query = query.filter(DBProduct.price <= max_price)
+            db_products = query.order_by(DBProduct.rating.desc(), DBProduct.id).limit(limit).all()
+        return [ProductModel.from_orm(product) for product in db_products]
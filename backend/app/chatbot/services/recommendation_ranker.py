@@ -0,0 +1,147 @@
+# filepath: backend/app/chatbot/services/recommendation_ranker.py
+"""
+Ranking local de recomendaciones
+Puntúa los candidatos con NumPy según el caso de uso (ChatbotConfig.USE_CASES),
+el presupuesto, las especificaciones normalizadas (ProductSpecs), rating, stock y
+descuento. La selección es determinista; la IA solo redacta la explicación de los
+productos elegidos a partir de datos compactos
+"""
+import logging
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from app.models import Product as ProductModel
+from ..core.config import ChatbotConfig
+from ..utils.product_specs import ProductSpecs, get_product_specs
+from ..utils.prompt_budget import product_row
+
+logger = logging.getLogger(__name__)
+
+class RankedProduct:
+    """Producto elegido por el ranking con su puntaje y especificaciones"""
+
+    __slots__ = ("product", "score", "specs")
+
+    def __init__(self, product: ProductModel, score: float, specs: ProductSpecs):
+        self.product = product
+        self.score = score
+        self.specs = specs
+
+    def compact_facts(self) -> str:
+        """Una línea con lo necesario para que la IA redacte la recomendación"""
+        return product_row(self.product, self.specs)
+
+class RecommendationRanker:
+    """Puntuación vectorizada de productos por caso de uso"""
+
+    # Columnas de la matriz de características (todas normalizadas a [0, 1])
+    FEATURES = ("gpu", "cpu", "ram", "storage", "refresh", "rating", "stock", "discount", "value", "use_case")
+
+    # Puntaje de CPU por familia (la generación suma un pequeño extra)
+    CPU_FAMILY_SCORES = {
+        "Celeron": 0.2, "Pentium": 0.25,
+        "Core i3": 0.4, "Ryzen 3": 0.4,
+        "Core i5": 0.6, "Ryzen 5": 0.6, "Core Ultra 5": 0.7,
+        "Core i7": 0.8, "Ryzen 7": 0.8, "Core Ultra 7": 0.85, "M1": 0.75, "M2": 0.8, "M3": 0.85, "M4": 0.9,
+        "Core i9": 1.0, "Ryzen 9": 1.0, "Core Ultra 9": 1.0,
+    }
+
+    # Pesos por caso de uso (mismo orden que FEATURES)
+    USE_CASE_WEIGHTS = {
+        "gaming":       (0.35, 0.15, 0.12, 0.03, 0.05, 0.10, 0.04, 0.04, 0.04, 0.08),
+        "diseño":       (0.20, 0.20, 0.22, 0.08, 0.00, 0.10, 0.04, 0.04, 0.04, 0.08),
+        "programacion": (0.03, 0.25, 0.27, 0.12, 0.00, 0.12, 0.04, 0.05, 0.06, 0.06),
+        "trabajo":      (0.00, 0.20, 0.18, 0.10, 0.00, 0.20, 0.06, 0.06, 0.12, 0.08),
+        "universidad":  (0.02, 0.12, 0.15, 0.08, 0.00, 0.18, 0.05, 0.08, 0.27, 0.05),
+        "basico":       (0.00, 0.06, 0.08, 0.04, 0.00, 0.20, 0.06, 0.10, 0.40, 0.06),
+        None:           (0.06, 0.15, 0.15, 0.08, 0.01, 0.25, 0.08, 0.10, 0.12, 0.00),
+    }
+
+    def __init__(self, config: Optional[ChatbotConfig] = None):
+        self.config = config or ChatbotConfig()
+        self._weights = {use_case: np.asarray(weights, dtype=np.float64)
+                         for use_case, weights in self.USE_CASE_WEIGHTS.items()}
+        # Fila de especificaciones por producto (se reutiliza mientras ProductSpecs no cambie)
+        self._spec_rows: Dict[int, Tuple[ProductSpecs, np.ndarray]] = {}
+
+    def _spec_row(self, product: ProductModel, specs: ProductSpecs) -> np.ndarray:
+        cached = self._spec_rows.get(product.id)
+        if cached is not None and cached[0] is specs:
+            return cached[1]
+        cpu = self.CPU_FAMILY_SCORES.get(specs.cpu_family, 0.0)
+        if cpu and specs.cpu_generation:
+            cpu = min(1.0, cpu + 0.01 * min(specs.cpu_generation, 14))
+        row = np.array([
+            (specs.gpu_tier or 0) / 4,
+            cpu,
+            min(specs.ram_gb or 0, 32) / 32,
+            min(specs.storage_gb or 0, 1000) / 1000,
+            1.0 if (specs.refresh_hz or 0) >= 120 else 0.0,
+        ], dtype=np.float64)
+        self._spec_rows[product.id] = (specs, row)
+        return row
+
+    def _use_case_matches(self, product: ProductModel, use_case: Optional[str]) -> float:
+        keywords = self.config.USE_CASES.get(use_case, []) if use_case else []
+        text = f"{product.name} {product.description or ''}".lower()
+        return 1.0 if any(keyword in text for keyword in keywords) else 0.0
+
+    def score(self, products: Sequence[ProductModel], use_case: Optional[str] = None,
+              max_price: Optional[float] = None) -> np.ndarray:
+        """Puntaje de cada producto (-inf para los que no tienen stock o exceden el presupuesto)"""
+        if not products:
+            return np.empty(0)
+        specs = [get_product_specs(product) for product in products]
+        spec_matrix = np.vstack([self._spec_row(product, product_specs)
+                                 for product, product_specs in zip(products, specs)])
+
+        price = np.array([product.price or 0.0 for product in products], dtype=np.float64)
+        original = np.array([product.original_price or 0.0 for product in products], dtype=np.float64)
+        rating = np.array([product.rating or 0.0 for product in products], dtype=np.float64)
+        stock = np.array([product.stock_quantity or 0 for product in products], dtype=np.float64)
+        use_case_match = np.array([self._use_case_matches(product, use_case) for product in products])
+
+        discount = np.where(original > price, (original - price) / np.maximum(original, 1e-9), 0.0)
+        if max_price:
+            # Con presupuesto: mejor cuanto más se aprovecha sin pasarse
+            value = np.clip(price / max_price, 0.0, 1.0)
+        else:
+            # Sin presupuesto: más barato = mejor relación precio/valor
+            value = 1.0 - price / max(price.max(), 1e-9)
+
+        features = np.column_stack([
+            spec_matrix,
+            rating / 5,
+            np.minimum(stock, 10) / 10,
+            np.minimum(discount, 0.5) / 0.5,
+            value,
+            use_case_match,
+        ])
+        weights = self._weights.get(use_case, self._weights[None])
+        scores = features @ weights
+
+        excluded = stock <= 0
+        if max_price:
+            excluded |= price > max_price
+        return np.where(excluded, -np.inf, scores)
+
+    def rank(self, products: Sequence[ProductModel], use_case: Optional[str] = None,
+             max_price: Optional[float] = None, top_k: int = 3) -> List[RankedProduct]:
+        """Los top_k mejores productos; empates resueltos por rating y luego por id (reproducible)"""
+        scores = self.score(products, use_case, max_price)
+        if scores.size == 0:
+            return []
+        ids = np.array([product.id for product in products])
+        ratings = np.array([product.rating or 0.0 for product in products])
+        # lexsort ordena por la última clave primero: puntaje desc, rating desc, id asc
+        order = np.lexsort((ids, -ratings, -scores))
+        ranked = []
+        for index in order[:top_k]:
+            if not np.isfinite(scores[index]):
+                break
+            product = products[index]
+            ranked.append(RankedProduct(product, round(float(scores[index]), 4), get_product_specs(product)))
+        logger.debug("Ranking de %d candidatos (uso=%s): %s", len(products), use_case,
+                     [(item.product.id, item.score) for item in ranked])
+        return ranked
@@ -0,0 +1,139 @@
+# filepath: backend/app/chatbot/services/rule_based_classifier.py
+"""
+Pre-clasificador de intenciones basado en reglas deterministas
+Resuelve sin llamar a Gemini los mensajes obvios (saludos, respuestas preparadas,
+"la segunda", "agrega al carrito", comparaciones AMD vs Intel...) y deja pasar
+los ambiguos al clasificador con IA
+"""
+import re
+import logging
+from typing import Dict, Any, Optional, Callable
+from ..core.config import ChatbotConfig
+
+logger = logging.getLogger(__name__)
+
+class RuleBasedIntentClassifier:
+    """Clasificador rápido por reglas que devuelve una intención con su confianza"""
+
+    # Palabras que por sí solas forman un saludo, despedida o agradecimiento
+    SMALL_TALK_WORDS = {
+        "hola", "holi", "buenas", "buenos", "buen", "dia", "días", "dias", "tardes", "noches",
+        "gracias", "muchas", "mil", "te", "agradezco", "adios", "adiós", "chau", "chao",
+        "saludos", "hey", "hi", "ok", "okay", "vale", "genial", "perfecto", "excelente",
+        "listo", "hasta", "luego", "pronto", "nos", "vemos", "infobot", "bot", "que", "qué",
+        "tal", "como", "cómo", "estas", "estás", "va", "todo", "bien", "y", "tu", "tú"
+    }
+
+    PRODUCT_TYPES = ["laptop", "pc", "tablet", "smartphone", "monitor", "computadora", "equipo",
+                     "notebook", "teclado", "mouse", "impresora", "audifonos", "audífonos"]
+
+    SEARCH_VERBS = ["busco", "buscando", "quiero ver", "necesito", "muéstrame", "muestrame",
+                    "tienes", "tienen", "hay", "venden", "quiero una", "quiero un"]
+
+    TECH_TERMS = [
+        "amd", "intel", "nvidia", "ssd", "hdd", "windows", "linux", "mac", "android", "ios",
+        "asus", "lenovo", "hp", "dell", "acer", "msi", "apple", "samsung",
+        "ddr4", "ddr5", "ram", "procesador", "cpu", "gpu", "laptop", "pc"
+    ]
+
+    def __init__(self, fallback_classifier: Optional[Callable[[str, Optional[list]], Dict[str, Any]]] = None):
+        """Compilar una sola vez los patrones de configuración"""
+        self.config = ChatbotConfig()
+        self.fallback_classifier = fallback_classifier
+
+        self._contextual_spec_patterns = [re.compile(p) for p in self.config.CONTEXTUAL_SPEC_PATTERNS]
+        self._strong_cart_patterns = [
+            re.compile(p) for p in self.config.CART_PATTERNS
+            if p not in self.config.CART_GENERIC_VERBS
+        ]
+        self._cart_imperative = re.compile(r"^(?:por\s+favor\s+)?(?:agr[eé]ga(?:me|lo|la)?|a[ñn]ade(?:me|lo|la)?)\b")
+        self._tech_question = re.compile(
+            r"(?:(?:qu[eé]|cu[aá]l)\s+es\s+mejor\s+(?:una?\s+)?(?P<a>[\w\-]+)\s+o\s+(?:una?\s+)?(?P<b>[\w\-]+)"
+            r"|diferencias?\s+entre\s+(?:una?\s+)?(?P<c>[\w\-]+)\s+[ye]\s+(?:una?\s+)?(?P<d>[\w\-]+)"
+            r"|(?P<e>[\w\-]+)\s+vs\.?\s+(?P<f>[\w\-]+))"
+        )
+        self._punctuation = re.compile(r"[¿?¡!.,;:]+")
+
+    def classify(self, message: str, conversation_history: Optional[list] = None) -> Optional[Dict[str, Any]]:
+        """
+        Clasificar por reglas. Devuelve None si ninguna regla aplica; el llamador compara
+        la confianza con INTENT_FAST_PATH_THRESHOLD para decidir si escala a Gemini.
+        """
+        message_lower = self._punctuation.sub(" ", message.lower()).strip()
+        message_lower = " ".join(message_lower.split())
+        if not message_lower:
+            return None
+        words = message_lower.split()
+        mentions_product = any(re.search(rf"\b{p}s?\b", message_lower) for p in self.PRODUCT_TYPES)
+
+        # 1. Referencias ordinales a productos mostrados ("la segunda", "specs del 2")
+        for pattern in self._contextual_spec_patterns:
+            if pattern.search(message_lower):
+                entities: Dict[str, Any] = {"referencia_contextual": True}
+                numero = self._extract_product_number(message_lower)
+                if numero:
+                    entities["numero_producto"] = numero
+                return self._result("ver_especificaciones", 0.95, entities, True, "referencia ordinal")
+
+        # 2. Saludos, despedidas y agradecimientos cortos
+        if len(words) <= 6 and all(word in self.SMALL_TALK_WORDS for word in words):
+            return self._result("conversacion_general", 0.95, {}, False, "saludo o agradecimiento")
+
+        # 3. Preguntas con respuesta preparada (envío, garantía, ubicación, financiamiento)
+        if not mentions_product:
+            for category, info in self.config.PREPARED_RESPONSES.items():
+                if any(pattern in message_lower for pattern in info["patterns"]):
+                    return self._result("conversacion_general", 0.9, {"respuesta_preparada": category},
+                                        False, f"respuesta preparada '{category}'")
+
+        # 4. Acciones explícitas de carrito
+        if any(pattern.search(message_lower) for pattern in self._strong_cart_patterns) \
+                or self._cart_imperative.search(message_lower):
+            return self._result("agregar_carrito", 0.9, {}, True, "acción explícita de carrito")
+
+        # 5. Comparaciones tecnológicas generales ("qué es mejor AMD o Intel")
+        tech_match = self._tech_question.search(message_lower)
+        if tech_match:
+            items = [item for item in tech_match.groups() if item]
+            if len(items) == 2 and all(item in self.TECH_TERMS for item in items):
+                return self._result("pregunta_tecnologica", 0.9, {"components": items}, False,
+                                    "comparación tecnológica general")
+
+        # 6. Búsquedas directas de productos ("busco una laptop gaming")
+        if mentions_product and any(verb in message_lower for verb in self.SEARCH_VERBS) \
+                and "mejor" not in message_lower and "recomi" not in message_lower:
+            return self._result("buscar_producto", 0.9, {}, True, "búsqueda directa de productos")
+
+        # 7. Resto: reglas del clasificador de respaldo (recomendaciones explícitas, etc.)
+        if self.fallback_classifier:
+            result = self.fallback_classifier(message, conversation_history)
+            if result.get("intent") == "recomendar_producto":
+                result["confidence"] = 0.9
+            else:
+                # El respaldo es permisivo ("16gb" cuenta como referencia "1"): nunca decide solo
+                result["confidence"] = min(result.get("confidence", 0.0), 0.7)
+            return result
+
+        return None
+
+    def _extract_product_number(self, message_lower: str) -> Optional[int]:
+        """Determinar a qué posición de la lista se refiere el usuario"""
+        if re.search(r"segund|(?:\s|^)2(?:\s|$)", message_lower):
+            return 2
+        if re.search(r"primer|(?:\s|^)1(?:\s|$)", message_lower):
+            return 1
+        if re.search(r"tercer|(?:\s|^)3(?:\s|$)", message_lower):
+            return 3
+        number_match = re.search(r"(?:\s|^)([1-5])(?:\s|$)", message_lower)
+        return int(number_match.group(1)) if number_match else None
+
+    def _result(self, intent: str, confidence: float, entities: Dict[str, Any],
+                should_show_products: bool, reason: str) -> Dict[str, Any]:
+        """Construir resultado con el mismo formato que IntentClassifier"""
+        return {
+            "intent": intent,
+            "confidence": confidence,
+            "entities": entities,
+            "should_show_products": should_show_products,
+            "reasoning": f"Clasificación rápida por reglas - {reason}"
+        }
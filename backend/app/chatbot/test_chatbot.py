@@ -20,7 +20,7 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(
 
 # Importar los módulos necesarios
 from app.database import SessionLocal
-from app.chatbot.core.enhanced_chatbot_v4_fixed import EnhancedInfotecChatbotV4
+from app.chatbot.core.enhanced_chatbot_v4_fixed_clean import EnhancedInfotecChatbotV4
 from app.chatbot.services.intent_classifier import IntentClassifier
 
 # Obtener la API key de las variables de entorno
@@ -3,5 +3,8 @@
 from .response_formatter import ResponseFormatter
 from .entity_extractor import EntityExtractor
 from .conversation_manager import ConversationManager
+from .conversation_store import ConversationStore
+from .response_cache import ResponseCache
+from .prompt_budget import PromptBuilder
 
-__all__ = ["ResponseFormatter", "EntityExtractor", "ConversationManager"]
+__all__ = ["ResponseFormatter", "EntityExtractor", "ConversationManager", "ConversationStore", "ResponseCache", "PromptBuilder"]
@@ -1,47 +1,43 @@
 ﻿"""
 Manejador de conversaciones y contexto
-Maneja el historial de conversaciones y el contexto entre mensajes
+Maneja el historial de conversaciones y el contexto entre mensajes.
+El almacenamiento es intercambiable (ver conversation_store): memoria del proceso
+acotada o base de datos compartida entre workers
 """
 import logging
 import re
-from datetime import datetime
 from typing import Dict, List, Any, Optional
 
+from app.database import run_db
+from ..core.config import ChatbotConfig
+from .conversation_store import ConversationEntry, ConversationStore, create_conversation_store
+
 logger = logging.getLogger(__name__)
 
 class ConversationManager:
     """Maneja el historial y contexto de conversaciones"""
     
-    def __init__(self):
-        # Diccionario para mantener las conversaciones por sesión
-        self.session_conversations: Dict[str, List[Dict[str, Any]]] = {}
+    def __init__(self, config: Optional[ChatbotConfig] = None, store: Optional[ConversationStore] = None):
+        self.config = config or ChatbotConfig()
+        self.store = store or create_conversation_store(self.config)
     
     def get_conversation_history(self, session_id: str) -> List[Dict[str, Any]]:
         """Obtener historial de conversación para una sesión específica"""
-        return self.session_conversations.get(session_id, [])
+        return self.store.load(session_id)
+    
+    async def get_conversation_history_async(self, session_id: str) -> List[Dict[str, Any]]:
+        """Versión async: si el almacenamiento hace I/O se lee fuera del event loop"""
+        if self.store.performs_io:
+            return await run_db(self.store.load, session_id)
+        return self.store.load(session_id)
     
     def save_conversation(self, session_id: str, user_message: str, bot_response: str, 
                          intent: str, entities: Dict[str, Any], products_shown: bool = False,
                          products_list: Optional[List[Dict]] = None) -> None:
         """Guardar conversación en el historial"""
-        if session_id not in self.session_conversations:
-            self.session_conversations[session_id] = []
-        
-        conversation_entry = {
-            "timestamp": datetime.now().isoformat(),
-            "user_message": user_message,
-            "bot_response": bot_response,
-            "intent": intent,
-            "entities": entities,
-            "products_shown": products_shown,
-            "products_list": products_list if products_list is not None else []
-        }
-        
-        self.session_conversations[session_id].append(conversation_entry)
-        
-        # Mantener solo las últimas 10 conversaciones por eficiencia
-        if len(self.session_conversations[session_id]) > 10:
-            self.session_conversations[session_id] = self.session_conversations[session_id][-10:]
+        entry = ConversationEntry(user_message, bot_response, intent, entities, products_shown,
+                                  products_list, self.config.CONVERSATION_MAX_RESPONSE_CHARS)
+        self.store.append(session_id, entry)
     
     def get_context_string(self, conversation_history: List[Dict[str, Any]]) -> str:
         """Generar string de contexto para la IA con información detallada"""
@@ -111,13 +107,12 @@ class ConversationManager:
     
     def clear_session(self, session_id: str) -> None:
         """Limpiar historial de una sesión específica"""
-        if session_id in self.session_conversations:
-            del self.session_conversations[session_id]
-            logger.info(f"Historial de sesión {session_id} eliminado")
+        if self.store.clear(session_id):
+            logger.info("Historial de sesión %s eliminado", session_id)
     
     def get_active_sessions(self) -> List[str]:
         """Obtener lista de sesiones activas"""
-        return list(self.session_conversations.keys())
+        return self.store.active_sessions()
     
     def get_session_stats(self, session_id: str) -> Dict[str, Any]:
         """Obtener estadísticas de una sesión"""
@@ -135,9 +130,16 @@ class ConversationManager:
             "last_activity": history[-1]["timestamp"] if history else None
         }
     
+    def get_stats(self) -> Dict[str, Any]:
+        """Métricas del almacenamiento del historial para monitoreo"""
+        return self.store.get_stats()
+    
     def clear_all_sessions(self) -> int:
         """Limpiar todos los historiales de conversación"""
-        session_count = len(self.session_conversations)
-        self.session_conversations.clear()
-        logger.info(f"Todos los historiales eliminados ({session_count} sesiones)")
+        session_count = self.store.clear_all()
+        logger.info("Todos los historiales eliminados (%s sesiones)", session_count)
         return session_count
+    
+    def close(self) -> None:
+        """Persistir escrituras pendientes y detener los hilos de fondo"""
+        self.store.close()
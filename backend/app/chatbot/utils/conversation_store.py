@@ -0,0 +1,598 @@
+# filepath: backend/app/chatbot/utils/conversation_store.py
+"""
+Almacenamiento del historial de conversaciones
+- MemoryConversationStore: memoria del proceso, acotada (TTL por inactividad, LRU, bytes)
+- DatabaseConversationStore: tablas chat_sessions / chat_messages, compartidas entre workers
+  y réplicas. Escritura diferida por lotes (sin latencia por mensaje) y caché de lectura
+  en memoria validada con chat_sessions.last_activity a lo sumo cada
+  CONVERSATION_CACHE_VALIDATE_SECONDS por sesión
+"""
+import json
+import sys
+import time
+import queue
+import logging
+import threading
+from abc import ABC, abstractmethod
+from collections import OrderedDict, deque
+from datetime import datetime, timedelta
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+from sqlalchemy import insert
+from sqlalchemy.exc import IntegrityError
+
+from app.database import ChatSession, ChatMessage, SessionLocal
+from ..core.config import ChatbotConfig
+
+logger = logging.getLogger(__name__)
+
+# Tamaño aproximado (bytes) de los objetos de una entrada sin contar sus textos
+_ENTRY_OVERHEAD = 200
+_PRODUCT_OVERHEAD = 240
+
+class ConversationEntry:
+    """
+    Turno de conversación compacto (__slots__, intención internada, entidades sin
+    los campos internos del clasificador). Se lee como el dict original:
+    entry.get("intent"), entry["bot_response"], ...
+    """
+
+    __slots__ = ("created_at", "user_message", "bot_response", "intent", "entities",
+                 "products_shown", "products_list", "size_bytes")
+
+    FIELDS = ("timestamp", "user_message", "bot_response", "intent", "entities",
+              "products_shown", "products_list")
+
+    def __init__(self, user_message: str, bot_response: str, intent: str, entities: Dict[str, Any],
+                 products_shown: bool, products_list: Optional[List[Dict]], max_response_chars: int = 0,
+                 created_at: Optional[float] = None):
+        self.created_at = created_at if created_at is not None else time.time()
+        self.user_message = user_message or ""
+        bot_response = bot_response or ""
+        self.bot_response = bot_response[:max_response_chars] if max_response_chars else bot_response
+        self.intent = sys.intern(intent or "")
+        # _ai_entities, _intent_reasoning, etc. solo sirven durante el turno en curso
+        self.entities = {
+            key: value for key, value in (entities or {}).items()
+            if not key.startswith("_") and value not in (None, "", [], {})
+        }
+        self.products_shown = products_shown
+        self.products_list = tuple(self._compact_product(product) for product in products_list or ())
+        self.size_bytes = self._estimate_size()
+
+    @staticmethod
+    def _compact_product(product: Dict[str, Any]) -> Dict[str, Any]:
+        compact = {key: value for key, value in product.items() if value not in (None, "")}
+        for key in ("brand", "type"):
+            if isinstance(compact.get(key), str):
+                compact[key] = sys.intern(compact[key])
+        return compact
+
+    def _estimate_size(self) -> int:
+        """Estimación barata de la memoria retenida (textos + sobrecarga fija por objeto)"""
+        size = _ENTRY_OVERHEAD + sys.getsizeof(self.user_message) + sys.getsizeof(self.bot_response)
+        size += sum(len(key) + len(str(value)) for key, value in self.entities.items())
+        size += sum(_PRODUCT_OVERHEAD + len(str(product.get("name", ""))) for product in self.products_list)
+        return size
+
+    @property
+    def timestamp(self) -> str:
+        return datetime.fromtimestamp(self.created_at).isoformat()
+
+    def get(self, key: str, default: Any = None) -> Any:
+        if key in self.FIELDS:
+            return getattr(self, key)
+        return default
+
+    def __getitem__(self, key: str) -> Any:
+        if key not in self.FIELDS:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.FIELDS
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {key: getattr(self, key) for key in self.FIELDS}
+
+class ConversationStore(ABC):
+    """Interfaz de almacenamiento del historial usada por ConversationManager"""
+
+    # True si las lecturas hacen I/O (el orquestador las ejecuta fuera del event loop)
+    performs_io = False
+
+    @abstractmethod
+    def load(self, session_id: str) -> List[ConversationEntry]:
+        """Turnos de la sesión, del más antiguo al más reciente ([] si no existe o expiró)"""
+
+    @abstractmethod
+    def append(self, session_id: str, entry: ConversationEntry) -> None:
+        """Agregar un turno al final del historial de la sesión"""
+
+    @abstractmethod
+    def clear(self, session_id: str) -> bool:
+        """Eliminar el historial de una sesión; devuelve si existía"""
+
+    @abstractmethod
+    def clear_all(self) -> int:
+        """Eliminar todos los historiales; devuelve cuántas sesiones había"""
+
+    @abstractmethod
+    def active_sessions(self) -> List[str]:
+        """IDs de las sesiones con historial vigente"""
+
+    @abstractmethod
+    def get_stats(self) -> Dict[str, Any]:
+        """Métricas del almacenamiento para monitoreo"""
+
+    def flush(self) -> None:
+        """Persistir escrituras pendientes (no-op en almacenamientos síncronos)"""
+
+    def close(self) -> None:
+        self.flush()
+
+class _SessionHistory:
+    """Turnos de una sesión con su última actividad y bytes retenidos"""
+
+    __slots__ = ("entries", "last_access", "size_bytes")
+
+    def __init__(self, max_turns: int):
+        self.entries: Deque[ConversationEntry] = deque(maxlen=max_turns)
+        self.last_access = time.monotonic()
+        self.size_bytes = 0
+
+class MemoryConversationStore(ConversationStore):
+    """
+    Historial en memoria del proceso: sesiones en orden LRU (la más reciente al final),
+    expiración por inactividad con un hilo de limpieza y presupuesto opcional de bytes
+    """
+
+    def __init__(self, max_turns: int, idle_ttl_seconds: float, max_sessions: int,
+                 max_bytes: int = 0, sweep_interval_seconds: float = 0):
+        self.max_turns = max_turns
+        self.idle_ttl_seconds = idle_ttl_seconds
+        self.max_sessions = max_sessions
+        self.max_bytes = max_bytes
+        self.sweep_interval_seconds = sweep_interval_seconds
+
+        self.sessions: "OrderedDict[str, _SessionHistory]" = OrderedDict()
+        self.bytes_held = 0
+        self.stats = {"evicted_idle": 0, "evicted_lru": 0, "evicted_bytes": 0, "sweeps": 0}
+        self._lock = threading.RLock()
+        self._sweeper: Optional[threading.Thread] = None
+        self._stop_sweeper = threading.Event()
+
+    def load(self, session_id: str) -> List[ConversationEntry]:
+        with self._lock:
+            session = self._get_live_session(session_id)
+            if session is None:
+                return []
+            session.last_access = time.monotonic()
+            self.sessions.move_to_end(session_id)
+            return list(session.entries)
+
+    def append(self, session_id: str, entry: ConversationEntry) -> None:
+        with self._lock:
+            session = self._get_live_session(session_id)
+            if session is None:
+                session = self.sessions[session_id] = _SessionHistory(self.max_turns)
+            self._append_entry(session, entry)
+            session.last_access = time.monotonic()
+            self.sessions.move_to_end(session_id)
+            self._enforce_limits()
+        self._ensure_sweeper()
+
+    def replace(self, session_id: str, entries: List[ConversationEntry]) -> None:
+        """Reemplazar el historial de una sesión (p. ej. recargado desde la base de datos)"""
+        with self._lock:
+            previous = self.sessions.pop(session_id, None)
+            if previous is not None:
+                self.bytes_held -= previous.size_bytes
+            session = self.sessions[session_id] = _SessionHistory(self.max_turns)
+            for entry in entries:
+                self._append_entry(session, entry)
+            self._enforce_limits()
+        self._ensure_sweeper()
+
+    def _append_entry(self, session: _SessionHistory, entry: ConversationEntry) -> None:
+        # El deque descarta el turno más antiguo al superar max_turns
+        if len(session.entries) == session.entries.maxlen:
+            dropped = session.entries[0]
+            session.size_bytes -= dropped.size_bytes
+            self.bytes_held -= dropped.size_bytes
+        session.entries.append(entry)
+        session.size_bytes += entry.size_bytes
+        self.bytes_held += entry.size_bytes
+
+    def _get_live_session(self, session_id: str) -> Optional[_SessionHistory]:
+        """Sesión existente y no expirada (las expiradas se eliminan al leerlas)"""
+        session = self.sessions.get(session_id)
+        if session is not None and self._is_idle(session, time.monotonic()):
+            self._evict(session_id, "evicted_idle")
+            return None
+        return session
+
+    def _is_idle(self, session: _SessionHistory, now: float) -> bool:
+        return self.idle_ttl_seconds > 0 and now - session.last_access > self.idle_ttl_seconds
+
+    def _evict(self, session_id: str, reason: str) -> None:
+        session = self.sessions.pop(session_id)
+        self.bytes_held -= session.size_bytes
+        self.stats[reason] += 1
+
+    def _enforce_limits(self) -> None:
+        """Desalojar las sesiones menos recientes hasta respetar el máximo de sesiones y de bytes"""
+        while self.max_sessions and len(self.sessions) > self.max_sessions:
+            self._evict(next(iter(self.sessions)), "evicted_lru")
+        # La sesión más reciente (la que acaba de escribir) nunca se desaloja por bytes
+        while self.max_bytes and self.bytes_held > self.max_bytes and len(self.sessions) > 1:
+            self._evict(next(iter(self.sessions)), "evicted_bytes")
+
+    def sweep_expired(self) -> int:
+        """Eliminar las sesiones inactivas por más de idle_ttl_seconds; devuelve cuántas"""
+        if self.idle_ttl_seconds <= 0:
+            return 0
+        now = time.monotonic()
+        removed = 0
+        with self._lock:
+            # Orden LRU: las expiradas están al principio
+            while self.sessions:
+                session_id, session = next(iter(self.sessions.items()))
+                if not self._is_idle(session, now):
+                    break
+                self._evict(session_id, "evicted_idle")
+                removed += 1
+            self.stats["sweeps"] += 1
+        if removed:
+            logger.info("Sesiones inactivas eliminadas: %s", removed)
+        return removed
+
+    def _ensure_sweeper(self) -> None:
+        """Iniciar (una sola vez) el hilo que limpia sesiones inactivas en segundo plano"""
+        if self._sweeper is not None or self.sweep_interval_seconds <= 0 or self.idle_ttl_seconds <= 0:
+            return
+        with self._lock:
+            if self._sweeper is None:
+                self._sweeper = threading.Thread(target=self._sweep_loop, name="conversation-sweeper",
+                                                 daemon=True)
+                self._sweeper.start()
+
+    def _sweep_loop(self) -> None:
+        while not self._stop_sweeper.wait(self.sweep_interval_seconds):
+            try:
+                self.sweep_expired()
+            except Exception as e:
+                logger.error("Error limpiando sesiones inactivas: %s", e)
+
+    def clear(self, session_id: str) -> bool:
+        with self._lock:
+            session = self.sessions.pop(session_id, None)
+            if session is None:
+                return False
+            self.bytes_held -= session.size_bytes
+            return True
+
+    def clear_all(self) -> int:
+        with self._lock:
+            session_count = len(self.sessions)
+            self.sessions.clear()
+            self.bytes_held = 0
+        return session_count
+
+    def active_sessions(self) -> List[str]:
+        with self._lock:
+            return list(self.sessions.keys())
+
+    def close(self) -> None:
+        self._stop_sweeper.set()
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "store": "memory",
+                **self.stats,
+                "live_sessions": len(self.sessions),
+                "live_entries": sum(len(session.entries) for session in self.sessions.values()),
+                "bytes_held": self.bytes_held,
+                "max_sessions": self.max_sessions,
+                "max_bytes": self.max_bytes,
+                "idle_ttl_seconds": self.idle_ttl_seconds,
+                "sweeper_running": self._sweeper is not None and self._sweeper.is_alive()
+            }
+
+class DatabaseConversationStore(ConversationStore):
+    """
+    Historial persistente en chat_sessions / chat_messages (un registro por turno).
+    - append(): actualiza la caché y encola; un hilo escribe por lotes en una transacción
+    - load(): una sesión validada o escrita por este worker hace menos de
+      validate_seconds se sirve de la caché sin consultar la base; si no, devuelve la caché
+      si chat_sessions.last_activity no es más reciente que su último turno (otro worker no
+      escribió) y si lo es, recarga los últimos turnos de la base
+    Lo que otro worker escriba o limpie en la misma sesión se ve tras validate_seconds como máximo
+    """
+
+    performs_io = True
+
+    def __init__(self, session_factory: Callable, cache: MemoryConversationStore,
+                 batch_size: int = 50, flush_interval_seconds: float = 0.2, validate_seconds: float = 30):
+        self.session_factory = session_factory
+        self.cache = cache
+        self.batch_size = batch_size
+        self.flush_interval_seconds = flush_interval_seconds
+        self.validate_seconds = validate_seconds
+        # session_id -> monotonic de la última validación contra la base (o escritura propia)
+        self._validated: Dict[str, float] = {}
+
+        self._queue: "queue.Queue[Tuple[str, ConversationEntry]]" = queue.Queue()
+        # Turnos encolados y aún no confirmados, por sesión (visibles al recargar desde la base)
+        self._pending: Dict[str, List[ConversationEntry]] = {}
+        self._lock = threading.Lock()
+        self._writer: Optional[threading.Thread] = None
+        self._stop_writer = threading.Event()
+        self.stats = {"cache_hits": 0, "cache_misses": 0, "cache_unvalidated_hits": 0,
+                      "batches_written": 0, "messages_written": 0, "write_errors": 0}
+
+    def _mark_validated(self, session_id: str) -> None:
+        with self._lock:
+            if len(self._validated) >= self.cache.max_sessions:
+                self._validated.clear()
+            self._validated[session_id] = time.monotonic()
+
+    def load(self, session_id: str) -> List[ConversationEntry]:
+        cached = self.cache.load(session_id)
+        if cached and self.validate_seconds > 0:
+            with self._lock:
+                validated_at = self._validated.get(session_id)
+            if validated_at is not None and time.monotonic() - validated_at < self.validate_seconds:
+                self.stats["cache_hits"] += 1
+                self.stats["cache_unvalidated_hits"] += 1
+                return cached
+        db = self.session_factory()
+        try:
+            row = db.query(ChatSession.last_activity, ChatSession.is_active).filter(
+                ChatSession.session_id == session_id
+            ).first()
+            last_activity = row.last_activity if row and row.is_active else None
+
+            # Sin fila: aún no se ha persistido nada y la caché es la fuente de verdad.
+            # Fila inactiva: otro worker limpió la sesión
+            if row is None:
+                cache_fresh = True
+            else:
+                cache_fresh = bool(cached) and last_activity is not None and \
+                    last_activity <= datetime.fromtimestamp(cached[-1].created_at)
+            if cached and cache_fresh:
+                self.stats["cache_hits"] += 1
+                self._mark_validated(session_id)
+                return cached
+
+            self.stats["cache_misses"] += 1
+            entries = []
+            idle_limit = self.cache.idle_ttl_seconds
+            if last_activity is not None and (
+                    idle_limit <= 0 or last_activity >= datetime.now() - timedelta(seconds=idle_limit)):
+                entries = self._load_entries(db, session_id)
+        finally:
+            db.close()
+
+        with self._lock:
+            pending = list(self._pending.get(session_id, ()))
+        persisted = {entry.created_at for entry in entries}
+        entries.extend(entry for entry in pending if entry.created_at not in persisted)
+        entries = entries[-self.cache.max_turns:]
+        if entries:
+            self.cache.replace(session_id, entries)
+            self._mark_validated(session_id)
+        else:
+            self.cache.clear(session_id)
+        return entries
+
+    def _load_entries(self, db, session_id: str) -> List[ConversationEntry]:
+        rows = db.query(ChatMessage).join(ChatSession, ChatMessage.session_id == ChatSession.id).filter(
+            ChatSession.session_id == session_id
+        ).order_by(ChatMessage.timestamp.desc(), ChatMessage.id.desc()).limit(self.cache.max_turns).all()
+        return [self._row_to_entry(row) for row in reversed(rows)]
+
+    def _row_to_entry(self, row) -> ConversationEntry:
+        try:
+            entities = json.loads(row.entities) if row.entities else {}
+        except ValueError:
+            entities = {}
+        products_shown = bool(entities.pop("_products_shown", False))
+        products_list = entities.pop("_products_list", None)
+        created_at = row.timestamp.timestamp() if row.timestamp else time.time()
+        return ConversationEntry(row.message, row.response, row.intent, entities, products_shown,
+                                 products_list, created_at=created_at)
+
+    def append(self, session_id: str, entry: ConversationEntry) -> None:
+        self.cache.append(session_id, entry)
+        self._mark_validated(session_id)
+        with self._lock:
+            self._pending.setdefault(session_id, []).append(entry)
+        self._queue.put((session_id, entry))
+        self._ensure_writer()
+
+    def _ensure_writer(self) -> None:
+        if self._writer is not None:
+            return
+        with self._lock:
+            if self._writer is None:
+                self._writer = threading.Thread(target=self._write_loop, name="conversation-writer",
+                                                daemon=True)
+                self._writer.start()
+
+    def _write_loop(self) -> None:
+        while not self._stop_writer.is_set():
+            try:
+                first = self._queue.get(timeout=1.0)
+            except queue.Empty:
+                continue
+            # Agrupar lo que llegue durante flush_interval (o hasta batch_size)
+            batch = [first]
+            deadline = time.monotonic() + self.flush_interval_seconds
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            try:
+                self._write_batch(batch)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    def _write_batch(self, batch: List[Tuple[str, ConversationEntry]]) -> None:
+        """Insertar un lote de turnos en una transacción (crea las sesiones que falten)"""
+        for attempt in range(2):
+            db = self.session_factory()
+            try:
+                session_ids = {session_id for session_id, _ in batch}
+                sessions = {
+                    chat_session.session_id: chat_session
+                    for chat_session in db.query(ChatSession).filter(ChatSession.session_id.in_(session_ids))
+                }
+                for session_id, entry in batch:
+                    if session_id not in sessions:
+                        sessions[session_id] = ChatSession(
+                            session_id=session_id, started_at=datetime.fromtimestamp(entry.created_at)
+                        )
+                        db.add(sessions[session_id])
+                db.flush()
+
+                db.execute(insert(ChatMessage), [self._entry_to_row(sessions[session_id].id, entry)
+                                                 for session_id, entry in batch])
+                for session_id, entry in batch:
+                    chat_session = sessions[session_id]
+                    timestamp = datetime.fromtimestamp(entry.created_at)
+                    if not chat_session.last_activity or timestamp > chat_session.last_activity \
+                            or not chat_session.is_active:
+                        chat_session.last_activity = timestamp
+                    chat_session.is_active = True
+                db.commit()
+                self.stats["batches_written"] += 1
+                self.stats["messages_written"] += len(batch)
+                break
+            except IntegrityError:
+                # Otro worker creó la misma sesión a la vez: reintentar una vez
+                db.rollback()
+                if attempt == 1:
+                    self.stats["write_errors"] += 1
+                    logger.error("Error guardando historial de conversación: sesión duplicada")
+            except Exception as e:
+                db.rollback()
+                self.stats["write_errors"] += 1
+                logger.error("Error guardando historial de conversación (%s turnos): %s", len(batch), e)
+                break
+            finally:
+                db.close()
+
+        with self._lock:
+            for session_id, entry in batch:
+                pending = self._pending.get(session_id)
+                if pending and entry in pending:
+                    pending.remove(entry)
+                    if not pending:
+                        del self._pending[session_id]
+
+    def _entry_to_row(self, chat_session_id: int, entry: ConversationEntry) -> Dict[str, Any]:
+        """Fila de chat_messages; products_shown/products_list viajan dentro del JSON de entities"""
+        entities = dict(entry.entities)
+        entities["_products_shown"] = entry.products_shown
+        entities["_products_list"] = list(entry.products_list)
+        return {
+            "session_id": chat_session_id,
+            "message": entry.user_message,
+            "response": entry.bot_response,
+            "message_type": "user",
+            "intent": entry.intent,
+            "entities": json.dumps(entities, ensure_ascii=False, default=str),
+            "timestamp": datetime.fromtimestamp(entry.created_at)
+        }
+
+    def flush(self) -> None:
+        if self._writer is not None:
+            self._queue.join()
+
+    def clear(self, session_id: str) -> bool:
+        self.flush()
+        cleared = self.cache.clear(session_id)
+        with self._lock:
+            self._validated.pop(session_id, None)
+        db = self.session_factory()
+        try:
+            chat_session = db.query(ChatSession).filter(ChatSession.session_id == session_id).first()
+            if chat_session is not None:
+                db.query(ChatMessage).filter(ChatMessage.session_id == chat_session.id).delete(
+                    synchronize_session=False
+                )
+                chat_session.is_active = False
+                db.commit()
+                cleared = True
+        finally:
+            db.close()
+        return cleared
+
+    def clear_all(self) -> int:
+        self.flush()
+        self.cache.clear_all()
+        with self._lock:
+            self._validated.clear()
+        db = self.session_factory()
+        try:
+            session_count = db.query(ChatSession).filter(ChatSession.is_active == True).update(
+                {ChatSession.is_active: False}, synchronize_session=False
+            )
+            db.query(ChatMessage).delete(synchronize_session=False)
+            db.commit()
+            return session_count
+        finally:
+            db.close()
+
+    def active_sessions(self) -> List[str]:
+        db = self.session_factory()
+        try:
+            query = db.query(ChatSession.session_id).filter(ChatSession.is_active == True)
+            if self.cache.idle_ttl_seconds > 0:
+                since = datetime.now() - timedelta(seconds=self.cache.idle_ttl_seconds)
+                query = query.filter(ChatSession.last_activity >= since)
+            return [row.session_id for row in query]
+        finally:
+            db.close()
+
+    def close(self) -> None:
+        self.flush()
+        self._stop_writer.set()
+        self.cache.close()
+
+    def get_stats(self) -> Dict[str, Any]:
+        lookups = self.stats["cache_hits"] + self.stats["cache_misses"]
+        return {
+            **self.cache.get_stats(),
+            "store": "database",
+            **self.stats,
+            "cache_hit_ratio": round(self.stats["cache_hits"] / lookups, 3) if lookups else 0.0,
+            "pending_writes": self._queue.unfinished_tasks
+        }
+
+def create_conversation_store(config: Optional[ChatbotConfig] = None) -> ConversationStore:
+    """Construir el almacenamiento según ChatbotConfig (CONVERSATION_STORE: memory | database)"""
+    config = config or ChatbotConfig()
+    memory_store = MemoryConversationStore(
+        max_turns=config.CONVERSATION_MAX_TURNS,
+        idle_ttl_seconds=config.CONVERSATION_IDLE_TTL_SECONDS,
+        max_sessions=config.CONVERSATION_MAX_SESSIONS,
+        max_bytes=config.CONVERSATION_MAX_BYTES,
+        sweep_interval_seconds=config.CONVERSATION_SWEEP_INTERVAL_SECONDS
+    )
+    if config.CONVERSATION_STORE != "database":
+        return memory_store
+
+    logger.info("Historial de conversaciones en base de datos (lotes de %s, cada %ss)",
+                config.CONVERSATION_WRITE_BATCH_SIZE, config.CONVERSATION_WRITE_INTERVAL_SECONDS)
+    return DatabaseConversationStore(SessionLocal, memory_store,
+                                     batch_size=config.CONVERSATION_WRITE_BATCH_SIZE,
+                                     flush_interval_seconds=config.CONVERSATION_WRITE_INTERVAL_SECONDS,
+                                     validate_seconds=config.CONVERSATION_CACHE_VALIDATE_SECONDS)
@@ -5,16 +5,159 @@ Maneja la extracción de productos, marcas, precios, intenciones, etc.
 """
 import re
 import logging
-from typing import Dict, Any, List, Optional
+from typing import TYPE_CHECKING, Callable, Dict, Any, List, Optional
 from ..core.config import ChatbotConfig
+from .pattern_matcher import PatternFamily
+
+if TYPE_CHECKING:
+    from ..services.catalog_index import CatalogIndex
 
 logger = logging.getLogger(__name__)
 
+# Patrones para preguntas tecnológicas generales (no sobre productos específicos)
+TECH_QUESTION_PATTERNS = [
+    # Preguntas generales por categoría (que X es mejor)
+    r"(?:qu[eé]|cu[aá]l)\s+laptop\s+es\s+mejor",                                # "que laptop es mejor"
+    r"(?:qu[eé]|cu[aá]l)\s+pc\s+es\s+mejor",                                    # "que pc es mejor"
+    r"(?:qu[eé]|cu[aá]l)\s+monitor\s+es\s+mejor",                               # "que monitor es mejor"
+    r"(?:qu[eé]|cu[aá]l)\s+pantalla\s+es\s+mejor",                              # "que pantalla es mejor"
+    r"(?:qu[eé]|cu[aá]l)\s+teclado\s+es\s+mejor",                               # "que teclado es mejor"
+    r"(?:qu[eé]|cu[aá]l)\s+mouse\s+es\s+mejor",                                 # "que mouse es mejor"
+    r"(?:qu[eé]|cu[aá]l)\s+procesador\s+es\s+mejor",                            # "que procesador es mejor"
+    r"(?:qu[eé]|cu[aá]l)\s+tarjeta\s+(?:gráfica|de\s+video)\s+es\s+mejor",     # "que tarjeta grafica es mejor"
+    
+    # Comparaciones generales PC vs Laptop
+    r"(?:qu[eé]|cu[aá]l)\s+es\s+mejor\s+(?:una\s+)?laptop\s+o\s+(?:una\s+)?pc",  # "que es mejor una laptop o una pc"
+    r"(?:qu[eé]|cu[aá]l)\s+es\s+mejor\s+(?:una\s+)?pc\s+o\s+(?:una\s+)?laptop",  # "que es mejor una pc o una laptop"
+    r"laptop\s+o\s+pc\s+(?:para|qu[eé])",                                        # "laptop o pc para gaming"
+    r"pc\s+o\s+laptop\s+(?:para|qu[eé])",                                        # "pc o laptop para trabajo"
+    r"diferencia\s+entre\s+laptop\s+y\s+pc",                                     # "diferencia entre laptop y pc"
+    r"diferencia\s+entre\s+pc\s+y\s+laptop",                                     # "diferencia entre pc y laptop"
+    r"ventajas?\s+(?:de\s+)?laptop\s+(?:vs?|o)\s+pc",                           # "ventajas de laptop vs pc"
+    r"ventajas?\s+(?:de\s+)?pc\s+(?:vs?|o)\s+laptop",                           # "ventajas de pc vs laptop"
+    r"(?:qu[eé]|cu[aá]l)\s+conviene\s+más\s+laptop\s+o\s+pc",                   # "que conviene más laptop o pc"
+      # Comparaciones de componentes y marcas
+    r"(?:qu[eé]|cu[aá]l)\s+es\s+mejor\s+amd\s+o\s+intel",                      # "cual es mejor amd o intel"
+    r"(?:qu[eé]|cu[aá]l)\s+es\s+mejor\s+intel\s+o\s+amd",                      # "cual es mejor intel o amd"
+    r"diferencia\s+entre\s+amd\s+e?\s*intel",                                   # "diferencia entre amd e intel"
+    r"diferencia\s+entre\s+intel\s+y\s+amd",                                    # "diferencia entre intel y amd"
+    r"amd\s+vs?\s+intel",                                                       # "amd vs intel"
+    r"intel\s+vs?\s+amd",                                                       # "intel vs amd"
+    r"(?:qu[eé]|cu[aá]l)\s+es\s+mejor\s+nvidia\s+o\s+amd",                     # "cual es mejor nvidia o amd"
+    r"(?:qu[eé]|cu[aá]l)\s+es\s+mejor\s+amd\s+o\s+nvidia",                     # "cual es mejor amd o nvidia"
+    r"nvidia\s+vs?\s+amd",                                                      # "nvidia vs amd"
+    
+    # Comparaciones de marcas de fabricantes (preguntas generales)
+    r"(?:qu[eé]|cu[aá]l)\s+es\s+mejor\s+asus\s+o\s+lenovo",                    # "que es mejor asus o lenovo"
+    r"(?:qu[eé]|cu[aá]l)\s+es\s+mejor\s+lenovo\s+o\s+asus",                    # "que es mejor lenovo o asus"
+    r"(?:qu[eé]|cu[aá]l)\s+es\s+mejor\s+hp\s+o\s+dell",                        # "que es mejor hp o dell"
+    r"(?:qu[eé]|cu[aá]l)\s+es\s+mejor\s+dell\s+o\s+hp",                        # "que es mejor dell o hp"
+    r"(?:qu[eé]|cu[aá]l)\s+es\s+mejor\s+asus\s+o\s+hp",                        # "que es mejor asus o hp"
+    r"(?:qu[eé]|cu[aá]l)\s+es\s+mejor\s+hp\s+o\s+asus",                        # "que es mejor hp o asus"            r"(?:qu[eé]|cu[aá]l)\s+es\s+mejor\s+lenovo\s+o\s+dell",                    # "que es mejor lenovo o dell"
+    r"(?:qu[eé]|cu[aá]l)\s+es\s+mejor\s+dell\s+o\s+lenovo",                    # "que es mejor dell o lenovo"
+    r"(?:qu[eé]|cu[aá]l)\s+es\s+mejor\s+lenovo\s+o\s+hp",                      # "que es mejor lenovo o hp"
+    r"(?:qu[eé]|cu[aá]l)\s+es\s+mejor\s+hp\s+o\s+lenovo",                      # "que es mejor hp o lenovo"
+    r"diferencia\s+entre\s+asus\s+y\s+lenovo",                                  # "diferencia entre asus y lenovo"
+    r"diferencia\s+entre\s+lenovo\s+y\s+asus",                                  # "diferencia entre lenovo y asus"            r"diferencia\s+entre\s+hp\s+y\s+dell",                                      # "diferencia entre hp y dell"
+    r"diferencia\s+entre\s+dell\s+y\s+hp",                                      # "diferencia entre dell y hp"
+    r"diferencia\s+entre\s+lenovo\s+y\s+hp",                                    # "diferencia entre lenovo y hp"
+    r"diferencia\s+entre\s+hp\s+y\s+lenovo",                                    # "diferencia entre hp y lenovo"
+    r"asus\s+vs?\s+lenovo",                                                     # "asus vs lenovo"
+    r"lenovo\s+vs?\s+asus",                                                     # "lenovo vs asus"            r"hp\s+vs?\s+dell",                                                         # "hp vs dell"
+    r"dell\s+vs?\s+hp",                                                         # "dell vs hp"
+    r"lenovo\s+vs?\s+hp",                                                       # "lenovo vs hp"
+    r"hp\s+vs?\s+lenovo",                                                       # "hp vs lenovo"
+    
+    # Preguntas sobre tipos de componentes
+    r"(?:qu[eé]|cu[aá]l)\s+es\s+mejor\s+ssd\s+o\s+hdd",                        # "cual es mejor ssd o hdd"
+    r"(?:qu[eé]|cu[aá]l)\s+es\s+mejor\s+hdd\s+o\s+ssd",                        # "cual es mejor hdd o ssd"
+    r"diferencia\s+entre\s+ssd\s+y\s+hdd",                                      # "diferencia entre ssd y hdd"
+    r"ssd\s+vs?\s+hdd",                                                         # "ssd vs hdd"
+    
+    # Preguntas sobre sistemas operativos
+    r"(?:qu[eé]|cu[aá]l)\s+es\s+mejor\s+windows\s+o\s+linux",                  # "cual es mejor windows o linux"
+    r"(?:qu[eé]|cu[aá]l)\s+es\s+mejor\s+linux\s+o\s+windows",                  # "cual es mejor linux o windows"
+    r"diferencia\s+entre\s+windows\s+y\s+linux",                               # "diferencia entre windows y linux"
+]
+
+def _tech_question_type(pattern: str) -> str:
+    """Tipo de pregunta tecnológica según el patrón que coincidió (para respuestas más específicas)"""
+    if "laptop.*es.*mejor" in pattern and not ("pc" in pattern or "computadora" in pattern):
+        return "best_laptop"
+    elif "pc.*es.*mejor" in pattern:
+        return "best_pc"
+    elif "monitor.*es.*mejor" in pattern or "pantalla.*es.*mejor" in pattern:
+        return "best_monitor"
+    elif "teclado.*es.*mejor" in pattern:
+        return "best_keyboard"
+    elif "mouse.*es.*mejor" in pattern:
+        return "best_mouse"
+    elif "procesador.*es.*mejor" in pattern:
+        return "best_processor"
+    elif "tarjeta" in pattern and ("gráfica" in pattern or "video" in pattern):
+        return "best_gpu"
+    elif "laptop" in pattern and "pc" in pattern:
+        return "laptop_vs_pc"
+    elif "amd" in pattern and "intel" in pattern:
+        return "amd_vs_intel"
+    elif "nvidia" in pattern:
+        return "gpu_comparison"
+    elif "ssd" in pattern and "hdd" in pattern:
+        return "storage_comparison"
+    elif "windows" in pattern or "linux" in pattern:
+        return "os_comparison"
+    elif any(brand in pattern for brand in ["asus", "lenovo", "hp", "dell"]):
+        return "brand_comparison"
+    return "general_tech"
+
+class ExtractorPatterns:
+    """
+    Patrones de ChatbotConfig compilados una sola vez por proceso, una familia por tipo de
+    entidad (antes cada mensaje pasaba cada patrón crudo por re.search)
+    """
+
+    def __init__(self, config: ChatbotConfig, family: Callable[..., PatternFamily] = PatternFamily):
+        # `family` permite a benchmarks/entity_benchmark.py medir contra la búsqueda patrón por patrón
+        self.recommendation = family(config.RECOMMENDATION_QUERY_PATTERNS)
+        self.tech_questions = family(TECH_QUESTION_PATTERNS)
+        self.tech_question_types = {pattern: _tech_question_type(pattern) for pattern in TECH_QUESTION_PATTERNS}
+        self.comparison = family(config.COMPARISON_PATTERNS)
+        self.comparison_attributes = family(config.COMPARISON_ATTRIBUTE_PATTERNS)
+        self.brand_names = frozenset(brand.lower() for brand in config.BRANDS)
+        self.products = family(config.PRODUCT_PATTERNS)
+        self.brands = family(config.BRANDS, literal=True)
+        self.use_cases = family(config.USE_CASES, literal=True)
+        self.cart = family(config.CART_PATTERNS, literal=True)
+        self.contextual_refs = family(config.CONTEXTUAL_REFS, literal=True)
+        self.specs = family([pattern.lower() for pattern in config.SPEC_PATTERNS], literal=True)
+        self.contextual_specs = family(config.CONTEXTUAL_SPEC_PATTERNS)
+
+_extractor_patterns = ExtractorPatterns(ChatbotConfig)
+
+def get_extractor_patterns() -> ExtractorPatterns:
+    """Patrones compilados compartidos por todos los extractores del proceso"""
+    return _extractor_patterns
+
 class EntityExtractor:
     """Extrae entidades relevantes del mensaje del usuario"""
     
-    def __init__(self):
+    _BUDGET = re.compile(r'(?:hasta|máximo|presupuesto|budget)\s*(?:de\s*)?(?:s/\s*)?(\d+)')
+    _QUANTITY = re.compile(r'(\d+)\s*(?:unidades?|pcs?|equipos?)')
+    _CATEGORY = re.compile(r"(laptop|pc|computadora|equipo)s?")
+    # Número de producto de una referencia contextual, en este orden de prioridad
+    _ORDINALS = (
+        (2, re.compile(r"(?:la\s+)?segunda?|(?:\s|^)2(?:\s|$)")),
+        (1, re.compile(r"(?:la\s+)?primera?|(?:el\s+)?primero|(?:\s|^)1(?:\s|$)")),
+        (3, re.compile(r"(?:la\s+)?tercera?|(?:el\s+)?tercero|(?:\s|^)3(?:\s|$)")),
+    )
+    _ANY_ORDINAL = re.compile(r"(?:\s|^)([1-5])(?:\s|$)")
+    _SPEC_TITLE = re.compile(r"📋 \*\*Especificaciones Técnicas - (.+?)\*\*")
+    
+    def __init__(self, catalog_index: Optional["CatalogIndex"] = None):
         self.config = ChatbotConfig()
+        self.patterns = get_extractor_patterns()
+        # Sin índice del catálogo no se reconocen productos concretos (p. ej. proveedor local)
+        self.catalog_index = catalog_index
     
     def extract_entities(self, message: str, conversation_history: Optional[List[Dict[str, Any]]] = None) -> Dict[str, Any]:
         """Extraer entidades del mensaje usando regex y contexto"""
@@ -66,44 +209,41 @@ class EntityExtractor:
     
     def _extract_product_category(self, message_lower: str, entities: Dict[str, Any]) -> None:
         """Extraer categoría de producto"""
-        for product, pattern in self.config.PRODUCT_PATTERNS.items():
-            if re.search(pattern, message_lower):
-                entities["producto"] = product
-                break
+        product = self.patterns.products.find(message_lower)
+        if product:
+            entities["producto"] = product
     
     def _extract_brand(self, message_lower: str, entities: Dict[str, Any]) -> None:
         """Extraer marca del producto"""
-        for brand in self.config.BRANDS:
-            if brand in message_lower:
-                entities["marca"] = brand
-                break
+        brand = self.patterns.brands.find(message_lower)
+        if brand:
+            entities["marca"] = brand
     
     def _extract_budget(self, message_lower: str, entities: Dict[str, Any]) -> None:
         """Extraer presupuesto/precio máximo"""
-        price_match = re.search(r'(?:hasta|máximo|presupuesto|budget)\s*(?:de\s*)?(?:s/\s*)?(\d+)', message_lower)
+        price_match = self._BUDGET.search(message_lower)
         if price_match:
             entities["presupuesto"] = int(price_match.group(1))
     
     def _extract_quantity(self, message_lower: str, entities: Dict[str, Any]) -> None:
         """Extraer cantidad de productos"""
-        quantity_match = re.search(r'(\d+)\s*(?:unidades?|pcs?|equipos?)', message_lower)
+        quantity_match = self._QUANTITY.search(message_lower)
         if quantity_match:
             entities["cantidad"] = int(quantity_match.group(1))
     
     def _extract_use_case(self, message_lower: str, entities: Dict[str, Any]) -> None:
         """Detectar caso de uso/propósito"""
-        for use_case, keywords in self.config.USE_CASES.items():
-            if any(keyword in message_lower for keyword in keywords):
-                entities["uso"] = use_case
-                break
+        use_case = self.patterns.use_cases.find(message_lower)
+        if use_case:
+            entities["uso"] = use_case
     
     def _extract_cart_action(self, message_lower: str, entities: Dict[str, Any], 
                            conversation_history: Optional[List[Dict[str, Any]]]) -> None:
         """Detectar intención de agregar al carrito"""
-        if any(pattern in message_lower for pattern in self.config.CART_PATTERNS):
+        if self.patterns.cart.matches(message_lower):
             entities["accion"] = "agregar_carrito"
             # Si usa referencias contextuales sin especificar producto
-            if any(ref in message_lower for ref in self.config.CONTEXTUAL_REFS) and conversation_history:
+            if conversation_history and self.patterns.contextual_refs.matches(message_lower):
                 last_product = self._get_last_discussed_product(conversation_history)
                 if last_product:
                     entities["producto_especifico"] = last_product
@@ -112,70 +252,62 @@ class EntityExtractor:
         """Detectar solicitudes de especificaciones, incluyendo referencias contextuales"""
         
         # Verificar patrones básicos de especificaciones
-        for pattern in self.config.SPEC_PATTERNS:
-            if pattern.lower() in message_lower:
-                entities["accion"] = "ver_especificaciones"
-                logger.info("Detectada solicitud de especificaciones básica")
-                break
+        if self.patterns.specs.matches(message_lower):
+            entities["accion"] = "ver_especificaciones"
+            logger.debug("Detectada solicitud de especificaciones básica")
         
         # Verificar patrones contextuales para especificaciones (la segunda, el primero, etc.)
-        if entities.get("accion") != "ver_especificaciones":
-            for pattern in self.config.CONTEXTUAL_SPEC_PATTERNS:
-                if re.search(pattern, message_lower):
-                    entities["accion"] = "ver_especificaciones"
-                    entities["referencia_contextual"] = True
-                    
-                    # Extraer qué número de producto se refiere (mejorado para números directos)
-                    if re.search(r"(?:la\s+)?segunda?|(?:\s|^)2(?:\s|$)", message_lower):
-                        entities["numero_producto"] = 2
-                    elif re.search(r"(?:la\s+)?primera?|(?:el\s+)?primero|(?:\s|^)1(?:\s|$)", message_lower):
-                        entities["numero_producto"] = 1
-                    elif re.search(r"(?:la\s+)?tercera?|(?:el\s+)?tercero|(?:\s|^)3(?:\s|$)", message_lower):
-                        entities["numero_producto"] = 3
-                    else:
-                        # Fallback: buscar cualquier número del 1-5
-                        number_match = re.search(r"(?:\s|^)([1-5])(?:\s|$)", message_lower)
-                        if number_match:
-                            entities["numero_producto"] = int(number_match.group(1))
-                    
-                    logger.info(f"Detectada solicitud de especificaciones contextual - Producto #{entities.get('numero_producto', 'N/A')}")
+        elif self.patterns.contextual_specs.matches(message_lower):
+            entities["accion"] = "ver_especificaciones"
+            entities["referencia_contextual"] = True
+            
+            # Extraer qué número de producto se refiere (mejorado para números directos)
+            for number, ordinal in self._ORDINALS:
+                if ordinal.search(message_lower):
+                    entities["numero_producto"] = number
                     break
+            else:
+                # Fallback: buscar cualquier número del 1-5
+                number_match = self._ANY_ORDINAL.search(message_lower)
+                if number_match:
+                    entities["numero_producto"] = int(number_match.group(1))
+            
+            logger.debug("Detectada solicitud de especificaciones contextual - Producto #%s", entities.get('numero_producto', 'N/A'))
 
     def _extract_recommend_action(self, message_lower: str, entities: Dict[str, Any]) -> None:
         """Detectar solicitudes de recomendación inteligente"""
         # Verificar si el mensaje coincide con patrones de recomendación
-        for pattern in self.config.RECOMMENDATION_QUERY_PATTERNS:
-            if re.search(pattern, message_lower):
-                entities["accion"] = "recomendar_categoria"
-                
-                # Extraer la categoría mencionada en el patrón
-                category_match = re.search(r"(laptop|pc|computadora|equipo)s?", message_lower)
-                if category_match:
-                    category = category_match.group(1)
-                    if category in ["laptop", "computadora"]:
-                        entities["categoria"] = "laptop"
-                    elif category in ["pc", "equipo"]:
-                        entities["categoria"] = "pc"
-                    else:
-                        entities["categoria"] = category
-                
-                logger.info(f"Detectada solicitud de recomendación para categoría: {entities.get('categoria', 'general')}")
-                break
+        if self.patterns.recommendation.matches(message_lower):
+            entities["accion"] = "recomendar_categoria"
+            
+            # Extraer la categoría mencionada en el patrón
+            category_match = self._CATEGORY.search(message_lower)
+            if category_match:
+                category = category_match.group(1)
+                if category in ["laptop", "computadora"]:
+                    entities["categoria"] = "laptop"
+                elif category in ["pc", "equipo"]:
+                    entities["categoria"] = "pc"
+                else:
+                    entities["categoria"] = category
+            
+            logger.debug("Detectada solicitud de recomendación para categoría: %s", entities.get('categoria', 'general'))
 
     def _extract_specific_product_name(self, message_lower: str, entities: Dict[str, Any]) -> None:
-        """Extraer nombre específico del producto mencionado"""
-        for pattern in self.config.SPECIFIC_PRODUCT_PATTERNS:
-            match = re.search(pattern, message_lower)
-            if match:
-                entities["producto_especifico"] = match.group().strip()
-                break
+        """Extraer el producto concreto mencionado (trie del catálogo, sin consultas)"""
+        if self.catalog_index is None:
+            return
+        product = self.catalog_index.match_product(message_lower)
+        if product:
+            entities["producto_especifico"] = product.name
+            entities["producto_id"] = product.id
     
     def _get_last_discussed_product(self, conversation_history: List[Dict[str, Any]]) -> Optional[str]:
         """Obtener el último producto específico discutido en la conversación"""
         for conv in reversed(conversation_history):
             # Si mostró especificaciones, extraer el producto del mensaje del bot
             if "📋 **Especificaciones Técnicas -" in conv.get("bot_response", ""):
-                match = re.search(r"📋 \*\*Especificaciones Técnicas - (.+?)\*\*", conv["bot_response"])
+                match = self._SPEC_TITLE.search(conv["bot_response"])
                 if match:
                     return match.group(1).strip()
             
@@ -269,43 +401,40 @@ class EntityExtractor:
         attributes_to_compare = []
         marcas_to_compare = []
 
-        for pattern in self.config.COMPARISON_PATTERNS:
-            match = re.search(pattern, message_lower)
-            if match:
-                is_comparison_intent = True
-                # Extraer nombres de productos/marcas de los grupos de captura
-                if len(match.groups()) >= 2:
-                    # Limpiar y añadir los elementos a comparar
-                    item1_full = match.group(1).strip()
-                    item2_full = match.group(2).strip()
-                    
-                    # Intentar identificar si son marcas o nombres de producto más específicos
-                    # Esto es una heurística y podría mejorarse
-                    item1_is_brand = any(brand.lower() == item1_full.lower() for brand in self.config.BRANDS)
-                    item2_is_brand = any(brand.lower() == item2_full.lower() for brand in self.config.BRANDS)
-
-                    if item1_is_brand and item2_is_brand:
-                        marcas_to_compare.extend([item1_full, item2_full])
-                    elif item1_is_brand and not item2_is_brand: # Ej: "compara Asus con Dell XPS"
-                        marcas_to_compare.append(item1_full)
-                        product_names_to_compare.append(item2_full)
-                    elif not item1_is_brand and item2_is_brand: # Ej: "compara Dell XPS con Asus"
-                        product_names_to_compare.append(item1_full)
-                        marcas_to_compare.append(item2_full)
-                    else: # Asumir que son nombres de producto
-                        product_names_to_compare.extend([item1_full, item2_full])
+        found = self.patterns.comparison.search(message_lower)
+        if found:
+            match = found[1]
+            is_comparison_intent = True
+            # Extraer nombres de productos/marcas de los grupos de captura
+            if len(match.groups()) >= 2:
+                # Limpiar y añadir los elementos a comparar
+                item1_full = match.group(1).strip()
+                item2_full = match.group(2).strip()
                 
-                # Extraer atributos de comparación del resto del mensaje (si no están en los grupos)
-                # o de todo el mensaje si el patrón es simple como "vs"
-                text_for_attributes = message_lower
-                if len(match.groups()) >=2: # Si los productos estaban en grupos, buscar atributos en el resto
-                    text_for_attributes = message_lower.replace(match.group(0), "").strip()
-                
-                for attr, attr_patterns in self.config.COMPARISON_ATTRIBUTE_PATTERNS.items():
-                    for p_attr in attr_patterns:
-                        if re.search(p_attr, text_for_attributes) or re.search(p_attr, message_lower): # Buscar en el resto o en todo
-                            attributes_to_compare.append(attr)
-                break 
+                # Intentar identificar si son marcas o nombres de producto más específicos
+                # Esto es una heurística y podría mejorarse
+                item1_is_brand = item1_full.lower() in self.patterns.brand_names
+                item2_is_brand = item2_full.lower() in self.patterns.brand_names
+
+                if item1_is_brand and item2_is_brand:
+                    marcas_to_compare.extend([item1_full, item2_full])
+                elif item1_is_brand and not item2_is_brand: # Ej: "compara Asus con Dell XPS"
+                    marcas_to_compare.append(item1_full)
+                    product_names_to_compare.append(item2_full)
+                elif not item1_is_brand and item2_is_brand: # Ej: "compara Dell XPS con Asus"
+                    product_names_to_compare.append(item1_full)
+                    marcas_to_compare.append(item2_full)
+                else: # Asumir que son nombres de producto
+                    product_names_to_compare.extend([item1_full, item2_full])
+            
+            # Extraer atributos de comparación del resto del mensaje (si no están en los grupos)
+            # o de todo el mensaje si el patrón es simple como "vs"
+            text_for_attributes = message_lower
+            if len(match.groups()) >=2: # Si los productos estaban en grupos, buscar atributos en el resto
+                text_for_attributes = message_lower.replace(match.group(0), "").strip()
+            
+            # Buscar en el resto o en todo
+            attributes_to_compare.extend(self.patterns.comparison_attributes.find_all([text_for_attributes, message_lower]))
 
         if is_comparison_intent:
             entities["accion"] = "comparar_productos"
@@ -324,103 +453,9 @@ class EntityExtractor:
     
     def _extract_tech_question(self, message_lower: str, entities: Dict[str, Any]) -> None:
         """Detectar preguntas tecnológicas generales (no sobre productos específicos)"""
-          # Patrones para preguntas tecnológicas generales
-        tech_question_patterns = [
-            # Preguntas generales por categoría (que X es mejor)
-            r"(?:qu[eé]|cu[aá]l)\s+laptop\s+es\s+mejor",                                # "que laptop es mejor"
-            r"(?:qu[eé]|cu[aá]l)\s+pc\s+es\s+mejor",                                    # "que pc es mejor"
-            r"(?:qu[eé]|cu[aá]l)\s+monitor\s+es\s+mejor",                               # "que monitor es mejor"
-            r"(?:qu[eé]|cu[aá]l)\s+pantalla\s+es\s+mejor",                              # "que pantalla es mejor"
-            r"(?:qu[eé]|cu[aá]l)\s+teclado\s+es\s+mejor",                               # "que teclado es mejor"
-            r"(?:qu[eé]|cu[aá]l)\s+mouse\s+es\s+mejor",                                 # "que mouse es mejor"
-            r"(?:qu[eé]|cu[aá]l)\s+procesador\s+es\s+mejor",                            # "que procesador es mejor"
-            r"(?:qu[eé]|cu[aá]l)\s+tarjeta\s+(?:gráfica|de\s+video)\s+es\s+mejor",     # "que tarjeta grafica es mejor"
-            
-            # Comparaciones generales PC vs Laptop
-            r"(?:qu[eé]|cu[aá]l)\s+es\s+mejor\s+(?:una\s+)?laptop\s+o\s+(?:una\s+)?pc",  # "que es mejor una laptop o una pc"
-            r"(?:qu[eé]|cu[aá]l)\s+es\s+mejor\s+(?:una\s+)?pc\s+o\s+(?:una\s+)?laptop",  # "que es mejor una pc o una laptop"
-            r"laptop\s+o\s+pc\s+(?:para|qu[eé])",                                        # "laptop o pc para gaming"
-            r"pc\s+o\s+laptop\s+(?:para|qu[eé])",                                        # "pc o laptop para trabajo"
-            r"diferencia\s+entre\s+laptop\s+y\s+pc",                                     # "diferencia entre laptop y pc"
-            r"diferencia\s+entre\s+pc\s+y\s+laptop",                                     # "diferencia entre pc y laptop"
-            r"ventajas?\s+(?:de\s+)?laptop\s+(?:vs?|o)\s+pc",                           # "ventajas de laptop vs pc"
-            r"ventajas?\s+(?:de\s+)?pc\s+(?:vs?|o)\s+laptop",                           # "ventajas de pc vs laptop"
-            r"(?:qu[eé]|cu[aá]l)\s+conviene\s+más\s+laptop\s+o\s+pc",                   # "que conviene más laptop o pc"
-              # Comparaciones de componentes y marcas
-            r"(?:qu[eé]|cu[aá]l)\s+es\s+mejor\s+amd\s+o\s+intel",                      # "cual es mejor amd o intel"
-            r"(?:qu[eé]|cu[aá]l)\s+es\s+mejor\s+intel\s+o\s+amd",                      # "cual es mejor intel o amd"
-            r"diferencia\s+entre\s+amd\s+e?\s*intel",                                   # "diferencia entre amd e intel"
-            r"diferencia\s+entre\s+intel\s+y\s+amd",                                    # "diferencia entre intel y amd"
-            r"amd\s+vs?\s+intel",                                                       # "amd vs intel"
-            r"intel\s+vs?\s+amd",                                                       # "intel vs amd"
-            r"(?:qu[eé]|cu[aá]l)\s+es\s+mejor\s+nvidia\s+o\s+amd",                     # "cual es mejor nvidia o amd"
-            r"(?:qu[eé]|cu[aá]l)\s+es\s+mejor\s+amd\s+o\s+nvidia",                     # "cual es mejor amd o nvidia"
-            r"nvidia\s+vs?\s+amd",                                                      # "nvidia vs amd"
-            
-            # Comparaciones de marcas de fabricantes (preguntas generales)
-            r"(?:qu[eé]|cu[aá]l)\s+es\s+mejor\s+asus\s+o\s+lenovo",                    # "que es mejor asus o lenovo"
-            r"(?:qu[eé]|cu[aá]l)\s+es\s+mejor\s+lenovo\s+o\s+asus",                    # "que es mejor lenovo o asus"
-            r"(?:qu[eé]|cu[aá]l)\s+es\s+mejor\s+hp\s+o\s+dell",                        # "que es mejor hp o dell"
-            r"(?:qu[eé]|cu[aá]l)\s+es\s+mejor\s+dell\s+o\s+hp",                        # "que es mejor dell o hp"
-            r"(?:qu[eé]|cu[aá]l)\s+es\s+mejor\s+asus\s+o\s+hp",                        # "que es mejor asus o hp"
-            r"(?:qu[eé]|cu[aá]l)\s+es\s+mejor\s+hp\s+o\s+asus",                        # "que es mejor hp o asus"            r"(?:qu[eé]|cu[aá]l)\s+es\s+mejor\s+lenovo\s+o\s+dell",                    # "que es mejor lenovo o dell"
-            r"(?:qu[eé]|cu[aá]l)\s+es\s+mejor\s+dell\s+o\s+lenovo",                    # "que es mejor dell o lenovo"
-            r"(?:qu[eé]|cu[aá]l)\s+es\s+mejor\s+lenovo\s+o\s+hp",                      # "que es mejor lenovo o hp"
-            r"(?:qu[eé]|cu[aá]l)\s+es\s+mejor\s+hp\s+o\s+lenovo",                      # "que es mejor hp o lenovo"
-            r"diferencia\s+entre\s+asus\s+y\s+lenovo",                                  # "diferencia entre asus y lenovo"
-            r"diferencia\s+entre\s+lenovo\s+y\s+asus",                                  # "diferencia entre lenovo y asus"            r"diferencia\s+entre\s+hp\s+y\s+dell",                                      # "diferencia entre hp y dell"
-            r"diferencia\s+entre\s+dell\s+y\s+hp",                                      # "diferencia entre dell y hp"
-            r"diferencia\s+entre\s+lenovo\s+y\s+hp",                                    # "diferencia entre lenovo y hp"
-            r"diferencia\s+entre\s+hp\s+y\s+lenovo",                                    # "diferencia entre hp y lenovo"
-            r"asus\s+vs?\s+lenovo",                                                     # "asus vs lenovo"
-            r"lenovo\s+vs?\s+asus",                                                     # "lenovo vs asus"            r"hp\s+vs?\s+dell",                                                         # "hp vs dell"
-            r"dell\s+vs?\s+hp",                                                         # "dell vs hp"
-            r"lenovo\s+vs?\s+hp",                                                       # "lenovo vs hp"
-            r"hp\s+vs?\s+lenovo",                                                       # "hp vs lenovo"
-            
-            # Preguntas sobre tipos de componentes
-            r"(?:qu[eé]|cu[aá]l)\s+es\s+mejor\s+ssd\s+o\s+hdd",                        # "cual es mejor ssd o hdd"
-            r"(?:qu[eé]|cu[aá]l)\s+es\s+mejor\s+hdd\s+o\s+ssd",                        # "cual es mejor hdd o ssd"
-            r"diferencia\s+entre\s+ssd\s+y\s+hdd",                                      # "diferencia entre ssd y hdd"
-            r"ssd\s+vs?\s+hdd",                                                         # "ssd vs hdd"
-            
-            # Preguntas sobre sistemas operativos
-            r"(?:qu[eé]|cu[aá]l)\s+es\s+mejor\s+windows\s+o\s+linux",                  # "cual es mejor windows o linux"
-            r"(?:qu[eé]|cu[aá]l)\s+es\s+mejor\s+linux\s+o\s+windows",                  # "cual es mejor linux o windows"
-            r"diferencia\s+entre\s+windows\s+y\s+linux",                               # "diferencia entre windows y linux"
-        ]
-        
-        for pattern in tech_question_patterns:
-            if re.search(pattern, message_lower):
-                entities["accion"] = "pregunta_tecnologica"                # Clasificar el tipo de pregunta para respuestas más específicas
-                if "laptop.*es.*mejor" in pattern and not ("pc" in pattern or "computadora" in pattern):
-                    entities["tipo_pregunta"] = "best_laptop"
-                elif "pc.*es.*mejor" in pattern:
-                    entities["tipo_pregunta"] = "best_pc"
-                elif "monitor.*es.*mejor" in pattern or "pantalla.*es.*mejor" in pattern:
-                    entities["tipo_pregunta"] = "best_monitor"
-                elif "teclado.*es.*mejor" in pattern:
-                    entities["tipo_pregunta"] = "best_keyboard"
-                elif "mouse.*es.*mejor" in pattern:
-                    entities["tipo_pregunta"] = "best_mouse"
-                elif "procesador.*es.*mejor" in pattern:
-                    entities["tipo_pregunta"] = "best_processor"
-                elif "tarjeta" in pattern and ("gráfica" in pattern or "video" in pattern):
-                    entities["tipo_pregunta"] = "best_gpu"
-                elif "laptop" in pattern and "pc" in pattern:
-                    entities["tipo_pregunta"] = "laptop_vs_pc"
-                elif "amd" in pattern and "intel" in pattern:
-                    entities["tipo_pregunta"] = "amd_vs_intel"
-                elif "nvidia" in pattern:
-                    entities["tipo_pregunta"] = "gpu_comparison"
-                elif "ssd" in pattern and "hdd" in pattern:
-                    entities["tipo_pregunta"] = "storage_comparison"
-                elif "windows" in pattern or "linux" in pattern:
-                    entities["tipo_pregunta"] = "os_comparison"
-                elif any(brand in pattern for brand in ["asus", "lenovo", "hp", "dell"]):
-                    entities["tipo_pregunta"] = "brand_comparison"
-                else:
-                    entities["tipo_pregunta"] = "general_tech"
-                
-                logger.info(f"Detectada pregunta tecnológica general: {entities['tipo_pregunta']}")
-                break
\ No newline at end of file
+        found = self.patterns.tech_questions.search(message_lower)
+        if found:
+            entities["accion"] = "pregunta_tecnologica"
+            # Clasificar el tipo de pregunta para respuestas más específicas
+            entities["tipo_pregunta"] = self.patterns.tech_question_types[found[0]]
+            logger.debug("Detectada pregunta tecnológica general: %s", entities['tipo_pregunta'])
\ No newline at end of file
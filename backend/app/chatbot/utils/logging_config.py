@@ -0,0 +1,116 @@
+# filepath: backend/app/chatbot/utils/logging_config.py
+"""
+Configuración de logging del proceso
+- Salida no bloqueante: los handlers solo encolan (QueueHandler) y un hilo
+  (QueueListener) formatea y escribe, así el event loop nunca espera por la E/S
+- Formato texto o JSON de una línea (LOG_FORMAT) y niveles por módulo (LOG_LEVELS)
+- Un solo registro por mensaje del chat con los tiempos por tramo de metrics.RequestTrace
+  (logger "app.chatbot.requests"), muestreado con LOG_REQUEST_SAMPLE_RATE; los mensajes
+  lentos y los que terminan en error se registran siempre
+"""
+import sys
+import json
+import queue
+import atexit
+import random
+import logging
+import logging.handlers
+from typing import Any, Dict, Optional
+
+from ..core.config import ChatbotConfig
+from .metrics import RequestTrace, get_metrics
+
+TEXT_FORMAT = "%(asctime)s %(levelname)s %(name)s: %(message)s"
+
+request_logger = logging.getLogger("app.chatbot.requests")
+
+class JsonFormatter(logging.Formatter):
+    """Un objeto JSON por línea; los campos de `extra={"fields": {...}}` se agregan tal cual"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        payload: Dict[str, Any] = {
+            "ts": self.formatTime(record, "%Y-%m-%dT%H:%M:%S"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        fields = getattr(record, "fields", None)
+        if fields:
+            payload.update(fields)
+        if record.exc_info:
+            payload["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(payload, ensure_ascii=False, default=str)
+
+class RequestLogSampler:
+    """Oyente de métricas: un registro por mensaje con intención, tramos, SQL e IA"""
+
+    def __init__(self, sample_rate: float, slow_ms: float):
+        self.sample_rate = sample_rate
+        self.slow_ms = slow_ms
+        self._random = random.Random()
+
+    @classmethod
+    def from_config(cls, config: ChatbotConfig) -> "RequestLogSampler":
+        return cls(config.LOG_REQUEST_SAMPLE_RATE, config.LOG_SLOW_REQUEST_MS)
+
+    def __call__(self, trace: RequestTrace, intent: str) -> None:
+        if not request_logger.isEnabledFor(logging.INFO):
+            return
+        total_ms = trace.elapsed() * 1000
+        if intent != "error" and total_ms < self.slow_ms and self._random.random() >= self.sample_rate:
+            return
+        summary = trace.as_dict()
+        request_logger.info(
+            "chat intent=%s total_ms=%.1f sql=%d/%.1fms llm=%d/%.1fms stages=%s",
+            intent, total_ms, trace.db_queries, summary["db_ms"], trace.llm_calls, summary["llm_ms"],
+            summary["stages_ms"], extra={"fields": {"intent": intent, **summary}}
+        )
+
+_listener: Optional[logging.handlers.QueueListener] = None
+_sampler: Optional[RequestLogSampler] = None
+
+def _parse_levels(spec: str) -> Dict[str, str]:
+    """ "app.search=DEBUG,sqlalchemy.engine=WARNING" -> {módulo: nivel} """
+    levels = {}
+    for item in spec.split(","):
+        name, _, level = item.partition("=")
+        if name.strip() and level.strip():
+            levels[name.strip()] = level.strip().upper()
+    return levels
+
+def configure_logging(config: Optional[ChatbotConfig] = None) -> None:
+    """Reemplazar los handlers del logger raíz por la cola no bloqueante (idempotente)"""
+    global _listener, _sampler
+    config = config or ChatbotConfig()
+    if _listener is not None:
+        _listener.stop()
+
+    output = logging.StreamHandler(sys.stderr)
+    output.setFormatter(JsonFormatter() if config.LOG_FORMAT.lower() == "json" else logging.Formatter(TEXT_FORMAT))
+    log_queue: queue.Queue = queue.Queue(-1)
+    _listener = logging.handlers.QueueListener(log_queue, output, respect_handler_level=True)
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(logging.handlers.QueueHandler(log_queue))
+    root.setLevel(config.LOG_LEVEL.upper())
+    for name, level in _parse_levels(config.LOG_LEVELS).items():
+        logging.getLogger(name).setLevel(level)
+
+    if _sampler is None:
+        _sampler = RequestLogSampler.from_config(config)
+        get_metrics().add_listener(_sampler)
+    else:
+        _sampler.sample_rate = config.LOG_REQUEST_SAMPLE_RATE
+        _sampler.slow_ms = config.LOG_SLOW_REQUEST_MS
+    _listener.start()
+
+def shutdown_logging() -> None:
+    """Vaciar la cola y detener el hilo de escritura"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+atexit.register(shutdown_logging)
@@ -0,0 +1,361 @@
+# filepath: backend/app/chatbot/utils/metrics.py
+"""
+Métricas del chatbot en formato de texto de Prometheus (GET /metrics)
+- Tramos por petición: process_message y cada _handle_* miden su duración con
+  perf_counter en un RequestTrace guardado en un contextvar (sin locks en el camino caliente)
+- Contadores e histogramas propios (sin prometheus_client), con un lock por métrica
+- Consultas SQL por petición vía eventos del engine, llamadas y tokens de la IA desde
+  LLMClient y aciertos de cachés leídos de sus get_stats() al momento del scrape
+"""
+import time
+import bisect
+import asyncio
+import logging
+import functools
+import threading
+from contextvars import ContextVar, Token
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from ..core.config import ChatbotConfig
+
+logger = logging.getLogger(__name__)
+
+# Segundos: de una consulta indexada (~1 ms) a una llamada lenta a la IA
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 50)
+
+# (labels, valor) de una serie que devuelve un colector
+Sample = Tuple[Dict[str, str], float]
+# (nombre, tipo, ayuda, muestras) que devuelve un colector al momento del scrape
+CollectedMetric = Tuple[str, str, str, List[Sample]]
+
+def _escape(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(names: Sequence[str], values: Sequence[Any], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+class Counter:
+    """Contador monótono con etiquetas"""
+
+    __slots__ = ("name", "help", "labelnames", "_values", "_lock")
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, labels: tuple = (), amount: float = 1.0) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def value(self, labels: tuple = ()) -> float:
+        with self._lock:
+            return self._values.get(labels, 0.0)
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        lines.extend(f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}"
+                     for labels, value in items)
+        return lines
+
+class Histogram:
+    """Histograma acumulativo con etiquetas (buckets fijos, suma y conteo por serie)"""
+
+    __slots__ = ("name", "help", "labelnames", "buckets", "_series", "_lock")
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # labels -> [conteo por bucket (+ desbordes), suma, conteo total]
+        self._series: Dict[tuple, list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, labels: tuple = ()) -> None:
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def count(self, labels: tuple = ()) -> int:
+        with self._lock:
+            series = self._series.get(labels)
+            return series[2] if series else 0
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = sorted((labels, (list(series[0]), series[1], series[2]))
+                           for labels, series in self._series.items())
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for labels, (bucket_counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), bucket_counts):
+                cumulative += bucket_count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, labels, le)} {cumulative}")
+            label_text = _format_labels(self.labelnames, labels)
+            lines.append(f"{self.name}_sum{label_text} {_format_value(total)}")
+            lines.append(f"{self.name}_count{label_text} {count}")
+        return lines
+
+class RequestTrace:
+    """Tiempos de una petición al chat: tramos, consultas SQL y llamadas a la IA"""
+
+    __slots__ = ("started", "stages", "db_queries", "db_seconds", "llm_calls", "llm_seconds",
+                 "llm_prompt_tokens", "llm_completion_tokens")
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stages: Dict[str, float] = {}
+        self.db_queries = 0
+        self.db_seconds = 0.0
+        self.llm_calls = 0
+        self.llm_seconds = 0.0
+        self.llm_prompt_tokens = 0
+        self.llm_completion_tokens = 0
+
+    def add_stage(self, name: str, seconds: float) -> None:
+        self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started
+
+    def as_dict(self) -> Dict[str, Any]:
+        """Resumen en milisegundos (para logs y depuración)"""
+        return {
+            "total_ms": round(self.elapsed() * 1000, 2),
+            "stages_ms": {name: round(seconds * 1000, 2) for name, seconds in self.stages.items()},
+            "db_queries": self.db_queries,
+            "db_ms": round(self.db_seconds * 1000, 2),
+            "llm_calls": self.llm_calls,
+            "llm_ms": round(self.llm_seconds * 1000, 2),
+            "llm_tokens": self.llm_prompt_tokens + self.llm_completion_tokens,
+        }
+
+# Traza de la petición en curso; run_db copia el contexto a sus hilos para las consultas SQL
+_current_trace: ContextVar[Optional[RequestTrace]] = ContextVar("chat_request_trace", default=None)
+
+def current_trace() -> Optional[RequestTrace]:
+    return _current_trace.get()
+
+class span:
+    """
+    Medir un tramo de la petición en curso (context manager). Sin traza activa
+    (métricas desactivadas o código fuera del chat) no hace nada
+    """
+
+    __slots__ = ("name", "_trace", "_start")
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __enter__(self) -> "span":
+        self._trace = _current_trace.get()
+        if self._trace is not None:
+            self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        if self._trace is not None:
+            self._trace.add_stage(self.name, time.perf_counter() - self._start)
+
+def traced(name: str) -> Callable:
+    """Decorador: medir cada llamada del método (síncrono o async) como el tramo `name`"""
+    def decorator(func: Callable) -> Callable:
+        if asyncio.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                trace = _current_trace.get()
+                if trace is None:
+                    return await func(*args, **kwargs)
+                start = time.perf_counter()
+                try:
+                    return await func(*args, **kwargs)
+                finally:
+                    trace.add_stage(name, time.perf_counter() - start)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            trace = _current_trace.get()
+            if trace is None:
+                return func(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                trace.add_stage(name, time.perf_counter() - start)
+        return wrapper
+    return decorator
+
+class ChatMetrics:
+    """Registro de métricas del proceso y render en formato de texto de Prometheus"""
+
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self.requests = Counter("chat_requests_total", "Mensajes procesados por intención", ("intent",))
+        self.request_seconds = Histogram("chat_request_duration_seconds",
+                                         "Duración de process_message por intención", ("intent",))
+        self.stage_seconds = Histogram("chat_stage_duration_seconds",
+                                       "Duración de cada tramo del pipeline por intención", ("intent", "stage"))
+        self.request_queries = Histogram("chat_db_queries_per_request", "Consultas SQL por mensaje e intención",
+                                         ("intent",), QUERY_COUNT_BUCKETS)
+        self.db_queries = Counter("db_queries_total", "Consultas SQL ejecutadas por el proceso")
+        self.db_seconds = Histogram("db_query_duration_seconds", "Duración de cada consulta SQL")
+        self.llm_calls = Counter("llm_calls_total", "Llamadas a la IA por proveedor y resultado",
+                                 ("provider", "outcome"))
+        self.llm_seconds = Histogram("llm_call_duration_seconds", "Duración de las llamadas a la IA (con reintentos)",
+                                     ("provider",))
+        self.llm_tokens = Counter("llm_tokens_total", "Tokens estimados enviados y recibidos de la IA",
+                                  ("provider", "direction"))
+        self.orders = Counter("orders_total", "Órdenes procesadas por resultado", ("outcome",))
+        self.order_seconds = Histogram("order_create_duration_seconds",
+                                       "Duración de la creación de cada orden por resultado", ("outcome",))
+        self._metrics = [self.requests, self.request_seconds, self.stage_seconds, self.request_queries,
+                         self.db_queries, self.db_seconds, self.llm_calls, self.llm_seconds, self.llm_tokens,
+                         self.orders, self.order_seconds]
+        self._collectors: Dict[str, Callable[[], Iterable[CollectedMetric]]] = {}
+        self._listeners: List[Callable[[RequestTrace, str], None]] = []
+
+    # ---- ciclo de vida de una petición ----
+
+    def start_request(self) -> Optional[Token]:
+        """Abrir la traza de un mensaje; None si las métricas están desactivadas"""
+        if not self.enabled:
+            return None
+        return _current_trace.set(RequestTrace())
+
+    def finish_request(self, token: Optional[Token], intent: str) -> Optional[RequestTrace]:
+        """Cerrar la traza: observar histogramas por intención y avisar a los oyentes"""
+        if token is None:
+            return None
+        trace = _current_trace.get()
+        _current_trace.reset(token)
+        if trace is None:
+            return None
+        labels = (intent,)
+        self.requests.inc(labels)
+        self.request_seconds.observe(trace.elapsed(), labels)
+        self.request_queries.observe(trace.db_queries, labels)
+        for stage, seconds in trace.stages.items():
+            self.stage_seconds.observe(seconds, (intent, stage))
+        if trace.db_queries:
+            self.stage_seconds.observe(trace.db_seconds, (intent, "db"))
+        if trace.llm_calls:
+            self.stage_seconds.observe(trace.llm_seconds, (intent, "llm"))
+        for listener in self._listeners:
+            try:
+                listener(trace, intent)
+            except Exception as e:
+                logger.warning("Error en oyente de métricas: %s", e)
+        return trace
+
+    def add_listener(self, listener: Callable[[RequestTrace, str], None]) -> None:
+        """Función llamada con (traza, intención) al terminar cada mensaje"""
+        self._listeners.append(listener)
+
+    # ---- base de datos e IA ----
+
+    def record_query(self, seconds: float) -> None:
+        self.db_queries.inc()
+        self.db_seconds.observe(seconds)
+        trace = _current_trace.get()
+        if trace is not None:
+            trace.db_queries += 1
+            trace.db_seconds += seconds
+
+    def record_llm_call(self, provider: str, outcome: str, seconds: float,
+                        prompt_tokens: int = 0, completion_tokens: int = 0) -> None:
+        if not self.enabled:
+            return
+        self.llm_calls.inc((provider, outcome))
+        self.llm_seconds.observe(seconds, (provider,))
+        if prompt_tokens:
+            self.llm_tokens.inc((provider, "prompt"), prompt_tokens)
+        if completion_tokens:
+            self.llm_tokens.inc((provider, "completion"), completion_tokens)
+        trace = _current_trace.get()
+        if trace is not None and outcome != "rejected":
+            trace.llm_calls += 1
+            trace.llm_seconds += seconds
+            trace.llm_prompt_tokens += prompt_tokens
+            trace.llm_completion_tokens += completion_tokens
+
+    # ---- órdenes ----
+
+    def record_order(self, outcome: str, seconds: float) -> None:
+        """outcome: created, empty_cart, insufficient_stock, lock_timeout o error"""
+        if not self.enabled:
+            return
+        self.orders.inc((outcome,))
+        self.order_seconds.observe(seconds, (outcome,))
+
+    # ---- exposición ----
+
+    def add_collector(self, name: str, collector: Callable[[], Iterable[CollectedMetric]]) -> None:
+        """Métricas calculadas al momento del scrape (p. ej. a partir de get_stats()); reemplaza por nombre"""
+        self._collectors[name] = collector
+
+    def render(self) -> str:
+        """Todas las métricas en formato de texto de Prometheus 0.0.4"""
+        lines: List[str] = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        for name, collector in list(self._collectors.items()):
+            try:
+                collected = list(collector())
+            except Exception as e:
+                logger.warning("Error en colector de métricas '%s': %s", name, e)
+                continue
+            for metric_name, metric_type, help_text, samples in collected:
+                lines.append(f"# HELP {metric_name} {help_text}")
+                lines.append(f"# TYPE {metric_name} {metric_type}")
+                for labels, value in samples:
+                    label_text = _format_labels(tuple(labels), tuple(labels.values()))
+                    lines.append(f"{metric_name}{label_text} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+def instrument_engine(engine) -> None:
+    """Contar y medir las consultas SQL del engine (idempotente)"""
+    from sqlalchemy import event
+
+    metrics = get_metrics()
+    if not metrics.enabled or getattr(engine, "_chat_metrics_instrumented", False):
+        return
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        context._chat_metrics_start = time.perf_counter()
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        start = getattr(context, "_chat_metrics_start", None)
+        if start is not None:
+            metrics.record_query(time.perf_counter() - start)
+
+    engine._chat_metrics_instrumented = True
+
+_chat_metrics = ChatMetrics(ChatbotConfig.METRICS_ENABLED)
+
+def get_metrics() -> ChatMetrics:
+    """Registro compartido por todo el proceso"""
+    return _chat_metrics
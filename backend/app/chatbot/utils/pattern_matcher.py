@@ -0,0 +1,133 @@
+# filepath: backend/app/chatbot/utils/pattern_matcher.py
+"""
+Familias de patrones preparadas una sola vez
+Cada familia (PRODUCT_PATTERNS, CART_PATTERNS, ...) se compila al importar el extractor y
+se recorre en el orden de la lista, así la prioridad es la misma que la de los bucles con
+re.search (gana el primer patrón de la lista que coincida en cualquier parte del texto).
+Cada regex lleva además el literal que toda coincidencia debe contener ("mejor",
+"diferencia", "recomien"...): si no aparece en el mensaje el patrón ni se ejecuta, así la
+mayoría de los mensajes descarta familias completas con búsquedas de subcadena en C.
+
+Nota: en el motor de `re` de CPython una alternancia `(?P<p0>...)|(?P<p1>...)` con todos
+los patrones de una familia resulta más lenta que recorrer los patrones compilados, porque
+pierde la búsqueda por prefijo literal de cada patrón (ver benchmarks/entity_benchmark.py);
+lo mismo ocurre con las listas de palabras, donde `in` ya es una búsqueda en C.
+"""
+import re
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Set, Tuple, Union
+
+Patterns = Union[Dict[Any, Union[str, Sequence[str]]], Sequence[str]]
+
+_META = set(".^$*+?{}[]\\|()")
+# Literal más corto que vale la pena usar como filtro previo
+_MIN_LITERAL = 3
+
+def _required_literal(source: str) -> Optional[str]:
+    """
+    Subcadena literal que toda coincidencia del patrón debe contener, o None.
+    Análisis conservador del nivel superior: cualquier alternancia `|` fuera de grupos
+    anula el filtro; grupos, clases, escapes y comodines cortan el literal, y un carácter
+    seguido de `?`, `*` o `{` se considera opcional
+    """
+    if source.startswith("(?") and not source.startswith(("(?:", "(?P", "(?=", "(?!", "(?<")):
+        return None  # flags en línea como (?i)
+    runs: List[str] = []
+    current: List[str] = []
+    depth = 0
+    index = 0
+    while index < len(source):
+        char = source[index]
+        if char == "\\":
+            index += 2
+            if depth == 0:
+                runs.append("".join(current))
+                current = []
+            continue
+        if char == "[":
+            # Saltar la clase completa (un "]" inicial es literal dentro de la clase)
+            index += 2 if source[index + 1:index + 2] in ("]", "^") else 1
+            while index < len(source) and source[index] != "]":
+                index += 2 if source[index] == "\\" else 1
+            index += 1
+            if depth == 0:
+                runs.append("".join(current))
+                current = []
+            continue
+        if char == "(":
+            depth += 1
+        elif char == ")":
+            depth -= 1
+        elif char == "|" and depth == 0:
+            return None
+        if depth == 0 and char not in _META:
+            current.append(char)
+        elif depth == 0 or char == "(":
+            if char in "?*{" and current:
+                current.pop()
+            runs.append("".join(current))
+            current = []
+            if char == "{":
+                # Saltar el cuantificador {m,n}
+                closing = source.find("}", index)
+                index = closing if closing != -1 else len(source)
+        index += 1
+    runs.append("".join(current))
+    best = max(runs, key=len)
+    return best if len(best) >= _MIN_LITERAL else None
+
+class PatternFamily:
+    """
+    Patrones de una familia en orden de prioridad
+    - literal=True busca subcadenas con `in` (listas de palabras como BRANDS o CART_PATTERNS)
+    - Las claves de un diccionario se devuelven como resultado; un valor lista aporta
+      varios patrones con la misma clave (p. ej. USE_CASES o COMPARISON_ATTRIBUTE_PATTERNS)
+    """
+
+    __slots__ = ("keys", "literal", "_entries")
+
+    def __init__(self, patterns: Patterns, literal: bool = False):
+        items: List[Tuple[Any, str]] = []
+        if isinstance(patterns, dict):
+            for key, value in patterns.items():
+                values = [value] if isinstance(value, str) else list(value)
+                items.extend((key, pattern) for pattern in values)
+        else:
+            items = [(pattern, pattern) for pattern in patterns]
+        self.keys = [key for key, _ in items]
+        self.literal = literal
+        # Regex: (clave, patrón compilado, literal obligatorio para descartarlo sin ejecutarlo)
+        self._entries: Tuple[Tuple[Any, Any, Optional[str]], ...] = tuple(
+            (key, pattern, None) if literal else (key, re.compile(pattern), _required_literal(pattern))
+            for key, pattern in items
+        )
+
+    def search(self, text: str) -> Optional[Tuple[Any, Optional["re.Match[str]"]]]:
+        """Clave y coincidencia (None en familias literales) del primer patrón que coincide"""
+        if self.literal:
+            for key, word, _ in self._entries:
+                if word in text:
+                    return key, None
+            return None
+        for key, pattern, required in self._entries:
+            if required is not None and required not in text:
+                continue
+            match = pattern.search(text)
+            if match:
+                return key, match
+        return None
+
+    def matches(self, text: str) -> bool:
+        return self.search(text) is not None
+
+    def find(self, text: str) -> Optional[Any]:
+        """Clave del primer patrón (en orden de la lista) que coincide, o None"""
+        found = self.search(text)
+        return None if found is None else found[0]
+
+    def find_all(self, texts: Iterable[str]) -> Set[Any]:
+        """Todas las claves con algún patrón que coincida en alguno de los textos"""
+        texts = list(texts)
+        if self.literal:
+            return {key for key, word, _ in self._entries if any(word in text for text in texts)}
+        return {key for key, pattern, required in self._entries
+                if any((required is None or required in text) and pattern.search(text) for text in texts)}
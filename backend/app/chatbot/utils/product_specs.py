@@ -0,0 +1,370 @@
+# filepath: backend/app/chatbot/utils/product_specs.py
+"""
+Especificaciones normalizadas de productos
+Cada producto se analiza una sola vez (al cargarse en el índice del catálogo o al
+modificarse): se combinan las especificaciones JSON de la base de datos con heurísticas
+sobre el nombre y se obtiene un ProductSpecs con valores tipados (GB de RAM y
+almacenamiento, familia y generación de CPU, gama de GPU, pulgadas de pantalla...)
+que usan los formateadores, las comparaciones y las recomendaciones
+"""
+import re
+import json
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Tuple
+
+# Claves JSON reconocidas para cada campo (el resto se muestra tal cual como "extra")
+_JSON_KEYS = {
+    "processor": ("processor", "procesador", "cpu"),
+    "ram": ("ram", "memoria", "memoria_ram", "memory"),
+    "storage": ("storage", "almacenamiento", "disco"),
+    "gpu": ("graphics", "gpu", "tarjeta_grafica", "grafica", "video"),
+    "display": ("display", "pantalla", "screen"),
+    "size": ("size", "tamano", "tamaño"),
+    "resolution": ("resolution", "resolucion", "resolución"),
+    "refresh_rate": ("refresh_rate", "tasa_refresco"),
+    "os": ("os", "sistema_operativo", "operating_system"),
+}
+_CONSUMED_KEYS = {key for keys in _JSON_KEYS.values() for key in keys} | {"id", "product_id"}
+
+_PROCESSOR_NAMES = (
+    ("core ultra 5", "Intel Core Ultra 5"),
+    ("core ultra 7", "Intel Core Ultra 7"),
+    ("core ultra 9", "Intel Core Ultra 9"),
+    ("ryzen 3", "AMD Ryzen 3"),
+    ("ryzen 5", "AMD Ryzen 5"),
+    ("ryzen 7", "AMD Ryzen 7"),
+    ("ryzen 9", "AMD Ryzen 9"),
+    ("i3", "Intel Core i3"),
+    ("i5", "Intel Core i5"),
+    ("i7", "Intel Core i7"),
+    ("i9", "Intel Core i9"),
+    ("n4500", "Intel Celeron N4500"),
+)
+_PROCESSOR_NAME_PATTERN = re.compile(
+    r"\b(core ultra [579]|ryzen [3579]|i[3579]|n4500)\b(?:[\s-]+(\d{4,5}[a-z]*))?"
+)
+
+_GPU_NAMES = (
+    (re.compile(r"\brtx\s*(\d{4})\b"), "NVIDIA GeForce RTX {}"),
+    (re.compile(r"\bgtx\s*(\d{4})\b"), "NVIDIA GeForce GTX {}"),
+    (re.compile(r"\b(?:radeon\s*)?rx\s*(\d{4})\b"), "AMD Radeon RX {}"),
+    (re.compile(r"\bradeon (\d{4})\b"), "AMD Radeon RX {}"),
+)
+_INTEGRATED_GPUS = (
+    ("intel iris xe", "Intel Iris Xe"),
+    ("intel uhd", "Intel UHD Graphics"),
+    ("intel arc", "Intel Arc"),
+    ("radeon vega", "AMD Radeon Vega"),
+    ("gráficos integrados", "Gráficos integrados"),
+    ("graphics integrated", "Gráficos integrados"),
+)
+
+_INTEL_PATTERN = re.compile(r"\bi([3579])[\s-]*(\d{4,5})?")
+_ULTRA_PATTERN = re.compile(r"core ultra ([579])")
+_RYZEN_PATTERN = re.compile(r"ryzen ([3579])(?:\s+(?:pro\s+)?(\d{4}))?")
+_APPLE_PATTERN = re.compile(r"\bm([1-4])\b(?:\s*(pro|max|ultra))?")
+_DISCRETE_GPU_PATTERN = re.compile(r"\b(rtx|gtx|rx)\s*(\d{4})\b")
+_RAM_PATTERN = re.compile(r"\b(\d{1,3})\s*gb\b(?!\s*(?:ssd|hdd|nvme|emmc|de almacenamiento))")
+_RAM_TYPE_PATTERN = re.compile(r"\b(ddr\d|lpddr\d)\b")
+_STORAGE_PATTERN = re.compile(r"(\d+(?:\.\d+)?)\s*(gb|tb)")
+_NAME_STORAGE_PATTERN = re.compile(r"(\d+(?:\.\d+)?)\s*(gb|tb)\s*(?:nvme\s*)?(ssd|hdd|emmc)")
+_INCHES_PATTERN = re.compile(r"(\d{2}(?:\.\d)?)\s*(?:\"|”|''|pulgadas|pulg\b|in\b)")
+_REFRESH_PATTERN = re.compile(r"(\d{2,3})\s*hz\b")
+
+_RESOLUTIONS = (
+    (("uhd", "4k", "3840x2160"), "Ultra HD 4K"),
+    (("qhd", "2k", "2560x1440", "wqhd"), "QHD (2560x1440)"),
+    (("fhd", "full hd", "1920x1080"), "Full HD (1920x1080)"),
+)
+
+_OPERATING_SYSTEMS = (
+    (("windows 11",), "Windows 11"),
+    (("windows 10",), "Windows 10"),
+    (("windows",), "Windows"),
+    (("macos", "mac os"), "macOS"),
+    (("linux",), "Linux"),
+    (("sin sistema operativo", "free dos", "freedos"), "Sin sistema operativo"),
+)
+
+_FEATURES = (
+    (("gaming", "gamer"), "Optimizado para gaming"),
+    (("business", "profesional"), "Diseño profesional"),
+    (("2 en 1", "2-en-1", "convertible", "2-in-1"), "Convertible 2-en-1"),
+    (("retroiluminado", "backlit"), "Teclado retroiluminado"),
+    (("huella", "fingerprint"), "Lector de huella digital"),
+    (("ultraligero", "ultra ligero", "lightweight"), "Diseño ultraligero"),
+)
+
+class ProductSpecs:
+    """Especificaciones normalizadas de un producto (textos para mostrar + valores tipados)"""
+
+    __slots__ = ("processor", "ram", "storage", "display", "os", "gpu", "features", "extra",
+                 "cpu_brand", "cpu_family", "cpu_generation", "ram_gb", "ram_type",
+                 "storage_gb", "storage_type", "gpu_tier", "screen_inches", "resolution", "refresh_hz")
+
+    # Campos mostrados en fichas técnicas: (atributo, emoji, etiqueta, clave de comparación)
+    DISPLAY_FIELDS = (
+        ("processor", "⚡", "Procesador", "procesador"),
+        ("ram", "🧠", "Memoria RAM", "ram"),
+        ("storage", "💾", "Almacenamiento", "almacenamiento"),
+        ("display", "🖥️", "Pantalla", "pantalla"),
+        ("os", "🌐", "Sistema operativo", "sistema operativo"),
+        ("gpu", "🎮", "Tarjeta gráfica", "tarjeta grafica"),
+    )
+
+    # Gama de GPU: 0 integrada, 1 entrada (xx50, GTX), 2 media (xx60), 3 alta (xx70), 4 tope (xx80+)
+    GPU_TIER_NAMES = {0: "integrada", 1: "entrada", 2: "media", 3: "alta", 4: "tope"}
+
+    def __init__(self):
+        self.processor = ""
+        self.ram = ""
+        self.storage = ""
+        self.display = ""
+        self.os = ""
+        self.gpu = ""
+        self.features: Tuple[str, ...] = ()
+        self.extra: Tuple[Tuple[str, str], ...] = ()
+        self.cpu_brand: Optional[str] = None
+        self.cpu_family: Optional[str] = None
+        self.cpu_generation: Optional[int] = None
+        self.ram_gb: Optional[int] = None
+        self.ram_type: Optional[str] = None
+        self.storage_gb: Optional[int] = None
+        self.storage_type: Optional[str] = None
+        self.gpu_tier: Optional[int] = None
+        self.screen_inches: Optional[float] = None
+        self.resolution: Optional[str] = None
+        self.refresh_hz: Optional[int] = None
+
+    def display_items(self) -> List[Tuple[str, str, str]]:
+        """(emoji, etiqueta, valor) de los campos conocidos y, al final, los extra del JSON"""
+        items = [(emoji, label, getattr(self, attr)) for attr, emoji, label, _ in self.DISPLAY_FIELDS
+                 if getattr(self, attr)]
+        if self.features:
+            items.append(("✨", "Características especiales", ", ".join(self.features)))
+        items.extend(("•", label, value) for label, value in self.extra)
+        return items
+
+    def as_comparison_dict(self) -> Dict[str, str]:
+        """Valores por clave de atributo de comparación ("procesador", "ram", ...)"""
+        return {key: getattr(self, attr) for attr, _, _, key in self.DISPLAY_FIELDS if getattr(self, attr)}
+
+    def summary(self) -> str:
+        """Resumen compacto en una línea para prompts y comparaciones"""
+        parts = [getattr(self, attr) for attr, _, _, _ in self.DISPLAY_FIELDS if getattr(self, attr)]
+        parts.extend(f"{label}: {value}" for label, value in self.extra)
+        return " · ".join(parts)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {attr: getattr(self, attr) for attr in self.__slots__}
+
+def _fold(text: str) -> str:
+    return " ".join(str(text).lower().split())
+
+def _load_json_specs(specifications: Any) -> Dict[str, Any]:
+    if not specifications:
+        return {}
+    if isinstance(specifications, dict):
+        return specifications
+    try:
+        specs = json.loads(specifications)
+    except (TypeError, ValueError):
+        return {}
+    return specs if isinstance(specs, dict) else {}
+
+def _json_value(specs: Dict[str, Any], field: str) -> str:
+    lowered = {str(key).lower(): value for key, value in specs.items()}
+    for key in _JSON_KEYS[field]:
+        value = lowered.get(key)
+        if value not in (None, ""):
+            return str(value)
+    return ""
+
+def _processor_from_name(name_lower: str) -> str:
+    match = _PROCESSOR_NAME_PATTERN.search(name_lower)
+    if not match:
+        return ""
+    label = dict(_PROCESSOR_NAMES)[match.group(1)]
+    return f"{label} {match.group(2).upper()}" if match.group(2) else label
+
+def _parse_cpu(specs: ProductSpecs, text: str) -> None:
+    text = text.lower()
+    match = _ULTRA_PATTERN.search(text)
+    if match:
+        specs.cpu_brand, specs.cpu_family = "Intel", f"Core Ultra {match.group(1)}"
+        return
+    match = _RYZEN_PATTERN.search(text)
+    if match:
+        specs.cpu_brand, specs.cpu_family = "AMD", f"Ryzen {match.group(1)}"
+        if match.group(2):
+            specs.cpu_generation = int(match.group(2)[0])
+        return
+    match = _INTEL_PATTERN.search(text)
+    if match:
+        specs.cpu_brand, specs.cpu_family = "Intel", f"Core i{match.group(1)}"
+        model = match.group(2)
+        if model:
+            # i5-11400H -> 11, i5-1235U -> 12, i7-8550U -> 8
+            two_digits = len(model) == 5 or model.startswith("1")
+            specs.cpu_generation = int(model[:2]) if two_digits else int(model[0])
+        return
+    if "celeron" in text or "pentium" in text or "n4500" in text:
+        specs.cpu_brand, specs.cpu_family = "Intel", "Celeron" if "pentium" not in text else "Pentium"
+        return
+    if "apple" in text or "macbook" in text:
+        match = _APPLE_PATTERN.search(text)
+        if match:
+            specs.cpu_brand, specs.cpu_family = "Apple", f"M{match.group(1)}"
+            specs.cpu_generation = int(match.group(1))
+
+def _gpu_from_name(name_lower: str) -> str:
+    for pattern, template in _GPU_NAMES:
+        match = pattern.search(name_lower)
+        if match:
+            return template.format(match.group(1))
+    for pattern, value in _INTEGRATED_GPUS:
+        if pattern in name_lower:
+            return value
+    return ""
+
+def _gpu_tier(gpu_lower: str) -> Optional[int]:
+    if not gpu_lower:
+        return None
+    match = _DISCRETE_GPU_PATTERN.search(gpu_lower)
+    if match:
+        family, model = match.group(1), int(match.group(2))
+        if family == "gtx":
+            return 1
+        series = model % 100
+        if series >= 80:
+            return 4
+        return {70: 3, 60: 2}.get(series, 1 if series >= 50 else 0)
+    if any(word in gpu_lower for word in ("integrada", "integrado", "integrated", "iris", "uhd", "vega", "arc")):
+        return 0
+    return None
+
+def _storage_gb(amount: str, unit: str) -> int:
+    value = float(amount)
+    return int(value * 1000) if unit == "tb" else int(value)
+
+def _ram_from_name(name_lower: str) -> str:
+    match = _RAM_PATTERN.search(name_lower)
+    if not match or int(match.group(1)) not in (4, 8, 12, 16, 24, 32, 48, 64, 96, 128):
+        return ""
+    ram_type = _RAM_TYPE_PATTERN.search(name_lower)
+    return f"{match.group(1)}GB {ram_type.group(1).upper()}" if ram_type else f"{match.group(1)}GB"
+
+def _display_from_name(name_lower: str) -> str:
+    parts = []
+    size = _INCHES_PATTERN.search(name_lower)
+    if size:
+        parts.append(f"{size.group(1)} pulgadas")
+    elif "15.6" in name_lower:
+        parts.append("15.6 pulgadas")
+    resolution = _resolution(name_lower)
+    if resolution:
+        parts.append(resolution)
+    if "táctil" in name_lower or "touch" in name_lower:
+        parts.append("táctil")
+    if "ips" in name_lower.split():
+        parts.append("IPS")
+    refresh = _REFRESH_PATTERN.search(name_lower)
+    if refresh:
+        parts.append(f"{refresh.group(1)}Hz")
+    return ", ".join(parts)
+
+def _resolution(text_lower: str) -> Optional[str]:
+    for patterns, value in _RESOLUTIONS:
+        if any(pattern in text_lower for pattern in patterns):
+            return value
+    return None
+
+def _operating_system(text_lower: str) -> str:
+    for patterns, value in _OPERATING_SYSTEMS:
+        if any(pattern in text_lower for pattern in patterns):
+            return value
+    return ""
+
+@lru_cache(maxsize=4096)
+def parse_product_specs(name: str, specifications: Optional[str] = None) -> ProductSpecs:
+    """
+    Analizar un producto: primero las especificaciones JSON, luego el nombre para lo que falte.
+    Resultado en caché por (nombre, especificaciones): un cambio en el producto genera otra clave
+    """
+    specs = ProductSpecs()
+    name_lower = _fold(name or "")
+    json_specs = _load_json_specs(specifications)
+
+    specs.processor = _json_value(json_specs, "processor") or _processor_from_name(name_lower)
+    specs.ram = _json_value(json_specs, "ram") or _ram_from_name(name_lower)
+    specs.gpu = _json_value(json_specs, "gpu") or _gpu_from_name(name_lower)
+    specs.os = _json_value(json_specs, "os") or _operating_system(name_lower)
+
+    specs.storage = _json_value(json_specs, "storage")
+    if not specs.storage:
+        match = _NAME_STORAGE_PATTERN.search(name_lower)
+        if match:
+            specs.storage = f"{match.group(1).upper()}{match.group(2).upper()} {match.group(3).upper()}"
+
+    display = _json_value(json_specs, "display")
+    if not display:
+        # Monitores: tamaño, resolución y frecuencia en campos separados
+        display = ", ".join(value for value in (
+            _json_value(json_specs, "size"), _json_value(json_specs, "resolution"),
+            _json_value(json_specs, "refresh_rate")
+        ) if value)
+    specs.display = display or _display_from_name(name_lower)
+
+    # Valores tipados
+    _parse_cpu(specs, specs.processor or name_lower)
+    if not specs.processor and specs.cpu_brand == "Apple":
+        specs.processor = f"Apple {specs.cpu_family}"
+
+    ram_lower = specs.ram.lower()
+    ram_match = re.search(r"(\d{1,3})\s*gb", ram_lower)
+    specs.ram_gb = int(ram_match.group(1)) if ram_match else None
+    ram_type = _RAM_TYPE_PATTERN.search(ram_lower) or _RAM_TYPE_PATTERN.search(name_lower)
+    specs.ram_type = ram_type.group(1).upper() if ram_type else None
+
+    storage_lower = specs.storage.lower()
+    storage_match = _STORAGE_PATTERN.search(storage_lower)
+    specs.storage_gb = _storage_gb(*storage_match.groups()) if storage_match else None
+    if "nvme" in storage_lower:
+        specs.storage_type = "NVMe SSD"
+    elif "ssd" in storage_lower:
+        specs.storage_type = "SSD"
+    elif "hdd" in storage_lower:
+        specs.storage_type = "HDD"
+    elif "emmc" in storage_lower:
+        specs.storage_type = "eMMC"
+
+    specs.gpu_tier = _gpu_tier(specs.gpu.lower())
+
+    display_lower = _fold(f"{specs.display} {name_lower}")
+    inches = _INCHES_PATTERN.search(display_lower)
+    specs.screen_inches = float(inches.group(1)) if inches else (15.6 if "15.6" in display_lower else None)
+    specs.resolution = _resolution(display_lower)
+    refresh = _REFRESH_PATTERN.search(display_lower)
+    specs.refresh_hz = int(refresh.group(1)) if refresh else None
+
+    specs.features = tuple(label for patterns, label in _FEATURES
+                           if any(pattern in name_lower for pattern in patterns))
+    specs.extra = tuple(
+        (str(key).replace("_", " ").capitalize(), str(value))
+        for key, value in json_specs.items()
+        if str(key).lower() not in _CONSUMED_KEYS and value not in (None, "")
+    )
+    if specifications and not json_specs:
+        # Especificaciones en texto libre: se muestran tal cual
+        specs.extra = (("Especificaciones", str(specifications)),)
+    return specs
+
+def get_product_specs(product: Any) -> ProductSpecs:
+    """Especificaciones de un ProductModel, modelo ORM o dict de producto (parseadas una sola vez)"""
+    if isinstance(product, dict):
+        name, specifications = product.get("name", ""), product.get("specifications")
+    else:
+        name, specifications = getattr(product, "name", ""), getattr(product, "specifications", None)
+    if isinstance(specifications, dict):
+        specifications = json.dumps(specifications, sort_keys=True, ensure_ascii=False)
+    return parse_product_specs(name or "", specifications or None)
@@ -0,0 +1,172 @@
+# filepath: backend/app/chatbot/utils/prompt_budget.py
+"""
+Presupuesto de tamaño para los prompts de la IA
+Estimación rápida de tokens, filas compactas de productos (id | nombre | precio | specs)
+y un constructor que recorta primero lo menos relevante para no pasar del presupuesto.
+Registra los tokens de cada prompt por tipo para monitoreo
+"""
+import logging
+import threading
+from typing import Any, Dict, Iterable, List, Optional, Union
+
+from ..core.config import ChatbotConfig
+from .product_specs import ProductSpecs, get_product_specs
+
+logger = logging.getLogger(__name__)
+
+# Promedio aproximado para texto en español de Gemini (sin tokenizer local)
+CHARS_PER_TOKEN = 4
+
+def estimate_tokens(text: Optional[str]) -> int:
+    """Estimar los tokens de un texto (~4 caracteres por token)"""
+    if not text:
+        return 0
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+def truncate_to_tokens(text: Optional[str], max_tokens: int, keep_end: bool = False) -> str:
+    """Recortar un texto al presupuesto en un límite de palabra (keep_end conserva el final)"""
+    if not text or estimate_tokens(text) <= max_tokens:
+        return text or ""
+    max_chars = max(0, max_tokens * CHARS_PER_TOKEN - 1)
+    if keep_end:
+        cut = text[-max_chars:]
+        space = cut.find(" ")
+        return "…" + (cut[space + 1:] if 0 <= space < 40 else cut)
+    cut = text[:max_chars]
+    space = cut.rfind(" ")
+    return (cut[:space] if space > max_chars - 40 else cut) + "…"
+
+def _field(product: Any, name: str, default: Any = None) -> Any:
+    if isinstance(product, dict):
+        return product.get(name, default)
+    return getattr(product, name, default)
+
+def product_row(product: Any, specs: Optional[ProductSpecs] = None) -> str:
+    """Fila compacta de un producto: ID | nombre | precio | descuento | specs | rating | stock"""
+    price = _field(product, "price") or 0
+    original_price = _field(product, "original_price")
+    rating = _field(product, "rating")
+    parts = [f"ID {_field(product, 'id')}", _field(product, "name", "Producto"), f"S/ {price:.2f}"]
+    if original_price and original_price > price:
+        parts.append(f"{round((1 - price / original_price) * 100)}% desc")
+    summary = (specs or get_product_specs(product)).summary()
+    if summary:
+        parts.append(summary)
+    if rating:
+        parts.append(f"rating {rating}/5")
+    parts.append(f"stock {_field(product, 'stock_quantity', 0)}")
+    return " | ".join(parts)
+
+def data_row(data: Dict[str, Any], max_value_chars: int = 120) -> str:
+    """Fila compacta de un diccionario de datos (omite vacíos y "N/A", acota cada valor)"""
+    parts = []
+    for key, value in data.items():
+        if not value or value == "N/A":
+            continue
+        text = str(value)
+        if len(text) > max_value_chars:
+            text = text[:max_value_chars - 1] + "…"
+        parts.append(f"{key.replace('_', ' ')}: {text}")
+    return " | ".join(parts)
+
+class _RowSection:
+    """Filas ordenadas por relevancia que se recortan desde el final"""
+
+    __slots__ = ("header", "rows", "min_rows")
+
+    def __init__(self, header: str, rows: List[str], min_rows: int):
+        self.header = header
+        self.rows = rows
+        self.min_rows = min_rows
+
+class PromptBuilder:
+    """Arma un prompt por secciones respetando un presupuesto de tokens"""
+
+    def __init__(self, kind: str, budget: Optional[int] = None,
+                 metrics: Optional["PromptMetrics"] = None):
+        self.kind = kind
+        self.budget = budget or ChatbotConfig.PROMPT_TOKEN_BUDGET
+        self.metrics = metrics or get_prompt_metrics()
+        self._sections: List[Union[str, _RowSection]] = []
+
+    def add(self, text: str) -> "PromptBuilder":
+        """Sección fija (instrucciones, consulta): siempre se incluye"""
+        self._sections.append(text)
+        return self
+
+    def add_context(self, text: Optional[str], max_tokens: Optional[int] = None,
+                    empty: str = "Sin contexto previo") -> "PromptBuilder":
+        """Contexto conversacional acotado; se conserva lo más reciente (el final)"""
+        limit = max_tokens or ChatbotConfig.PROMPT_CONTEXT_MAX_TOKENS
+        self._sections.append(truncate_to_tokens(text, limit, keep_end=True) if text else empty)
+        return self
+
+    def add_rows(self, header: str, rows: Iterable[str], min_rows: int = 1) -> "PromptBuilder":
+        """Filas ordenadas de más a menos relevante; las últimas se descartan si no entran"""
+        self._sections.append(_RowSection(header, list(rows), min_rows))
+        return self
+
+    def build(self) -> str:
+        fixed_tokens = sum(estimate_tokens(section) for section in self._sections if isinstance(section, str))
+        remaining = self.budget - fixed_tokens
+        parts = []
+        dropped = 0
+        for section in self._sections:
+            if isinstance(section, str):
+                parts.append(section)
+                continue
+            kept = []
+            remaining -= estimate_tokens(section.header)
+            for row in section.rows:
+                cost = estimate_tokens(row) + 1
+                if len(kept) >= section.min_rows and cost > remaining:
+                    break
+                kept.append(row)
+                remaining -= cost
+            dropped += len(section.rows) - len(kept)
+            parts.append(section.header)
+            parts.extend(kept)
+        prompt = "\n".join(parts)
+        tokens = estimate_tokens(prompt)
+        self.metrics.record(self.kind, tokens, dropped, tokens > self.budget)
+        if dropped:
+            logger.debug("Prompt '%s': %s filas descartadas para respetar %s tokens", self.kind, dropped, self.budget)
+        return prompt
+
+class PromptMetrics:
+    """Tokens estimados por tipo de prompt (llamadas, total, máximo, filas recortadas)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._by_kind: Dict[str, Dict[str, int]] = {}
+
+    def record(self, kind: str, tokens: int, dropped_rows: int = 0, over_budget: bool = False) -> None:
+        with self._lock:
+            stats = self._by_kind.get(kind)
+            if stats is None:
+                stats = self._by_kind[kind] = {"calls": 0, "total_tokens": 0, "max_tokens": 0,
+                                               "last_tokens": 0, "dropped_rows": 0, "over_budget": 0}
+            stats["calls"] += 1
+            stats["total_tokens"] += tokens
+            stats["last_tokens"] = tokens
+            stats["max_tokens"] = max(stats["max_tokens"], tokens)
+            stats["dropped_rows"] += dropped_rows
+            stats["over_budget"] += int(over_budget)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Métricas por tipo de prompt para monitoreo"""
+        with self._lock:
+            return {
+                kind: {**stats, "avg_tokens": round(stats["total_tokens"] / stats["calls"], 1)}
+                for kind, stats in self._by_kind.items()
+            }
+
+    def reset(self) -> None:
+        with self._lock:
+            self._by_kind.clear()
+
+_prompt_metrics = PromptMetrics()
+
+def get_prompt_metrics() -> PromptMetrics:
+    """Métricas compartidas por todos los servicios de IA del proceso"""
+    return _prompt_metrics
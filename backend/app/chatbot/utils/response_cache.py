@@ -0,0 +1,252 @@
+# filepath: backend/app/chatbot/utils/response_cache.py
+"""
+Caché de respuestas generadas por la IA
+Evita volver a llamar a Gemini para preguntas repetidas ("qué es mejor AMD o Intel").
+LRU acotado por tamaño con expiración por TTL y backend intercambiable:
+memoria del proceso o SQLite (compartible entre varios workers)
+"""
+import json
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+import unicodedata
+import re
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+from app.database import run_db
+from ..core.config import ChatbotConfig
+
+logger = logging.getLogger(__name__)
+
+class CacheBackend(ABC):
+    """Interfaz de almacenamiento para ResponseCache"""
+
+    # True si las operaciones hacen I/O (las variantes async de ResponseCache las sacan del event loop)
+    performs_io = False
+
+    @abstractmethod
+    def get(self, key: str, now: float) -> Tuple[Optional[str], bool]:
+        """Devolver (valor, expirado). Las entradas expiradas se eliminan al leerlas"""
+
+    @abstractmethod
+    def set(self, key: str, value: str, expires_at: float, now: float) -> int:
+        """Guardar un valor y devolver cuántas entradas se desalojaron para respetar el límite"""
+
+    @abstractmethod
+    def clear(self) -> None:
+        """Eliminar todas las entradas"""
+
+    @abstractmethod
+    def size(self) -> int:
+        """Entradas almacenadas (incluidas las expiradas aún no eliminadas)"""
+
+class MemoryCacheBackend(CacheBackend):
+    """LRU en memoria del proceso (OrderedDict: el más reciente al final)"""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str, now: float) -> Tuple[Optional[str], bool]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None, False
+            value, expires_at = entry
+            if expires_at <= now:
+                del self._entries[key]
+                return None, True
+            self._entries.move_to_end(key)
+            return value, False
+
+    def set(self, key: str, value: str, expires_at: float, now: float) -> int:
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            evicted = 0
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                evicted += 1
+            return evicted
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def size(self) -> int:
+        return len(self._entries)
+
+class SQLiteCacheBackend(CacheBackend):
+    """LRU persistente en un archivo SQLite; varios workers pueden apuntar al mismo archivo"""
+
+    performs_io = True
+
+    def __init__(self, path: str, max_entries: int):
+        self.path = path
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=5.0, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS response_cache ("
+            " key TEXT PRIMARY KEY, value TEXT NOT NULL,"
+            " expires_at REAL NOT NULL, last_access REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS ix_response_cache_last_access ON response_cache (last_access)"
+        )
+
+    def get(self, key: str, now: float) -> Tuple[Optional[str], bool]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, expires_at FROM response_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None, False
+            value, expires_at = row
+            if expires_at <= now:
+                self._conn.execute("DELETE FROM response_cache WHERE key = ?", (key,))
+                return None, True
+            self._conn.execute("UPDATE response_cache SET last_access = ? WHERE key = ?", (now, key))
+            return value, False
+
+    def set(self, key: str, value: str, expires_at: float, now: float) -> int:
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO response_cache (key, value, expires_at, last_access) "
+                    "VALUES (?, ?, ?, ?)",
+                    (key, value, expires_at, now)
+                )
+                evicted = self._conn.execute(
+                    "DELETE FROM response_cache WHERE expires_at <= ?", (now,)
+                ).rowcount
+                overflow = self._conn.execute("SELECT COUNT(*) FROM response_cache").fetchone()[0] - self.max_entries
+                if overflow > 0:
+                    evicted += self._conn.execute(
+                        "DELETE FROM response_cache WHERE key IN ("
+                        " SELECT key FROM response_cache ORDER BY last_access LIMIT ?)",
+                        (overflow,)
+                    ).rowcount
+                self._conn.execute("COMMIT")
+                return evicted
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM response_cache")
+
+    def size(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM response_cache").fetchone()[0]
+
+class ResponseCache:
+    """Caché de respuestas con métricas de aciertos, fallos y desalojos"""
+
+    _PUNCTUATION = re.compile(r"[¿?¡!.,;:\"'()]+")
+
+    def __init__(self, backend: CacheBackend, ttl_seconds: float, enabled: bool = True):
+        self.backend = backend
+        self.ttl_seconds = ttl_seconds
+        self.enabled = enabled
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0, "expirations": 0, "sets": 0, "errors": 0}
+
+    @classmethod
+    def from_config(cls) -> "ResponseCache":
+        """Construir la caché según ChatbotConfig (RESPONSE_CACHE_*)"""
+        config = ChatbotConfig()
+        if config.RESPONSE_CACHE_BACKEND == "sqlite":
+            backend: CacheBackend = SQLiteCacheBackend(config.RESPONSE_CACHE_SQLITE_PATH,
+                                                       config.RESPONSE_CACHE_MAX_ENTRIES)
+        else:
+            backend = MemoryCacheBackend(config.RESPONSE_CACHE_MAX_ENTRIES)
+        logger.info("Caché de respuestas: backend=%s, max=%s, ttl=%ss", config.RESPONSE_CACHE_BACKEND,
+                    config.RESPONSE_CACHE_MAX_ENTRIES, config.RESPONSE_CACHE_TTL_SECONDS)
+        return cls(backend, config.RESPONSE_CACHE_TTL_SECONDS, config.RESPONSE_CACHE_ENABLED)
+
+    @classmethod
+    def normalize(cls, text: str) -> str:
+        """Minúsculas, sin tildes, sin signos de puntuación y con espacios colapsados"""
+        text = unicodedata.normalize("NFKD", text.lower())
+        text = "".join(char for char in text if not unicodedata.combining(char))
+        return " ".join(cls._PUNCTUATION.sub(" ", text).split())
+
+    def make_key(self, namespace: str, message: str, *context: Any) -> str:
+        """Clave = espacio de nombres + mensaje normalizado + hash del contexto relevante"""
+        payload = json.dumps([self.normalize(message), context], sort_keys=True, default=str, ensure_ascii=False)
+        return f"{namespace}:{hashlib.sha256(payload.encode('utf-8')).hexdigest()}"
+
+    def get(self, key: str) -> Optional[str]:
+        if not self.enabled:
+            return None
+        try:
+            value, expired = self.backend.get(key, time.time())
+        except Exception as e:
+            self.stats["errors"] += 1
+            logger.warning("Error leyendo caché de respuestas: %s", e)
+            return None
+        if expired:
+            self.stats["expirations"] += 1
+        if value is None:
+            self.stats["misses"] += 1
+            return None
+        self.stats["hits"] += 1
+        return value
+
+    def set(self, key: str, value: str) -> None:
+        if not self.enabled or not value:
+            return
+        now = time.time()
+        try:
+            self.stats["evictions"] += self.backend.set(key, value, now + self.ttl_seconds, now)
+            self.stats["sets"] += 1
+        except Exception as e:
+            self.stats["errors"] += 1
+            logger.warning("Error escribiendo caché de respuestas: %s", e)
+
+    async def get_async(self, key: str) -> Optional[str]:
+        """get() para código async: con un backend en disco se ejecuta en el pool de run_db"""
+        if self.enabled and self.backend.performs_io:
+            return await run_db(self.get, key)
+        return self.get(key)
+
+    async def set_async(self, key: str, value: str) -> None:
+        if self.enabled and value and self.backend.performs_io:
+            await run_db(self.set, key, value)
+        else:
+            self.set(key, value)
+
+    def clear(self) -> None:
+        self.backend.clear()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Métricas de la caché para monitoreo"""
+        lookups = self.stats["hits"] + self.stats["misses"]
+        return {
+            **self.stats,
+            "size": self.backend.size(),
+            "hit_ratio": round(self.stats["hits"] / lookups, 3) if lookups else 0.0,
+            "backend": type(self.backend).__name__,
+            "ttl_seconds": self.ttl_seconds
+        }
+
+_shared_cache: Optional[ResponseCache] = None
+_shared_cache_lock = threading.Lock()
+
+def get_response_cache() -> ResponseCache:
+    """Caché compartida por todos los servicios de IA del proceso"""
+    global _shared_cache
+    if _shared_cache is None:
+        with _shared_cache_lock:
+            if _shared_cache is None:
+                _shared_cache = ResponseCache.from_config()
+    return _shared_cache
@@ -50,7 +50,7 @@ class ResponseFormatter:
                 response += f"📦 {stock_status}\n\n"
                 
             except Exception as e:
-                logger.warning(f"Error formateando producto {product.id}: {e}")
+                logger.warning("Error formateando producto %s: %s", product.id, e)
                 continue
         
         response += "💡 ¿Te interesa alguno en particular? ¡Puedo darte más detalles o agregarlo al carrito! 😊"
@@ -125,7 +125,7 @@ class ResponseFormatter:
             return spec_response
             
         except Exception as e:
-            logger.error(f"Error generando especificaciones: {e}")
+            logger.error("Error generando especificaciones: %s", e)
             return f"❌ Error al obtener las especificaciones de {product.name if product else 'el producto'}."
     
     def _extract_processor_info(self, name_lower: str) -> str:
@@ -355,7 +355,7 @@ class ResponseFormatter:
             return response
             
         except Exception as e:
-            logger.error(f"Error formateando detalles del producto: {e}")
+            logger.error("Error formateando detalles del producto: %s", e)
             return ("📋 **Información del Producto - " + getattr(product, 'name', 'Producto') + "**\n\n" +
                    f"💰 Precio: S/ {getattr(product, 'price', 0):.2f}\n" +
                    f"📦 Stock: {getattr(product, 'stock_quantity', 0)} unidades\n\n" +
@@ -0,0 +1,43 @@
+# filepath: backend/app/chatbot/utils/streaming.py
+"""
+Soporte de streaming de respuestas (Server-Sent Events)
+El orquestador activa un "sumidero" de eventos por petición mediante contextvars;
+los servicios de IA envían ahí los fragmentos de texto a medida que Gemini los genera,
+sin cambiar la firma de los métodos existentes
+"""
+import asyncio
+import logging
+from contextvars import ContextVar
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# Cola de eventos (nombre, datos) de la petición en curso; None fuera de /api/chat/stream
+_event_sink: ContextVar[Optional[asyncio.Queue]] = ContextVar("chat_event_sink", default=None)
+
+def set_event_sink(queue: Optional[asyncio.Queue]):
+    """Activar el sumidero para el contexto actual (devuelve el token para restaurarlo)"""
+    return _event_sink.set(queue)
+
+def reset_event_sink(token) -> None:
+    _event_sink.reset(token)
+
+def is_streaming() -> bool:
+    """Indica si la petición actual se está transmitiendo por streaming"""
+    return _event_sink.get() is not None
+
+def emit_event(event: str, data: Dict[str, Any]) -> None:
+    """Enviar un evento al cliente si la petición actual es de streaming (no-op en otro caso)"""
+    queue = _event_sink.get()
+    if queue is not None:
+        queue.put_nowait((event, data))
+
+async def generate_text_async(llm_client, prompt: str) -> str:
+    """
+    Generar texto con el cliente compartido de Gemini. Si hay streaming activo, se pide la
+    respuesta por fragmentos y cada uno se emite como evento "token"; en ambos casos se
+    devuelve el texto completo
+    """
+    if not is_streaming():
+        return await llm_client.generate_async(prompt)
+    return await llm_client.generate_async(prompt, on_chunk=lambda text: emit_event("token", {"text": text}))
@@ -1,12 +1,19 @@
 # CRUD operations for e-commerce
 from sqlalchemy.orm import Session
-from sqlalchemy import or_, and_
+from sqlalchemy import or_, and_, insert, select, text
+from sqlalchemy.exc import OperationalError
 from typing import List, Optional
 from app.database import User, Product, Category, Cart, Order, OrderItem, cart_items
+from app.search import fulltext_enabled, fulltext_search
+from app.cart_summary import CartSummary, get_cart_summary, invalidate_cart_summaries
 from app.models import UserCreate, ProductCreate, CategoryCreate, OrderCreate
 from datetime import datetime
+import logging
+import os
 import uuid
 
+logger = logging.getLogger(__name__)
+
 # User CRUD
 def create_user(db: Session, user: UserCreate) -> User:
     db_user = User(**user.dict())
@@ -42,6 +49,8 @@ def get_products(db: Session, skip: int = 0, limit: int = 100, category_id: Opti
     return query.offset(skip).limit(limit).all()
 
 def search_products(db: Session, search_term: str, limit: int = 10) -> List[Product]:
+    if fulltext_enabled():
+        return fulltext_search(db, search_term, limit=limit)
     return db.query(Product).filter(
         Product.is_active == True,
         (Product.name.ilike(f"%{search_term}%") | 
@@ -96,189 +105,290 @@ def get_or_create_cart(db: Session, user_id: Optional[int] = None, session_id: O
     return cart
 
 def get_cart_total(db: Session, user_id: int) -> float:
-    """Get total amount for user's cart"""
-    from sqlalchemy import text
-    result = db.execute(text("SELECT total_amount FROM carts WHERE user_id = :user_id"), {"user_id": user_id}).first()
-    return float(result[0]) if result else 0.0
-
-def add_to_cart(db: Session, user_id: int, product_id: int, quantity: int = 1):
-    """Add product to cart - wrapper function for main.py"""
-    cart = get_or_create_cart(db, user_id=user_id)
-    # Get cart ID using safe query
-    from sqlalchemy import text
-    cart_id_result = db.execute(text("SELECT id FROM carts WHERE user_id = :user_id"), {"user_id": user_id}).first()
-    cart_id = cart_id_result[0] if cart_id_result else None
-    
-    if cart_id:
-        success = add_item_to_cart(db, cart_id, product_id, quantity)
-        if success:
-            # Return a mock object with id for compatibility
-            class MockCartItem:
-                def __init__(self, cart_id: int, product_id: int):
-                    self.id = f"{cart_id}_{product_id}"
-            return MockCartItem(cart_id, product_id)
-    return None
+    """Get total amount for user's cart (derivado de los items y los precios actuales)"""
+    return get_cart_summary(db, user_id=user_id).total
 
-def update_cart_item(db: Session, item_id: str, quantity: int):
-    """Update cart item quantity - item_id is in format 'cart_id_product_id'"""
+# Escrituras del carrito: una sentencia por operación en PostgreSQL (CTEs que modifican datos,
+# ON CONFLICT ... DO UPDATE y RETURNING del nuevo total). SQLite no admite CTEs que modifiquen
+# datos, así que ejecuta dos sentencias en la misma transacción; la primera ya es una escritura
+# y toma el bloqueo de la base antes de leer cantidades o precios.
+# Toda operación de PostgreSQL bloquea primero la fila del carrito (la de `carts`) y después la
+# del item, así operaciones concurrentes sobre un mismo carrito se serializan sin deadlocks y el
+# total nunca pierde incrementos. Cada sentencia devuelve cart_id, total_amount y/o quantity.
+_PG_ADD_ITEM = """
+WITH product AS (
+    SELECT price FROM products WHERE id = :product_id AND stock_quantity >= :quantity
+), cart AS (
+    {cart}
+), item AS (
+    INSERT INTO cart_items (cart_id, product_id, quantity, added_at)
+    SELECT id, :product_id, :quantity, CURRENT_TIMESTAMP FROM cart
+    ON CONFLICT (cart_id, product_id) DO UPDATE SET quantity = cart_items.quantity + EXCLUDED.quantity
+    RETURNING cart_id, quantity
+)
+SELECT item.cart_id, cart.total_amount, item.quantity FROM cart JOIN item ON item.cart_id = cart.id
+"""
+
+# Crea el carrito del dueño si no existe; {owner} es user_id o session_id (ambos únicos en carts)
+_PG_OWNER_CART = """
+    INSERT INTO carts ({owner}, total_amount, created_at, updated_at)
+    SELECT :{owner}, price * :quantity, CURRENT_TIMESTAMP, CURRENT_TIMESTAMP FROM product
+    ON CONFLICT ({owner}) DO UPDATE
+    SET total_amount = COALESCE(carts.total_amount, 0) + EXCLUDED.total_amount, updated_at = EXCLUDED.updated_at
+    RETURNING id, total_amount"""
+
+_SQLITE_OWNER_CART = """
+INSERT INTO carts ({owner}, total_amount, created_at, updated_at)
+SELECT :{owner}, price * :quantity, CURRENT_TIMESTAMP, CURRENT_TIMESTAMP
+FROM products WHERE id = :product_id AND stock_quantity >= :quantity
+ON CONFLICT ({owner}) DO UPDATE
+SET total_amount = COALESCE(carts.total_amount, 0) + excluded.total_amount, updated_at = excluded.updated_at
+RETURNING id AS cart_id, total_amount
+"""
+
+_SQLITE_UPSERT_ITEM = text("""
+INSERT INTO cart_items (cart_id, product_id, quantity, added_at)
+VALUES (:cart_id, :product_id, :quantity, CURRENT_TIMESTAMP)
+ON CONFLICT (cart_id, product_id) DO UPDATE SET quantity = cart_items.quantity + excluded.quantity
+RETURNING quantity
+""")
+
+_CART_SQL = {
+    "postgresql": {
+        "add_for_user": (text(_PG_ADD_ITEM.format(cart=_PG_OWNER_CART.format(owner="user_id"))),),
+        "add_for_session": (text(_PG_ADD_ITEM.format(cart=_PG_OWNER_CART.format(owner="session_id"))),),
+        "add": (text(_PG_ADD_ITEM.format(cart="""
+    UPDATE carts SET total_amount = COALESCE(carts.total_amount, 0) + product.price * :quantity,
+                     updated_at = CURRENT_TIMESTAMP
+    FROM product WHERE carts.id = :cart_id
+    RETURNING carts.id, carts.total_amount""")),),
+        "update": (text("""
+WITH cart AS (
+    SELECT id FROM carts WHERE id = :cart_id FOR UPDATE
+), item AS (
+    SELECT ci.quantity AS old_quantity, p.price
+    FROM cart_items ci JOIN cart ON cart.id = ci.cart_id JOIN products p ON p.id = ci.product_id
+    WHERE ci.product_id = :product_id
+    FOR UPDATE OF ci
+), changed AS (
+    UPDATE cart_items SET quantity = :quantity FROM item
+    WHERE cart_items.cart_id = :cart_id AND cart_items.product_id = :product_id
+    RETURNING cart_items.quantity
+)
+UPDATE carts SET total_amount = COALESCE(carts.total_amount, 0) + item.price * (:quantity - item.old_quantity),
+                 updated_at = CURRENT_TIMESTAMP
+FROM item, changed WHERE carts.id = :cart_id
+RETURNING carts.id AS cart_id, carts.total_amount, changed.quantity
+"""),),
+        "remove": (text("""
+WITH cart AS (
+    SELECT id FROM carts WHERE id = :cart_id FOR UPDATE
+), item AS (
+    DELETE FROM cart_items USING cart
+    WHERE cart_items.cart_id = cart.id AND cart_items.product_id = :product_id
+    RETURNING cart_items.quantity
+)
+UPDATE carts SET total_amount = COALESCE(carts.total_amount, 0) - products.price * item.quantity,
+                 updated_at = CURRENT_TIMESTAMP
+FROM item, products WHERE carts.id = :cart_id AND products.id = :product_id
+RETURNING carts.id AS cart_id, carts.total_amount, item.quantity
+"""),),
+    },
+    "sqlite": {
+        "add_for_user": (text(_SQLITE_OWNER_CART.format(owner="user_id")), _SQLITE_UPSERT_ITEM),
+        "add_for_session": (text(_SQLITE_OWNER_CART.format(owner="session_id")), _SQLITE_UPSERT_ITEM),
+        "add": (
+            text("""
+UPDATE carts SET total_amount = COALESCE(total_amount, 0) + (SELECT price * :quantity FROM products WHERE id = :product_id),
+                 updated_at = CURRENT_TIMESTAMP
+WHERE id = :cart_id
+  AND EXISTS (SELECT 1 FROM products WHERE id = :product_id AND stock_quantity >= :quantity)
+RETURNING id AS cart_id, total_amount
+"""),
+            _SQLITE_UPSERT_ITEM,
+        ),
+        "update": (
+            text("""
+UPDATE carts SET total_amount = COALESCE(total_amount, 0) + (
+                     SELECT p.price * (:quantity - ci.quantity)
+                     FROM cart_items ci JOIN products p ON p.id = ci.product_id
+                     WHERE ci.cart_id = :cart_id AND ci.product_id = :product_id),
+                 updated_at = CURRENT_TIMESTAMP
+WHERE id = :cart_id
+  AND EXISTS (SELECT 1 FROM cart_items ci JOIN products p ON p.id = ci.product_id
+              WHERE ci.cart_id = :cart_id AND ci.product_id = :product_id)
+RETURNING id AS cart_id, total_amount
+"""),
+            text("""
+UPDATE cart_items SET quantity = :quantity WHERE cart_id = :cart_id AND product_id = :product_id
+RETURNING quantity
+"""),
+        ),
+        "remove": (
+            text("""
+UPDATE carts SET total_amount = COALESCE(total_amount, 0) - (
+                     SELECT p.price * ci.quantity
+                     FROM cart_items ci JOIN products p ON p.id = ci.product_id
+                     WHERE ci.cart_id = :cart_id AND ci.product_id = :product_id),
+                 updated_at = CURRENT_TIMESTAMP
+WHERE id = :cart_id
+  AND EXISTS (SELECT 1 FROM cart_items ci JOIN products p ON p.id = ci.product_id
+              WHERE ci.cart_id = :cart_id AND ci.product_id = :product_id)
+RETURNING id AS cart_id, total_amount
+"""),
+            text("""
+DELETE FROM cart_items WHERE cart_id = :cart_id AND product_id = :product_id
+RETURNING quantity
+"""),
+        ),
+    },
+}
+
+class CartMutation:
+    """
+    Resultado de una escritura en el carrito; `id` conserva el formato 'cart_id_product_id'
+    cart_total es el acumulado de carts.total_amount; el total mostrado al usuario se deriva
+    de los items con get_cart_summary
+    """
+
+    __slots__ = ("id", "cart_id", "product_id", "quantity", "cart_total")
+
+    def __init__(self, cart_id: int, product_id: int, quantity: int, cart_total: float):
+        self.id = f"{cart_id}_{product_id}"
+        self.cart_id = cart_id
+        self.product_id = product_id
+        self.quantity = quantity
+        self.cart_total = cart_total
+
+def _mutate_cart_portable(db: Session, operation: str, params: dict) -> Optional[dict]:
+    """
+    Misma operación con el ORM para dialectos sin _CART_SQL: bloquea el carrito y el item con
+    SELECT ... FOR UPDATE (en ese orden) y ajusta total_amount en la misma transacción
+    """
+    if operation in ("add_for_user", "add_for_session"):
+        owner = "user_id" if operation == "add_for_user" else "session_id"
+        cart = db.query(Cart).filter(getattr(Cart, owner) == params[owner]).with_for_update().first()
+        if cart is None:
+            cart = Cart(**{owner: params[owner]}, total_amount=0.0)
+            db.add(cart)
+            db.flush()
+    else:
+        cart = db.query(Cart).filter(Cart.id == params["cart_id"]).with_for_update().first()
+    product = db.query(Product).filter(Product.id == params["product_id"]).first()
+    if cart is None or product is None:
+        return None
+
+    item = and_(cart_items.c.cart_id == cart.id, cart_items.c.product_id == product.id)
+    current = db.execute(select(cart_items.c.quantity).where(item).with_for_update()).scalar()
+    if operation in ("add", "add_for_user", "add_for_session"):
+        if product.stock_quantity < params["quantity"]:
+            return None
+        quantity = (current or 0) + params["quantity"]
+        if current is None:
+            db.execute(cart_items.insert().values(cart_id=cart.id, product_id=product.id, quantity=quantity))
+        else:
+            db.execute(cart_items.update().where(item).values(quantity=quantity))
+        delta = product.price * params["quantity"]
+    elif current is None:
+        return None
+    elif operation == "update":
+        quantity = params["quantity"]
+        db.execute(cart_items.update().where(item).values(quantity=quantity))
+        delta = product.price * (quantity - current)
+    else:
+        quantity = current
+        db.execute(cart_items.delete().where(item))
+        delta = -product.price * current
+    cart.total_amount = (cart.total_amount or 0.0) + delta
+    db.flush()
+    return {"cart_id": cart.id, "total_amount": cart.total_amount, "quantity": quantity}
+
+def _mutate_cart(db: Session, operation: str, **params) -> Optional[CartMutation]:
+    """
+    Ejecutar una operación de _CART_SQL en una sola transacción (o su versión ORM en otros
+    dialectos). Si alguna sentencia no devuelve fila (producto inexistente o sin stock, carrito
+    o item inexistente) se hace rollback y se devuelve None
+    """
+    statements = _CART_SQL.get(db.get_bind().dialect.name, {}).get(operation)
+    values = dict(params)
     try:
-        cart_id, product_id = item_id.split('_')
-        cart_id, product_id = int(cart_id), int(product_id)
-        
-        # Get current item
-        from sqlalchemy import and_
-        existing_item = db.execute(
-            cart_items.select().where(
-                and_(
-                    cart_items.c.cart_id == cart_id,
-                    cart_items.c.product_id == product_id
-                )
-            )
-        ).first()
-        
-        if existing_item:
-            # Get product price using safe query
-            from sqlalchemy import text
-            product_price_result = db.execute(text("SELECT price FROM products WHERE id = :product_id"), {"product_id": product_id}).first()
-            if not product_price_result:
+        if statements is None:
+            row = _mutate_cart_portable(db, operation, params)
+            if row is None:
+                db.rollback()
                 return None
-            
-            # Calculate price difference
-            old_quantity = existing_item.quantity
-            product_price = float(product_price_result[0])
-            price_diff = product_price * (quantity - old_quantity)
-            
-            # Update quantity
-            db.execute(
-                cart_items.update().where(
-                    and_(
-                        cart_items.c.cart_id == cart_id,
-                        cart_items.c.product_id == product_id
-                    )
-                ).values(quantity=quantity)
-            )
-            
-            # Update cart total using safe query
-            db.execute(text("UPDATE carts SET total_amount = total_amount + :price_diff, updated_at = NOW() WHERE id = :cart_id"), 
-                      {"price_diff": price_diff, "cart_id": cart_id})
-            
-            db.commit()
-            return True
-        return None
-    except Exception as e:
+            values.update(row)
+        for statement in statements or ():
+            row = db.execute(statement, values).mappings().first()
+            if row is None:
+                db.rollback()
+                return None
+            values.update(row)
+        db.commit()
+    except Exception:
+        logger.exception("Error en la operación del carrito %s (%s)", operation, params)
         db.rollback()
         return None
+    invalidate_cart_summaries([values["cart_id"]])
+    return CartMutation(values["cart_id"], params["product_id"], values["quantity"], float(values["total_amount"]))
 
-def remove_from_cart(db: Session, item_id: str) -> bool:
-    """Remove item from cart - item_id is in format 'cart_id_product_id'"""
+def _parse_item_id(item_id: str) -> Optional[tuple]:
     try:
         cart_id, product_id = item_id.split('_')
-        cart_id, product_id = int(cart_id), int(product_id)
-        return remove_item_from_cart(db, cart_id, product_id)
-    except Exception:
+        return int(cart_id), int(product_id)
+    except ValueError:
+        return None
+
+def add_to_cart(db: Session, user_id: Optional[int], product_id: int, quantity: int = 1,
+                session_id: Optional[str] = None) -> Optional[CartMutation]:
+    """
+    Agregar producto al carrito del usuario o, sin usuario, al carrito de invitado de la sesión
+    (creándolo si no existe) y devolver el nuevo total
+    """
+    if user_id:
+        return _mutate_cart(db, "add_for_user", user_id=user_id, product_id=product_id, quantity=quantity)
+    if session_id:
+        return _mutate_cart(db, "add_for_session", session_id=session_id, product_id=product_id, quantity=quantity)
+    return None
+
+def update_cart_item(db: Session, item_id: str, quantity: int) -> Optional[CartMutation]:
+    """Update cart item quantity - item_id is in format 'cart_id_product_id'"""
+    parsed = _parse_item_id(item_id)
+    if parsed is None:
+        return None
+    cart_id, product_id = parsed
+    return _mutate_cart(db, "update", cart_id=cart_id, product_id=product_id, quantity=quantity)
+
+def remove_from_cart(db: Session, item_id: str) -> bool:
+    """Remove item from cart - item_id is in format 'cart_id_product_id'"""
+    parsed = _parse_item_id(item_id)
+    if parsed is None:
         return False
+    return remove_item_from_cart(db, *parsed)
 
 def add_item_to_cart(db: Session, cart_id: int, product_id: int, quantity: int = 1) -> bool:
-    try:
-        # Verificar que el producto existe y tiene stock
-        from sqlalchemy import text
-        product_result = db.execute(text("SELECT id, price, stock_quantity FROM products WHERE id = :product_id"), 
-                                  {"product_id": product_id}).first()
-        if not product_result or product_result[2] < quantity:  # stock_quantity < quantity
-            return False
-        
-        product_price = float(product_result[1])
-        
-        # Verificar si ya existe el item en el carrito
-        from sqlalchemy import and_
-        existing_item = db.execute(
-            cart_items.select().where(
-                and_(
-                    cart_items.c.cart_id == cart_id,
-                    cart_items.c.product_id == product_id
-                )
-            )
-        ).first()
-        
-        if existing_item:
-            # Actualizar cantidad
-            new_quantity = existing_item.quantity + quantity
-            db.execute(
-                cart_items.update().where(
-                    and_(
-                        cart_items.c.cart_id == cart_id,
-                        cart_items.c.product_id == product_id
-                    )
-                ).values(quantity=new_quantity)
-            )
-        else:
-            # Crear nuevo item
-            db.execute(
-                cart_items.insert().values(
-                    cart_id=cart_id,
-                    product_id=product_id,
-                    quantity=quantity
-                )
-            )
-        
-        # Actualizar total del carrito usando SQL directo
-        db.execute(text("UPDATE carts SET total_amount = total_amount + :amount, updated_at = NOW() WHERE id = :cart_id"), 
-                  {"amount": product_price * quantity, "cart_id": cart_id})
-        
-        db.commit()
-        return True
-        
-    except Exception as e:
-        db.rollback()
-        return False
+    return _mutate_cart(db, "add", cart_id=cart_id, product_id=product_id, quantity=quantity) is not None
 
 def remove_item_from_cart(db: Session, cart_id: int, product_id: int) -> bool:
-    try:
-        # Get product price and existing item info
-        from sqlalchemy import text, and_
-        product_result = db.execute(text("SELECT price FROM products WHERE id = :product_id"), 
-                                  {"product_id": product_id}).first()
-        if not product_result:
-            return False
-        
-        product_price = float(product_result[0])
-        
-        # Obtener cantidad actual
-        existing_item = db.execute(
-            cart_items.select().where(
-                and_(
-                    cart_items.c.cart_id == cart_id,
-                    cart_items.c.product_id == product_id
-                )
-            )
-        ).first()
-        
-        if existing_item:
-            item_quantity = existing_item.quantity
-            
-            # Eliminar item
-            db.execute(
-                cart_items.delete().where(
-                    and_(
-                        cart_items.c.cart_id == cart_id,
-                        cart_items.c.product_id == product_id
-                    )
-                )
-            )
-            
-            # Actualizar total del carrito usando SQL directo
-            total_reduction = product_price * item_quantity
-            db.execute(text("UPDATE carts SET total_amount = total_amount - :amount, updated_at = NOW() WHERE id = :cart_id"), 
-                      {"amount": total_reduction, "cart_id": cart_id})
-            
-            db.commit()
-            return True
-        
-        return False
-        
-    except Exception as e:
-        db.rollback()
-        return False
+    return _mutate_cart(db, "remove", cart_id=cart_id, product_id=product_id) is not None
+
+def get_cart_rows(db: Session, user_id: Optional[int] = None, session_id: Optional[str] = None):
+    """
+    Items del carrito del usuario (o del invitado de la sesión) con todas las columnas del
+    producto en una sola consulta (cart_items JOIN products JOIN carts); cada fila trae además
+    cart_id y quantity
+    """
+    products = Product.__table__
+    carts = Cart.__table__
+    owner = carts.c.user_id == user_id if user_id is not None else carts.c.session_id == session_id
+    statement = (
+        select(cart_items.c.cart_id, cart_items.c.quantity, *products.c)
+        .select_from(cart_items.join(products, products.c.id == cart_items.c.product_id)
+                     .join(carts, carts.c.id == cart_items.c.cart_id))
+        .where(owner)
+        .order_by(cart_items.c.added_at, cart_items.c.product_id)
+    )
+    return db.execute(statement).mappings().all()
 
 def get_cart_items(db: Session, cart_id: int):
     return db.execute(
@@ -291,46 +401,135 @@ def clear_cart(db: Session, cart_id: int) -> bool:
         db.execute(cart_items.delete().where(cart_items.c.cart_id == cart_id))
         
         # Update cart total using SQL directo
-        db.execute(text("UPDATE carts SET total_amount = 0.0, updated_at = NOW() WHERE id = :cart_id"), 
+        db.execute(text("UPDATE carts SET total_amount = 0.0, updated_at = CURRENT_TIMESTAMP WHERE id = :cart_id"), 
                   {"cart_id": cart_id})
         
         db.commit()
+        invalidate_cart_summaries([cart_id])
         return True
     except Exception as e:
         db.rollback()
         return False
 
+# Fusión del carrito de invitado en el del usuario al iniciar sesión (mismas sentencias en
+# PostgreSQL y SQLite). Las cantidades de productos repetidos se suman y carts.total_amount se
+# recalcula desde los items, así el acumulado del usuario no arrastra desvíos.
+_MERGE_GUEST_CART_SQL = (
+    text("""
+INSERT INTO carts (user_id, total_amount, created_at, updated_at)
+VALUES (:user_id, 0, CURRENT_TIMESTAMP, CURRENT_TIMESTAMP)
+ON CONFLICT (user_id) DO UPDATE SET updated_at = excluded.updated_at
+RETURNING id AS cart_id
+"""),
+    text("""
+INSERT INTO cart_items (cart_id, product_id, quantity, added_at)
+SELECT :cart_id, ci.product_id, ci.quantity, ci.added_at
+FROM cart_items ci JOIN carts guest ON guest.id = ci.cart_id
+WHERE guest.session_id = :session_id
+ON CONFLICT (cart_id, product_id) DO UPDATE SET quantity = cart_items.quantity + excluded.quantity
+"""),
+    text("DELETE FROM cart_items WHERE cart_id IN (SELECT id FROM carts WHERE session_id = :session_id)"),
+    text("DELETE FROM carts WHERE session_id = :session_id RETURNING id"),
+    text("""
+UPDATE carts SET total_amount = (
+    SELECT COALESCE(SUM(ci.quantity * p.price), 0)
+    FROM cart_items ci JOIN products p ON p.id = ci.product_id
+    WHERE ci.cart_id = :cart_id)
+WHERE id = :cart_id
+"""),
+)
+
+def merge_guest_cart(db: Session, session_id: str, user_id: int) -> Optional[int]:
+    """
+    Pasar los items del carrito de invitado al carrito del usuario en una transacción y
+    eliminar el carrito de invitado; devuelve el ID del carrito del usuario (None si falla)
+    """
+    create_cart, move_items, delete_items, delete_guest, resync_total = _MERGE_GUEST_CART_SQL
+    params = {"user_id": user_id, "session_id": session_id}
+    try:
+        params["cart_id"] = db.execute(create_cart, params).scalar_one()
+        db.execute(move_items, params)
+        db.execute(delete_items, params)
+        guest_ids = db.execute(delete_guest, params).scalars().all()
+        db.execute(resync_total, params)
+        db.commit()
+    except Exception:
+        db.rollback()
+        return None
+    invalidate_cart_summaries([params["cart_id"], *guest_ids])
+    return params["cart_id"]
+
 # Order CRUD
-def create_order(db: Session, order_data: OrderCreate, user_id: int, cart_id: int) -> Optional[Order]:
+# Espera máxima por el bloqueo de un producto o carrito al crear una orden (PostgreSQL): en
+# picos de compras (Cyber Days) una orden que no obtiene el bloqueo falla rápido con
+# "lock_timeout" en lugar de encolar conexiones detrás del producto más vendido
+ORDER_LOCK_TIMEOUT_MS = int(os.getenv("ORDER_LOCK_TIMEOUT_MS", "3000"))
+
+# Primera sentencia de la orden: toma el bloqueo del carrito (el mismo que las escrituras del
+# carrito) y deja el total en 0, ya que el carrito se vacía en la misma transacción
+_LOCK_CART_FOR_ORDER_SQL = "UPDATE carts SET total_amount = 0, updated_at = CURRENT_TIMESTAMP WHERE {owner} RETURNING id"
+_LOCK_CART_BY_ID = text(_LOCK_CART_FOR_ORDER_SQL.format(owner="id = :cart_id"))
+_LOCK_CART_BY_USER = text(_LOCK_CART_FOR_ORDER_SQL.format(owner="user_id = :user_id"))
+
+class OrderError(Exception):
+    """Orden rechazada; reason: empty_cart, insufficient_stock o lock_timeout"""
+
+    def __init__(self, reason: str, message: str, product_ids: Optional[List[int]] = None):
+        super().__init__(message)
+        self.reason = reason
+        self.message = message
+        self.product_ids = product_ids or []
+
+def _is_lock_timeout(error: OperationalError) -> bool:
+    # 55P03 = lock_not_available (lock_timeout de PostgreSQL); SQLite: "database is locked"
+    return getattr(error.orig, "pgcode", None) == "55P03" or "database is locked" in str(error.orig)
+
+def create_order(db: Session, order_data: OrderCreate, user_id: int, cart_id: Optional[int] = None) -> Optional[Order]:
+    """
+    Crear la orden del carrito en una sola transacción:
+    bloquear el carrito, leer sus items, bloquear los productos con un único
+    SELECT ... WHERE id IN (...) FOR UPDATE (en orden de ID, así dos órdenes con productos en
+    común esperan en vez de interbloquearse), verificar y descontar stock, insertar todos los
+    order_items en un INSERT de varias filas y vaciar el carrito.
+    Lanza OrderError si el carrito está vacío, falta stock o no se obtuvo un bloqueo a tiempo
+    """
     try:
-        # Generar número de orden único
-        order_number = f"ORD-{datetime.now().strftime('%Y%m%d')}-{uuid.uuid4().hex[:8].upper()}"
-        
-        # Obtener items del carrito
-        cart_items_data = get_cart_items(db, cart_id)
-        if not cart_items_data:
-            return None
-        
-        # Calcular total
+        if db.get_bind().dialect.name == "postgresql" and ORDER_LOCK_TIMEOUT_MS > 0:
+            db.execute(text(f"SET LOCAL lock_timeout = '{ORDER_LOCK_TIMEOUT_MS:d}ms'"))
+        if cart_id is not None:
+            cart_id = db.execute(_LOCK_CART_BY_ID, {"cart_id": cart_id}).scalar()
+        else:
+            cart_id = db.execute(_LOCK_CART_BY_USER, {"user_id": user_id}).scalar()
+        quantities = dict(db.execute(
+            select(cart_items.c.product_id, cart_items.c.quantity).where(cart_items.c.cart_id == cart_id)
+        ).all()) if cart_id is not None else {}
+        if not quantities:
+            raise OrderError("empty_cart", "El carrito está vacío")
+
+        products = (db.query(Product).filter(Product.id.in_(quantities)).order_by(Product.id)
+                    .with_for_update().populate_existing().all())
+        unavailable = [product.id for product in products
+                       if not product.is_active or product.stock_quantity < quantities[product.id]]
+        if unavailable or not products:
+            raise OrderError("insufficient_stock", "Stock insuficiente para algunos productos del carrito", unavailable)
+
+        # Items cuyo producto ya no existe quedan fuera de la orden, como antes
         total_amount = 0.0
         order_items_data = []
-        
-        for item in cart_items_data:
-            product = db.query(Product).filter(Product.id == item.product_id).first()
-            if product:
-                item_total = product.price * item.quantity
-                total_amount += item_total
-                
-                order_items_data.append({
-                    "product_id": product.id,
-                    "quantity": item.quantity,
-                    "unit_price": product.price,
-                    "total_price": item_total
-                })
-        
-        # Crear orden
+        for product in products:
+            quantity = quantities[product.id]
+            item_total = product.price * quantity
+            total_amount += item_total
+            product.stock_quantity -= quantity
+            order_items_data.append({
+                "product_id": product.id,
+                "quantity": quantity,
+                "unit_price": product.price,
+                "total_price": item_total
+            })
+
         db_order = Order(
-            order_number=order_number,
+            order_number=f"ORD-{datetime.now().strftime('%Y%m%d')}-{uuid.uuid4().hex[:8].upper()}",
             user_id=user_id,
             total_amount=total_amount,
             shipping_address=order_data.shipping_address,
@@ -338,28 +537,27 @@ def create_order(db: Session, order_data: OrderCreate, user_id: int, cart_id: in
             status="pending",
             payment_status="pending"
         )
-        
         db.add(db_order)
+        db.flush()  # INSERT de la orden y UPDATE del stock de los productos (executemany)
+
+        db.execute(insert(OrderItem), [{"order_id": db_order.id, **item_data} for item_data in order_items_data])
+        db.execute(cart_items.delete().where(cart_items.c.cart_id == cart_id))
         db.commit()
-        db.refresh(db_order)
-        
-        # Crear items de la orden
-        for item_data in order_items_data:
-            order_item = OrderItem(
-                order_id=db_order.id,
-                **item_data
-            )
-            db.add(order_item)
-        
-        # Limpiar carrito
-        clear_cart(db, cart_id)
-        
-        db.commit()
-        return db_order
-        
-    except Exception as e:
+    except OrderError:
+        db.rollback()
+        raise
+    except OperationalError as e:
+        db.rollback()
+        if _is_lock_timeout(e):
+            raise OrderError("lock_timeout", "Hay mucha demanda en este momento. Inténtalo nuevamente.")
+        logger.exception("Error de base de datos creando la orden del usuario %s", user_id)
+        return None
+    except Exception:
         db.rollback()
+        logger.exception("Error inesperado creando la orden del usuario %s", user_id)
         return None
+    invalidate_cart_summaries([cart_id])
+    return db_order
 
 def get_user_orders(db: Session, user_id: int) -> List[Order]:
     return db.query(Order).filter(Order.user_id == user_id).order_by(Order.created_at.desc()).all()
@@ -1,9 +1,13 @@
-from fastapi import FastAPI, HTTPException, Depends
+from fastapi import FastAPI, HTTPException, Depends, Header, Response
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from datetime import datetime
+import json
+import hashlib
 import logging
 import os
+import time
+import uuid
 from dotenv import load_dotenv
 from typing import List, Optional
 
@@ -13,16 +17,21 @@ load_dotenv()
 # Importar nuestros módulos
 from app.models import (
     ChatMessage, ChatResponse, HealthCheck,
-    ProductResponse, CategoryResponse, CartResponse, OrderResponse,
-    ProductCreate, CategoryCreate, CartItemCreate, OrderCreate
+    ProductResponse, CategoryResponse, CartItemResponse, CartResponse, OrderResponse,
+    ProductCreate, CategoryCreate, CartItemCreate, CartMergeRequest, OrderCreate
 )
 from app.chatbot import EnhancedInfotecChatbotV4  # Usar la nueva versión modularizada V4
-from app.database import get_db, create_tables
+from app.chatbot.core.config import ChatbotConfig
+from app.chatbot.utils.prompt_budget import get_prompt_metrics
+from app.chatbot.utils.metrics import get_metrics
+from app.chatbot.utils.logging_config import configure_logging, shutdown_logging
+from app.database import get_db, create_tables, run_db
 from app import crud
+from app.cart_summary import get_cart_summary_cache
 from sqlalchemy.orm import Session
 
-# Configurar logging
-logging.basicConfig(level=logging.INFO)
+# Configurar logging (cola no bloqueante, niveles por módulo y formato desde LOG_*)
+configure_logging()
 logger = logging.getLogger(__name__)
 
 # Crear instancia de FastAPI
@@ -51,7 +60,8 @@ def get_enhanced_chatbot() -> EnhancedInfotecChatbotV4:
     global enhanced_chatbot_instance
     if enhanced_chatbot_instance is None:
         api_key = os.getenv("GOOGLE_API_KEY")
-        if not api_key:
+        # El proveedor local (pruebas de carga, CI) no necesita API key
+        if not api_key and ChatbotConfig.LLM_PROVIDER != "local":
             raise HTTPException(status_code=500, detail="Google API Key no configurada")
         enhanced_chatbot_instance = EnhancedInfotecChatbotV4(api_key)
     return enhanced_chatbot_instance
@@ -67,7 +77,7 @@ async def startup_event():
         
         # Verificar API key
         api_key = os.getenv("GOOGLE_API_KEY")
-        if not api_key:
+        if not api_key and ChatbotConfig.LLM_PROVIDER != "local":
             logger.error("❌ GOOGLE_API_KEY no encontrada en variables de entorno")
             raise Exception("API Key no configurada")
             
@@ -77,9 +87,16 @@ async def startup_event():
         logger.info("🗄️ Base de datos PostgreSQL conectada")
         
     except Exception as e:
-        logger.error(f"❌ Error en startup: {e}")
+        logger.error("❌ Error en startup: %s", e)
         raise
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Evento de cierre: persistir el historial de conversaciones pendiente"""
+    if enhanced_chatbot_instance is not None:
+        enhanced_chatbot_instance.conversation_manager.close()
+    shutdown_logging()
+
 # =======================
 # ENDPOINTS DE SALUD
 # =======================
@@ -102,10 +119,52 @@ async def health_check():
         version="2.0.0"
     )
 
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Métricas en formato de texto de Prometheus (latencia por intención, SQL, IA y cachés)"""
+    return PlainTextResponse(get_metrics().render(), media_type="text/plain; version=0.0.4")
+
 # =======================
 # ENDPOINTS DE CHAT
 # =======================
 
+def _serialize_products(products) -> List[dict]:
+    """Convertir los productos devueltos por el chatbot (Pydantic, SQLAlchemy o dict) a diccionarios"""
+    products_list = []
+    if products:
+        for product in products:
+            if hasattr(product, 'dict'):
+                # Si es un objeto Pydantic, usar el método dict()
+                products_list.append(product.dict())
+            elif hasattr(product, '__dict__'):
+                # Si es un objeto SQLAlchemy, convertir manualmente
+                products_list.append({
+                    "id": product.id,
+                    "name": product.name,
+                    "description": product.description,
+                    "price": product.price,
+                    "original_price": product.original_price,
+                    "sku": product.sku,
+                    "brand": product.brand,
+                    "model": product.model,
+                    "image_url": product.image_url,
+                    "rating": product.rating,
+                    "review_count": product.review_count,
+                    "stock_quantity": product.stock_quantity,
+                    "specifications": product.specifications,
+                    "category_id": product.category_id,
+                    "is_active": product.is_active,
+                    "is_featured": product.is_featured,
+                    "is_new": product.is_new
+                })
+            elif isinstance(product, dict):
+                # Si ya es un diccionario, usarlo directamente
+                products_list.append(product)
+            else:
+                # Caso de respaldo: convertir a string
+                products_list.append({"name": str(product)})
+    return products_list
+
 @app.post("/api/chat", response_model=ChatResponse)
 async def chat_endpoint(
         message: ChatMessage,
@@ -114,7 +173,7 @@ async def chat_endpoint(
 ):
     """Endpoint principal para chatear con InfoBot V3 mejorado"""
     try:
-        logger.info(f"💬 Nueva consulta: {message.message[:50]}...")
+        logger.debug("💬 Nueva consulta: %s...", message.message[:50])
         
         # Validar mensaje
         if not message.message or not message.message.strip():
@@ -129,48 +188,19 @@ async def chat_endpoint(
         if len(message.message) > 1000:
             raise HTTPException(status_code=400, detail="El mensaje es demasiado largo (máximo 1000 caracteres)")
           # Generar respuesta con el chatbot V3 mejorado
-        response_data = chatbot.process_message(
+        # Sin session_id se crea una sesión propia (se devuelve en la respuesta): una sesión
+        # compartida mezclaría historial y carrito de invitado entre clientes
+        session_id = message.session_id or _new_session_id()
+        response_data = await chatbot.process_message_async(
             message=message.message.strip(), 
             db=db,
-            user_id=None,
-            session_id=message.session_id or "default"
+            user_id=message.user_id,
+            session_id=session_id
         )
         
         # Convertir productos a diccionarios si es necesario
-        products_list = []
-        if response_data.get("products"):
-            for product in response_data["products"]:
-                if hasattr(product, 'dict'):
-                    # Si es un objeto Pydantic, usar el método dict()
-                    products_list.append(product.dict())
-                elif hasattr(product, '__dict__'):
-                    # Si es un objeto SQLAlchemy, convertir manualmente
-                    products_list.append({
-                        "id": product.id,
-                        "name": product.name,
-                        "description": product.description,
-                        "price": product.price,
-                        "original_price": product.original_price,
-                        "sku": product.sku,
-                        "brand": product.brand,
-                        "model": product.model,
-                        "image_url": product.image_url,
-                        "rating": product.rating,
-                        "review_count": product.review_count,
-                        "stock_quantity": product.stock_quantity,
-                        "specifications": product.specifications,
-                        "category_id": product.category_id,
-                        "is_active": product.is_active,
-                        "is_featured": product.is_featured,
-                        "is_new": product.is_new
-                    })
-                elif isinstance(product, dict):
-                    # Si ya es un diccionario, usarlo directamente
-                    products_list.append(product)
-                else:
-                    # Caso de respaldo: convertir a string
-                    products_list.append({"name": str(product)})
-          
+        products_list = _serialize_products(response_data.get("products"))
+        
           # Crear respuesta estructurada
         response = ChatResponse(
             response=response_data.get("response", "Lo siento, no pude procesar tu solicitud."),
@@ -180,15 +210,16 @@ async def chat_endpoint(
             entities=response_data.get("entities", {}),
             products=products_list,
             cart_total=response_data.get("cart_total"),
-            cart_action=response_data.get("cart_action")
+            cart_action=response_data.get("cart_action"),
+            session_id=session_id
         )
-        logger.info(f"✅ Respuesta V3 generada exitosamente - Intent: {response.intent}")
+        logger.debug("✅ Respuesta V3 generada exitosamente - Intent: %s", response.intent)
         return response
         
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"❌ Error en chat endpoint V3: {e}")
+        logger.error("❌ Error en chat endpoint V3: %s", e)
         # Respuesta de fallback amigable
         return ChatResponse(
             response="Disculpa, tuve un problema técnico momentáneo. ¿Podrías repetir tu mensaje? Estoy aquí para ayudarte 🤖",
@@ -198,6 +229,66 @@ async def chat_endpoint(
             products=[]
         )
 
+def _is_guest_session(session_id: Optional[str]) -> bool:
+    """Sesión válida para un carrito de invitado ("default" la comparten todos los clientes sin sesión)"""
+    return bool(session_id) and session_id != "default"
+
+def _new_session_id() -> str:
+    """Sesión nueva para clientes que no envían session_id"""
+    return f"session-{uuid.uuid4().hex}"
+
+def _sse_event(event: str, data) -> str:
+    """Formatear un evento Server-Sent Events"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False, default=str)}\n\n"
+
+@app.post("/api/chat/stream")
+async def chat_stream_endpoint(
+    message: ChatMessage,
+    db: Session = Depends(get_db),
+    chatbot: EnhancedInfotecChatbotV4 = Depends(get_enhanced_chatbot)
+):
+    """
+    Variante de /api/chat por Server-Sent Events: emite "intent", los fragmentos "token" a medida
+    que Gemini los genera, "products" y "cart_action" cuando se resuelven, y "done" al final
+    """
+    if len(message.message) > 1000:
+        raise HTTPException(status_code=400, detail="El mensaje es demasiado largo (máximo 1000 caracteres)")
+    
+    logger.debug("💬 Nueva consulta (stream): %s...", message.message[:50])
+    session_id = message.session_id or _new_session_id()
+    
+    async def event_stream():
+        try:
+            async for event, data in chatbot.process_message_stream(
+                message=message.message.strip(),
+                db=db,
+                user_id=message.user_id,
+                session_id=session_id
+            ):
+                if event == "products":
+                    data = {"products": _serialize_products(data["products"])}
+                elif event == "done":
+                    data = {
+                        "response": data.get("response", ""),
+                        "timestamp": datetime.now().isoformat(),
+                        "intent": data.get("intent", "general"),
+                        "entities": data.get("entities", {}),
+                        "cart_total": data.get("cart_total"),
+                        "session_id": session_id
+                    }
+                yield _sse_event(event, data)
+        except Exception as e:
+            logger.error("❌ Error en chat stream: %s", e)
+            yield _sse_event("error", {
+                "response": "Disculpa, tuve un problema técnico momentáneo. ¿Podrías repetir tu mensaje? Estoy aquí para ayudarte 🤖"
+            })
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 # =======================
 # ENDPOINTS DE PRODUCTOS
 # =======================
@@ -213,86 +304,143 @@ async def get_products(
     """Obtener lista de productos"""
     try:
         if search:
-            products = crud.search_products(db, search, limit)
+            products = await run_db(crud.search_products, db, search, limit)
         elif category_id:
-            products = crud.get_products(db, skip, limit, category_id)
+            products = await run_db(crud.get_products, db, skip, limit, category_id)
         else:
-            products = crud.get_products(db, skip, limit)
+            products = await run_db(crud.get_products, db, skip, limit)
         
         return [ProductResponse.from_orm(p) for p in products]
     except Exception as e:
-        logger.error(f"Error obteniendo productos: {e}")
+        logger.error("Error obteniendo productos: %s", e)
         raise HTTPException(status_code=500, detail="Error obteniendo productos")
 
 @app.get("/api/products/{product_id}", response_model=ProductResponse)
 async def get_product(product_id: int, db: Session = Depends(get_db)):
     """Obtener un producto específico"""
     try:
-        product = crud.get_product(db, product_id)
+        product = await run_db(crud.get_product, db, product_id)
         if not product:
             raise HTTPException(status_code=404, detail="Producto no encontrado")
         return ProductResponse.from_orm(product)
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"Error obteniendo producto: {e}")
+        logger.error("Error obteniendo producto: %s", e)
         raise HTTPException(status_code=500, detail="Error obteniendo producto")
 
 @app.get("/api/categories", response_model=List[CategoryResponse])
 async def get_categories(db: Session = Depends(get_db)):
     """Obtener lista de categorías"""
     try:
-        categories = crud.get_categories(db)
+        categories = await run_db(crud.get_categories, db)
         return [CategoryResponse.from_orm(c) for c in categories]
     except Exception as e:
-        logger.error(f"Error obteniendo categorías: {e}")
+        logger.error("Error obteniendo categorías: %s", e)
         raise HTTPException(status_code=500, detail="Error obteniendo categorías")
 
 # =======================
 # ENDPOINTS DE CARRITO
 # =======================
 
+def _cart_etag(rows) -> str:
+    """ETag fuerte a partir de las filas crudas: no hace falta construir la respuesta para un 304"""
+    digest = hashlib.blake2b(repr([tuple(row.values()) for row in rows]).encode("utf-8"), digest_size=16)
+    return f'"{digest.hexdigest()}"'
+
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Comparación débil de If-None-Match (lista separada por comas, prefijo W/ o "*")"""
+    if not if_none_match:
+        return False
+    candidates = [candidate.strip() for candidate in if_none_match.split(",")]
+    return "*" in candidates or etag in (candidate[2:] if candidate.startswith("W/") else candidate
+                                         for candidate in candidates)
+
+def _cart_response(rows, response: Response, if_none_match: Optional[str]):
+    """CartResponse (o 304) a partir de las filas de crud.get_cart_rows"""
+    etag = _cart_etag(rows)
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if _etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+
+    response.headers.update(headers)
+    items = [
+        CartItemResponse(
+            id=f"{row['cart_id']}_{row['id']}",
+            product_id=row["id"],
+            quantity=row["quantity"],
+            product=ProductResponse(**row)
+        )
+        for row in rows
+    ]
+    return CartResponse(
+        items=items,
+        total=sum(row["price"] * row["quantity"] for row in rows),
+        item_count=len(items)
+    )
+
 @app.get("/api/cart/{user_id}", response_model=CartResponse)
-async def get_cart(user_id: int, db: Session = Depends(get_db)):
-    """Obtener carrito de usuario"""
+def get_cart(user_id: int, response: Response, if_none_match: Optional[str] = Header(None),
+             db: Session = Depends(get_db)):
+    """Obtener carrito de usuario con los datos completos de cada producto"""
     try:
-        cart = crud.get_or_create_cart(db, user_id=user_id)
-        # Get cart ID safely 
-        from sqlalchemy import text
-        cart_id_result = db.execute(text("SELECT id FROM carts WHERE user_id = :user_id"), {"user_id": user_id}).first()
-        cart_id = cart_id_result[0] if cart_id_result else None
-        
-        if cart_id:
-            cart_items_data = crud.get_cart_items(db, cart_id)
-            cart_total = crud.get_cart_total(db, user_id)
-            
-            return CartResponse(
-                items=[],  # TODO: Convertir items correctamente 
-                total=cart_total,
-                item_count=len(cart_items_data) if cart_items_data else 0
-            )
-        else:
-            return CartResponse(items=[], total=0.0, item_count=0)
+        # Items y productos en una sola consulta; total y conteo salen de las mismas filas
+        return _cart_response(crud.get_cart_rows(db, user_id=user_id), response, if_none_match)
+    except Exception as e:
+        logger.error("Error obteniendo carrito: %s", e)
+        raise HTTPException(status_code=500, detail="Error obteniendo carrito")
+
+@app.get("/api/cart/session/{session_id}", response_model=CartResponse)
+def get_guest_cart(session_id: str, response: Response, if_none_match: Optional[str] = Header(None),
+                   db: Session = Depends(get_db)):
+    """Obtener el carrito de invitado de una sesión (mismo formato que el de usuario)"""
+    if not _is_guest_session(session_id):
+        raise HTTPException(status_code=400, detail="session_id inválido")
+    try:
+        return _cart_response(crud.get_cart_rows(db, session_id=session_id), response, if_none_match)
     except Exception as e:
-        logger.error(f"Error obteniendo carrito: {e}")
+        logger.error("Error obteniendo carrito de invitado: %s", e)
         raise HTTPException(status_code=500, detail="Error obteniendo carrito")
 
+@app.post("/api/cart/merge")
+async def merge_guest_cart(merge: CartMergeRequest, db: Session = Depends(get_db)):
+    """Al iniciar sesión: pasar el carrito de invitado de la sesión al carrito del usuario"""
+    if not _is_guest_session(merge.session_id):
+        raise HTTPException(status_code=400, detail="session_id inválido")
+    try:
+        cart_id = await run_db(crud.merge_guest_cart, db, merge.session_id, merge.user_id)
+        if cart_id is None:
+            raise HTTPException(status_code=400, detail="No se pudo fusionar el carrito")
+        summary = await run_db(crud.get_cart_summary, db, cart_id=cart_id)
+        return {"message": "Carrito fusionado", "cart_id": cart_id, "cart_total": summary.total,
+                "item_count": summary.item_count}
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error("Error fusionando carrito: %s", e)
+        raise HTTPException(status_code=500, detail="Error fusionando carrito")
+
 @app.post("/api/cart")
 async def add_to_cart(
     item: CartItemCreate,
     db: Session = Depends(get_db)
 ):
-    """Agregar producto al carrito"""
+    """Agregar producto al carrito del usuario o, sin user_id, al de invitado de session_id"""
+    if item.user_id is None and not _is_guest_session(item.session_id):
+        raise HTTPException(status_code=400, detail="Se requiere user_id o session_id")
     try:
-        cart_item = crud.add_to_cart(db, item.user_id, item.product_id, item.quantity)
+        cart_item = await run_db(crud.add_to_cart, db, item.user_id, item.product_id, item.quantity,
+                                 session_id=item.session_id)
         if cart_item:
-            return {"message": "Producto agregado al carrito", "item_id": cart_item.id}
+            summary = await run_db(crud.get_cart_summary, db, cart_id=cart_item.cart_id)
+            return {"message": "Producto agregado al carrito", "item_id": cart_item.id,
+                    "cart_total": summary.total}
         else:
             raise HTTPException(status_code=400, detail="No se pudo agregar el producto al carrito")
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"Error agregando al carrito: {e}")
+        logger.error("Error agregando al carrito: %s", e)
         raise HTTPException(status_code=500, detail="Error agregando al carrito")
 
 @app.put("/api/cart/{item_id}")
@@ -303,28 +451,29 @@ async def update_cart_item(
 ):
     """Actualizar cantidad en carrito"""
     try:
-        updated_item = crud.update_cart_item(db, item_id, quantity)
+        updated_item = await run_db(crud.update_cart_item, db, item_id, quantity)
         if not updated_item:
             raise HTTPException(status_code=404, detail="Item de carrito no encontrado")
-        return {"message": "Carrito actualizado"}
+        summary = await run_db(crud.get_cart_summary, db, cart_id=updated_item.cart_id)
+        return {"message": "Carrito actualizado", "cart_total": summary.total}
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"Error actualizando carrito: {e}")
+        logger.error("Error actualizando carrito: %s", e)
         raise HTTPException(status_code=500, detail="Error actualizando carrito")
 
 @app.delete("/api/cart/{item_id}")
 async def remove_from_cart(item_id: str, db: Session = Depends(get_db)):  # Changed to str
     """Eliminar producto del carrito"""
     try:
-        success = crud.remove_from_cart(db, item_id)
+        success = await run_db(crud.remove_from_cart, db, item_id)
         if not success:
             raise HTTPException(status_code=404, detail="Item de carrito no encontrado")
         return {"message": "Producto eliminado del carrito"}
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"Error eliminando del carrito: {e}")
+        logger.error("Error eliminando del carrito: %s", e)
         raise HTTPException(status_code=500, detail="Error eliminando del carrito")
 
 # =======================
@@ -337,35 +486,37 @@ async def create_order(
     user_id: int,  # Add user_id parameter
     db: Session = Depends(get_db)
 ):
-    """Crear nueva orden"""
+    """Crear nueva orden con el contenido del carrito del usuario"""
+    started = time.perf_counter()
+    outcome = "error"
     try:
-        # Get user's cart
-        cart = crud.get_or_create_cart(db, user_id=user_id)
-        from sqlalchemy import text
-        cart_id_result = db.execute(text("SELECT id FROM carts WHERE user_id = :user_id"), {"user_id": user_id}).first()
-        cart_id = cart_id_result[0] if cart_id_result else None
-        
-        if not cart_id:
-            raise HTTPException(status_code=400, detail="No se encontró carrito para el usuario")
-        
-        new_order = crud.create_order(db, order, user_id, cart_id)
+        new_order = await run_db(crud.create_order, db, order, user_id)
         if not new_order:
             raise HTTPException(status_code=400, detail="Error creando orden")
-        return OrderResponse.from_orm(new_order)
+        outcome = "created"
+        return await run_db(OrderResponse.from_orm, new_order)
+    except crud.OrderError as e:
+        outcome = e.reason
+        status_code = {"empty_cart": 400, "insufficient_stock": 409}.get(e.reason, 503)
+        raise HTTPException(status_code=status_code, detail=e.message)
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"Error creando orden: {e}")
+        logger.error("Error creando orden: %s", e)
         raise HTTPException(status_code=500, detail="Error creando orden")
+    finally:
+        elapsed = time.perf_counter() - started
+        get_metrics().record_order(outcome, elapsed)
+        logger.info("Orden usuario %s: %s en %.1f ms", user_id, outcome, elapsed * 1000)
 
 @app.get("/api/orders/{user_id}", response_model=List[OrderResponse])
 async def get_user_orders(user_id: int, db: Session = Depends(get_db)):
     """Obtener órdenes de usuario"""
     try:
-        orders = crud.get_user_orders(db, user_id)
+        orders = await run_db(crud.get_user_orders, db, user_id)
         return [OrderResponse.from_orm(o) for o in orders]
     except Exception as e:
-        logger.error(f"Error obteniendo órdenes: {e}")
+        logger.error("Error obteniendo órdenes: %s", e)
         raise HTTPException(status_code=500, detail="Error obteniendo órdenes")
 
 # =======================
@@ -378,10 +529,10 @@ async def initialize_database(db: Session = Depends(get_db)):
     try:
         # Importar y ejecutar script de inicialización
         from app.init_db import init_sample_data
-        init_sample_data(db)
+        await run_db(init_sample_data, db)
         return {"message": "Base de datos inicializada con datos de muestra"}
     except Exception as e:
-        logger.error(f"Error inicializando base de datos: {e}")
+        logger.error("Error inicializando base de datos: %s", e)
         raise HTTPException(status_code=500, detail="Error inicializando base de datos")
 
 # =======================
@@ -391,12 +542,24 @@ async def initialize_database(db: Session = Depends(get_db)):
 @app.exception_handler(Exception)
 async def global_exception_handler(request, exc):
     """Manejador global de excepciones"""
-    logger.error(f"Error no manejado: {exc}")
+    logger.error("Error no manejado: %s", exc)
     return JSONResponse(
         status_code=500,
         content={"detail": "Error interno del servidor"}
     )
 
+def _clear_history(chatbot: EnhancedInfotecChatbotV4, session_id: Optional[str]) -> None:
+    # Con CONVERSATION_STORE=database consulta y vacía la cola de escritura (bloqueante): va en run_db
+    if session_id:
+        chatbot.clear_session(session_id)
+        logger.info("🗑️ Historial limpiado para sesión: %s", session_id)
+    else:
+        # Limpiar todas las sesiones
+        active_sessions = chatbot.conversation_manager.get_active_sessions()
+        for session in active_sessions:
+            chatbot.clear_session(session)
+        logger.info("🗑️ Todos los historiales limpiados")
+
 @app.post("/api/clear-history")
 async def clear_conversation_history(
     session_id: Optional[str] = None,
@@ -404,22 +567,35 @@ async def clear_conversation_history(
 ):
     """Limpiar historial de conversación para una sesión específica"""
     try:
-        if session_id:
-            chatbot.clear_session(session_id)
-            logger.info(f"🗑️ Historial limpiado para sesión: {session_id}")
-        else:
-            # Limpiar todas las sesiones
-            active_sessions = chatbot.conversation_manager.get_active_sessions()
-            for session in active_sessions:
-                chatbot.clear_session(session)
-            logger.info("🗑️ Todos los historiales limpiados")
-        
+        await run_db(_clear_history, chatbot, session_id)
         return {"status": "success", "message": "Historial limpiado correctamente"}
         
     except Exception as e:
-        logger.error(f"❌ Error limpiando historial: {e}")
+        logger.error("❌ Error limpiando historial: %s", e)
         raise HTTPException(status_code=500, detail="Error limpiando historial")
 
+def _conversation_stats(chatbot: EnhancedInfotecChatbotV4, session_id: Optional[str]) -> dict:
+    # Consultas al almacén de conversaciones y a la caché de respuestas (SQLite): va en run_db
+    if session_id:
+        stats = chatbot.conversation_manager.get_session_stats(session_id)
+        return {
+            "session_id": session_id,
+            **stats
+        }
+    active_sessions = chatbot.conversation_manager.get_active_sessions()
+    memory_stats = chatbot.conversation_manager.get_stats()
+    return {
+        "total_sessions": memory_stats["live_sessions"],
+        "total_messages": memory_stats["live_entries"],
+        "active_sessions": active_sessions,
+        "conversation_memory": memory_stats,
+        "intent_classifier": chatbot.intent_classifier.get_stats(),
+        "response_cache": chatbot.llm_service.response_cache.get_stats(),
+        "llm_client": chatbot.llm_client.get_stats(),
+        "prompt_tokens": get_prompt_metrics().get_stats(),
+        "cart_summary_cache": get_cart_summary_cache().get_stats()
+    }
+
 @app.get("/api/conversation-stats")
 async def get_conversation_stats(
     session_id: Optional[str] = None,
@@ -427,27 +603,10 @@ async def get_conversation_stats(
 ):
     """Obtener estadísticas de conversación"""
     try:
-        if session_id:
-            stats = chatbot.conversation_manager.get_session_stats(session_id)
-            return {
-                "session_id": session_id,
-                **stats
-            }
-        else:
-            active_sessions = chatbot.conversation_manager.get_active_sessions()
-            total_sessions = len(active_sessions)
-            total_messages = sum(
-                len(chatbot.conversation_manager.get_conversation_history(session)) 
-                for session in active_sessions
-            )
-            return {
-                "total_sessions": total_sessions,
-                "total_messages": total_messages,
-                "active_sessions": active_sessions
-            }
+        return await run_db(_conversation_stats, chatbot, session_id)
             
     except Exception as e:
-        logger.error(f"❌ Error obteniendo estadísticas: {e}")
+        logger.error("❌ Error obteniendo estadísticas: %s", e)
         raise HTTPException(status_code=500, detail="Error obteniendo estadísticas")
 
 # =====================
@@ -6,6 +6,7 @@ class ChatMessage(BaseModel):
     message: str
     max_tokens: Optional[int] = 1000
     session_id: Optional[str] = None
+    user_id: Optional[int] = None  # Sin usuario, el carrito del chat es el de invitado de la sesión
     current_page: Optional[str] = None
     current_product_id: Optional[int] = None
     context_data: Optional[Dict[str, Any]] = None
@@ -19,6 +20,7 @@ class ChatResponse(BaseModel):
     products: Optional[List[Dict[str, Any]]] = []
     cart_total: Optional[float] = None
     cart_action: Optional[Dict[str, Any]] = None  # Para acciones del carrito
+    session_id: Optional[str] = None  # Sesión usada (la creada si el cliente no envió una)
 
 class ConversationHistory(BaseModel):
     role: str  # "user" or "assistant"
@@ -186,7 +188,7 @@ class CategoryResponse(BaseModel):
         from_attributes = True
 
 class CartItemResponse(BaseModel):
-    id: int
+    id: str  # 'cart_id_product_id', el mismo formato que usan PUT/DELETE /api/cart/{item_id}
     product_id: int
     quantity: int
     product: ProductResponse
@@ -200,10 +202,15 @@ class CartResponse(BaseModel):
     item_count: int
 
 class CartItemCreate(BaseModel):
-    user_id: int
+    user_id: Optional[int] = None
+    session_id: Optional[str] = None  # Carrito de invitado cuando no hay user_id
     product_id: int
     quantity: int = 1
 
+class CartMergeRequest(BaseModel):
+    session_id: str
+    user_id: int
+
 class OrderItemResponse(BaseModel):
     id: int
     product_id: int
@@ -0,0 +1,236 @@
+# Búsqueda de productos con índices de texto completo
+"""
+Backend de búsqueda para catálogos grandes (SEARCH_BACKEND=fulltext)
+
+- PostgreSQL: columna generada `search_vector` (tsvector, configuración 'spanish' + unaccent)
+  con índice GIN, e índices GIN pg_trgm sobre name/brand/model para LIKE '%texto%' y similitud.
+  El ranking combina ts_rank con el rating del producto.
+- SQLite (desarrollo y pruebas locales): tabla virtual FTS5 `products_fts` sincronizada con
+  triggers, ranking bm25 combinado con el rating.
+
+Con SEARCH_BACKEND=memory (por defecto) el chatbot usa el índice en memoria (CatalogIndex)
+y crud.search_products conserva el ILIKE original.
+"""
+import os
+import re
+import logging
+import unicodedata
+from typing import List, Optional
+
+from sqlalchemy import event, text
+from sqlalchemy.orm import Session
+
+from app.database import Product
+
+logger = logging.getLogger(__name__)
+
+SEARCH_BACKEND = os.getenv("SEARCH_BACKEND", "memory").lower()  # memory | fulltext
+
+# Peso del rating (0-5) frente a la relevancia textual al ordenar resultados
+SEARCH_RATING_WEIGHT = float(os.getenv("SEARCH_RATING_WEIGHT", "0.1"))
+
+_TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+
+# Candidatos de FTS5 en los que se busca la frase exacta del nombre (SQLite)
+_PHRASE_CANDIDATES = 50
+
+_STOP_WORDS = {
+    "de", "del", "la", "el", "los", "las", "un", "una", "y", "o", "con", "para", "por", "en", "que"
+}
+
+# DDL por dialecto; todas las sentencias son idempotentes
+_SEARCH_DDL = {
+    "postgresql": [
+        "CREATE EXTENSION IF NOT EXISTS unaccent",
+        "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+        # unaccent() es STABLE; los índices y columnas generadas exigen una función IMMUTABLE
+        """
+        CREATE OR REPLACE FUNCTION immutable_unaccent(text) RETURNS text
+        LANGUAGE sql IMMUTABLE PARALLEL SAFE STRICT
+        AS $$ SELECT public.unaccent('public.unaccent'::regdictionary, $1) $$
+        """,
+        """
+        ALTER TABLE products ADD COLUMN IF NOT EXISTS search_vector tsvector
+        GENERATED ALWAYS AS (
+            setweight(to_tsvector('spanish', immutable_unaccent(coalesce(name, ''))), 'A') ||
+            setweight(to_tsvector('spanish', immutable_unaccent(coalesce(brand, '') || ' ' || coalesce(model, ''))), 'A') ||
+            setweight(to_tsvector('spanish', immutable_unaccent(coalesce(specifications, ''))), 'C') ||
+            setweight(to_tsvector('spanish', immutable_unaccent(coalesce(description, ''))), 'D')
+        ) STORED
+        """,
+        "CREATE INDEX IF NOT EXISTS ix_products_search_vector ON products USING GIN (search_vector)",
+        "CREATE INDEX IF NOT EXISTS ix_products_name_trgm ON products USING GIN (immutable_unaccent(lower(name)) gin_trgm_ops)",
+        "CREATE INDEX IF NOT EXISTS ix_products_brand_trgm ON products USING GIN (immutable_unaccent(lower(brand)) gin_trgm_ops)",
+        "CREATE INDEX IF NOT EXISTS ix_products_model_trgm ON products USING GIN (immutable_unaccent(lower(model)) gin_trgm_ops)",
+    ],
+    "sqlite": [
+        """
+        CREATE VIRTUAL TABLE IF NOT EXISTS products_fts USING fts5(
+            name, brand, model, specifications, description,
+            content='products', content_rowid='id', tokenize='unicode61 remove_diacritics 2'
+        )
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS products_fts_ai AFTER INSERT ON products BEGIN
+            INSERT INTO products_fts(rowid, name, brand, model, specifications, description)
+            VALUES (new.id, new.name, new.brand, new.model, new.specifications, new.description);
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS products_fts_ad AFTER DELETE ON products BEGIN
+            INSERT INTO products_fts(products_fts, rowid, name, brand, model, specifications, description)
+            VALUES ('delete', old.id, old.name, old.brand, old.model, old.specifications, old.description);
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS products_fts_au AFTER UPDATE ON products BEGIN
+            INSERT INTO products_fts(products_fts, rowid, name, brand, model, specifications, description)
+            VALUES ('delete', old.id, old.name, old.brand, old.model, old.specifications, old.description);
+            INSERT INTO products_fts(rowid, name, brand, model, specifications, description)
+            VALUES (new.id, new.name, new.brand, new.model, new.specifications, new.description);
+        END
+        """,
+        # Indexar las filas que existían antes de crear la tabla FTS
+        "INSERT INTO products_fts(products_fts) VALUES ('rebuild')",
+    ],
+}
+
+def fulltext_enabled() -> bool:
+    return SEARCH_BACKEND == "fulltext"
+
+def _install_search_schema(connection) -> None:
+    statements = _SEARCH_DDL.get(connection.dialect.name)
+    if not statements:
+        logger.warning("Búsqueda de texto completo no soportada para el dialecto %s", connection.dialect.name)
+        return
+    for statement in statements:
+        connection.execute(text(statement))
+    logger.info("Esquema de búsqueda de texto completo instalado (%s)", connection.dialect.name)
+
+@event.listens_for(Product.__table__, "after_create")
+def _create_search_schema(target, connection, **kw) -> None:
+    """Crear los índices de búsqueda junto con la tabla products"""
+    if fulltext_enabled():
+        _install_search_schema(connection)
+
+def ensure_search_schema(engine) -> None:
+    """Instalar los índices de búsqueda en una base de datos existente (idempotente)"""
+    if not fulltext_enabled():
+        return
+    with engine.begin() as connection:
+        _install_search_schema(connection)
+
+def _fold(value: Optional[str]) -> str:
+    """Minúsculas y sin tildes ("Portátil" -> "portatil")"""
+    folded = unicodedata.normalize("NFKD", (value or "").lower())
+    return "".join(char for char in folded if not unicodedata.combining(char))
+
+def _search_tokens(search_term: str) -> List[str]:
+    """Tokens sin tildes ni signos: seguros para construir tsquery / consultas FTS5"""
+    return [token for token in dict.fromkeys(_TOKEN_PATTERN.findall(_fold(search_term))) if token not in _STOP_WORDS]
+
+def _match_expression(dialect: str, tokens: List[str], operator: str) -> str:
+    """Consulta por prefijos: 'laptop:* & gaming:*' (PostgreSQL) o '"laptop"* AND "gaming"*' (FTS5)"""
+    if dialect == "postgresql":
+        return f" {'&' if operator == 'AND' else '|'} ".join(f"{token}:*" for token in tokens)
+    return f" {operator} ".join(f'"{token}"*' for token in tokens)
+
+def _ranked_ids(db: Session, match: str, limit: int, in_stock_only: bool,
+                max_price: Optional[float], name_only: bool = False) -> List[int]:
+    dialect = db.get_bind().dialect.name
+    filters = "p.is_active = TRUE"
+    params = {"match": match, "limit": limit, "rating_weight": SEARCH_RATING_WEIGHT}
+    if in_stock_only:
+        filters += " AND p.stock_quantity > 0"
+    if max_price:
+        filters += " AND p.price <= :max_price"
+        params["max_price"] = max_price
+
+    if dialect == "postgresql":
+        vector = "setweight(to_tsvector('spanish', immutable_unaccent(coalesce(p.name, ''))), 'A')" \
+            if name_only else "p.search_vector"
+        sql = f"""
+            SELECT p.id FROM products p, to_tsquery('spanish', :match) query
+            WHERE {vector} @@ query AND {filters}
+            ORDER BY ts_rank({vector}, query) + :rating_weight * coalesce(p.rating, 0) / 5 DESC, p.id
+            LIMIT :limit
+        """
+    else:
+        # bm25 es negativo: más bajo = más relevante
+        if name_only:
+            params["match"] = f"name : ({match})"
+        sql = f"""
+            SELECT p.id FROM products_fts JOIN products p ON p.id = products_fts.rowid
+            WHERE products_fts MATCH :match AND {filters}
+            ORDER BY bm25(products_fts, 10.0, 10.0, 5.0, 2.0, 1.0) - :rating_weight * coalesce(p.rating, 0) / 5, p.id
+            LIMIT :limit
+        """
+    return [row[0] for row in db.execute(text(sql), params)]
+
+def _load_in_order(db: Session, ids: List[int]) -> List[Product]:
+    if not ids:
+        return []
+    products = {product.id: product for product in db.query(Product).filter(Product.id.in_(ids)).all()}
+    return [products[product_id] for product_id in ids if product_id in products]
+
+def fulltext_search(db: Session, search_term: str, limit: int = 10, in_stock_only: bool = False,
+                    max_price: Optional[float] = None) -> List[Product]:
+    """
+    Buscar productos por texto completo: primero todos los términos (AND) y, si no hay
+    resultados, cualquiera de ellos (OR). Ordenado por relevancia combinada con rating
+    """
+    tokens = _search_tokens(search_term)
+    if not tokens:
+        return []
+    dialect = db.get_bind().dialect.name
+    ids = _ranked_ids(db, _match_expression(dialect, tokens, "AND"), limit, in_stock_only, max_price)
+    if not ids and len(tokens) > 1:
+        ids = _ranked_ids(db, _match_expression(dialect, tokens, "OR"), limit, in_stock_only, max_price)
+    return _load_in_order(db, ids)
+
+def fulltext_find_by_name(db: Session, product_name: str) -> Optional[Product]:
+    """
+    Buscar un producto por nombre: coincidencia del texto completo (LIKE acelerado por
+    pg_trgm en PostgreSQL), luego todas las palabras en el nombre y, en PostgreSQL,
+    el nombre más parecido por similitud de trigramas
+    """
+    tokens = _search_tokens(product_name)
+    if not tokens:
+        return None
+    dialect = db.get_bind().dialect.name
+    # El texto tal cual (sin tildes, espacios colapsados); los tokens solo sirven para tsquery / FTS5
+    phrase = " ".join(_fold(product_name).split())
+
+    if dialect == "postgresql":
+        pattern = phrase.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        row = db.execute(text("""
+            SELECT id FROM products
+            WHERE immutable_unaccent(lower(name)) LIKE '%' || :pattern || '%'
+            ORDER BY rating DESC NULLS LAST, id LIMIT 1
+        """), {"pattern": pattern}).first()
+        if row:
+            return db.get(Product, row[0])
+    else:
+        # SQLite no tiene unaccent: FTS5 (remove_diacritics) acota los candidatos y la frase
+        # se compara con el nombre sin tildes en Python
+        ids = _ranked_ids(db, _match_expression(dialect, tokens, "AND"), _PHRASE_CANDIDATES, False, None,
+                          name_only=True)
+        matches = [product for product in _load_in_order(db, ids) if phrase in _fold(product.name)]
+        if matches:
+            return max(matches, key=lambda product: (product.rating or 0, -product.id))
+
+    keywords = [token for token in tokens if len(token) > 2]
+    if keywords:
+        ids = _ranked_ids(db, _match_expression(dialect, keywords, "AND"), 1, False, None, name_only=True)
+        if ids:
+            return db.get(Product, ids[0])
+
+    if dialect == "postgresql":
+        row = db.execute(text("""
+            SELECT id FROM products
+            WHERE immutable_unaccent(lower(name)) % :phrase
+            ORDER BY similarity(immutable_unaccent(lower(name)), :phrase) DESC LIMIT 1
+        """), {"phrase": phrase}).first()
+        if row:
+            return db.get(Product, row[0])
+    return None
@@ -0,0 +1,2 @@
+# filepath: backend/benchmarks/__init__.py
+"""Benchmarks de rendimiento del backend (ver chat_benchmark.py)"""
@@ -0,0 +1,296 @@
+# filepath: backend/benchmarks/chat_benchmark.py
+"""
+Benchmark de extremo a extremo del chat
+Reproduce el corpus de conversaciones (benchmarks/corpus.py) contra
+EnhancedInfotecChatbotV4.process_message_async y contra /api/chat (cliente ASGI en
+proceso), sobre un catálogo SQLite sembrado con init_db.py y el proveedor de IA local
+(LLM_PROVIDER=local, sin red ni cuota de Gemini).
+
+Reporta por modo y nivel de concurrencia: mensajes/segundo, latencia p50/p95/p99 por
+intención y el desglose por etapa (historial, IA, base de datos, entidades, formato,
+guardado y resto del pipeline).
+
+Uso (desde backend/):
+    python -m benchmarks.chat_benchmark
+    python -m benchmarks.chat_benchmark --mode direct --concurrency 1,8,32 --rounds 5
+    python -m benchmarks.chat_benchmark --llm-latency-ms 300 --json resultados.json
+"""
+import os
+import io
+import sys
+import json
+import math
+import time
+import asyncio
+import argparse
+import tempfile
+import contextlib
+from collections import defaultdict
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+from benchmarks.corpus import CONVERSATIONS, total_messages
+
+STAGES = ("history", "llm", "db", "entities", "format", "save")
+
+# Tiempo acumulado por etapa del mensaje en curso (cada conversación corre en su propia tarea)
+_message_stages: ContextVar[Optional[Dict[str, float]]] = ContextVar("benchmark_stages", default=None)
+
+def configure_environment(args: argparse.Namespace) -> str:
+    """Variables de entorno que deben existir antes de importar la aplicación"""
+    db_path = args.db or os.path.join(tempfile.mkdtemp(prefix="infotec-bench-"), "benchmark.db")
+    os.environ["DATABASE_URL"] = f"sqlite:///{db_path}"
+    os.environ["LLM_PROVIDER"] = "local"
+    os.environ["LOCAL_LLM_LATENCY_MS"] = str(args.llm_latency_ms)
+    os.environ["LOCAL_LLM_JITTER_MS"] = str(args.llm_jitter_ms)
+    os.environ["LOCAL_LLM_ERROR_RATE"] = str(args.llm_error_rate)
+    # Sin caché de respuestas: cada ronda repite los mismos mensajes y mediría solo aciertos
+    os.environ["RESPONSE_CACHE_ENABLED"] = "true" if args.cache else "false"
+    # main configura logging al importarse (LOG_LEVEL); el reporte necesita una salida limpia
+    os.environ["LOG_LEVEL"] = args.log_level
+    return db_path
+
+def seed_database(db_path: str) -> None:
+    """Crear tablas y cargar el catálogo de ejemplo una sola vez por archivo"""
+    from app.database import SessionLocal, create_tables, Product
+
+    create_tables()
+    db = SessionLocal()
+    try:
+        seeded = db.query(Product).count() > 0
+    finally:
+        db.close()
+    if not seeded:
+        from app.init_db import init_database
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            init_database()
+    print(f"Catálogo SQLite: {db_path}")
+
+def _record(stage: str, elapsed: float) -> None:
+    stages = _message_stages.get()
+    if stages is not None:
+        stages[stage] = stages.get(stage, 0.0) + elapsed
+
+def _timed_async(func: Callable[..., Awaitable[Any]], stage: str) -> Callable[..., Awaitable[Any]]:
+    async def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return await func(*args, **kwargs)
+        finally:
+            _record(stage, time.perf_counter() - start)
+    return wrapper
+
+def _timed_sync(func: Callable[..., Any], stage: str) -> Callable[..., Any]:
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            _record(stage, time.perf_counter() - start)
+    return wrapper
+
+def instrument(bot) -> None:
+    """Medir las etapas del pipeline envolviendo los componentes del chatbot"""
+    from app.chatbot.core import enhanced_chatbot_v4_fixed_clean as orchestrator
+
+    if getattr(bot, "_benchmark_instrumented", False):
+        return
+    orchestrator.run_db = _timed_async(orchestrator.run_db, "db")
+    bot.llm_client.generate_async = _timed_async(bot.llm_client.generate_async, "llm")
+    bot.llm_client.generate = _timed_sync(bot.llm_client.generate, "llm")
+    manager = bot.conversation_manager
+    manager.get_conversation_history_async = _timed_async(manager.get_conversation_history_async, "history")
+    manager.save_conversation = _timed_sync(manager.save_conversation, "save")
+    bot.entity_extractor.extract_entities = _timed_sync(bot.entity_extractor.extract_entities, "entities")
+    formatter = bot.response_formatter
+    for name in dir(formatter):
+        if not name.startswith("_") and callable(getattr(formatter, name)):
+            setattr(formatter, name, _timed_sync(getattr(formatter, name), "format"))
+    bot._benchmark_instrumented = True
+
+class LevelResult:
+    """Mediciones de un modo y nivel de concurrencia"""
+
+    def __init__(self, mode: str, concurrency: int):
+        self.mode = mode
+        self.concurrency = concurrency
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.stage_totals: Dict[str, float] = defaultdict(float)
+        self.errors = 0
+        self.wall_seconds = 0.0
+
+    @property
+    def messages(self) -> int:
+        return sum(len(values) for values in self.latencies.values())
+
+    def add(self, intent: str, latency: float, stages: Dict[str, float]) -> None:
+        self.latencies[intent].append(latency)
+        accounted = 0.0
+        for stage, elapsed in stages.items():
+            self.stage_totals[stage] += elapsed
+            accounted += elapsed
+        self.stage_totals["other"] += max(0.0, latency - accounted)
+
+    def summary(self) -> Dict[str, Any]:
+        all_latencies = [value for values in self.latencies.values() for value in values]
+        total_time = sum(all_latencies) or 1.0
+        return {
+            "mode": self.mode,
+            "concurrency": self.concurrency,
+            "messages": self.messages,
+            "errors": self.errors,
+            "wall_seconds": round(self.wall_seconds, 3),
+            "messages_per_second": round(self.messages / self.wall_seconds, 1) if self.wall_seconds else 0.0,
+            "latency_ms": _percentiles(all_latencies),
+            "by_intent": {intent: {"count": len(values), **_percentiles(values)}
+                          for intent, values in sorted(self.latencies.items())},
+            "stages_ms_per_message": {stage: round(self.stage_totals.get(stage, 0.0) * 1000 / max(self.messages, 1), 2)
+                                      for stage in STAGES + ("other",)},
+            "stages_share": {stage: round(self.stage_totals.get(stage, 0.0) / total_time, 3)
+                             for stage in STAGES + ("other",)},
+        }
+
+def _percentile(sorted_values: List[float], fraction: float) -> float:
+    # Rango más cercano: el valor que deja por debajo al menos esa fracción de muestras
+    index = max(0, min(len(sorted_values) - 1, math.ceil(fraction * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+def _percentiles(values: List[float]) -> Dict[str, float]:
+    if not values:
+        return {"p50": 0.0, "p95": 0.0, "p99": 0.0}
+    ordered = sorted(values)
+    return {name: round(_percentile(ordered, fraction) * 1000, 2)
+            for name, fraction in (("p50", 0.50), ("p95", 0.95), ("p99", 0.99))}
+
+SendFunc = Callable[[str, str, Any], Awaitable[str]]
+
+async def _run_conversation(send: SendFunc, open_session: Callable[[], Any], messages: List[str],
+                            session_id: str, result: LevelResult) -> None:
+    session = open_session()
+    try:
+        for message in messages:
+            stages: Dict[str, float] = {}
+            token = _message_stages.set(stages)
+            start = time.perf_counter()
+            try:
+                intent = await send(message, session_id, session)
+            except Exception as e:
+                result.errors += 1
+                intent = f"error:{type(e).__name__}"
+            finally:
+                _message_stages.reset(token)
+            result.add(intent, time.perf_counter() - start, stages)
+    finally:
+        if session is not None:
+            session.close()
+
+async def run_level(mode: str, send: SendFunc, open_session: Callable[[], Any],
+                    concurrency: int, rounds: int, run_id: str) -> LevelResult:
+    """Enviar rounds veces el corpus con hasta `concurrency` conversaciones simultáneas"""
+    result = LevelResult(mode, concurrency)
+    slots = asyncio.Semaphore(concurrency)
+
+    async def worker(index: int, messages: List[str]) -> None:
+        async with slots:
+            await _run_conversation(send, open_session, messages, f"bench-{run_id}-{index}", result)
+
+    jobs = [messages for _ in range(rounds) for messages in CONVERSATIONS]
+    start = time.perf_counter()
+    await asyncio.gather(*(worker(index, messages) for index, messages in enumerate(jobs)))
+    result.wall_seconds = time.perf_counter() - start
+    return result
+
+def _direct_target(bot):
+    from app.database import SessionLocal
+
+    async def send(message: str, session_id: str, db) -> str:
+        response = await bot.process_message_async(message, db, None, session_id)
+        return response.get("intent") or "desconocido"
+
+    return send, SessionLocal
+
+def _asgi_target(client):
+    async def send(message: str, session_id: str, _session) -> str:
+        response = await client.post("/api/chat", json={"message": message, "session_id": session_id})
+        if response.status_code != 200:
+            raise RuntimeError(f"HTTP {response.status_code}")
+        return response.json().get("intent") or "desconocido"
+
+    return send, lambda: None
+
+async def run_benchmark(args: argparse.Namespace) -> List[Dict[str, Any]]:
+    import httpx
+    from app import main
+
+    bot = main.get_enhanced_chatbot()
+    instrument(bot)
+    levels = [int(level) for level in args.concurrency.split(",")]
+    modes = ["direct", "asgi"] if args.mode == "both" else [args.mode]
+    summaries = []
+
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app),
+                                 base_url="http://benchmark") as client:
+        targets = {"direct": _direct_target(bot), "asgi": _asgi_target(client)}
+        # Calentamiento: carga del índice del catálogo, cachés de specs y compilación de patrones
+        send, open_session = targets[modes[0]]
+        await run_level("warmup", send, open_session, 4, 1, "warmup")
+
+        for mode in modes:
+            send, open_session = targets[mode]
+            for concurrency in levels:
+                result = await run_level(mode, send, open_session, concurrency, args.rounds,
+                                         f"{mode}-{concurrency}-{time.time_ns()}")
+                summary = result.summary()
+                summaries.append(summary)
+                print_summary(summary)
+    bot.conversation_manager.close()
+    return summaries
+
+def print_summary(summary: Dict[str, Any]) -> None:
+    latency = summary["latency_ms"]
+    print(f"\n=== {summary['mode']} | concurrencia {summary['concurrency']} | "
+          f"{summary['messages']} mensajes en {summary['wall_seconds']}s | "
+          f"{summary['messages_per_second']} msg/s | errores {summary['errors']}")
+    print(f"    total{'':17} p50 {latency['p50']:>8.2f} ms  p95 {latency['p95']:>8.2f} ms  p99 {latency['p99']:>8.2f} ms")
+    for intent, stats in summary["by_intent"].items():
+        print(f"    {intent:<22} p50 {stats['p50']:>8.2f} ms  p95 {stats['p95']:>8.2f} ms  "
+              f"p99 {stats['p99']:>8.2f} ms  (n={stats['count']})")
+    stages = "  ".join(f"{stage} {summary['stages_ms_per_message'][stage]:.2f}ms "
+                       f"({summary['stages_share'][stage] * 100:.0f}%)"
+                       for stage in STAGES + ("other",))
+    print(f"    etapas/mensaje: {stages}")
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Benchmark de extremo a extremo del chat (sin Gemini)")
+    parser.add_argument("--mode", choices=("direct", "asgi", "both"), default="both",
+                        help="process_message_async directo, /api/chat por ASGI o ambos")
+    parser.add_argument("--concurrency", default="1,4,16",
+                        help="niveles de conversaciones simultáneas, separados por coma")
+    parser.add_argument("--rounds", type=int, default=3, help="veces que se envía el corpus por nivel")
+    parser.add_argument("--db", help="archivo SQLite a usar (por defecto uno temporal nuevo)")
+    parser.add_argument("--llm-latency-ms", type=float, default=0.0, help="latencia simulada de la IA")
+    parser.add_argument("--llm-jitter-ms", type=float, default=0.0, help="variación (±) de la latencia simulada")
+    parser.add_argument("--llm-error-rate", type=float, default=0.0, help="fracción de llamadas a la IA que fallan")
+    parser.add_argument("--cache", action="store_true", help="mantener activa la caché de respuestas")
+    parser.add_argument("--json", help="guardar los resultados en este archivo JSON")
+    parser.add_argument("--log-level", default="ERROR", help="nivel de logging de la aplicación durante la corrida")
+    return parser.parse_args(argv)
+
+def main(argv: Optional[List[str]] = None) -> None:
+    args = parse_args(argv)
+    db_path = configure_environment(args)
+    seed_database(db_path)
+    print(f"Corpus: {len(CONVERSATIONS)} conversaciones, {total_messages()} mensajes por ronda")
+    summaries = asyncio.run(run_benchmark(args))
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as output:
+            json.dump(summaries, output, ensure_ascii=False, indent=2)
+        print(f"\nResultados guardados en {args.json}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+# filepath: backend/benchmarks/corpus.py
+"""
+Corpus de conversaciones de compra en español para los benchmarks
+Cada conversación se envía en orden dentro de una misma sesión (los mensajes
+dependen del contexto: "la segunda", "agrégala"...). Cubre todas las intenciones
+sobre el catálogo de ejemplo de init_db.py
+"""
+from typing import List
+
+CONVERSATIONS: List[List[str]] = [
+    [
+        "hola",
+        "busco una laptop gaming",
+        "la segunda",
+        "agrega la laptop asus rog strix g15",
+        "gracias",
+    ],
+    [
+        "buenas tardes",
+        "qué me recomiendas para gaming",
+        "muéstrame las especificaciones de la primera",
+        "cuánto tarda el envío a provincia",
+    ],
+    [
+        "necesito una laptop para la universidad hasta 3500 soles",
+        "cuál me conviene más",
+        "tiene garantía?",
+        "muchas gracias",
+    ],
+    [
+        "qué es mejor AMD o Intel",
+        "y para programar cuál me recomiendas",
+        "busco una pc de escritorio",
+        "la tercera",
+    ],
+    [
+        "diferencia entre ssd y hdd",
+        "quiero ver monitores gamer",
+        "el primero",
+        "agrégalo al carrito",
+    ],
+    [
+        "compara la asus rog strix con la lenovo legion",
+        "cuál es mejor para diseño gráfico",
+        "especificaciones de la lenovo legion 5",
+    ],
+    [
+        "tienen teclados mecánicos?",
+        "busco un procesador amd ryzen",
+        "qué es la memoria ddr5?",
+        "hacen envíos a arequipa?",
+    ],
+    [
+        "hola, necesito una computadora para la oficina",
+        "algo más barato?",
+        "la segunda",
+        "quiero comprar la pc oficina intel core i3",
+        "adiós",
+    ],
+    [
+        "cuál es la mejor laptop que tienes",
+        "tienen financiamiento o cuotas?",
+        "busco laptop hp",
+        "detalles de la primera",
+    ],
+    [
+        "laptop para trabajo con 16gb de ram",
+        "qué me recomiendas hasta 5000",
+        "vs la hp pavilion gaming?",
+        "gracias, lo pensaré",
+    ],
+]
+
+def total_messages() -> int:
+    return sum(len(conversation) for conversation in CONVERSATIONS)
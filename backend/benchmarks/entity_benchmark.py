@@ -0,0 +1,127 @@
+# filepath: backend/benchmarks/entity_benchmark.py
+"""
+Micro-benchmark de EntityExtractor.extract_entities
+Compara, sobre los mensajes del corpus (benchmarks/corpus.py) más variantes generadas con
+el vocabulario de ChatbotConfig, el tiempo por mensaje de:
+- "por patrón": re.search con el patrón crudo (o `in`) en cada mensaje, como recorría el
+  extractor antes de compilar las familias
+- "compilado": familias compiladas al importar (utils/pattern_matcher.PatternFamily)
+Antes de medir verifica que ambos extraigan exactamente las mismas entidades.
+
+Uso (desde backend/):
+    python -m benchmarks.entity_benchmark
+    python -m benchmarks.entity_benchmark --messages 5000 --repeat 7
+"""
+import os
+import re
+import sys
+import time
+import random
+import argparse
+import statistics
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+from benchmarks.corpus import CONVERSATIONS
+from app.chatbot.core.config import ChatbotConfig
+from app.chatbot.utils.entity_extractor import EntityExtractor, ExtractorPatterns
+
+class PerPatternFamily:
+    """Misma interfaz que PatternFamily, pero recorriendo los patrones uno por uno"""
+
+    def __init__(self, patterns, literal: bool = False):
+        if isinstance(patterns, dict):
+            self.items = [(key, pattern) for key, value in patterns.items()
+                          for pattern in ([value] if isinstance(value, str) else value)]
+        else:
+            self.items = [(pattern, pattern) for pattern in patterns]
+        self.literal = literal
+
+    def _first(self, text: str) -> Optional[Tuple[Any, Any]]:
+        for key, pattern in self.items:
+            if self.literal:
+                if pattern in text:
+                    return key, None
+            else:
+                match = re.search(pattern, text)
+                if match:
+                    return key, match
+        return None
+
+    def matches(self, text: str) -> bool:
+        return self._first(text) is not None
+
+    def find(self, text: str) -> Optional[Any]:
+        found = self._first(text)
+        return found[0] if found else None
+
+    def search(self, text: str) -> Optional[Tuple[Any, Any]]:
+        return self._first(text)
+
+    def find_all(self, texts: List[str]) -> Set[Any]:
+        return {key for key, pattern in self.items if any(re.search(pattern, text) for text in texts)}
+
+def build_messages(count: int, seed: int) -> List[str]:
+    """Corpus completo más mensajes sintéticos con marcas, usos, carrito, comparaciones..."""
+    config = ChatbotConfig
+    vocabulary = (list(config.BRANDS) + [word for words in config.USE_CASES.values() for word in words]
+                  + list(config.CART_PATTERNS) + list(config.CONTEXTUAL_REFS) + list(config.SPEC_PATTERNS)
+                  + ["laptop", "pc", "monitor", "teclado", "hasta 3000", "2 unidades", "la segunda",
+                     "vs", "compara asus con dell", "qué es mejor amd o intel", "precio", "batería",
+                     "asus rog strix g15", "lenovo legion 5", "hp pavilion gaming", "qué me recomiendas"])
+    messages = [message for conversation in CONVERSATIONS for message in conversation]
+    rng = random.Random(seed)
+    while len(messages) < count:
+        messages.append(" ".join(rng.choice(vocabulary) for _ in range(rng.randint(1, 6))))
+    return messages[:count]
+
+def _normalized(entities: Dict[str, Any]) -> Dict[str, Any]:
+    # Las listas de comparación salen de un set: el orden no es significativo
+    return {key: sorted(value) if isinstance(value, list) else value for key, value in entities.items()}
+
+def time_extractor(extractor: EntityExtractor, messages: List[str], history: List[Dict[str, Any]],
+                   repeat: int) -> List[float]:
+    """Microsegundos por mensaje de cada repetición"""
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for message in messages:
+            extractor.extract_entities(message, history)
+        samples.append((time.perf_counter() - started) / len(messages) * 1e6)
+    return samples
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Micro-benchmark de EntityExtractor")
+    parser.add_argument("--messages", type=int, default=2000, help="mensajes por repetición")
+    parser.add_argument("--repeat", type=int, default=5, help="repeticiones (se reporta la mediana)")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args(argv)
+
+    messages = build_messages(args.messages, args.seed)
+    history = [{"user_message": "la segunda", "entities": {},
+                "bot_response": "📋 **Especificaciones Técnicas - ASUS ROG Strix G15**"}]
+    compiled = EntityExtractor()
+    per_pattern = EntityExtractor()
+    per_pattern.patterns = ExtractorPatterns(ChatbotConfig, family=PerPatternFamily)
+
+    for message in messages:
+        expected = _normalized(per_pattern.extract_entities(message, history))
+        actual = _normalized(compiled.extract_entities(message, history))
+        if expected != actual:
+            raise SystemExit(f"Entidades distintas para {message!r}:\n  {expected}\n  {actual}")
+
+    results = {}
+    for name, extractor in (("por patrón", per_pattern), ("compilado", compiled)):
+        time_extractor(extractor, messages[:100], history, 1)
+        results[name] = statistics.median(time_extractor(extractor, messages, history, args.repeat))
+
+    print(f"{len(messages)} mensajes, mediana de {args.repeat} repeticiones (entidades idénticas)")
+    for name, micros in results.items():
+        print(f"    {name:<12} {micros:>8.1f} µs/mensaje")
+    print(f"    aceleración  {results['por patrón'] / results['compilado']:>8.2f}x")
+
+if __name__ == "__main__":
+    main()
@@ -21,6 +21,7 @@ export interface ChatMessage {
   isBot: boolean;
   timestamp: Date;
   isLoading?: boolean;
+  isStreaming?: boolean;
   typingState?: 'typing' | 'thinking' | 'searching';
   products?: Product[];
   intent?: string;
@@ -85,19 +86,47 @@ export const useChat = () => {
     localStorage.setItem(`chat_messages_${sessionId}`, JSON.stringify(messages));
   }, [messages, sessionId]);
 
-  // Mutation para enviar mensajes
+  // Mostrar cada fragmento del streaming: el mensaje de carga se convierte en la respuesta parcial
+  const appendStreamedText = useCallback((chunk: string) => {
+    setBotTypingState('idle');
+    setMessages(prev => prev.map(msg => {
+      if (msg.isLoading) {
+        return { id: `stream-${Date.now()}`, text: chunk, isBot: true, timestamp: new Date(), isStreaming: true };
+      }
+      if (msg.isStreaming) {
+        return { ...msg, text: msg.text + chunk };
+      }
+      return msg;
+    }));
+  }, []);
+
+  // Las tarjetas de productos llegan en un evento aparte, en cuanto están resueltas
+  const showStreamedProducts = useCallback((products: Product[]) => {
+    setMessages(prev => prev.map(msg => (msg.isStreaming ? { ...msg, products } : msg)));
+  }, []);
+
+  // Mutation para enviar mensajes (por streaming SSE)
   const sendMessageMutation = useMutation({
-    mutationFn: (userMessageText: string) => apiService.sendMessage(
+    mutationFn: (userMessageText: string) => apiService.streamMessage(
       userMessageText,
       sessionId,
       currentPage,
       currentProductId,
-      contextData
+      contextData,
+      {
+        onIntent: (_intent, shouldShowProducts) => setBotTypingState(shouldShowProducts ? 'searching' : 'typing'),
+        onToken: appendStreamedText,
+        onProducts: showStreamedProducts,
+      }
     ),
+    // Sin reintentos: un evento "error" llega cuando el servidor ya registró el turno y
+    // reenviarlo duplicaría el mensaje del usuario en el historial
+    retry: 0,
     onSuccess: (response: ChatResponse, userMessage: string) => {
-      // Remover mensaje de carga y agregar respuesta del bot
+      setBotTypingState('idle');
+      // Remover mensaje de carga (o parcial del streaming) y agregar respuesta final del bot
       setMessages(prev => {
-        const withoutLoading = prev.filter(msg => !msg.isLoading);
+        const withoutLoading = prev.filter(msg => !msg.isLoading && !msg.isStreaming);
         return [
           ...withoutLoading,
           {
@@ -142,9 +171,10 @@ export const useChat = () => {
       }
     },
     onError: (error: Error) => {
+      setBotTypingState('idle');
       // Remover mensaje de carga y mostrar error
       setMessages(prev => {
-        const withoutLoading = prev.filter(msg => !msg.isLoading);
+        const withoutLoading = prev.filter(msg => !msg.isLoading && !msg.isStreaming);
         return [
           ...withoutLoading,
           {
@@ -166,23 +196,6 @@ export const useChat = () => {
     retry: 1,
   });
 
-  // Función para simular escritura realista
-  const simulateTyping = useCallback((messageLength: number) => {
-    setBotTypingState('thinking');
-    
-    // Tiempo basado en la longitud del mensaje
-    const baseTime = Math.min(messageLength * 50, 3000); // Max 3 segundos
-    const thinkingTime = Math.random() * 1000 + 500; // 0.5-1.5 segundos pensando
-    
-    setTimeout(() => {
-      setBotTypingState('typing');
-      
-      setTimeout(() => {
-        setBotTypingState('idle');
-      }, baseTime);
-    }, thinkingTime);
-  }, []);
-
   // Función para enviar mensaje mejorada
   const sendMessage = useCallback((text: string) => {
     if (!text.trim()) return;
@@ -220,12 +233,9 @@ export const useChat = () => {
     setMessages(prev => [...prev, userMessage, loadingMessage]);
     setBotTypingState(typingState);
 
-    // Simular escritura realista
-    simulateTyping(text.length);
-
-    // Enviar al backend
+    // Enviar al backend (el indicador se apaga con el primer fragmento recibido)
     sendMessageMutation.mutate(text.trim());
-  }, [sendMessageMutation, simulateTyping]);  // Función para limpiar chat
+  }, [sendMessageMutation]);  // Función para limpiar chat
   const clearChat = useCallback(() => {
     const initialMessage = {
       id: '1',
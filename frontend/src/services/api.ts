@@ -40,6 +40,26 @@ export interface ChatResponse {
   };
 }
 
+export interface ChatStreamHandlers {
+  onIntent?: (intent: string, shouldShowProducts: boolean) => void;
+  onToken?: (text: string) => void;
+  onProducts?: (products: Product[]) => void;
+}
+
+// Parsear un bloque "event: ...\ndata: ..." de Server-Sent Events
+const parseSseEvent = (rawEvent: string): { event: string; data: any } => {
+  let event = 'message';
+  const dataLines: string[] = [];
+  rawEvent.split('\n').forEach((line) => {
+    if (line.startsWith('event:')) {
+      event = line.slice(6).trim();
+    } else if (line.startsWith('data:')) {
+      dataLines.push(line.slice(5).trim());
+    }
+  });
+  return { event, data: dataLines.length ? JSON.parse(dataLines.join('\n')) : null };
+};
+
 export interface ConversationHistoryItem {
   role: string;
   content: string;
@@ -102,6 +122,83 @@ export const apiService = {  // Enviar mensaje al chatbot
     }
   },
 
+  // Enviar mensaje por streaming (SSE): el texto llega por fragmentos y los productos en un evento aparte
+  streamMessage: async (
+    userMessage: string,
+    sessionId?: string,
+    currentPage?: string,
+    currentProductId?: number,
+    contextData?: Record<string, any>,
+    handlers: ChatStreamHandlers = {}
+  ): Promise<ChatResponse> => {
+    const response = await fetch(`${API_BASE_URL}/api/chat/stream`, {
+      method: 'POST',
+      headers: {
+        'Content-Type': 'application/json',
+        Accept: 'text/event-stream',
+      },
+      body: JSON.stringify({
+        message: userMessage,
+        session_id: sessionId,
+        current_page: currentPage,
+        current_product_id: currentProductId,
+        context_data: contextData,
+      }),
+    }).catch(() => null);
+
+    // Backend sin streaming o navegador sin ReadableStream: usar el endpoint normal
+    if (!response || !response.ok || !response.body) {
+      console.warn('Streaming no disponible, usando /api/chat');
+      return apiService.sendMessage(userMessage, sessionId, currentPage, currentProductId, contextData);
+    }
+
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    let finalResponse: ChatResponse | null = null;
+    let products: Product[] | undefined;
+    let cartAction: ChatResponse['cart_action'];
+
+    while (true) {
+      const { value, done } = await reader.read();
+      if (done) break;
+      buffer += decoder.decode(value, { stream: true });
+
+      let boundary = buffer.indexOf('\n\n');
+      while (boundary !== -1) {
+        const { event, data } = parseSseEvent(buffer.slice(0, boundary));
+        buffer = buffer.slice(boundary + 2);
+        boundary = buffer.indexOf('\n\n');
+
+        switch (event) {
+          case 'intent':
+            handlers.onIntent?.(data.intent, data.should_show_products);
+            break;
+          case 'token':
+            handlers.onToken?.(data.text);
+            break;
+          case 'products':
+            products = data.products;
+            handlers.onProducts?.(data.products);
+            break;
+          case 'cart_action':
+            cartAction = data.cart_action;
+            break;
+          case 'done':
+            finalResponse = data;
+            break;
+          case 'error':
+            throw new Error(data.response || 'Error al enviar mensaje.');
+        }
+      }
+    }
+
+    if (!finalResponse) {
+      throw new Error('La conexión se cerró antes de completar la respuesta.');
+    }
+    return { ...finalResponse, products, cart_action: cartAction };
+  },
+
   // Obtener historial de conversación
   getHistory: async (): Promise<ConversationHistoryItem[]> => {
     try {